@@ -40,11 +40,14 @@ def initialize_addon():
         except Exception:
             errors.append("mistune 库不可用（用于 markdown 处理）: " + _tb.format_exc())
 
+        # requests 只在选用 requests 传输或打开配置界面时才导入，这里只确认它能被找到
         try:
-            import requests  # noqa: F401
-            print("✅ Requests loaded successfully")
+            import importlib.util
+            if importlib.util.find_spec("requests") is None:
+                raise ImportError("No module named 'requests'")
+            print("✅ Requests available")
         except Exception:
-            errors.append("requests 库不可用（用于直连 OpenAI）: " + _tb.format_exc())
+            errors.append("requests 库不可用（用于模型列表与密钥验证）: " + _tb.format_exc())
 
         # 2) 配置读写检查
         try:
@@ -91,8 +94,8 @@ def initialize_addon():
 
         # 4) 服务初始化检查（仅直连路径）
         try:
-            from services.ai_service_adapter import AIServiceAdapter
-            adapter = AIServiceAdapter()
+            from services.service_registry import ServiceRegistry
+            adapter = ServiceRegistry.get_adapter()
             status = adapter.get_service_status()
             if not status.get("service_available", False):
                 warnings.append(f"服务不可用: {status.get('error')}")
@@ -111,6 +114,76 @@ def initialize_addon():
         # 注册命令处理器
         gui_hooks.webview_did_receive_js_message.append(handle_js_message)
 
+        # 共享 AI 服务实例随 Anki 配置档打开/关闭
+        try:
+            from services.service_registry import ServiceRegistry
+            gui_hooks.profile_did_open.append(ServiceRegistry.on_profile_open)
+            gui_hooks.profile_will_close.append(ServiceRegistry.on_profile_close)
+        except Exception as e:
+            print(f"Warning: Could not register service lifecycle hooks: {e}")
+
+        # 复习开始时预热 AI 端点连接
+        try:
+            from services.connection_warmer import connection_warmer
+            gui_hooks.state_did_change.append(connection_warmer.on_state_change)
+            gui_hooks.reviewer_did_show_question.append(connection_warmer.on_reviewer_activity)
+            gui_hooks.reviewer_did_show_answer.append(connection_warmer.on_reviewer_activity)
+            ServiceRegistry.add_profile_close_hook(connection_warmer.stop)
+        except Exception as e:
+            print(f"Warning: Could not register connection pre-warm hooks: {e}")
+
+        # 字段中的对话引用标记：复习时按需展开，对话存储随配置档关闭
+        try:
+            from ui.transcript_view import render_references, handle_expand_message
+            from services.conversation_store import close_conversation_stores
+            gui_hooks.card_will_show.append(render_references)
+            gui_hooks.webview_did_receive_js_message.append(handle_expand_message)
+            ServiceRegistry.add_profile_close_hook(close_conversation_stores)
+        except Exception as e:
+            print(f"Warning: Could not register conversation store hooks: {e}")
+
+        # 配置档关闭时取消仍在进行的 AI 请求
+        try:
+            from services.cancellation import cancel_all_tokens
+            from services.executor_service import executor
+            ServiceRegistry.add_profile_close_hook(cancel_all_tokens)
+            ServiceRegistry.add_profile_close_hook(executor.cancel_all)
+        except Exception as e:
+            print(f"Warning: Could not register cancellation hooks: {e}")
+
+        # 配置档关闭时结束异步传输的事件循环线程（未使用时什么也不做）
+        try:
+            from services.async_transport import event_loop
+            ServiceRegistry.add_profile_close_hook(event_loop.stop)
+        except Exception as e:
+            print(f"Warning: Could not register event loop hook: {e}")
+
+        # 配置档关闭前写入尚在排队的卡片保存
+        try:
+            from services.card_writer import card_writer
+            ServiceRegistry.add_profile_close_hook(card_writer.flush_sync)
+        except Exception as e:
+            print(f"Warning: Could not register card writer hooks: {e}")
+
+        # 相关卡片索引：配置档打开时加载，笔记修改或添加后增量更新
+        try:
+            from services.related_cards import related_cards_index
+            ServiceRegistry.add_profile_open_hook(related_cards_index.on_profile_open)
+            ServiceRegistry.add_profile_close_hook(related_cards_index.close)
+            gui_hooks.operation_did_execute.append(related_cards_index.on_operation_did_execute)
+            gui_hooks.add_cards_did_add_note.append(related_cards_index.on_note_added)
+        except Exception as e:
+            print(f"Warning: Could not register related cards hooks: {e}")
+
+        # 语义索引：配置档打开和笔记修改后在后台同步嵌入向量
+        try:
+            from services.embedding_store import semantic_index
+            ServiceRegistry.add_profile_open_hook(semantic_index.on_profile_open)
+            ServiceRegistry.add_profile_close_hook(semantic_index.close)
+            gui_hooks.operation_did_execute.append(semantic_index.on_operation_did_execute)
+        except Exception as e:
+            print(f"Warning: Could not register semantic index hooks: {e}")
+
         # 添加配置菜单
         setup_menu()
 
@@ -205,6 +278,16 @@ def setup_menu():
         config_action.triggered.connect(open_config_dialog)
         mw.form.menuTools.addAction(config_action)
 
+        # 搜索全部卡片的 AI 对话
+        search_action = QAction(_("Chat with Card") + " - " + _("Search AI Conversations..."), mw)
+        search_action.triggered.connect(open_conversation_search)
+        mw.form.menuTools.addAction(search_action)
+
+        # 批量压缩已保存到卡片的对话
+        compact_action = QAction(_("Chat with Card") + " - " + _("Compact Saved Conversations..."), mw)
+        compact_action.triggered.connect(open_compact_conversations)
+        mw.form.menuTools.addAction(compact_action)
+
     except Exception as e:
         showInfo(f"Error setting up menu: {str(e)}")
 
@@ -223,5 +306,26 @@ def open_config_dialog():
     except Exception as e:
         showInfo(f"Error opening config dialog: {str(e)}")
 
+def open_conversation_search():
+    """打开对话搜索窗口"""
+    try:
+        from ui.search_dialog import ConversationSearchDialog
+
+        dialog = ConversationSearchDialog(mw)
+        dialog.show()
+
+    except Exception as e:
+        showInfo(f"Error opening conversation search: {str(e)}")
+
+def open_compact_conversations():
+    """压缩集合中已保存的 AI 对话"""
+    try:
+        from ui.compact_conversations import compact_saved_conversations
+
+        compact_saved_conversations(mw)
+
+    except Exception as e:
+        showInfo(f"Error compacting conversations: {str(e)}")
+
 # 初始化插件
 initialize_addon()
@@ -22,8 +22,12 @@ class Config:
         "max_tokens": 500,
         "temperature": 0.7,
 
-        # 统一 AI 配置已禁用（仅保留 openai 直连）
+        # 聊天使用的提供商："openai"（含 OpenAI 兼容端点）、"anthropic" 或 "google"，均为 HTTP 直连
         "ai_provider": "openai",
+        "anthropic_model": "claude-3-5-haiku-latest",
+        "google_model": "gemini-2.0-flash",
+        # 为真时每次请求在所有已配置密钥的提供商之间按实时延迟与错误率选择（否则只用 ai_provider）
+        "provider_routing_enabled": False,
 
         # 增强配置
         "retry_attempts": 3,
@@ -36,7 +40,100 @@ class Config:
         "chat_window_height": 400,
         "save_conversations": True,
         "conversation_separator": "<hr><h3>AI Chat History</h3>",
-        "debug_mode": False
+        "debug_mode": False,
+
+        # 连接预热（复习开始时建立连接，并在服务器空闲超时前刷新）
+        "prewarm_enabled": True,
+        "prewarm_refresh_seconds": 45,
+        "prewarm_idle_stop_seconds": 600,
+
+        # 模型目录缓存有效期
+        "model_catalog_ttl_hours": 24,
+
+        # API 密钥验证结果缓存时间
+        "key_validation_cache_minutes": 10,
+
+        # 卡片上下文（每一面）提取后的最大字符数，0 表示不限制
+        "card_context_max_chars": 4000,
+
+        # 卡片上下文来源："fields" 直接读取笔记字段，"rendered" 渲染卡片模板
+        "card_context_mode": "fields",
+        # 按笔记类型名称指定字段角色，例如 {"My Vocab": {"front": ["Word"], "back": ["Meaning"], "extra": ["Example"]}}
+        "field_role_rules": {},
+
+        # 保存到卡片的对话样式："class" 使用短类名并把样式表装入笔记类型 CSS，"inline" 每个元素写内联样式
+        "conversation_style_mode": "class",
+        # 对话保存位置："field" 追加到笔记背面字段；"store" 保存到插件数据库，字段中只留引用标记
+        "conversation_storage_mode": "field",
+
+        # 聊天窗口对话历史：按卡片保存，重新打开时恢复；超出上限或期限的轮次在配置档关闭时清理
+        "conversation_history_enabled": True,
+        "conversation_history_page_size": 20,
+        "conversation_history_max_turns_per_card": 200,
+        "conversation_history_max_age_days": 365,
+
+        # 相关卡片：本地 BM25 索引集合中的笔记文本，聊天时把最相关的几张卡片附加到上下文
+        "related_cards_enabled": False,
+        "related_cards_count": 3,
+
+        # 语义索引：通过 /v1/embeddings 为笔记生成向量并保存在本地（会产生嵌入接口费用）
+        "semantic_index_enabled": False,
+        "embedding_model": "text-embedding-3-small",
+        # 留空时使用 OPENAI_EMBEDDINGS_URL 环境变量或 OpenAI 官方地址
+        "embeddings_url": "",
+
+        # 近似回答缓存：同一张（或几乎相同的）卡片上几乎相同的问题直接返回之前的回答，并在界面中标出
+        "response_cache_enabled": False,
+        "response_cache_threshold": 0.85,
+        "response_cache_max_entries": 500,
+        "response_cache_ttl_hours": 24,
+
+        # 聊天请求的 HTTP 传输："http_client" 标准库实现（不导入 requests）；"requests" 原有实现；
+        # "asyncio" 所有请求的网络读写在同一个事件循环线程中并发、复用连接
+        #（聊天与批量任务仍经由阻塞接口调用，每个流式回答依旧占用一个执行器线程，线程数不会减少）；
+        # "qt" 聊天窗口的流式回答由 QNetworkAccessManager 在界面事件循环中接收（不可用时回退到 requests）
+        "http_transport": "http_client",
+
+        # 流式回答的截止时间：首个分片与完整回答分开计时（秒，0 表示不限制）
+        "first_token_timeout_seconds": 30,
+        "stream_total_timeout_seconds": 300,
+        # 对冲请求：超过历史 TTFT 的该分位数仍未出字时，向同一端点（或 hedge_endpoint）再发一次相同请求，
+        # 先出字者胜，另一个立即取消；样本不足时按 hedge_max_delay_ms 等待。
+        # hedge_endpoint 可以是端点配置档名称（使用该配置档的密钥），或一个地址（使用 hedge_api_key）
+        "hedge_enabled": False,
+        "hedge_percentile": 95,
+        "hedge_min_delay_ms": 1500,
+        "hedge_max_delay_ms": 8000,
+        "hedge_endpoint": "",
+        "hedge_api_key": "",
+
+        # 端点配置档：除主端点（openai_api_key + OPENAI_BASE_URL，名称为 "openai"）外的 OpenAI 兼容端点，
+        # 每个有自己的密钥、模型映射与连接池，例如
+        # [{"name": "local", "url": "http://127.0.0.1:8000/v1/chat/completions", "api_key": "",
+        #   "models": {"gpt-4o-mini": "qwen2.5:7b"}}]
+        # 列在 endpoint_fallbacks 中的端点只在其余端点都失败后按顺序尝试，其余端点按延迟与错误率分流
+        # （fallback_providers 列的是提供商名称，见 ai_provider）
+        "endpoint_profiles": [],
+        "endpoint_fallbacks": [],
+        "fallback_providers": [],
+        # 路由统计：延迟与错误率的指数加权系数；连续失败多少次剔除端点，剔除时长（每次加倍，有上限）
+        "router_ewma_alpha": 0.3,
+        "router_eject_failures": 3,
+        "router_eject_seconds": 30,
+        "router_max_eject_seconds": 300,
+
+        # 分级模型路由：默认由快速模型回答；问题过长、含复杂问题特征、上下文过长、用户要求
+        # 或快速模型的回答信心不足（空回答、被截断、表示不确定）时由强模型回答。
+        # 两个模型都属于 ai_provider，留空时使用该提供商配置的模型，例如 "gpt-4o-mini" / "gpt-4o"
+        "cascade_enabled": False,
+        "cascade_fast_model": "",
+        "cascade_strong_model": "",
+        "cascade_max_fast_prompt_tokens": 200,
+        "cascade_max_fast_context_tokens": 6000,
+        "cascade_escalate_on_low_confidence": True,
+        # 按牌组覆盖上述配置（键去掉 cascade_ 前缀），子牌组继承，最长的牌组名匹配优先，例如
+        # {"Medicine": {"fast_model": "gpt-4o", "enabled": true}, "Languages::Spanish": {"enabled": false}}
+        "cascade_deck_rules": {}
     }
     
     _config = None
@@ -117,6 +214,117 @@ class Config:
             "conversation_separator": config.get("conversation_separator", "<hr><h3>AI Chat History</h3>")
         }
     
+    @classmethod
+    def get_prewarm_config(cls):
+        """获取连接预热相关配置"""
+        config = cls.get_config()
+        return {
+            "enabled": config.get("prewarm_enabled", True),
+            "refresh_seconds": config.get("prewarm_refresh_seconds", 45),
+            "idle_stop_seconds": config.get("prewarm_idle_stop_seconds", 600)
+        }
+
+    @classmethod
+    def get_conversation_history_config(cls):
+        """获取聊天历史保存相关配置"""
+        config = cls.get_config()
+        return {
+            "enabled": config.get("conversation_history_enabled", True),
+            "page_size": config.get("conversation_history_page_size", 20),
+            "max_turns_per_card": config.get("conversation_history_max_turns_per_card", 200),
+            "max_age_days": config.get("conversation_history_max_age_days", 365)
+        }
+
+    @classmethod
+    def get_related_cards_config(cls):
+        """获取相关卡片上下文配置"""
+        config = cls.get_config()
+        return {
+            "enabled": config.get("related_cards_enabled", False),
+            "count": config.get("related_cards_count", 3)
+        }
+
+    @classmethod
+    def get_semantic_index_config(cls):
+        """获取语义索引（嵌入向量）配置"""
+        config = cls.get_config()
+        return {
+            "enabled": config.get("semantic_index_enabled", False),
+            "model": config.get("embedding_model", "text-embedding-3-small"),
+            "endpoint": config.get("embeddings_url", "")
+        }
+
+    @classmethod
+    def get_response_cache_config(cls):
+        """获取近似回答缓存配置"""
+        config = cls.get_config()
+        return {
+            "enabled": config.get("response_cache_enabled", False),
+            "threshold": config.get("response_cache_threshold", 0.85),
+            "max_entries": config.get("response_cache_max_entries", 500),
+            "ttl_hours": config.get("response_cache_ttl_hours", 24)
+        }
+
+    @classmethod
+    def get_transport_config(cls):
+        """获取聊天请求的 HTTP 传输配置"""
+        config = cls.get_config()
+        return {
+            "transport": config.get("http_transport", "http_client")
+        }
+
+    @classmethod
+    def get_hedging_config(cls):
+        """获取首个分片截止时间与对冲请求配置"""
+        config = cls.get_config()
+        return {
+            "first_token_timeout": config.get("first_token_timeout_seconds", 30),
+            "total_timeout": config.get("stream_total_timeout_seconds", 300),
+            "enabled": config.get("hedge_enabled", False),
+            "percentile": config.get("hedge_percentile", 95),
+            "min_delay_ms": config.get("hedge_min_delay_ms", 1500),
+            "max_delay_ms": config.get("hedge_max_delay_ms", 8000),
+            "endpoint": config.get("hedge_endpoint", ""),
+            "api_key": config.get("hedge_api_key", "")
+        }
+
+    @classmethod
+    def get_endpoint_config(cls):
+        """获取端点配置档与路由配置"""
+        config = cls.get_config()
+        return {
+            "profiles": config.get("endpoint_profiles", []),
+            "fallback": config.get("endpoint_fallbacks", []),
+            "ewma_alpha": config.get("router_ewma_alpha", 0.3),
+            "eject_failures": config.get("router_eject_failures", 3),
+            "eject_seconds": config.get("router_eject_seconds", 30),
+            "max_eject_seconds": config.get("router_max_eject_seconds", 300)
+        }
+
+    @classmethod
+    def get_cascade_config(cls, deck: str = None):
+        """获取分级模型路由配置；传入牌组名时合并该牌组（或最近的上级牌组）的覆盖配置"""
+        config = cls.get_config()
+        settings = {
+            "enabled": config.get("cascade_enabled", False),
+            "fast_model": config.get("cascade_fast_model", ""),
+            "strong_model": config.get("cascade_strong_model", ""),
+            "max_fast_prompt_tokens": config.get("cascade_max_fast_prompt_tokens", 200),
+            "max_fast_context_tokens": config.get("cascade_max_fast_context_tokens", 6000),
+            "escalate_on_low_confidence": config.get("cascade_escalate_on_low_confidence", True)
+        }
+        if deck:
+            rules = config.get("cascade_deck_rules", {}) or {}
+            matches = [name for name in rules if deck == name or deck.startswith(name + "::")]
+            if matches:
+                override = rules[max(matches, key=len)] or {}
+                settings.update({key: value for key, value in override.items() if key in settings})
+        provider = config.get("ai_provider", "openai")
+        default_model = cls.get_provider_config(provider if provider in ("anthropic", "google") else "openai")["model"]
+        settings["fast_model"] = settings["fast_model"] or default_model
+        settings["strong_model"] = settings["strong_model"] or default_model
+        return settings
+
     @classmethod
     def is_debug_mode(cls):
         """是否为调试模式"""
@@ -172,12 +380,12 @@ class Config:
         elif provider == "anthropic":
             return {
                 "api_key": config.get("anthropic_api_key", ""),
-                "model": "claude-3-sonnet-20240229"
+                "model": config.get("anthropic_model", "claude-3-5-haiku-latest")
             }
         elif provider == "google":
             return {
                 "api_key": config.get("google_api_key", ""),
-                "model": "gemini-pro"
+                "model": config.get("google_model", "gemini-2.0-flash")
             }
         else:
             return {}
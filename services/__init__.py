@@ -8,8 +8,9 @@ AI 服务包
 try:
     from services.ai_service_adapter import AIServiceAdapter
     from services.card_service import CardService
+    from services.service_registry import ServiceRegistry
 
-    __all__ = ['AIServiceAdapter', 'CardService']
+    __all__ = ['AIServiceAdapter', 'CardService', 'ServiceRegistry']
 
 except ImportError as e:
     print(f"Services package import warning: {e}")
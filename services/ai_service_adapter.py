@@ -1,15 +1,35 @@
 # AI 服务适配器 - 保持向后兼容性
 
 import logging
-from typing import Dict, Any, Tuple
+import threading
+import time
+from typing import Dict, Any, List, Tuple
 
 # 尝试相对导入，如果失败则使用绝对导入
 try:
     from ..config import Config
     from .openai_service import OpenAIService
+    from .anthropic_service import AnthropicService
+    from .gemini_service import GeminiService
+    from .cancellation import CancelledError
+    from .chat_client import DELTA, StreamEvent
+    from .endpoint_router import provider_router, should_fail_over
 except ImportError:
     from config import Config
     from services.openai_service import OpenAIService
+    from services.anthropic_service import AnthropicService
+    from services.gemini_service import GeminiService
+    from services.cancellation import CancelledError
+    from services.chat_client import DELTA, StreamEvent
+    from services.endpoint_router import provider_router, should_fail_over
+
+# 直连客户端：提供商名称 → 客户端类（openai 由 OpenAIService 处理，包括 OpenAI 兼容端点）
+PROVIDER_CLIENTS = {
+    "anthropic": AnthropicService,
+    "google": GeminiService,
+}
+PROVIDERS = ("openai",) + tuple(PROVIDER_CLIENTS)
+
 
 class AIServiceAdapter:
     """AI 服务适配器 - 根据配置选择使用统一服务或原有 OpenAI 服务"""
@@ -19,6 +39,9 @@ class AIServiceAdapter:
         self.logger = logging.getLogger(__name__)
         self._service = None
         self._service_type = None
+        # 其他提供商的客户端，第一次路由到时创建
+        self._clients = {}
+        self._clients_lock = threading.Lock()
         self._initialize_service()
     
     def _initialize_service(self):
@@ -40,12 +63,118 @@ class AIServiceAdapter:
                 self._service = None
                 self._service_type = None
     
+    def _provider_available(self, provider: str) -> bool:
+        """提供商是否已配置密钥（openai 也可以只配置端点配置档）"""
+        if provider == "openai":
+            return bool(Config.get("openai_api_key", "")) or bool(Config.get_endpoint_config()["profiles"])
+        return bool(Config.get(f"{provider}_api_key", ""))
+
+    def _provider_plan(self) -> List[str]:
+        """本次请求依次尝试的提供商
+
+        默认只用 ai_provider；provider_routing_enabled 为真时所有已配置密钥的提供商按实时延迟与错误率
+        分流（提供商级统计，与端点统计分开）。fallback_providers 中的提供商在其余提供商都失败后依次尝试。
+        """
+        primary = self.primary_provider()
+        available = [p for p in PROVIDERS if self._provider_available(p)]
+        balanced = [primary]
+        if Config.get("provider_routing_enabled", False):
+            balanced += [p for p in available if p != primary]
+        fallback = [p for p in Config.get("fallback_providers", []) if p in available and p not in balanced]
+        if len(balanced) > 1:
+            settings = Config.get_endpoint_config()
+            provider_router.configure(settings["ewma_alpha"], settings["eject_failures"],
+                                      settings["eject_seconds"], settings["max_eject_seconds"])
+            return provider_router.plan(balanced, fallback)
+        return balanced + fallback
+
+    def _provider_service(self, provider: str):
+        """提供商对应的服务实例（密钥与模型每次按当前配置同步）"""
+        if provider == "openai":
+            return self._service
+        with self._clients_lock:
+            client = self._clients.get(provider)
+            if client is None:
+                client = PROVIDER_CLIENTS[provider].from_config()
+                self._clients[provider] = client
+        provider_config = Config.get_provider_config(provider)
+        client.update_config({"api_key": provider_config.get("api_key", ""), "model": provider_config.get("model", "")})
+        return client
+
+    def uses_native_providers(self) -> bool:
+        """本次请求是否可能发往 OpenAI 以外的提供商（此时不能使用 OpenAIService 的回调流式接口）"""
+        return self._provider_plan() != ["openai"]
+
+    def stream_events(self, conversation_history, cancel_token=None, model=None):
+        """流式回答事件（StreamEvent）- 统一接口
+
+        按 _provider_plan() 的顺序尝试：某个提供商在产出任何事件之前失败（网络错误、5xx、限流、
+        鉴权等）时换下一个；已经开始回答后不再切换。
+        model（分级路由选出的模型）属于 ai_provider，只用于该提供商；其余提供商使用各自配置的模型。
+        """
+        if not self._service:
+            raise RuntimeError("服务未初始化")
+        plan = self._provider_plan()
+        services = [self._provider_service(name) for name in plan]
+        primary = self.primary_provider()
+        models = [model if name == primary else None for name in plan]
+        # 依次在当前线程中尝试：各提供商自己的流已经执行截止时间与端点对冲，这里不再套一层 hedged_stream
+        for index, name in enumerate(plan):
+            started = False
+            try:
+                for event in self._routed_events(name, services[index], conversation_history, cancel_token,
+                                                 models[index]):
+                    started = True
+                    yield event
+                return
+            except Exception as e:
+                if started or index == len(plan) - 1 or not should_fail_over(e):
+                    raise
+                if cancel_token is not None and cancel_token.is_cancelled:
+                    return
+                self.logger.warning(f"Provider {name} failed, trying {plan[index + 1]}: {e}")
+
+    @staticmethod
+    def _routed_events(provider, service, conversation_history, cancel_token, model):
+        """一个提供商的事件流；在它的第一个事件之前加上实际使用的提供商与模型（ROUTE 事件）
+
+        ROUTE 事件不单独产出：提供商失败前不会有任何事件，故障转移不受影响。
+        首个事件的延迟与出字前的失败记入提供商级路由统计。
+        """
+        started = time.monotonic()
+        first = True
+        try:
+            for event in service.stream_events(conversation_history, cancel_token=cancel_token, model=model):
+                if first:
+                    first = False
+                    provider_router.record(provider, (time.monotonic() - started) * 1000.0, True)
+                    yield StreamEvent.route(provider, model or getattr(service, "model", ""))
+                yield event
+        except Exception:
+            if first and not (cancel_token is not None and cancel_token.is_cancelled):
+                provider_router.record(provider, None, False)
+            raise
+
+    def primary_provider(self) -> str:
+        """ai_provider（无效时为 openai）"""
+        primary = Config.get("ai_provider", "openai")
+        return primary if primary in PROVIDERS else "openai"
+
+    def default_route(self, model=None) -> Tuple[str, str]:
+        """不发生故障转移时回答的 (提供商, 模型)"""
+        primary = self.primary_provider()
+        return primary, model or Config.get_provider_config(primary).get("model", "")
+
     def get_response(self, conversation_history):
         """获取 AI 回复 - 统一接口"""
         if not self._service:
             return "AI服务暂时不可用: 服务未初始化"
         
         try:
+            if self.uses_native_providers():
+                events = self.stream_events(conversation_history)
+                content = "".join(event.text for event in events if event.kind == DELTA)
+                return content.strip() or "AI服务暂时不可用: Empty response from API"
             if self._service_type == "unified":
                 # 使用统一服务，支持回退机制
                 return self._service.get_response_with_fallback(conversation_history)
@@ -56,13 +185,15 @@ class AIServiceAdapter:
             self.logger.error(f"Error in get_response: {e}")
             return f"AI服务暂时不可用: {str(e)}"
     
-    def validate_api_key(self) -> Tuple[bool, str]:
-        """验证 API 密钥 - 统一接口"""
+    def validate_api_key(self, allow_completion: bool = False, cancel_token=None) -> Tuple[bool, str]:
+        """验证 API 密钥 - 统一接口（allow_completion 为 True 时才允许发送补全请求；cancel_token 可中止请求）"""
         if not self._service:
             return False, "服务未初始化"
         
         try:
-            return self._service.validate_api_key()
+            return self._service.validate_api_key(allow_completion=allow_completion, cancel_token=cancel_token)
+        except CancelledError:
+            raise
         except Exception as e:
             self.logger.error(f"Error in validate_api_key: {e}")
             return False, f"验证失败: {str(e)}"
@@ -112,6 +243,11 @@ class AIServiceAdapter:
         try:
             # 更新服务配置
             self._service.update_config(new_config)
+            shared = {k: new_config[k] for k in ("max_tokens", "temperature") if k in new_config}
+            with self._clients_lock:
+                clients = list(self._clients.values())
+            for client in clients:
+                client.update_config(shared)
             
             # 如果配置中包含服务类型切换，重新初始化
             if "use_unified_service" in new_config:
@@ -123,6 +259,33 @@ class AIServiceAdapter:
         except Exception as e:
             self.logger.error(f"Error in update_config: {e}")
     
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取底层服务的请求统计（其他提供商的统计在 providers 下）"""
+        getter = getattr(self._service, "get_metrics", None)
+        if not callable(getter):
+            return {}
+        try:
+            metrics = getter()
+            with self._clients_lock:
+                clients = dict(self._clients)
+            if clients:
+                metrics["providers"] = {name: client.get_metrics() for name, client in clients.items()}
+            return metrics
+        except Exception as e:
+            self.logger.error(f"Error in get_metrics: {e}")
+            return {}
+
+    def close(self):
+        """释放底层服务持有的连接等资源"""
+        with self._clients_lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+        closer = getattr(self._service, "close", None)
+        if callable(closer):
+            closer()
+
     def switch_provider(self, provider: str) -> Tuple[bool, str]:
         """切换 AI 提供商（仅统一服务支持）"""
         if self._service_type != "unified":
@@ -175,15 +338,16 @@ class AIServiceAdapter:
                 self.logger.error(f"Error getting available providers: {e}")
                 return []
         else:
-            # 对于 OpenAI 服务，只返回 OpenAI
-            return ["openai"] if self._service else []
+            # 直连模式：已配置密钥的提供商
+            return [p for p in PROVIDERS if self._provider_available(p)] if self._service else []
     
     def get_current_provider(self) -> str:
         """获取当前提供商"""
+        provider = Config.get("ai_provider", "openai")
         if self._service_type == "unified":
-            return Config.get("ai_provider", "openai")
+            return provider
         else:
-            return "openai"
+            return provider if provider in PROVIDERS else "openai"
     
     def is_unified_service(self) -> bool:
         """是否使用统一服务"""
@@ -0,0 +1,117 @@
+# Anthropic Messages API 直连客户端（流式）
+
+import json
+import os
+from typing import List
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .chat_client import ChatClient, StreamEvent, split_system
+    from .transport import TransportError
+except ImportError:
+    from services.chat_client import ChatClient, StreamEvent, split_system
+    from services.transport import TransportError
+
+ANTHROPIC_MESSAGES_URL = "https://api.anthropic.com/v1/messages"
+ANTHROPIC_VERSION = "2023-06-01"
+
+# 流中 error 事件的错误类型 → 对应的 HTTP 状态（决定是否换提供商重试）
+_ERROR_STATUS = {
+    "invalid_request_error": 400,
+    "authentication_error": 401,
+    "permission_error": 403,
+    "not_found_error": 404,
+    "request_too_large": 413,
+    "rate_limit_error": 429,
+    "api_error": 500,
+    "overloaded_error": 529,
+}
+
+
+class AnthropicStreamParser:
+    """解析 Messages 流式事件：按 data 中的 type 字段区分，只取文本块的增量
+
+    message_start 带输入 token 数，message_delta 带输出 token 数与 stop_reason。
+    """
+
+    def __init__(self):
+        self.input_tokens = 0
+
+    def feed(self, data: str) -> List[StreamEvent]:
+        try:
+            obj = json.loads(data)
+        except ValueError:
+            return []
+        if not isinstance(obj, dict):
+            return []
+        kind = obj.get("type")
+        if kind == "content_block_delta":
+            delta = obj.get("delta") or {}
+            if delta.get("type") == "text_delta" and delta.get("text"):
+                return [StreamEvent.delta(delta["text"])]
+            return []
+        if kind == "message_start":
+            usage = (obj.get("message") or {}).get("usage") or {}
+            self.input_tokens = usage.get("input_tokens", 0)
+            return [StreamEvent.usage_of(self.input_tokens, usage.get("output_tokens", 0))]
+        if kind == "message_delta":
+            events = []
+            usage = obj.get("usage")
+            if usage:
+                events.append(StreamEvent.usage_of(usage.get("input_tokens") or self.input_tokens,
+                                                   usage.get("output_tokens", 0)))
+            reason = (obj.get("delta") or {}).get("stop_reason")
+            if reason:
+                events.append(StreamEvent.finish("stop" if reason == "end_turn" else reason))
+            return events
+        if kind == "error":
+            error = obj.get("error") or {}
+            raise TransportError(f"{error.get('type', 'error')}: {error.get('message', '')}",
+                                 _ERROR_STATUS.get(error.get("type"), 0))
+        # ping、content_block_start/stop、message_stop
+        return []
+
+
+class AnthropicService(ChatClient):
+    """Anthropic Messages API 客户端（anthropic_api_key / anthropic_model）"""
+
+    name = "anthropic"
+    provider_config_key = "anthropic"
+
+    def __init__(self, api_key: str = "", model: str = "", max_tokens: int = 500, temperature: float = 0.7):
+        super().__init__(api_key, model, max_tokens, temperature)
+        self.messages_url = os.environ.get("ANTHROPIC_MESSAGES_URL", ANTHROPIC_MESSAGES_URL)
+
+    @property
+    def endpoint(self) -> str:
+        return self.messages_url
+
+    def _stream_request(self, conversation_history, model):
+        system, messages = split_system(conversation_history)
+        headers = {
+            "x-api-key": self.api_key,
+            "anthropic-version": ANTHROPIC_VERSION,
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        body = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": True
+        }
+        if system:
+            body["system"] = system
+        return self.messages_url, headers, json.dumps(body).encode("utf-8")
+
+    def _new_parser(self):
+        return AnthropicStreamParser()
+
+    def validate_api_key(self, allow_completion=False, cancel_token=None):
+        """通过模型列表接口验证密钥（不产生费用）"""
+        try:
+            from .key_probe import probe_anthropic_key
+        except ImportError:
+            from services.key_probe import probe_anthropic_key
+        return probe_anthropic_key(self.api_key, cancel_token=cancel_token)
@@ -0,0 +1,471 @@
+# 异步传输 - 一个后台线程运行 asyncio 事件循环，用标准库 HTTP/1.1 客户端复用全部 AI 请求
+#
+# 注意：目前插件内没有调用方使用协程接口。AIServiceAdapter 的调用方（聊天窗口、批量任务）都通过阻塞的
+# request()/stream() 使用本传输，每个进行中的流式回答仍占用调用方的一个执行器线程，
+# 因此选择 "asyncio" 只带来连接复用，并不会减少线程数。
+
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import ssl
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .cancellation import CancelledError, CancelToken
+    from .transport import HTTPResponse, SSEParser, StreamResponse, Transport, TransportError
+except ImportError:
+    from services.cancellation import CancelledError, CancelToken
+    from services.transport import HTTPResponse, SSEParser, StreamResponse, Transport, TransportError
+
+# 每个源站最多保留的空闲连接数，以及空闲连接的最长保留时间（秒）
+MAX_IDLE_PER_HOST = 16
+IDLE_TIMEOUT = 60.0
+
+# 响应头的最大长度
+MAX_HEADER_BYTES = 64 * 1024
+READ_SIZE = 64 * 1024
+
+
+class EventLoopService:
+    """在专用后台线程中运行的 asyncio 事件循环（第一次使用时启动）
+
+    其他线程通过 submit() 把协程交给循环，拿到 concurrent.futures.Future；
+    配置档关闭时 stop() 取消未完成的任务并结束线程，之后再次使用会重新启动。
+    """
+
+    def __init__(self, thread_name: str = "chat-with-card-aio"):
+        self._thread_name = thread_name
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or not self.running:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                thread = threading.Thread(target=self._run, args=(loop, ready), name=self._thread_name, daemon=True)
+                thread.start()
+                ready.wait()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def _run(self, loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            try:
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            except Exception as e:
+                self.logger.warning(f"Event loop shutdown failed: {e}")
+            finally:
+                loop.close()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """在事件循环中运行协程（线程安全）；取消返回的 Future 会取消对应任务"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("blocking call from the event loop thread")
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+
+    def call_soon(self, callback, *args):
+        """在事件循环线程中执行回调（线程安全；循环未运行时忽略）"""
+        loop = self._loop
+        if loop is not None and self.running:
+            try:
+                loop.call_soon_threadsafe(callback, *args)
+            except RuntimeError:
+                pass
+
+    def stop(self, timeout: float = 2.0):
+        """取消循环中的全部任务并结束线程"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop, self._thread = None, None
+        if loop is None or thread is None or not thread.is_alive():
+            return
+        try:
+            loop.call_soon_threadsafe(loop.stop)
+        except RuntimeError:
+            return
+        if thread is not threading.current_thread():
+            thread.join(timeout)
+
+
+class _Connection:
+    __slots__ = ("key", "reader", "writer", "loop", "idle_since")
+
+    def __init__(self, key, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.idle_since = 0.0
+
+    @property
+    def usable(self) -> bool:
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class AsyncResponse:
+    """已读取响应头的异步响应；正文通过 iter_chunks()/read() 读取，读完后连接回到连接池"""
+
+    def __init__(self, client: "AsyncHTTPClient", conn: _Connection, method: str, status: int,
+                 reason: str, headers: Dict[str, str], keep_alive: bool):
+        self._client = client
+        self._conn: Optional[_Connection] = conn
+        self.method = method
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._keep_alive = keep_alive
+
+    @property
+    def closed(self) -> bool:
+        return self._conn is None
+
+    async def iter_chunks(self, read_timeout: Optional[float] = None) -> AsyncIterator[bytes]:
+        """按到达顺序产出正文字节（已解开 chunked 编码）"""
+        conn = self._conn
+        if conn is None:
+            return
+        reader = conn.reader
+        try:
+            if self.method == "HEAD" or self.status in (204, 304):
+                pass
+            elif "chunked" in self.headers.get("transfer-encoding", "").lower():
+                while True:
+                    size_line = await asyncio.wait_for(reader.readline(), read_timeout)
+                    if not size_line:
+                        raise TransportError("connection closed inside chunked body")
+                    size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                    if size == 0:
+                        # 跳过 trailer，直到空行
+                        while (await asyncio.wait_for(reader.readline(), read_timeout)).strip():
+                            pass
+                        break
+                    data = await asyncio.wait_for(reader.readexactly(size), read_timeout)
+                    await asyncio.wait_for(reader.readexactly(2), read_timeout)
+                    yield data
+            elif "content-length" in self.headers:
+                remaining = int(self.headers["content-length"])
+                while remaining > 0:
+                    data = await asyncio.wait_for(reader.read(min(READ_SIZE, remaining)), read_timeout)
+                    if not data:
+                        raise TransportError("connection closed before end of body")
+                    remaining -= len(data)
+                    yield data
+            else:
+                # 没有长度信息：读到连接关闭为止
+                self._keep_alive = False
+                while True:
+                    data = await asyncio.wait_for(reader.read(READ_SIZE), read_timeout)
+                    if not data:
+                        break
+                    yield data
+        except BaseException:
+            self.abort()
+            raise
+        self._release()
+
+    async def read(self, read_timeout: Optional[float] = None) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_chunks(read_timeout)])
+
+    def _release(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._keep_alive:
+            self._client.release(conn)
+        else:
+            conn.close()
+
+    def abort(self):
+        """丢弃响应：关闭连接（不放回连接池）"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+class AsyncHTTPClient:
+    """只依赖标准库的 HTTP/1.1 客户端（asyncio.open_connection + TLS）
+
+    按 (scheme, host, port) 复用 keep-alive 连接；复用的空闲连接若已被服务器关闭，
+    请求会在新连接上重试一次。只能在事件循环中使用。
+    """
+
+    def __init__(self, max_idle_per_host: int = MAX_IDLE_PER_HOST, idle_timeout: float = IDLE_TIMEOUT):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self._pool: Dict[tuple, List[_Connection]] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self.stats = {"connections_opened": 0, "connections_reused": 0}
+
+    def _get_ssl_context(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    async def _connect(self, key, timeout: Optional[float]) -> _Connection:
+        scheme, host, port = key
+        ssl_context = self._get_ssl_context() if scheme == "https" else None
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context, server_hostname=host if ssl_context else None,
+                                    limit=MAX_HEADER_BYTES),
+            timeout,
+        )
+        self.stats["connections_opened"] += 1
+        return _Connection(key, reader, writer)
+
+    def _acquire_idle(self, key) -> Optional[_Connection]:
+        idle = self._pool.get(key)
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        while idle:
+            conn = idle.pop()
+            if conn.loop is loop and conn.usable and now - conn.idle_since < self.idle_timeout:
+                self.stats["connections_reused"] += 1
+                return conn
+            conn.close()
+        return None
+
+    def release(self, conn: _Connection):
+        """把读完响应的连接放回连接池"""
+        idle = self._pool.setdefault(conn.key, [])
+        if not conn.usable or len(idle) >= self.max_idle_per_host:
+            conn.close()
+            return
+        conn.idle_since = time.monotonic()
+        idle.append(conn)
+
+    def close_idle(self):
+        """关闭全部空闲连接"""
+        pool, self._pool = self._pool, {}
+        for idle in pool.values():
+            for conn in idle:
+                conn.close()
+
+    @staticmethod
+    def _build_request(method: str, host_header: str, target: str, headers: Dict[str, str],
+                       body: Optional[bytes]) -> bytes:
+        merged = {"Host": host_header, "Accept-Encoding": "identity", "Connection": "keep-alive"}
+        lowered = {k.lower(): k for k in merged}
+        for name, value in headers.items():
+            existing = lowered.get(name.lower())
+            if existing is not None:
+                del merged[existing]
+            merged[name] = value
+            lowered[name.lower()] = name
+        if body is not None or method in ("POST", "PUT", "PATCH"):
+            merged.pop(lowered.get("content-length", "Content-Length"), None)
+            merged["Content-Length"] = str(len(body or b""))
+        lines = [f"{method} {target} HTTP/1.1"] + [f"{k}: {v}" for k, v in merged.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> Tuple[str, int, str, Dict[str, str]]:
+        while True:
+            try:
+                raw = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.LimitOverrunError:
+                raise TransportError("response header too large")
+            lines = raw.decode("latin-1").split("\r\n")
+            version, _, rest = lines[0].partition(" ")
+            code, _, reason = rest.partition(" ")
+            if not version.startswith("HTTP/") or not code.isdigit():
+                raise TransportError(f"malformed status line: {lines[0][:100]!r}")
+            status = int(code)
+            if 100 <= status < 200:
+                # 100 Continue 等临时响应：继续读取最终响应
+                continue
+            headers: Dict[str, str] = {}
+            for line in lines[1:]:
+                if not line:
+                    continue
+                name, _, value = line.partition(":")
+                name = name.strip().lower()
+                value = value.strip()
+                headers[name] = f"{headers[name]}, {value}" if name in headers else value
+            return version, status, reason, headers
+
+    async def open(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes] = None,
+                   timeout: Optional[float] = 30) -> AsyncResponse:
+        """发送请求并读取响应头；正文由返回的 AsyncResponse 读取"""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https") or not parts.hostname:
+            raise TransportError(f"unsupported URL: {url}")
+        default_port = 443 if scheme == "https" else 80
+        port = parts.port or default_port
+        key = (scheme, parts.hostname, port)
+        host_header = parts.hostname if port == default_port else f"{parts.hostname}:{port}"
+        if ":" in parts.hostname:
+            host_header = f"[{parts.hostname}]" if port == default_port else f"[{parts.hostname}]:{port}"
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        payload = self._build_request(method, host_header, target, headers, body)
+
+        conn = self._acquire_idle(key)
+        while True:
+            reused = conn is not None
+            if conn is None:
+                conn = await self._connect(key, timeout)
+            try:
+                conn.writer.write(payload)
+                await asyncio.wait_for(conn.writer.drain(), timeout)
+                version, status, reason, resp_headers = await asyncio.wait_for(self._read_head(conn.reader), timeout)
+            except asyncio.TimeoutError:
+                conn.close()
+                raise
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                conn.close()
+                if reused:
+                    # 服务器已关闭空闲连接：换一个新连接重试一次
+                    conn = None
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            connection = resp_headers.get("connection", "").lower()
+            keep_alive = "close" not in connection and (version != "HTTP/1.0" or "keep-alive" in connection)
+            return AsyncResponse(self, conn, method, status, reason, resp_headers, keep_alive)
+
+
+class _AsyncStreamResponse(StreamResponse):
+    """把事件循环中的 SSE 读取桥接为普通线程可以迭代的序列"""
+
+    def __init__(self, transport: "AsyncTransport", response: AsyncResponse, read_timeout: float,
+                 cancel_token: Optional[CancelToken]):
+        self._transport = transport
+        self._response = response
+        self._read_timeout = read_timeout
+        self._cancel_token = cancel_token
+        self.status = response.status
+        self.headers = response.headers
+
+    def iter_events(self):
+        events: "queue.Queue[tuple]" = queue.Queue()
+        loop_service = self._transport.loop_service
+
+        async def pump():
+            async for event in self._transport.iter_events_async(self._response, self._read_timeout):
+                events.put(("event", event))
+
+        future = loop_service.submit(pump())
+        # 任务结束（包括被取消、尚未开始就被取消）时都会放入结束标记
+        future.add_done_callback(lambda f: events.put(("done", f)))
+        if self._cancel_token is not None:
+            self._cancel_token.add_callback(future.cancel)
+        try:
+            while True:
+                kind, value = events.get()
+                if kind == "event":
+                    yield value
+                    continue
+                if not value.cancelled() and value.exception() is not None:
+                    if self._cancel_token is not None and self._cancel_token.is_cancelled:
+                        return
+                    raise value.exception()
+                return
+        finally:
+            # 调用方提前停止迭代时中止读取
+            future.cancel()
+            if self._cancel_token is not None:
+                self._cancel_token.remove_callback(future.cancel)
+
+    def read_text(self, limit: int = 4096) -> str:
+        body = self._transport.loop_service.submit(self._response.read(self._read_timeout)).result()
+        return body.decode("utf-8", errors="replace")[:limit]
+
+    def close(self):
+        if not self._response.closed:
+            self._transport.loop_service.call_soon(self._response.abort)
+
+
+class AsyncTransport(Transport):
+    """所有请求在同一个事件循环线程中并发执行的传输
+
+    协程接口 request_async()/open_stream_async()/iter_events_async() 供事件循环内的调用方使用
+    （成百上千个并发流也只占一个线程）；request()/stream() 是面向普通线程的阻塞接口，
+    与 RequestsTransport 的行为一致。阻塞接口读取流时调用方线程一直等待事件队列，
+    所以经由阻塞接口的请求并不会节省线程。
+    """
+
+    name = "asyncio"
+
+    def __init__(self, loop_service: Optional[EventLoopService] = None):
+        self.loop_service = loop_service or event_loop
+        self.client = AsyncHTTPClient()
+
+    # ---- 协程接口 ----
+
+    async def request_async(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes] = None,
+                            timeout: float = 30) -> HTTPResponse:
+        response = await self.client.open(method, url, headers, body, timeout)
+        data = await response.read(timeout)
+        return HTTPResponse(response.status, response.headers, data)
+
+    async def open_stream_async(self, url: str, headers: Dict[str, str], body: bytes,
+                                timeout: float = 60) -> AsyncResponse:
+        return await self.client.open("POST", url, headers, body, timeout)
+
+    async def iter_events_async(self, response: AsyncResponse, read_timeout: Optional[float] = 60) -> AsyncIterator[str]:
+        parser = SSEParser()
+        async for chunk in response.iter_chunks(read_timeout):
+            for event in parser.feed(chunk):
+                yield event
+        for event in parser.close():
+            yield event
+
+    # ---- 线程接口 ----
+
+    def request(self, method, url, headers, body=None, timeout=30):
+        return self.loop_service.submit(self.request_async(method, url, headers, body, timeout)).result()
+
+    def stream(self, url, headers, body, timeout=60, cancel_token=None):
+        future = self.loop_service.submit(self.open_stream_async(url, headers, body, timeout))
+        # 等待响应头期间取消也能立即生效
+        if cancel_token is not None:
+            cancel_token.add_callback(future.cancel)
+        try:
+            response = future.result()
+        except concurrent.futures.CancelledError:
+            raise CancelledError("Request was cancelled")
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(future.cancel)
+        return _AsyncStreamResponse(self, response, timeout, cancel_token)
+
+    def close(self):
+        self.loop_service.call_soon(self.client.close_idle)
+
+
+# 全局实例
+event_loop = EventLoopService()
@@ -0,0 +1,90 @@
+# 取消令牌 - 在 UI 与后台任务之间传递取消请求
+
+import logging
+import threading
+import weakref
+from typing import Callable, List
+
+
+class CancelledError(Exception):
+    """任务已被取消"""
+
+
+class CancelToken:
+    """线程安全的取消令牌
+
+    UI 线程调用 cancel()；后台任务轮询 is_cancelled 或通过 add_callback 注册
+    取消时需要执行的动作（例如关闭网络响应）。已取消后注册的回调会立即执行。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """请求取消，并执行已注册的回调"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def add_callback(self, callback: Callable[[], None]):
+        """注册取消回调"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def remove_callback(self, callback: Callable[[], None]):
+        """移除取消回调（任务正常结束后调用）"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 CancelledError"""
+        if self._event.is_set():
+            raise CancelledError("Task was cancelled")
+
+    def wait(self, timeout=None) -> bool:
+        """等待取消，返回是否已取消"""
+        return self._event.wait(timeout)
+
+    @staticmethod
+    def _run_callback(callback: Callable[[], None]):
+        try:
+            callback()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Cancel callback failed: {e}")
+
+
+# 进行中的令牌（弱引用，任务结束后自动移除），配置档关闭时统一取消
+_active_tokens: "weakref.WeakSet[CancelToken]" = weakref.WeakSet()
+_active_lock = threading.Lock()
+
+
+def track_token(token: CancelToken) -> CancelToken:
+    """登记一个进行中的令牌，cancel_all_tokens() 时会被取消"""
+    with _active_lock:
+        _active_tokens.add(token)
+    return token
+
+
+def cancel_all_tokens() -> int:
+    """取消全部进行中的任务（配置档关闭时调用），返回取消的数量"""
+    with _active_lock:
+        tokens = [t for t in _active_tokens if not t.is_cancelled]
+        _active_tokens.clear()
+    for token in tokens:
+        token.cancel()
+    return len(tokens)
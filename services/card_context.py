@@ -0,0 +1,197 @@
+# 字段级卡片上下文提取 - 直接读取笔记字段，不渲染卡片模板
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..config import Config
+    from ..utils.html_text import html_to_text
+except ImportError:
+    from config import Config
+    from utils.html_text import html_to_text
+
+ROLES = ("front", "back", "extra")
+
+# 模板中的字段引用：{{Field}}、{{text:Field}}、{{cloze:Text}}（跳过 #/^ 条件段与注释）
+_FIELD_REF_RE = re.compile(r"\{\{\s*([^#/^!{}][^{}]*?)\s*\}\}")
+_SPECIAL_REFS = {"FrontSide", "Tags", "Deck", "Subdeck", "Card", "CardFlag", "Type", "CardID"}
+_CLOZE_RE = re.compile(r"\{\{c(\d+)::(.*?)(?:::(.*?))?\}\}", re.DOTALL)
+
+# 笔记类型为挖空类型时的 type 值
+MODEL_CLOZE = 1
+
+CONTEXT_CACHE_SIZE = 256
+
+
+def _template_field_refs(template: str) -> Tuple[List[str], List[str]]:
+    """返回模板引用的字段名，以及其中以 cloze: 过滤器引用的字段名"""
+    refs, cloze_refs = [], []
+    for match in _FIELD_REF_RE.finditer(template or ""):
+        parts = [p.strip() for p in match.group(1).split(":")]
+        name = parts[-1]
+        if not name or name in _SPECIAL_REFS:
+            continue
+        if name not in refs:
+            refs.append(name)
+        if "cloze" in parts[:-1] and name not in cloze_refs:
+            cloze_refs.append(name)
+    return refs, cloze_refs
+
+
+def _render_cloze(text: str, active_ord: int) -> Tuple[str, List[str]]:
+    """把挖空语法渲染为问题文本：当前挖空显示为 [...] 或 [提示]，其余挖空显示答案"""
+    answers = []
+
+    def replace(match):
+        number = int(match.group(1))
+        answer = match.group(2)
+        hint = match.group(3)
+        if number == active_ord:
+            answers.append(answer)
+            return f"[{hint}]" if hint else "[...]"
+        return answer
+
+    return _CLOZE_RE.sub(replace, text or ""), answers
+
+
+class CardContextExtractor:
+    """从笔记字段按角色（front / back / extra）提取卡片上下文
+
+    角色映射按 (笔记类型 id, 卡片模板序号) 缓存，笔记类型修改后自动失效：
+    - 配置 field_role_rules 中按笔记类型名称给出的规则优先；
+    - 挖空类型：以 cloze: 引用的字段为正面（当前挖空隐藏），挖空答案为背面；
+    - 其他类型：问题模板引用的字段为正面，答案模板额外引用的第一个字段为背面，
+      其后的字段为 extra（{{FrontSide}} 不会再次带入正面内容）。
+    提取结果按 (笔记 id, 笔记修改时间, 模板序号) 缓存，重复打开同一卡片不再重新提取。
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._role_cache: Dict[Tuple[int, int], Tuple[Any, Dict[str, Any]]] = {}
+        self._context_cache: "OrderedDict[Tuple[int, int, int], Dict[str, Any]]" = OrderedDict()
+
+    def clear_cache(self):
+        with self._lock:
+            self._role_cache.clear()
+            self._context_cache.clear()
+
+    # ---- 角色映射 ----
+
+    def get_role_mapping(self, notetype: Dict[str, Any], ord_: int) -> Dict[str, Any]:
+        """获取某笔记类型某模板的字段角色映射（带缓存）"""
+        key = (notetype.get("id", 0), ord_)
+        with self._lock:
+            cached = self._role_cache.get(key)
+            if cached and cached[0] == notetype.get("mod"):
+                return cached[1]
+        mapping = self._build_role_mapping(notetype, ord_)
+        with self._lock:
+            self._role_cache[key] = (notetype.get("mod"), mapping)
+        return mapping
+
+    def _build_role_mapping(self, notetype: Dict[str, Any], ord_: int) -> Dict[str, Any]:
+        field_names = [f.get("name", "") for f in notetype.get("flds", [])]
+        mapping: Dict[str, Any] = {"front": [], "back": [], "extra": [], "cloze": []}
+
+        rules = (Config.get("field_role_rules", {}) or {}).get(notetype.get("name", ""))
+        if isinstance(rules, dict):
+            for role in ROLES:
+                mapping[role] = [n for n in rules.get(role, []) if n in field_names]
+            if notetype.get("type") == MODEL_CLOZE:
+                mapping["cloze"] = [n for n in mapping["front"]]
+            return mapping
+
+        templates = notetype.get("tmpls", [])
+        template = {}
+        if templates:
+            index = 0 if notetype.get("type") == MODEL_CLOZE else min(ord_, len(templates) - 1)
+            template = templates[index]
+        q_refs, q_cloze = _template_field_refs(template.get("qfmt", ""))
+        a_refs, a_cloze = _template_field_refs(template.get("afmt", ""))
+        q_refs = [n for n in q_refs if n in field_names]
+        a_refs = [n for n in a_refs if n in field_names]
+
+        if notetype.get("type") == MODEL_CLOZE:
+            cloze_fields = [n for n in (q_cloze + a_cloze) if n in field_names] or field_names[:1]
+            mapping["front"] = list(dict.fromkeys(cloze_fields))
+            mapping["cloze"] = list(mapping["front"])
+            mapping["extra"] = [n for n in q_refs + a_refs if n not in mapping["front"]]
+        elif q_refs or a_refs:
+            answer_only = [n for n in a_refs if n not in q_refs]
+            mapping["front"] = q_refs
+            mapping["back"] = answer_only[:1]
+            mapping["extra"] = answer_only[1:]
+        else:
+            # 模板无法解析时按位置：第一个字段为正面，第二个为背面，其余为 extra
+            mapping["front"] = field_names[:1]
+            mapping["back"] = field_names[1:2]
+            mapping["extra"] = field_names[2:]
+        mapping["extra"] = list(dict.fromkeys(mapping["extra"]))
+        return mapping
+
+    # ---- 提取 ----
+
+    def extract(self, card) -> Optional[Dict[str, Any]]:
+        """提取卡片上下文：{"front", "back", "extra", "card_id", "note_id"}"""
+        note = card.note()
+        notetype = note.note_type() if hasattr(note, "note_type") else note.model()
+        ord_ = getattr(card, "ord", 0)
+        cache_key = (note.id, getattr(note, "mod", 0), ord_)
+        with self._lock:
+            cached = self._context_cache.get(cache_key)
+            if cached is not None:
+                self._context_cache.move_to_end(cache_key)
+                result = dict(cached)
+                result["card_id"] = card.id
+                return result
+
+        mapping = self.get_role_mapping(notetype, ord_)
+        field_names = [f.get("name", "") for f in notetype.get("flds", [])]
+        values = dict(zip(field_names, note.fields))
+        max_chars = Config.get("card_context_max_chars", 4000) or None
+
+        def join_fields(names):
+            texts = []
+            for name in names:
+                text = html_to_text(values.get(name, ""), max_chars=max_chars)
+                if text:
+                    texts.append(text)
+            return "\n".join(texts)
+
+        front_parts, cloze_answers = [], []
+        for name in mapping["front"]:
+            raw = values.get(name, "")
+            if name in mapping.get("cloze", []):
+                raw, answers = _render_cloze(raw, ord_ + 1)
+                cloze_answers.extend(answers)
+            text = html_to_text(raw, max_chars=max_chars)
+            if text:
+                front_parts.append(text)
+
+        back = join_fields(mapping["back"])
+        if cloze_answers:
+            answers_text = "; ".join(html_to_text(a) for a in cloze_answers)
+            back = f"{answers_text}\n{back}" if back else answers_text
+
+        context = {
+            "front": "\n".join(front_parts),
+            "back": back,
+            "extra": join_fields(mapping["extra"]),
+            "note_id": note.id,
+        }
+        with self._lock:
+            self._context_cache[cache_key] = context
+            while len(self._context_cache) > CONTEXT_CACHE_SIZE:
+                self._context_cache.popitem(last=False)
+        result = dict(context)
+        result["card_id"] = card.id
+        return result
+
+
+# 插件级单例
+card_context_extractor = CardContextExtractor()
@@ -6,8 +6,18 @@ import logging
 # 尝试相对导入，如果失败则使用绝对导入
 try:
     from ..config import Config
+    from ..utils.html_text import html_to_text
+    from .card_context import card_context_extractor
+    from . import conversation_style
+    from .conversation_store import get_conversation_store, make_reference
+    from .card_writer import card_writer
 except ImportError:
     from config import Config
+    from utils.html_text import html_to_text
+    from services.card_context import card_context_extractor
+    from services import conversation_style
+    from services.conversation_store import get_conversation_store, make_reference
+    from services.card_writer import card_writer
 
 # 尝试导入Anki模块
 try:
@@ -33,45 +43,62 @@ class CardService:
             if not current_card:
                 return None
             
-            # 提取正面和背面内容
-            front_html = current_card.question()
-            back_html = current_card.answer()
+            content = None
+            # 字段模式：直接读取笔记字段，不渲染模板（失败时回退到渲染模式）
+            if Config.get("card_context_mode", "fields") == "fields":
+                try:
+                    content = card_context_extractor.extract(current_card)
+                except Exception as e:
+                    logging.warning(f"Field-level card extraction failed, falling back to rendering: {e}")
             
-            front_content = CardService.extract_text_from_html(front_html)
-            back_content = CardService.extract_text_from_html(back_html)
+            if content is None:
+                # 渲染模式：提取正面和背面内容
+                front_html = current_card.question()
+                back_html = current_card.answer()
+                
+                front_content = CardService.extract_text_from_html(front_html)
+                back_content = CardService.extract_text_from_html(back_html)
+                
+                content = {
+                    "front": front_content,
+                    "back": back_content,
+                    "card_id": current_card.id,
+                    "note_id": current_card.nid
+                }
             
-            return {
-                "front": front_content,
-                "back": back_content,
-                "card_id": current_card.id
-            }
+            # 牌组名（筛选牌组中的卡片取原牌组），用于按牌组的模型分级配置
+            try:
+                content["deck"] = mw.col.decks.name(current_card.odid or current_card.did)
+            except Exception:
+                content["deck"] = ""
+            return content
             
         except Exception as e:
             logging.error(f"Error getting current card content: {e}")
             return None
     
     @staticmethod
-    def extract_text_from_html(html_content):
-        """从HTML中提取纯文本"""
+    def extract_text_from_html(html_content, max_chars=None):
+        """从HTML中提取纯文本（丢弃脚本/样式/隐藏内容，保留行结构，汇总媒体引用）"""
         if not html_content:
             return ""
         
         try:
-            # 移除HTML标签
-            text = re.sub(r'<[^>]+>', '', html_content)
-            
-            # 清理多余的空白字符
-            text = re.sub(r'\s+', ' ', text)
-            
-            return text.strip()
+            if max_chars is None:
+                max_chars = Config.get("card_context_max_chars", 4000)
+            return html_to_text(html_content, max_chars=max_chars or None)
             
         except Exception as e:
             logging.error(f"Error extracting text from HTML: {e}")
             return html_content  # 如果提取失败，返回原始内容
     
     @staticmethod
-    def append_to_card(conversation_content):
-        """将对话内容添加到卡片"""
+    def append_to_card(conversation_content, style_mode=None, on_done=None):
+        """将对话内容添加到当前卡片
+
+        写入由 card_writer 排队，在后台与其他待保存内容合并为一次可撤销的集合操作；
+        返回是否已排队，写入结果通过 on_done(success) 在主线程通知。
+        """
         try:
             # 检查Anki环境是否可用
             if not ANKI_AVAILABLE or not mw:
@@ -87,36 +114,91 @@ class CardService:
             if not note or len(note.fields) < 2:
                 return False
             
-            # 获取当前背面内容
-            current_back = note.fields[1]  # 假设背面是第二个字段
-            
             # 添加对话内容（不再显示 AI Chat History 标题，只保留细分隔线）
             # 将分隔符规范为细线，避免干扰阅读
-            separator = "<hr style=\"margin: 6px 0; padding: 0; border: none; border-top: 1px solid #e5e7eb;\">"
-            updated_back = current_back + separator + conversation_content
-            
-            # 更新字段
-            note.fields[1] = updated_back
-            
-            # 保存更改
-            note.flush()
+            mode = conversation_style.normalize_mode(style_mode or Config.get("conversation_style_mode", "class"))
+            separator = conversation_style.separator_html(mode)
             
-            # 刷新显示
-            if hasattr(mw.reviewer, 'refresh'):
-                mw.reviewer.refresh()
-            
-            return True
+            # 追加到背面字段（假设背面是第二个字段）
+            return card_writer.append(note.id, 1, separator + conversation_content, on_done)
             
         except Exception as e:
             logging.error(f"Error appending to card: {e}")
             return False
+
+    @staticmethod
+    def save_conversation_to_card(conversation_history, on_done=None):
+        """格式化并保存对话到当前卡片，返回 (是否已排队写入, 体积统计)；写入结果通过 on_done(success, 体积统计) 通知
+
+        类名模式下先把样式表装入笔记类型 CSS，装入失败时回退为内联样式。
+        存储模式为 "store" 时完整对话保存到对话存储，字段中只追加引用标记。
+        体积统计 {"mode", "inline_bytes", "bytes"} 对比同一段对话内联格式与实际写入的字节数。
+        """
+        mode = conversation_style.normalize_mode(Config.get("conversation_style_mode", "class"))
+        inline_html = CardService.format_conversation_for_card(conversation_history, conversation_style.STYLE_MODE_INLINE)
+        html = inline_html
+
+        if mode == conversation_style.STYLE_MODE_CLASS:
+            installed = False
+            try:
+                card = mw.reviewer.card if ANKI_AVAILABLE and mw else None
+                if card:
+                    note = card.note()
+                    notetype = note.note_type() if hasattr(note, "note_type") else note.model()
+                    installed = conversation_style.ensure_stylesheet(mw.col, notetype)
+            except Exception as e:
+                logging.error(f"Error preparing conversation stylesheet: {e}")
+            if installed:
+                html = CardService.format_conversation_for_card(conversation_history, mode)
+            else:
+                mode = conversation_style.STYLE_MODE_INLINE
+
+        if Config.get("conversation_storage_mode", "field") == "store":
+            html = CardService.store_conversation(conversation_history, html) or html
+
+        separator_bytes = len(conversation_style.separator_html(mode).encode("utf-8"))
+        stats = {
+            "mode": mode,
+            "inline_bytes": len(inline_html.encode("utf-8")) + len(conversation_style.INLINE_SEPARATOR.encode("utf-8")),
+            "bytes": len(html.encode("utf-8")) + separator_bytes,
+        }
+        callback = (lambda ok: on_done(ok, stats)) if on_done else None
+        success = CardService.append_to_card(html, style_mode=mode, on_done=callback)
+        if success:
+            logging.info(
+                f"Queued conversation for card ({mode} styles): {stats['bytes']} bytes "
+                f"(inline styles would be {stats['inline_bytes']} bytes)"
+            )
+        return success, stats
     
     @staticmethod
-    def format_conversation_for_card(conversation_history):
-        """格式化对话内容用于添加到卡片（紧凑样式，仿照前端渲染）"""
+    def store_conversation(conversation_history, html):
+        """把格式化后的对话保存到对话存储，返回写入字段的引用标记；失败返回 None（回退为写入字段）"""
+        try:
+            card = mw.reviewer.card if ANKI_AVAILABLE and mw else None
+            if not card:
+                return None
+            turns = sum(1 for msg in conversation_history if msg.get("role") == "user")
+            transcript_id = get_conversation_store().add_transcript(
+                card.note().id, html, html_to_text(html, include_media_summary=False), card_id=card.id, turns=turns
+            )
+            return make_reference(transcript_id, turns)
+        except Exception as e:
+            logging.error(f"Error storing conversation: {e}")
+            return None
+
+    @staticmethod
+    def format_conversation_for_card(conversation_history, style_mode=None):
+        """格式化对话内容用于添加到卡片（紧凑样式，仿照前端渲染）
+
+        style_mode 为 "class" 时只输出短类名（样式由笔记类型 CSS 提供），
+        为 "inline" 时每个元素写内联 style；默认取配置 conversation_style_mode。
+        """
         if not conversation_history:
             return ""
 
+        mode = conversation_style.normalize_mode(style_mode or Config.get("conversation_style_mode", "class"))
+
         def _escape_html(s: str) -> str:
             return (
                 s.replace("&", "&amp;")
@@ -127,24 +209,10 @@ class CardService:
             )
 
         def _light_md_to_html(text: str) -> str:
-            """使用 mistune 库进行 Markdown 转 HTML，并应用 Anki 卡片样式"""
+            """使用 mistune 库进行 Markdown 转 HTML"""
             try:
                 import mistune
-                # 使用mistune转换markdown
-                html = mistune.html(text)
-
-                # 应用Anki卡片样式
-                html = re.sub(r"<h([1-6])([^>]*)>", r"<h3 style=\"color:#333333;font-weight:600;line-height:1.2;margin:0;padding:0;text-align:left;font-size:1.2rem;display:block;\">", html)
-                html = re.sub(r"</h[1-6]>", r"</h3>", html)
-                html = re.sub(r"<ul([^>]*)>", r"<ul style=\"margin:0;padding:0 0 0 1.5rem;text-align:left;display:block;\">", html)
-                html = re.sub(r"<ol([^>]*)>", r"<ol style=\"margin:0;padding:0 0 0 1.5rem;text-align:left;display:block;\">", html)
-                html = re.sub(r"<li([^>]*)>", r"<li style=\"margin:0;padding:0;text-align:left;display:list-item;\">", html)
-                html = re.sub(r"<p([^>]*)>", r"<p style=\"margin:0;padding:0;text-align:left;line-height:1.2;display:block;\">", html)
-                html = re.sub(r"<strong([^>]*)>", r"<strong style=\"font-weight:600;color:#333333;\">", html)
-                html = re.sub(r"<code([^>]*)>", r"<code style=\"background-color:#f3f4f6;color:#dc2626;padding:2px 4px;border-radius:3px;font-family:monospace;font-size:0.875em;\">", html)
-
-                return html
-
+                return mistune.html(text)
             except ImportError:
                 # 如果mistune不可用，回退到简化版本
                 logging.warning("Mistune library not available, using fallback markdown parser")
@@ -160,38 +228,33 @@ class CardService:
                 is_user = (role == "user")
                 label_color = "#2563eb" if is_user else "#059669"
                 label_text = "Question:" if is_user else "Answer:"
+                margin_bottom = "8px" if is_user else "16px"
+                role_class = conversation_style.CLASS_QUESTION if is_user else conversation_style.CLASS_ANSWER
 
                 # 检测简单 markdown：特殊字符或双换行
                 has_md = bool(re.search(r"[#*`\[\]_~>\-]", raw)) or ("\n\n" in raw)
                 if has_md:
-                    converted = _light_md_to_html(raw)
-                    # 只显示处理后的内容，不显示摘要行
-                    styled = converted
-                    # 规范化常见块元素样式
-                    styled = re.sub(r"<div[^>]*>|</div>", "", styled)
-                    styled = re.sub(r"<h3([^>]*)>", "<h3 style=\"color:#333333;font-weight:600;line-height:1.2;margin:0;padding:0;text-align:left;font-size:1.2rem;display:block;\">", styled)
-                    styled = re.sub(r"<ul([^>]*)>", "<ul style=\"margin:0;padding:0 0 0 1.5rem;text-align:left;display:block;\">", styled)
-                    styled = re.sub(r"<ol([^>]*)>", "<ol style=\"margin:0;padding:0 0 0 1.5rem;text-align:left;display:block;\">", styled)
-                    styled = re.sub(r"<li([^>]*)>", "<li style=\"margin:0;padding:0;text-align:left;display:list-item;\">", styled)
-                    styled = re.sub(r"<p([^>]*)>", "<p style=\"margin:0;padding:0;text-align:left;line-height:1.2;display:block;\">", styled)
-                    styled = re.sub(r"<strong([^>]*)>", "<strong style=\"font-weight:600;color:#333333;\">", styled)
-                    styled = re.sub(r"<code([^>]*)>", "<code style=\"background-color:#f3f4f6;color:#dc2626;padding:2px 4px;border-radius:3px;font-family:monospace;font-size:0.875em;\">", styled)
+                    # 只显示处理后的内容，不显示摘要行；去掉 div 包装并规范化常见块元素
+                    styled = re.sub(r"<div[^>]*>|</div>", "", _light_md_to_html(raw))
+                    styled = conversation_style.style_markdown_html(styled, mode)
+                    body, tag, label_gap = styled, "div", "<br>"
+                else:
+                    body, tag, label_gap = _escape_html(raw), "p", " "
 
-                    # 添加标签和边框包装
-                    margin_bottom = "8px" if is_user else "16px"
+                if mode == conversation_style.STYLE_MODE_CLASS:
                     html_parts.append(
-                        f"<div style=\"margin:0 0 {margin_bottom} 0;padding:12px 16px;border:1px solid #e5e7eb;text-align:left;line-height:1.2;display:block;\">"
-                        f"<span style=\"color:{label_color};font-weight:600;\">{label_text}</span><br>"
-                        f"{styled}"
+                        f"<div class=\"{conversation_style.CLASS_BLOCK} {role_class}\">"
+                        f"<span class=\"{conversation_style.CLASS_LABEL}\">{label_text}</span>{label_gap}"
+                        f"{body}"
                         f"</div>"
                     )
                 else:
                     # 在Q和A之间添加适当的换行间距，并添加边框
-                    margin_bottom = "8px" if is_user else "16px"
                     html_parts.append(
-                        f"<p style=\"margin:0 0 {margin_bottom} 0;padding:12px 16px;border:1px solid #e5e7eb;text-align:left;line-height:1.2;display:block;\">"
-                        f"<span style=\"color:{label_color};font-weight:600;\">{label_text}</span> { _escape_html(raw) }"
-                        f"</p>"
+                        f"<{tag} style=\"margin:0 0 {margin_bottom} 0;padding:12px 16px;border:1px solid #e5e7eb;text-align:left;line-height:1.2;display:block;\">"
+                        f"<span style=\"color:{label_color};font-weight:600;\">{label_text}</span>{label_gap}"
+                        f"{body}"
+                        f"</{tag}>"
                     )
             return "".join(html_parts)
         except Exception as e:
@@ -0,0 +1,188 @@
+# 卡片写入队列 - 合并多次保存，在后台以一个可撤销操作写入集合
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from aqt import mw
+    from aqt.operations import CollectionOp
+    from aqt.qt import QTimer
+    ANKI_AVAILABLE = True
+except ImportError:
+    mw = None
+    CollectionOp = None
+    QTimer = None
+    ANKI_AVAILABLE = False
+
+# 最后一次保存请求之后等待多久再统一写入（毫秒）
+DEFAULT_DEBOUNCE_MS = 300
+
+
+class _PendingAppend:
+    __slots__ = ("note_id", "field_index", "content", "callback")
+
+    def __init__(self, note_id: int, field_index: int, content: str, callback: Optional[Callable[[bool], None]]):
+        self.note_id = note_id
+        self.field_index = field_index
+        self.content = content
+        self.callback = callback
+
+
+def apply_appends(col, pending: List[_PendingAppend], undo_name: Optional[str] = None):
+    """把待写入内容合并到笔记并用 update_notes 一次写入，返回 (OpChanges, 已修改的笔记 id 集合)
+
+    同一笔记的多次追加按入队顺序合并为一次更新；给出 undo_name 时全部修改合并为一个撤销步骤。
+    """
+    undo_entry = col.add_custom_undo_entry(undo_name) if undo_name else None
+    notes: Dict[int, Any] = {}
+    for item in pending:
+        note = notes.get(item.note_id)
+        if note is None:
+            note = col.get_note(item.note_id)
+            notes[item.note_id] = note
+        if item.field_index < len(note.fields):
+            note.fields[item.field_index] += item.content
+    changes = col.update_notes(list(notes.values())) if notes else None
+    if undo_entry is not None:
+        changes = col.merge_undo_entries(undo_entry)
+    return changes, set(notes)
+
+
+class CardWriter:
+    """把“追加到字段”的请求排队，短暂防抖后在 CollectionOp 的后台线程中批量写入
+
+    - 多次保存合并为一个事务和一个撤销步骤（编辑 > 撤销 “Save AI Conversation”）；
+    - 写入期间不阻塞界面，完成后在主线程回调 callback(success)；
+    - 只有当前复习卡片所属笔记被修改时才重绘复习界面；
+    - 不在 Anki 环境（或缺少 CollectionOp）时同步写入。
+    """
+
+    UNDO_NAME = "Save AI Conversation"
+
+    def __init__(self, debounce_ms: int = DEFAULT_DEBOUNCE_MS):
+        self.debounce_ms = debounce_ms
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._pending: List[_PendingAppend] = []
+        self._timer = None
+        self._stats = {"requests": 0, "batches": 0, "notes_written": 0, "failures": 0}
+
+    def append(self, note_id: int, field_index: int, content: str,
+               callback: Optional[Callable[[bool], None]] = None) -> bool:
+        """排队追加内容，返回是否已接受（结果通过 callback 通知；同步写入时返回写入结果）"""
+        with self._lock:
+            self._pending.append(_PendingAppend(int(note_id), int(field_index), content, callback))
+            self._stats["requests"] += 1
+        if ANKI_AVAILABLE and CollectionOp is not None and QTimer is not None and mw is not None:
+            self._schedule()
+            return True
+        return self.flush_sync()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = QTimer(mw)
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self.flush)
+        # 每次新请求都重新计时，连续保存合并为一批
+        self._timer.start(self.debounce_ms)
+
+    def _take_pending(self) -> List[_PendingAppend]:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """在后台写入当前队列（主线程调用）"""
+        pending = self._take_pending()
+        if not pending:
+            return
+        if not mw or not mw.col:
+            self._finish(pending, False)
+            return
+
+        result: Dict[str, Any] = {}
+
+        def op(col):
+            changes, touched = apply_appends(col, pending, self.UNDO_NAME)
+            result["touched"] = touched
+            return changes
+
+        def on_success(_changes):
+            touched = result.get("touched", set())
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["notes_written"] += len(touched)
+            self._refresh_reviewer_if_touched(touched)
+            self._finish(pending, True)
+
+        def on_failure(exc):
+            self.logger.error(f"Error writing conversations to notes: {exc}")
+            with self._lock:
+                self._stats["failures"] += 1
+            self._finish(pending, False)
+
+        # 以复习界面为发起方：Anki 不会因 note_text 变化自动重绘，由 on_success 按需刷新
+        CollectionOp(parent=mw, op=op).success(on_success).failure(on_failure).run_in_background(
+            initiator=getattr(mw, "reviewer", None)
+        )
+
+    def flush_sync(self) -> bool:
+        """同步写入当前队列（配置档关闭前、或不支持 CollectionOp 时）"""
+        pending = self._take_pending()
+        if not pending:
+            return True
+        col = getattr(mw, "col", None) if mw else None
+        if col is None:
+            self._finish(pending, False)
+            return False
+        try:
+            _, touched = apply_appends(col, pending)
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["notes_written"] += len(touched)
+            self._refresh_reviewer_if_touched(touched)
+            self._finish(pending, True)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error writing conversations to notes: {e}")
+            with self._lock:
+                self._stats["failures"] += 1
+            self._finish(pending, False)
+            return False
+
+    def _refresh_reviewer_if_touched(self, touched):
+        reviewer = getattr(mw, "reviewer", None) if mw else None
+        card = getattr(reviewer, "card", None)
+        if not card or card.nid not in touched:
+            return
+        try:
+            card.load()
+            if hasattr(reviewer, "_redraw_current_card"):
+                reviewer._redraw_current_card()
+            elif hasattr(reviewer, "refresh"):
+                reviewer.refresh()
+        except Exception as e:
+            self.logger.error(f"Error refreshing reviewer: {e}")
+
+    def _finish(self, pending: List[_PendingAppend], success: bool):
+        for item in pending:
+            if item.callback:
+                try:
+                    item.callback(success)
+                except Exception as e:
+                    self.logger.error(f"Error in card write callback: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
+
+
+# 插件级单例
+card_writer = CardWriter()
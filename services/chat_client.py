@@ -0,0 +1,289 @@
+# 直连聊天客户端 - 各提供商共用的流式事件协议与客户端基类（Anthropic、Gemini）
+
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..config import Config
+    from .cancellation import CancelledError
+    from .endpoint_router import endpoint_router
+    from .hedging import hedged_stream
+    from .transport import TransportError, create_transport, load_requests
+except ImportError:
+    from config import Config
+    from services.cancellation import CancelledError
+    from services.endpoint_router import endpoint_router
+    from services.hedging import hedged_stream
+    from services.transport import TransportError, create_transport, load_requests
+
+# 流式事件类型
+DELTA = "delta"    # 文本分片
+USAGE = "usage"    # 用量：到目前为止的 input_tokens / output_tokens（后到的覆盖先到的）
+FINISH = "finish"  # 结束原因（统一为小写，例如 "stop"、"max_tokens"）
+ROUTE = "route"    # 实际回答的提供商与模型（由 AIServiceAdapter 在该提供商的第一个事件之前产出）
+
+
+class StreamEvent:
+    """流式回答中的一个事件，各提供商的解析器都产出这种事件"""
+
+    __slots__ = ("kind", "text", "usage", "finish_reason", "provider", "model")
+
+    def __init__(self, kind: str, text: str = "", usage: Optional[Dict[str, int]] = None,
+                 finish_reason: Optional[str] = None, provider: str = "", model: str = ""):
+        self.kind = kind
+        self.text = text
+        self.usage = usage
+        self.finish_reason = finish_reason
+        self.provider = provider
+        self.model = model
+
+    @classmethod
+    def delta(cls, text: str) -> "StreamEvent":
+        return cls(DELTA, text=text)
+
+    @classmethod
+    def usage_of(cls, input_tokens: int, output_tokens: int) -> "StreamEvent":
+        return cls(USAGE, usage={"input_tokens": int(input_tokens or 0), "output_tokens": int(output_tokens or 0)})
+
+    @classmethod
+    def finish(cls, reason: str) -> "StreamEvent":
+        return cls(FINISH, finish_reason=(reason or "stop").lower())
+
+    @classmethod
+    def route(cls, provider: str, model: str) -> "StreamEvent":
+        return cls(ROUTE, provider=provider, model=model or "")
+
+    def __eq__(self, other):
+        if not isinstance(other, StreamEvent):
+            return NotImplemented
+        return (self.kind, self.text, self.usage, self.finish_reason, self.provider, self.model) == \
+            (other.kind, other.text, other.usage, other.finish_reason, other.provider, other.model)
+
+    def __repr__(self):
+        if self.kind == ROUTE:
+            value = f"{self.provider}/{self.model}"
+        else:
+            value = self.text if self.kind == DELTA else self.usage if self.kind == USAGE else self.finish_reason
+        return f"StreamEvent({self.kind}, {value!r})"
+
+
+def split_system(conversation_history: List[Dict[str, str]]) -> Tuple[str, List[Dict[str, str]]]:
+    """拆出系统提示，并合并相邻的同角色消息（Anthropic 与 Gemini 要求用户/助手交替）"""
+    system_parts, messages = [], []
+    for message in conversation_history:
+        role, content = message.get("role"), message.get("content") or ""
+        if role == "system":
+            system_parts.append(content)
+            continue
+        role = "assistant" if role == "assistant" else "user"
+        if messages and messages[-1]["role"] == role:
+            messages[-1]["content"] += "\n\n" + content
+        else:
+            messages.append({"role": role, "content": content})
+    return "\n\n".join(p for p in system_parts if p), messages
+
+
+class ChatClient:
+    """直连聊天客户端基类
+
+    子类提供 _stream_request()（URL、请求头与正文）与 _new_parser()（把一个 SSE data 解析为
+    StreamEvent 列表），这里负责传输、截止时间、请求统计与端点路由统计。接口与 OpenAIService 一致：
+    stream_events() / stream_response() / get_response()。
+    """
+
+    # 在 ai_provider、fallback_providers 与端点路由统计中使用的名称
+    name = "base"
+    provider_config_key = ""
+
+    def __init__(self, api_key: str = "", model: str = "", max_tokens: int = 500, temperature: float = 0.7):
+        self.api_key = api_key
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.logger = logging.getLogger(__name__)
+        self._session = None
+        try:
+            self.transport = create_transport(Config.get_transport_config()["transport"], self._get_session)
+        except Exception as e:
+            self.logger.warning(f"No HTTP transport available: {e}")
+            self.transport = None
+        self._metrics_lock = threading.Lock()
+        self.metrics = {"requests": 0, "errors": 0, "total_latency_ms": 0.0}
+
+    @classmethod
+    def from_config(cls):
+        """按当前配置创建"""
+        provider_config = Config.get_provider_config(cls.name)
+        openai_config = Config.get_openai_config()
+        return cls(provider_config.get("api_key", ""), provider_config.get("model", ""),
+                   openai_config.get("max_tokens", 500), openai_config.get("temperature", 0.7))
+
+    def _get_session(self):
+        if self._session is None:
+            requests = load_requests()
+            if requests is not None:
+                self._session = requests.Session()
+        return self._session
+
+    # ---- 子类实现 ----
+
+    @property
+    def endpoint(self) -> str:
+        raise NotImplementedError
+
+    def _stream_request(self, conversation_history, model: str) -> Tuple[str, Dict[str, str], bytes]:
+        raise NotImplementedError
+
+    def _new_parser(self):
+        raise NotImplementedError
+
+    def validate_api_key(self, allow_completion=False, cancel_token=None):
+        raise NotImplementedError
+
+    # ---- 统计 ----
+
+    def _record_request(self, started: float, ok: bool):
+        elapsed_ms = (time.monotonic() - started) * 1000.0
+        with self._metrics_lock:
+            self.metrics["requests"] += 1
+            self.metrics["total_latency_ms"] += elapsed_ms
+            if not ok:
+                self.metrics["errors"] += 1
+
+    def _record_endpoint(self, started: float, ok: bool):
+        endpoint_router.record(self.name, (time.monotonic() - started) * 1000.0, ok, self.endpoint)
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            snapshot = dict(self.metrics)
+        count = snapshot["requests"]
+        snapshot["avg_latency_ms"] = (snapshot["total_latency_ms"] / count) if count else 0.0
+        return snapshot
+
+    # ---- 请求 ----
+
+    def stream_events(self, conversation_history: List[Dict[str, str]], cancel_token=None,
+                      model: Optional[str] = None) -> Iterator[StreamEvent]:
+        """流式回答事件；首个分片与完整回答的截止时间与 OpenAIService 相同
+
+        model 为本轮使用的模型（分级路由），默认使用 self.model。
+        """
+        if self.transport is None:
+            raise RuntimeError("No HTTP transport available")
+        if not self.api_key:
+            raise TransportError("Invalid or missing API key")
+        if cancel_token is not None and cancel_token.is_cancelled:
+            return
+        settings = Config.get_hedging_config()
+        yield from hedged_stream(
+            lambda index, token: self._stream_once(conversation_history, model or self.model, token),
+            max_attempts=1,
+            first_token_timeout=settings["first_token_timeout"] or None,
+            total_timeout=settings["total_timeout"] or None,
+            cancel_token=cancel_token,
+        )
+
+    def _stream_once(self, conversation_history, model, cancel_token=None):
+        url, headers, body = self._stream_request(conversation_history, model)
+        started = time.monotonic()
+        try:
+            r = self.transport.stream(url, headers, body, timeout=60, cancel_token=cancel_token)
+        except CancelledError:
+            return
+        except Exception:
+            self._record_endpoint(started, False)
+            raise
+        with r:
+            self._record_request(started, r.status < 400)
+            if r.status >= 400:
+                self._record_endpoint(started, False)
+                raise TransportError(f"HTTP {r.status}: {r.read_text(300)}", r.status)
+            parser = self._new_parser()
+            first_delta = True
+            try:
+                for data in r.iter_events():
+                    if cancel_token is not None and cancel_token.is_cancelled:
+                        return
+                    for event in parser.feed(data):
+                        if first_delta and event.kind == DELTA:
+                            first_delta = False
+                            self._record_endpoint(started, True)
+                        yield event
+            except Exception:
+                if first_delta:
+                    self._record_endpoint(started, False)
+                raise
+
+    def stream_response(self, conversation_history: List[Dict[str, str]], cancel_token=None,
+                        model: Optional[str] = None) -> Iterator[str]:
+        """只产出文本分片"""
+        for event in self.stream_events(conversation_history, cancel_token=cancel_token, model=model):
+            if event.kind == DELTA:
+                yield event.text
+
+    def get_response(self, conversation_history: List[Dict[str, str]]):
+        """获取完整回复（内部仍走流式接口）"""
+        if not conversation_history:
+            return self._handle_api_error("Empty conversation history")
+        try:
+            content = "".join(self.stream_response(conversation_history))
+        except Exception as e:
+            return self._handle_api_error(str(e))
+        if not content:
+            return self._handle_api_error("Empty response from API")
+        return content.strip()
+
+    def warm_connection(self, timeout: float = 5.0) -> float:
+        """向端点源站发送 HEAD 请求以建立/保持连接，返回耗时（毫秒）"""
+        if self.transport is None:
+            raise RuntimeError("No HTTP transport available")
+        parsed = urlparse(self.endpoint)
+        started = time.monotonic()
+        self.transport.request("HEAD", f"{parsed.scheme}://{parsed.netloc}/", {}, None, timeout=timeout)
+        return (time.monotonic() - started) * 1000.0
+
+    def _handle_api_error(self, error_message: str):
+        self.logger.error(f"{self.name} API Error: {error_message}")
+        return f"AI服务暂时不可用: {error_message}"
+
+    def get_service_status(self):
+        return {
+            "provider": self.name,
+            "api_key_set": bool(self.api_key),
+            "transport": self.transport.name if self.transport is not None else None,
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature
+        }
+
+    def update_config(self, new_config):
+        """更新配置（接受 api_key/model，或带提供商前缀的键）"""
+        prefix = self.provider_config_key
+        for key in (f"{prefix}_api_key", "api_key"):
+            if key in new_config:
+                self.api_key = new_config[key]
+                break
+        for key in (f"{prefix}_model", "model"):
+            if key in new_config:
+                self.model = new_config[key]
+                break
+        if "max_tokens" in new_config:
+            self.max_tokens = new_config["max_tokens"]
+        if "temperature" in new_config:
+            self.temperature = new_config["temperature"]
+
+    def close(self):
+        if self.transport is not None:
+            try:
+                self.transport.close()
+            except Exception:
+                pass
+        if self._session is not None:
+            try:
+                self._session.close()
+            except Exception:
+                pass
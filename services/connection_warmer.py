@@ -0,0 +1,153 @@
+# 连接预热 - 复习开始时提前建立到 AI 端点的连接
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..config import Config
+    from .executor_service import PRIORITY_PREFETCH, executor
+    from .service_registry import ServiceRegistry
+except ImportError:
+    from config import Config
+    from services.executor_service import PRIORITY_PREFETCH, executor
+    from services.service_registry import ServiceRegistry
+
+
+class ConnectionWarmer:
+    """跟随复习生命周期预热并保持到配置端点的连接
+
+    进入复习或显示答案时，通过共享服务的连接池发送一次廉价的 HEAD 请求，
+    之后在服务器空闲超时之前定期刷新；长时间没有复习活动则停止刷新。
+    第一次（冷）请求包含 DNS/TCP/TLS 握手，之后的（热）请求只走已建立的连接，
+    两者之差即为预热为首次对话节省的时间。
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._in_flight = False
+        self._last_activity = 0.0
+        self._stats = {
+            "warm_count": 0,
+            "failures": 0,
+            "cold_handshake_ms": None,
+            "warm_request_ms": None,
+            "last_warmed_at": None,
+            "last_error": None,
+        }
+
+    # ---- Anki 钩子 ----
+
+    def on_state_change(self, new_state, old_state):
+        """gui_hooks.state_did_change：进入复习时预热，离开复习时停止刷新"""
+        if new_state == "review":
+            self.warm()
+        elif old_state == "review":
+            self.stop()
+
+    def on_reviewer_activity(self, card=None):
+        """gui_hooks.reviewer_did_show_question / reviewer_did_show_answer"""
+        self.warm()
+
+    # ---- 预热与刷新 ----
+
+    def warm(self):
+        """记录一次复习活动，并在需要时异步预热"""
+        config = Config.get_prewarm_config()
+        if not config.get("enabled", True):
+            return
+        with self._lock:
+            self._last_activity = time.monotonic()
+            if self._in_flight or self._timer is not None:
+                # 已有预热进行中或已安排刷新，连接仍然是热的
+                return
+            self._in_flight = True
+        executor.submit(self._warm_once, priority=PRIORITY_PREFETCH, group="prewarm", name="prewarm")
+
+    def _warm_once(self):
+        try:
+            adapter = ServiceRegistry.get_adapter()
+            service = getattr(adapter, "_service", None)
+            warm = getattr(service, "warm_connection", None)
+            if not callable(warm):
+                return
+            elapsed_ms = warm()
+            self._record_success(elapsed_ms)
+        except Exception as e:
+            with self._lock:
+                self._stats["failures"] += 1
+                self._stats["last_error"] = str(e)
+            self.logger.warning(f"Connection pre-warm failed: {e}")
+        finally:
+            with self._lock:
+                self._in_flight = False
+            self._schedule_refresh()
+
+    def _record_success(self, elapsed_ms: float):
+        with self._lock:
+            stats = self._stats
+            if stats["cold_handshake_ms"] is None:
+                stats["cold_handshake_ms"] = elapsed_ms
+            elif stats["warm_request_ms"] is None:
+                stats["warm_request_ms"] = elapsed_ms
+            else:
+                # 指数平滑，避免单次抖动影响估计
+                stats["warm_request_ms"] = stats["warm_request_ms"] * 0.8 + elapsed_ms * 0.2
+            stats["warm_count"] += 1
+            stats["last_warmed_at"] = time.time()
+            stats["last_error"] = None
+        if Config.is_debug_mode():
+            self.logger.info(f"Connection pre-warmed in {elapsed_ms:.1f} ms")
+
+    def _schedule_refresh(self):
+        """在服务器空闲超时之前安排下一次刷新"""
+        config = Config.get_prewarm_config()
+        refresh_seconds = max(5, int(config.get("refresh_seconds", 45)))
+        idle_stop_seconds = int(config.get("idle_stop_seconds", 600))
+        with self._lock:
+            self._timer = None
+            idle_for = time.monotonic() - self._last_activity
+            if not config.get("enabled", True) or idle_for >= idle_stop_seconds:
+                return
+            # 计时器只负责等待，刷新请求本身交给共享执行器
+            timer = threading.Timer(refresh_seconds, self._submit_refresh)
+            timer.daemon = True
+            self._timer = timer
+        timer.start()
+
+    def _submit_refresh(self):
+        executor.submit(self._refresh, priority=PRIORITY_PREFETCH, group="prewarm", name="prewarm-refresh")
+
+    def _refresh(self):
+        with self._lock:
+            self._timer = None
+            if self._in_flight:
+                return
+            self._in_flight = True
+        self._warm_once()
+
+    def stop(self):
+        """停止定期刷新（连接留在池中，由服务器自然关闭）"""
+        with self._lock:
+            timer = self._timer
+            self._timer = None
+        if timer is not None:
+            timer.cancel()
+        executor.cancel_group("prewarm")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预热统计：冷握手耗时、热请求耗时以及估算节省的时间"""
+        with self._lock:
+            stats = dict(self._stats)
+        cold = stats.get("cold_handshake_ms")
+        warm = stats.get("warm_request_ms")
+        stats["estimated_saving_ms"] = (cold - warm) if (cold is not None and warm is not None) else None
+        return stats
+
+
+# 插件级单例
+connection_warmer = ConnectionWarmer()
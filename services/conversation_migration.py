@@ -0,0 +1,181 @@
+# 已保存对话的批量压缩迁移 - 把内联样式的对话块改写为短类名
+
+import logging
+import re
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..utils.html_text import html_to_text
+    from . import conversation_style as cs
+except ImportError:
+    from utils.html_text import html_to_text
+    from services import conversation_style as cs
+
+# 字段分隔符（Anki notes.flds）
+FIELD_SEPARATOR = "\x1f"
+
+# 旧格式中各元素的完整开始标签 → 类名格式（只改写与插件输出逐字相同的标签，用户自己的样式不动）
+_WRAPPER_STYLE = "margin:0 0 {margin} 0;padding:12px 16px;border:1px solid #e5e7eb;text-align:left;line-height:1.2;display:block;"
+_WRAPPERS = {
+    f'<{tag} style="{_WRAPPER_STYLE.format(margin=margin)}">': (tag, f'<{tag} class="{cs.CLASS_BLOCK} {role}">')
+    for tag in ("div", "p")
+    for margin, role in (("8px", cs.CLASS_QUESTION), ("16px", cs.CLASS_ANSWER))
+}
+_LABELS = {
+    '<span style="color:#2563eb;font-weight:600;">': f'<span class="{cs.CLASS_LABEL}">',
+    '<span style="color:#059669;font-weight:600;">': f'<span class="{cs.CLASS_LABEL}">',
+}
+_INNER_TAGS = {f'<{tag} style="{style}">': f"<{tag}>" for tag, style in cs.INLINE_STYLES.items()}
+
+_WRAPPER_RE = re.compile("|".join(re.escape(t) for t in _WRAPPERS))
+_INNER_RE = re.compile("|".join(re.escape(t) for t in list(_LABELS) + list(_INNER_TAGS)))
+_TAG_RE = re.compile(r"<\s*(/?)\s*([a-zA-Z][a-zA-Z0-9]*)[^>]*>")
+
+# 候选笔记的 SQL 过滤条件（只需命中插件输出的特征片段，精确判断在 Python 中完成）
+_CANDIDATE_PATTERNS = (
+    "%padding:12px 16px;border:1px solid #e5e7eb%",
+    "%" + cs.INLINE_SEPARATOR + "%",
+)
+_CANDIDATE_WHERE = " or ".join("flds like ?" for _ in _CANDIDATE_PATTERNS)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def compact_conversation_html(html: str) -> str:
+    """把字段中由插件生成的内联样式对话块改写为短类名格式，其余内容保持不变"""
+    if not html:
+        return html
+    html = html.replace(cs.INLINE_SEPARATOR, cs.CLASS_SEPARATOR_HTML)
+
+    out: List[str] = []
+    pos = 0
+    for match in _WRAPPER_RE.finditer(html):
+        if match.start() < pos:
+            continue
+        tag, replacement = _WRAPPERS[match.group(0)]
+        # 插件输出的包装块内不嵌套同名标签（div 已去除、纯文本已转义），下一个结束标签即为块尾
+        end = html.find(f"</{tag}>", match.end())
+        end = len(html) if end < 0 else end
+        body = _INNER_RE.sub(lambda m: _LABELS.get(m.group(0)) or _INNER_TAGS[m.group(0)], html[match.end():end])
+        out.append(html[pos:match.start()])
+        out.append(replacement)
+        out.append(body)
+        pos = end
+    out.append(html[pos:])
+    return "".join(out)
+
+
+def _tag_skeleton(html: str) -> List[Tuple[str, str]]:
+    return [(m.group(1), m.group(2).lower()) for m in _TAG_RE.finditer(html)]
+
+
+def is_equivalent(original: str, compacted: str) -> bool:
+    """验证改写前后渲染等价：标签结构一致（只改了属性）且提取出的文本一致"""
+    if original == compacted:
+        return True
+    return (
+        _tag_skeleton(original) == _tag_skeleton(compacted)
+        and html_to_text(original) == html_to_text(compacted)
+    )
+
+
+class ConversationMigrator:
+    """在集合中查找含旧格式对话块的笔记并压缩
+
+    按笔记 id 分页流式读取（每批 batch_size 条），只为需要改写的笔记加载 Note 对象，
+    处理完一批即写入并释放，内存占用与集合大小无关。
+    run() 应在 CollectionOp 的后台线程中调用，全部写入合并为一个撤销步骤。
+    """
+
+    UNDO_NAME = "Compact AI conversations"
+
+    def __init__(self, col, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.col = col
+        self.batch_size = max(1, int(batch_size))
+        self.logger = logging.getLogger(__name__)
+
+    def count_candidates(self) -> int:
+        return int(self.col.db.scalar(f"select count() from notes where {_CANDIDATE_WHERE}", *_CANDIDATE_PATTERNS) or 0)
+
+    def iter_candidate_batches(self) -> Iterator[List[Tuple[int, int, str]]]:
+        """按 id 分页返回 [(note_id, notetype_id, flds), ...]"""
+        last_id = 0
+        while True:
+            rows = self.col.db.all(
+                f"select id, mid, flds from notes where id > ? and ({_CANDIDATE_WHERE}) order by id limit ?",
+                last_id, *_CANDIDATE_PATTERNS, self.batch_size,
+            )
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    def run(self, progress: Optional[Callable[[int, int], None]] = None, should_cancel: Optional[Callable[[], bool]] = None):
+        """执行迁移，返回 (OpChanges 或 None, 报告)"""
+        report: Dict[str, Any] = {
+            "scanned": 0, "changed": 0, "skipped": 0,
+            "bytes_before": 0, "bytes_after": 0, "cancelled": False, "elapsed_ms": 0.0,
+        }
+        started = time.perf_counter()
+        total = self.count_candidates()
+        undo_entry = self.col.add_custom_undo_entry(self.UNDO_NAME) if total else None
+        styled_notetypes = set()
+        changes = None
+
+        for rows in self.iter_candidate_batches():
+            if should_cancel and should_cancel():
+                report["cancelled"] = True
+                break
+            updated = []
+            for note_id, notetype_id, flds in rows:
+                report["scanned"] += 1
+                fields = flds.split(FIELD_SEPARATOR)
+                compacted = [compact_conversation_html(f) for f in fields]
+                if compacted == fields:
+                    continue
+                if not all(is_equivalent(a, b) for a, b in zip(fields, compacted)):
+                    report["skipped"] += 1
+                    self.logger.warning(f"Skipped note {note_id}: compacted HTML is not equivalent")
+                    continue
+                if notetype_id not in styled_notetypes:
+                    notetype = self.col.models.get(notetype_id)
+                    if not notetype or not cs.ensure_stylesheet(self.col, notetype):
+                        report["skipped"] += 1
+                        continue
+                    styled_notetypes.add(notetype_id)
+                note = self.col.get_note(note_id)
+                note.fields[:] = compacted
+                updated.append(note)
+                report["changed"] += 1
+                report["bytes_before"] += len(flds.encode("utf-8"))
+                report["bytes_after"] += len(FIELD_SEPARATOR.join(compacted).encode("utf-8"))
+            if updated:
+                self.col.update_notes(updated)
+                changes = self.col.merge_undo_entries(undo_entry)
+            if progress:
+                progress(report["scanned"], total)
+
+        report["bytes_saved"] = report["bytes_before"] - report["bytes_after"]
+        report["elapsed_ms"] = (time.perf_counter() - started) * 1000
+        self.logger.info(f"Conversation migration finished: {report}")
+        if changes is None and undo_entry is not None:
+            changes = self.col.merge_undo_entries(undo_entry)
+        return changes, report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """把迁移报告格式化为多行文本"""
+    lines = [
+        f"Notes scanned: {report.get('scanned', 0):,}",
+        f"Notes compacted: {report.get('changed', 0):,}",
+    ]
+    if report.get("skipped"):
+        lines.append(f"Notes skipped (not equivalent): {report['skipped']:,}")
+    before, after = report.get("bytes_before", 0), report.get("bytes_after", 0)
+    if before:
+        lines.append(f"Size: {before:,} → {after:,} bytes (saved {before - after:,} bytes, {100 * (before - after) / before:.0f}%)")
+    if report.get("cancelled"):
+        lines.append("Cancelled: notes processed before cancelling stay compacted (undo reverts them).")
+    return "\n".join(lines)
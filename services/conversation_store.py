@@ -0,0 +1,456 @@
+# 对话存储 - 插件自管理的 SQLite 数据库（保存在 user_files 下，按 Anki 配置档分库）
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..config import Config
+    from ..utils.helpers import get_profile_file_suffix, get_user_files_dir
+    from ..utils.search_text import build_fts_query, make_snippet, prepare_fts_text, tokenize
+except ImportError:
+    from config import Config
+    from utils.helpers import get_profile_file_suffix, get_user_files_dir
+    from utils.search_text import build_fts_query, make_snippet, prepare_fts_text, tokenize
+
+STORE_FILENAME = "conversations{suffix}.db"
+
+# 字段中的引用标记：只保留一行提示，完整对话在复习时按需展开
+REF_CLASS = "cwc-ref"
+_REF_RE = re.compile(r'<div class="cwc-ref" data-cwc-id="(\d+)">(.*?)</div>', re.DOTALL)
+
+# 数据库结构版本（PRAGMA user_version），按版本号逐步升级
+SCHEMA_VERSION = 2
+
+# 对话轮次正文编码：0 为 UTF-8 原文，1 为 zlib 压缩（短消息压缩收益不大，不压缩）
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+COMPRESS_MIN_BYTES = 128
+
+
+def _encode_body(content: str) -> Tuple[int, bytes]:
+    raw = (content or "").encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return CODEC_ZLIB, packed
+    return CODEC_RAW, raw
+
+
+def _decode_body(codec: int, body: bytes) -> str:
+    if codec == CODEC_ZLIB:
+        body = zlib.decompress(body)
+    return bytes(body).decode("utf-8")
+
+
+def make_reference(transcript_id: int, turns: int = 0) -> str:
+    """生成写入笔记字段的引用标记（未安装插件的客户端只显示提示文字）"""
+    label = f"AI conversation ({turns} turns)" if turns else "AI conversation"
+    return f'<div class="{REF_CLASS}" data-cwc-id="{int(transcript_id)}">💬 {label}</div>'
+
+
+def find_references(html: str) -> List[int]:
+    return [int(m.group(1)) for m in _REF_RE.finditer(html or "")]
+
+
+def expand_references(html: str, render) -> str:
+    """把字段中的引用标记替换为 render(transcript_id, label_html) 的结果"""
+    if not html or REF_CLASS not in html:
+        return html
+    return _REF_RE.sub(lambda m: render(int(m.group(1)), m.group(2)), html)
+
+
+class ConversationStore:
+    """对话存储
+
+    transcripts 表按笔记 id 保存保存到卡片的完整对话（HTML 与纯文本），
+    纯文本进入全文索引（SQLite 不支持 FTS5 时退回 LIKE 查询）。
+    turns 表按卡片 id 逐条保存聊天窗口中的对话轮次（正文压缩），用于重新打开卡片时恢复对话；
+    轮次写入时同步进入无内容（contentless）全文索引 turns_fts，CJK 文本按二元组切分后索引。
+    连接以 WAL 模式打开，每次写入单独提交；可在后台线程与主线程之间共享（内部加锁）。
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self.has_fts = False
+        self.has_turns_fts = False
+        self._configure()
+        self._migrate()
+
+    # ---- 连接与结构 ----
+
+    def _configure(self):
+        with self._lock:
+            # 新建的数据库使用增量 vacuum（必须在建表之前设置）
+            if self._conn.execute("select count() from sqlite_master").fetchone()[0] == 0:
+                self._conn.execute("pragma auto_vacuum = incremental")
+            if self.path != ":memory:":
+                self._conn.execute("pragma journal_mode = wal")
+            self._conn.execute("pragma synchronous = normal")
+            self._conn.execute("pragma foreign_keys = on")
+
+    def _migrate(self):
+        with self._lock:
+            version = self._conn.execute("pragma user_version").fetchone()[0]
+            if version < 1:
+                with self.transaction():
+                    self._conn.execute(
+                        "create table if not exists transcripts ("
+                        " id integer primary key,"
+                        " note_id integer not null,"
+                        " card_id integer,"
+                        " created real not null,"
+                        " turns integer not null default 0,"
+                        " html text not null,"
+                        " text text not null)"
+                    )
+                    self._conn.execute("create index if not exists ix_transcripts_note on transcripts(note_id)")
+                    self._conn.execute("pragma user_version = 1")
+            if version < 2:
+                with self.transaction():
+                    self._conn.execute(
+                        "create table if not exists turns ("
+                        " id integer primary key,"
+                        " card_id integer not null,"
+                        " note_id integer not null,"
+                        " created real not null,"
+                        " role text not null,"
+                        " codec integer not null,"
+                        " body blob not null,"
+                        " saved integer not null default 0)"
+                    )
+                    self._conn.execute("create index if not exists ix_turns_card on turns(card_id, id)")
+                    self._conn.execute("create index if not exists ix_turns_note on turns(note_id)")
+                    self._conn.execute("create index if not exists ix_turns_created on turns(created)")
+                    self._conn.execute("pragma user_version = 2")
+            self.has_fts = self._ensure_fts()
+            self.has_turns_fts = self._ensure_turns_fts()
+
+    def _ensure_turns_fts(self) -> bool:
+        """创建对话轮次的全文索引：只保存倒排索引，不保存正文（片段由 Python 从 turns 生成）"""
+        try:
+            with self.transaction():
+                exists = self._conn.execute(
+                    "select count() from sqlite_master where name = 'turns_fts'"
+                ).fetchone()[0]
+                if exists:
+                    return True
+                self._conn.execute("create virtual table turns_fts using fts5(text, content='')")
+                # 为建索引之前已保存的轮次补建索引
+                for row in self._conn.execute("select id, codec, body from turns").fetchall():
+                    self._index_turn_locked(row["id"], _decode_body(row["codec"], row["body"]))
+            return True
+        except sqlite3.OperationalError as e:
+            self.logger.info(f"FTS5 not available, conversation turn search scans stored turns: {e}")
+            return False
+
+    def _index_turn_locked(self, turn_id: int, content: str):
+        self._conn.execute("insert into turns_fts (rowid, text) values (?, ?)", (turn_id, prepare_fts_text(content)))
+
+    def _unindex_turns_locked(self, rows):
+        """从无内容索引中删除轮次（需要提供原始文本）"""
+        for row in rows:
+            self._conn.execute(
+                "insert into turns_fts (turns_fts, rowid, text) values ('delete', ?, ?)",
+                (row["id"], prepare_fts_text(_decode_body(row["codec"], row["body"]))),
+            )
+
+    def _delete_turns_locked(self, where: str, args) -> int:
+        if self.has_turns_fts:
+            rows = self._conn.execute(f"select id, codec, body from turns where {where}", args).fetchall()
+            self._unindex_turns_locked(rows)
+        return self._conn.execute(f"delete from turns where {where}", args).rowcount
+
+    def _ensure_fts(self) -> bool:
+        """创建 transcripts 的全文索引（外部内容表，由触发器同步）"""
+        try:
+            with self.transaction():
+                self._conn.execute(
+                    "create virtual table if not exists transcripts_fts using fts5("
+                    " text, content='transcripts', content_rowid='id')"
+                )
+                self._conn.execute(
+                    "create trigger if not exists transcripts_ai after insert on transcripts begin"
+                    " insert into transcripts_fts(rowid, text) values (new.id, new.text); end"
+                )
+                self._conn.execute(
+                    "create trigger if not exists transcripts_ad after delete on transcripts begin"
+                    " insert into transcripts_fts(transcripts_fts, rowid, text) values ('delete', old.id, old.text); end"
+                )
+            return True
+        except sqlite3.OperationalError as e:
+            self.logger.info(f"FTS5 not available, conversation search falls back to LIKE: {e}")
+            return False
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception as e:
+                self.logger.error(f"Error closing conversation store: {e}")
+
+    # ---- transcripts ----
+
+    def add_transcript(self, note_id: int, html: str, text: str, card_id: Optional[int] = None, turns: int = 0) -> int:
+        """保存一段对话，返回其 id（写入字段的引用标记使用该 id）"""
+        with self._lock, self.transaction():
+            cursor = self._conn.execute(
+                "insert into transcripts (note_id, card_id, created, turns, html, text) values (?, ?, ?, ?, ?, ?)",
+                (int(note_id), card_id, time.time(), int(turns), html, text),
+            )
+            return int(cursor.lastrowid)
+
+    def get_transcript(self, transcript_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("select * from transcripts where id = ?", (int(transcript_id),)).fetchone()
+        return dict(row) if row else None
+
+    def get_note_transcripts(self, note_id: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "select * from transcripts where note_id = ? order by id", (int(note_id),)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def delete_note_transcripts(self, note_id: int) -> int:
+        with self._lock, self.transaction():
+            return self._conn.execute("delete from transcripts where note_id = ?", (int(note_id),)).rowcount
+
+    def search_transcripts(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """全文搜索已保存的对话，返回 [{"id", "note_id", "card_id", "created"}]（新的在前）"""
+        query = (query or "").strip()
+        if not query:
+            return []
+        with self._lock:
+            if self.has_fts:
+                # 每个词按短语匹配，避免用户输入被当作 FTS 语法
+                match = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+                rows = self._conn.execute(
+                    "select t.id, t.note_id, t.card_id, t.created from transcripts_fts f"
+                    " join transcripts t on t.id = f.rowid where transcripts_fts match ?"
+                    " order by t.id desc limit ?",
+                    (match, int(limit)),
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "select id, note_id, card_id, created from transcripts where text like ? order by id desc limit ?",
+                    (f"%{query}%", int(limit)),
+                ).fetchall()
+        return [dict(r) for r in rows]
+
+    # ---- turns ----
+
+    def append_turn(self, card_id: int, note_id: int, role: str, content: str) -> int:
+        """追加一条完成的对话轮次（单独提交），返回其 id"""
+        codec, body = _encode_body(content)
+        with self._lock, self.transaction():
+            cursor = self._conn.execute(
+                "insert into turns (card_id, note_id, created, role, codec, body) values (?, ?, ?, ?, ?, ?)",
+                (int(card_id), int(note_id or 0), time.time(), role, codec, body),
+            )
+            turn_id = int(cursor.lastrowid)
+            if self.has_turns_fts:
+                self._index_turn_locked(turn_id, content)
+            return turn_id
+
+    def load_turns(self, card_id: int, before_id: Optional[int] = None, limit: int = 20) -> Tuple[List[Dict[str, Any]], bool]:
+        """按时间顺序返回某卡片最近的 limit 条轮次（before_id 给出时只取更早的），以及是否还有更早的轮次"""
+        sql = "select id, role, codec, body, created, saved from turns where card_id = ?"
+        args: List[Any] = [int(card_id)]
+        if before_id is not None:
+            sql += " and id < ?"
+            args.append(int(before_id))
+        sql += " order by id desc limit ?"
+        args.append(int(limit) + 1)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        has_more = len(rows) > limit
+        turns = [
+            {
+                "id": row["id"],
+                "role": row["role"],
+                "content": _decode_body(row["codec"], row["body"]),
+                "created": row["created"],
+                "saved": bool(row["saved"]),
+            }
+            for row in reversed(rows[:limit])
+        ]
+        return turns, has_more
+
+    def mark_turns_saved(self, card_id: int, up_to_id: int) -> int:
+        """标记某卡片 id 不大于 up_to_id 的轮次已保存到卡片"""
+        with self._lock, self.transaction():
+            return self._conn.execute(
+                "update turns set saved = 1 where card_id = ? and id <= ? and saved = 0", (int(card_id), int(up_to_id))
+            ).rowcount
+
+    def delete_card_turns(self, card_id: int) -> int:
+        with self._lock, self.transaction():
+            return self._delete_turns_locked("card_id = ?", (int(card_id),))
+
+    def count_turns(self, card_id: Optional[int] = None) -> int:
+        with self._lock:
+            if card_id is None:
+                return self._conn.execute("select count() from turns").fetchone()[0]
+            return self._conn.execute("select count() from turns where card_id = ?", (int(card_id),)).fetchone()[0]
+
+    def search_turns(self, query: str, limit: int = 50, snippet_width: int = 160,
+                     marker=("[", "]")) -> List[Dict[str, Any]]:
+        """全文搜索对话轮次，按 BM25 相关度排序
+
+        返回 [{"turn_id", "card_id", "note_id", "role", "created", "saved", "score", "snippet"}]，
+        snippet 中命中的查询词用 marker 标出。
+        """
+        match = build_fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            if self.has_turns_fts:
+                rows = self._conn.execute(
+                    "select t.id, t.card_id, t.note_id, t.role, t.created, t.saved, t.codec, t.body,"
+                    " bm25(turns_fts) as score"
+                    " from turns_fts join turns t on t.id = turns_fts.rowid"
+                    " where turns_fts match ? order by score limit ?",
+                    (match, int(limit)),
+                ).fetchall()
+                hits = [(row, _decode_body(row["codec"], row["body"]), row["score"]) for row in rows]
+            else:
+                hits = self._scan_turns_locked(query, limit)
+        return [
+            {
+                "turn_id": row["id"],
+                "card_id": row["card_id"],
+                "note_id": row["note_id"],
+                "role": row["role"],
+                "created": row["created"],
+                "saved": bool(row["saved"]),
+                "score": score,
+                "snippet": make_snippet(content, query, snippet_width, marker),
+            }
+            for row, content, score in hits
+        ]
+
+    def _scan_turns_locked(self, query: str, limit: int):
+        """不支持 FTS5 时的退路：逐条解压比对（只在最近的轮次中查找）"""
+        terms = set(tokenize(query))
+        hits = []
+        for row in self._conn.execute(
+            "select id, card_id, note_id, role, created, saved, codec, body from turns order by id desc limit 20000"
+        ):
+            content = _decode_body(row["codec"], row["body"])
+            tokens = tokenize(content)
+            if terms and terms.issubset(tokens):
+                hits.append((row, content, -float(sum(tokens.count(t) for t in terms))))
+                if len(hits) >= limit:
+                    break
+        hits.sort(key=lambda h: h[2])
+        return hits
+
+    # ---- 保留策略与空间回收 ----
+
+    def apply_retention(self, max_turns_per_card: int = 0, max_age_days: float = 0) -> int:
+        """删除超过期限的轮次，以及每张卡片超出上限的最早轮次；0 表示不限制。返回删除条数"""
+        deleted = 0
+        with self._lock, self.transaction():
+            if max_age_days and max_age_days > 0:
+                cutoff = time.time() - float(max_age_days) * 86400
+                deleted += self._delete_turns_locked("created < ?", (cutoff,))
+            if max_turns_per_card and max_turns_per_card > 0:
+                cards = self._conn.execute(
+                    "select card_id from turns group by card_id having count() > ?", (int(max_turns_per_card),)
+                ).fetchall()
+                for (card_id,) in cards:
+                    deleted += self._delete_turns_locked(
+                        "card_id = ? and id not in (select id from turns where card_id = ? order by id desc limit ?)",
+                        (card_id, card_id, int(max_turns_per_card)),
+                    )
+        return deleted
+
+    def vacuum(self):
+        """回收空闲页：增量模式下只释放空闲页，否则转换为增量模式并整理一次"""
+        with self._lock:
+            mode = self._conn.execute("pragma auto_vacuum").fetchone()[0]
+            if mode == 2:
+                # execute() 每次只释放一页，executescript 会把该语句执行完
+                self._conn.executescript("pragma incremental_vacuum;")
+            else:
+                self._conn.execute("pragma auto_vacuum = incremental")
+                self._conn.execute("vacuum")
+            if self.path != ":memory:":
+                self._conn.execute("pragma wal_checkpoint(truncate)").fetchall()
+
+    def maintain(self, max_turns_per_card: int = 0, max_age_days: float = 0) -> Dict[str, int]:
+        """执行保留策略，有可回收空间时 vacuum"""
+        deleted = self.apply_retention(max_turns_per_card, max_age_days)
+        with self._lock:
+            free_pages = self._conn.execute("pragma freelist_count").fetchone()[0]
+        if deleted or free_pages:
+            self.vacuum()
+        return {"deleted": deleted, "free_pages": free_pages}
+
+
+class _Transaction:
+    """显式事务（连接工作在自动提交模式，嵌套时只有最外层提交）"""
+
+    def __init__(self, store: ConversationStore):
+        self.store = store
+        self.outer = False
+
+    def __enter__(self):
+        self.store._lock.acquire()
+        conn = self.store._conn
+        self.outer = not conn.in_transaction
+        if self.outer:
+            conn.execute("begin immediate")
+        return conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.outer:
+                self.store._conn.execute("rollback" if exc_type else "commit")
+        finally:
+            self.store._lock.release()
+        return False
+
+
+_stores: Dict[str, ConversationStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """获取当前 Anki 配置档的对话存储（笔记 id 只在同一集合内唯一，因此按配置档分库）"""
+    suffix = get_profile_file_suffix()
+    with _stores_lock:
+        store = _stores.get(suffix)
+        if store is None:
+            path = os.path.join(get_user_files_dir(), STORE_FILENAME.format(suffix=suffix))
+            store = ConversationStore(path)
+            _stores[suffix] = store
+        return store
+
+
+def close_conversation_stores():
+    """执行保留策略后关闭所有已打开的对话存储（配置档关闭时调用）"""
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    history = Config.get_conversation_history_config()
+    for store in stores:
+        try:
+            store.maintain(history["max_turns_per_card"], history["max_age_days"])
+        except Exception as e:
+            logging.error(f"Error maintaining conversation store: {e}")
+        store.close()
@@ -0,0 +1,105 @@
+# 保存到卡片的对话样式 - 短类名 + 笔记类型样式表
+
+import logging
+import re
+from typing import Any, Dict
+
+# 保存模式："inline" 每个元素写内联 style（旧格式）；"class" 只写短类名，样式表装入笔记类型 CSS
+STYLE_MODE_INLINE = "inline"
+STYLE_MODE_CLASS = "class"
+
+# 笔记类型 CSS 中样式表的起止标记（用于检测、更新与移除）
+STYLESHEET_BEGIN = "/* chat-with-card:begin */"
+STYLESHEET_END = "/* chat-with-card:end */"
+
+# 块包装类名：cwc 公共样式，cwc-q 提问，cwc-a 回答，cwc-l 标签，cwc-sep 对话分隔线
+CLASS_BLOCK = "cwc"
+CLASS_QUESTION = "cwc-q"
+CLASS_ANSWER = "cwc-a"
+CLASS_LABEL = "cwc-l"
+CLASS_SEPARATOR = "cwc-sep"
+
+# 与内联格式逐项等价的样式表（内部元素通过后代选择器命中，无需类名）
+STYLESHEET = "\n".join([
+    STYLESHEET_BEGIN,
+    ".cwc{margin:0 0 16px 0;padding:12px 16px;border:1px solid #e5e7eb;text-align:left;line-height:1.2;display:block}",
+    ".cwc-q{margin-bottom:8px}",
+    ".cwc-l{font-weight:600}",
+    ".cwc-q>.cwc-l{color:#2563eb}",
+    ".cwc-a>.cwc-l{color:#059669}",
+    ".cwc h3{color:#333;font-weight:600;line-height:1.2;margin:0;padding:0;text-align:left;font-size:1.2rem;display:block}",
+    ".cwc ul,.cwc ol{margin:0;padding:0 0 0 1.5rem;text-align:left;display:block}",
+    ".cwc li{margin:0;padding:0;text-align:left;display:list-item}",
+    ".cwc p{margin:0;padding:0;text-align:left;line-height:1.2;display:block}",
+    ".cwc strong{font-weight:600;color:#333}",
+    ".cwc code{background-color:#f3f4f6;color:#dc2626;padding:2px 4px;border-radius:3px;font-family:monospace;font-size:.875em}",
+    "hr.cwc-sep{margin:6px 0;padding:0;border:none;border-top:1px solid #e5e7eb}",
+    STYLESHEET_END,
+])
+
+# 内联模式下各元素的样式（与历史输出保持一致）
+INLINE_STYLES = {
+    "h3": "color:#333333;font-weight:600;line-height:1.2;margin:0;padding:0;text-align:left;font-size:1.2rem;display:block;",
+    "ul": "margin:0;padding:0 0 0 1.5rem;text-align:left;display:block;",
+    "ol": "margin:0;padding:0 0 0 1.5rem;text-align:left;display:block;",
+    "li": "margin:0;padding:0;text-align:left;display:list-item;",
+    "p": "margin:0;padding:0;text-align:left;line-height:1.2;display:block;",
+    "strong": "font-weight:600;color:#333333;",
+    "code": "background-color:#f3f4f6;color:#dc2626;padding:2px 4px;border-radius:3px;font-family:monospace;font-size:0.875em;",
+}
+INLINE_SEPARATOR = "<hr style=\"margin: 6px 0; padding: 0; border: none; border-top: 1px solid #e5e7eb;\">"
+CLASS_SEPARATOR_HTML = f"<hr class=\"{CLASS_SEPARATOR}\">"
+
+_STYLESHEET_RE = re.compile(re.escape(STYLESHEET_BEGIN) + r".*?" + re.escape(STYLESHEET_END), re.DOTALL)
+_HEADING_OPEN_RE = re.compile(r"<h[1-6]\b[^>]*>")
+_HEADING_CLOSE_RE = re.compile(r"</h[1-6]>")
+
+
+def normalize_mode(mode: Any) -> str:
+    return STYLE_MODE_CLASS if str(mode or "").strip().lower() == STYLE_MODE_CLASS else STYLE_MODE_INLINE
+
+
+def style_markdown_html(html: str, mode: str) -> str:
+    """规范化 Markdown 渲染结果：标题统一为 h3，内联模式为每个元素写 style，类名模式去掉所有属性"""
+    html = _HEADING_OPEN_RE.sub("<h3>", html)
+    html = _HEADING_CLOSE_RE.sub("</h3>", html)
+    for tag, style in INLINE_STYLES.items():
+        replacement = f"<{tag} style=\"{style}\">" if mode == STYLE_MODE_INLINE else f"<{tag}>"
+        html = re.sub(rf"<{tag}\b[^>]*>", replacement, html)
+    return html
+
+
+def separator_html(mode: str) -> str:
+    return CLASS_SEPARATOR_HTML if mode == STYLE_MODE_CLASS else INLINE_SEPARATOR
+
+
+def has_stylesheet(css: str) -> bool:
+    match = _STYLESHEET_RE.search(css or "")
+    return bool(match) and match.group(0) == STYLESHEET
+
+
+def merge_stylesheet(css: str) -> str:
+    """返回装入（或更新为当前版本）样式表后的 CSS；其余用户样式保持不变"""
+    css = css or ""
+    if _STYLESHEET_RE.search(css):
+        return _STYLESHEET_RE.sub(lambda _m: STYLESHEET, css, count=1)
+    separator = "" if not css or css.endswith("\n\n") else ("\n" if css.endswith("\n") else "\n\n")
+    return f"{css}{separator}{STYLESHEET}\n"
+
+
+def ensure_stylesheet(col, notetype: Dict[str, Any]) -> bool:
+    """确保笔记类型 CSS 中含有当前样式表，已存在时不写数据库；失败返回 False"""
+    try:
+        if has_stylesheet(notetype.get("css", "")):
+            return True
+        notetype["css"] = merge_stylesheet(notetype.get("css", ""))
+        models = col.models
+        if hasattr(models, "update_dict"):
+            models.update_dict(notetype)
+        else:
+            models.save(notetype)
+        logging.info(f"Installed conversation stylesheet into note type '{notetype.get('name', '')}'")
+        return True
+    except Exception as e:
+        logging.error(f"Error installing conversation stylesheet: {e}")
+        return False
@@ -0,0 +1,491 @@
+# 向量存储 - 笔记嵌入向量以 float32 矩阵写入磁盘并内存映射，用于语义检索相关卡片
+
+import base64
+import heapq
+import json
+import logging
+import mmap
+import os
+import threading
+from array import array
+from operator import mul
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..utils.helpers import get_profile_file_suffix, get_user_files_dir
+    from .executor_service import PRIORITY_BULK, executor
+    from .related_cards import iter_note_batches, note_text
+    from .transport import load_requests
+except ImportError:
+    from utils.helpers import get_profile_file_suffix, get_user_files_dir
+    from services.executor_service import PRIORITY_BULK, executor
+    from services.related_cards import iter_note_batches, note_text
+    from services.transport import load_requests
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STORE_DIRNAME = "embeddings{suffix}"
+DEFAULT_EMBEDDINGS_URL = "https://api.openai.com/v1/embeddings"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+
+# 一次请求最多嵌入的文本数、每段文本最多字符数
+EMBED_BATCH_SIZE = 64
+MAX_EMBED_CHARS = 8000
+
+# NumPy 路径每次参与矩阵乘法的行数（限制临时数组大小）
+SEARCH_BLOCK_ROWS = 8192
+
+# 墓碑行超过总行数的该比例时压缩
+COMPACT_RATIO = 0.2
+
+# 侧车文件中墓碑行的 id（笔记 id 总是正数）
+TOMBSTONE = 0
+
+
+def _normalize(vector: Sequence[float]) -> array:
+    """转为单位长度的 float32 数组，之后点积即余弦相似度"""
+    vec = array("f", vector)
+    norm = sum(v * v for v in vec) ** 0.5
+    if norm > 0:
+        vec = array("f", (v / norm for v in vec))
+    return vec
+
+
+class EmbeddingStore:
+    """内存映射的 float32 向量矩阵 + int64 笔记 id 侧车文件
+
+    目录结构：meta.json 记录维度、模型、水位（及修改时间恰为水位、已经嵌入的笔记 id）和当前代号 gen；vectors-<gen>.f32 为按行存放的
+    向量（已归一化），ids-<gen>.bin 为每行对应的笔记 id。追加直接写到文件末尾；删除只把侧车中的
+    id 改为 0（墓碑）；compact() 把存活行复制到新一代文件后切换 meta.json，不会留下不一致的文件对。
+    向量不读入 Python 对象，查询时通过 mmap 分块计算点积。
+    """
+
+    def __init__(self, directory: str, dim: Optional[int] = None, model: str = ""):
+        self.directory = directory
+        self.logger = logging.getLogger(__name__ + ".EmbeddingStore")
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self.meta = {"dim": dim, "model": model, "gen": 0, "watermark": 0}
+        meta_path = self._meta_path()
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta.update(json.load(f))
+        self.ids = array("q")
+        self.rows: Dict[int, int] = {}
+        self.tombstones = 0
+        self._mmap: Optional[mmap.mmap] = None
+        self._vectors_file = None
+        self._load()
+
+    # ---- 文件 ----
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _vectors_path(self, gen: Optional[int] = None) -> str:
+        return os.path.join(self.directory, f"vectors-{self.meta['gen'] if gen is None else gen}.f32")
+
+    def _ids_path(self, gen: Optional[int] = None) -> str:
+        return os.path.join(self.directory, f"ids-{self.meta['gen'] if gen is None else gen}.bin")
+
+    def _write_meta(self):
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path())
+
+    def _load(self):
+        ids = array("q")
+        if os.path.exists(self._ids_path()):
+            with open(self._ids_path(), "rb") as f:
+                ids.frombytes(f.read())
+        dim = self.meta.get("dim")
+        vector_bytes = 0
+        if dim and os.path.exists(self._vectors_path()):
+            vector_bytes = os.path.getsize(self._vectors_path())
+        # 写入中断时两个文件的行数可能不同，以较短者为准并截断多余部分
+        count = min(len(ids), vector_bytes // (4 * dim)) if dim else 0
+        if len(ids) != count or vector_bytes != count * 4 * (dim or 0):
+            del ids[count:]
+            with open(self._ids_path(), "wb") as f:
+                ids.tofile(f)
+            if dim:
+                with open(self._vectors_path(), "ab") as f:
+                    f.truncate(count * 4 * dim)
+        self.ids = ids
+        self.rows = {nid: row for row, nid in enumerate(ids) if nid != TOMBSTONE}
+        self.tombstones = count - len(self.rows)
+        self._remap()
+
+    def _unmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._vectors_file is not None:
+            self._vectors_file.close()
+            self._vectors_file = None
+
+    def _remap(self):
+        self._unmap()
+        if not self.ids or not self.meta.get("dim"):
+            return
+        self._vectors_file = open(self._vectors_path(), "rb")
+        self._mmap = mmap.mmap(self._vectors_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        with self._lock:
+            self._unmap()
+
+    # ---- 写入 ----
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.meta.get("dim")
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, items: Iterable[Tuple[int, Sequence[float]]], watermark: Optional[int] = None):
+        """追加 (note_id, 向量)；已有的笔记旧行打墓碑"""
+        with self._lock:
+            vectors, new_ids = array("f"), array("q")
+            for nid, vector in items:
+                vec = _normalize(vector)
+                if not self.meta.get("dim"):
+                    self.meta["dim"] = len(vec)
+                if len(vec) != self.meta["dim"]:
+                    raise ValueError(f"expected {self.meta['dim']}-dimensional vectors, got {len(vec)}")
+                pending = self.rows.get(nid, -1) - len(self.ids)
+                if pending >= 0:
+                    # 同一批中重复出现的笔记：只保留最后一个向量
+                    new_ids[pending] = TOMBSTONE
+                    self.tombstones += 1
+                    del self.rows[nid]
+                self._tombstone_locked(nid)
+                self.rows[nid] = len(self.ids) + len(new_ids)
+                new_ids.append(nid)
+                vectors.extend(vec)
+            if new_ids:
+                # 先写向量再写 id：中断时多出的向量行会在下次打开时截掉
+                with open(self._vectors_path(), "ab") as f:
+                    vectors.tofile(f)
+                with open(self._ids_path(), "ab") as f:
+                    new_ids.tofile(f)
+                self.ids.extend(new_ids)
+                self._remap()
+            if watermark is not None and watermark > self.meta.get("watermark", 0):
+                self.meta["watermark"] = watermark
+            self._write_meta()
+
+    def set_watermark(self, watermark: int, note_ids: Iterable[int] = ()):
+        """记录一次完整同步的水位；note_ids 为修改时间恰为水位、已经嵌入的笔记（下次同步跳过）"""
+        with self._lock:
+            self.meta["watermark"] = watermark
+            self.meta["watermark_ids"] = sorted(set(note_ids))
+            self._write_meta()
+
+    def remove(self, note_ids: Iterable[int]) -> int:
+        """把笔记对应的行标记为墓碑，返回标记的行数"""
+        with self._lock:
+            removed = sum(1 for nid in list(note_ids) if self._tombstone_locked(nid))
+            return removed
+
+    def _tombstone_locked(self, nid: int) -> bool:
+        row = self.rows.pop(nid, None)
+        if row is None:
+            return False
+        self.ids[row] = TOMBSTONE
+        with open(self._ids_path(), "r+b") as f:
+            f.seek(row * self.ids.itemsize)
+            f.write(array("q", [TOMBSTONE]).tobytes())
+        self.tombstones += 1
+        return True
+
+    def needs_compaction(self) -> bool:
+        return self.tombstones > max(len(self.ids), 1) * COMPACT_RATIO
+
+    def compact(self):
+        """把存活行复制到新一代文件并切换，删除旧文件"""
+        with self._lock:
+            if self._mmap is None:
+                return
+            dim = self.meta.get("dim")
+            old_gen = self.meta["gen"]
+            new_gen = old_gen + 1
+            row_bytes = 4 * dim if dim else 0
+            new_ids = array("q")
+            with open(self._vectors_path(new_gen), "wb") as out:
+                for row, nid in enumerate(self.ids):
+                    if nid != TOMBSTONE:
+                        out.write(self._mmap[row * row_bytes:(row + 1) * row_bytes])
+                        new_ids.append(nid)
+            with open(self._ids_path(new_gen), "wb") as f:
+                new_ids.tofile(f)
+            self._unmap()
+            self.meta["gen"] = new_gen
+            self._write_meta()
+            for path in (self._vectors_path(old_gen), self._ids_path(old_gen)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.ids = new_ids
+            self.rows = {nid: row for row, nid in enumerate(new_ids)}
+            self.tombstones = 0
+            self._remap()
+
+    # ---- 查询 ----
+
+    def search(self, query: Sequence[float], k: int = 5, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """返回与 query 余弦相似度最高的 k 篇笔记 [(note_id, score)]"""
+        with self._lock:
+            if self._mmap is None or not self.rows or k <= 0:
+                return []
+            q = _normalize(query)
+            if len(q) != self.meta["dim"]:
+                raise ValueError(f"expected {self.meta['dim']}-dimensional query, got {len(q)}")
+            exclude = set(exclude)
+            want = k + len(exclude)
+            if np is not None:
+                top = self._search_numpy(q, want)
+            else:
+                top = self._search_python(q, want)
+            return [(nid, score) for nid, score in top if nid not in exclude][:k]
+
+    def _search_numpy(self, q: array, want: int) -> List[Tuple[int, float]]:
+        dim, n = self.meta["dim"], len(self.ids)
+        matrix = np.frombuffer(self._mmap, dtype=np.float32, count=n * dim).reshape(n, dim)
+        ids = np.frombuffer(self.ids, dtype=np.int64)
+        qv = np.frombuffer(q, dtype=np.float32)
+        best: List[Tuple[float, int]] = []
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            end = min(n, start + SEARCH_BLOCK_ROWS)
+            scores = matrix[start:end] @ qv
+            scores[ids[start:end] == TOMBSTONE] = -np.inf
+            take = min(want, end - start)
+            idx = np.argpartition(-scores, take - 1)[:take]
+            for i in idx:
+                if scores[i] != -np.inf:
+                    best.append((float(scores[i]), int(ids[start + i])))
+            best = heapq.nlargest(want, best)
+        return [(nid, score) for score, nid in best]
+
+    def _search_python(self, q: array, want: int) -> List[Tuple[int, float]]:
+        # 无 NumPy 时逐行在 mmap 的 memoryview 上计算点积，向量不复制为 Python 列表
+        dim = self.meta["dim"]
+        view = memoryview(self._mmap).cast("f")
+        try:
+            ids = self.ids
+            scored = (
+                (sum(map(mul, view[row * dim:(row + 1) * dim], q)), nid)
+                for row, nid in enumerate(ids) if nid != TOMBSTONE
+            )
+            best = heapq.nlargest(want, scored)
+        finally:
+            view.release()
+        return [(nid, score) for score, nid in best]
+
+
+class EmbeddingsClient:
+    """OpenAI 兼容的 /v1/embeddings 客户端，按批请求并复用连接
+
+    请求 base64 编码的 float32 结果以减少 JSON 解析开销；不支持该格式的兼容端点返回浮点数组时同样可用。
+    """
+
+    def __init__(self, api_key: str, model: str = DEFAULT_EMBEDDING_MODEL, endpoint: Optional[str] = None,
+                 batch_size: int = EMBED_BATCH_SIZE, timeout: float = 60):
+        self.api_key = api_key
+        self.model = model
+        self.endpoint = endpoint or os.environ.get("OPENAI_EMBEDDINGS_URL", DEFAULT_EMBEDDINGS_URL)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        requests = load_requests()
+        self.session = requests.Session() if requests else None
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def embed(self, texts: Sequence[str]) -> List[array]:
+        """返回与 texts 一一对应的向量"""
+        if self.session is None:
+            raise RuntimeError("'requests' library not available")
+        vectors: List[array] = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch([t[:MAX_EMBED_CHARS] or " " for t in texts[start:start + self.batch_size]]))
+        return vectors
+
+    def _embed_batch(self, texts: List[str]) -> List[array]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        body = {"model": self.model, "input": texts, "encoding_format": "base64"}
+        resp = self.session.post(self.endpoint, headers=headers, json=body, timeout=self.timeout)
+        if resp.status_code >= 400:
+            raise RuntimeError(f"HTTP {resp.status_code}: {resp.text[:300]}")
+        data = sorted(resp.json().get("data", []), key=lambda item: item.get("index", 0))
+        if len(data) != len(texts):
+            raise RuntimeError(f"expected {len(texts)} embeddings, got {len(data)}")
+        vectors = []
+        for item in data:
+            embedding = item.get("embedding")
+            if isinstance(embedding, str):
+                vec = array("f")
+                vec.frombytes(base64.b64decode(embedding))
+            else:
+                vec = array("f", embedding)
+            vectors.append(vec)
+        return vectors
+
+
+def sync_embeddings(col, store: EmbeddingStore, client: EmbeddingsClient, batch_size: int = EMBED_BATCH_SIZE,
+                    should_cancel: Optional[Callable[[], bool]] = None) -> Dict[str, int]:
+    """嵌入修改时间不早于水位的笔记并删除已不存在笔记的向量，返回 {"embedded", "removed"}
+
+    笔记按 id 分页读取，修改时间并不递增，所以新水位（开始时集合中最大的修改时间）只在整轮同步
+    完成后写入：中途失败或取消时下次从旧水位重来，不会漏掉尚未嵌入的笔记。修改时间恰为旧水位、
+    上次已经嵌入的笔记不再重复请求嵌入接口。
+    """
+    watermark = store.meta.get("watermark", 0)
+    done = set(store.meta.get("watermark_ids", []))
+    target = max(col.db.scalar("select max(mod) from notes") or 0, watermark)
+    edge = set(done) if target == watermark else set()
+    embedded, cancelled = 0, False
+    for rows in iter_note_batches(col, batch_size, min_mod=watermark):
+        if should_cancel and should_cancel():
+            cancelled = True
+            break
+        rows = [row for row in rows if not (row[1] == watermark and row[0] in done)]
+        if not rows:
+            continue
+        texts = [note_text(flds) for _nid, _mod, flds in rows]
+        vectors = client.embed(texts)
+        store.add((nid, vec) for (nid, _mod, _flds), vec in zip(rows, vectors))
+        edge.update(nid for nid, mod, _flds in rows if mod == target)
+        embedded += len(rows)
+    if not cancelled:
+        store.set_watermark(target, edge)
+    # 同时有增删时笔记数可能不变，所以直接比较 id 集合
+    existing = set(col.db.list("select id from notes"))
+    removed = store.remove([nid for nid in list(store.rows) if nid not in existing])
+    if store.needs_compaction():
+        store.compact()
+    return {"embedded": embedded, "removed": removed}
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(model: str = DEFAULT_EMBEDDING_MODEL) -> EmbeddingStore:
+    """当前配置档与模型的向量存储（不同模型的向量不可混用，分目录保存）"""
+    safe_model = "".join(c if c.isalnum() or c in "-._" else "_" for c in model)
+    dirname = STORE_DIRNAME.format(suffix=get_profile_file_suffix())
+    key = os.path.join(dirname, safe_model)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = EmbeddingStore(os.path.join(get_user_files_dir(), dirname, safe_model), model=model)
+            _stores[key] = store
+        return store
+
+
+def close_embedding_stores():
+    """关闭全部向量存储（配置档关闭时调用）"""
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
+
+
+class SemanticIndex:
+    """当前配置档的笔记向量索引：配置档打开和笔记文本修改后在后台同步（未启用时不做任何事）"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__ + ".SemanticIndex")
+        self._lock = threading.Lock()
+        self._busy = False
+        self._pending = False
+        self._closed = True
+
+    @staticmethod
+    def _settings():
+        try:
+            from ..config import Config
+        except ImportError:
+            from config import Config
+        return Config.get_semantic_index_config(), Config.get_openai_config().get("api_key", "")
+
+    def on_profile_open(self):
+        settings, _api_key = self._settings()
+        if settings.get("enabled"):
+            self._closed = False
+            self.schedule_sync()
+
+    def on_operation_did_execute(self, changes, handler=None):
+        if getattr(changes, "note_text", False):
+            self.schedule_sync()
+
+    def close(self):
+        self._closed = True
+        close_embedding_stores()
+
+    def schedule_sync(self):
+        if self._closed:
+            return
+        with self._lock:
+            if self._busy:
+                self._pending = True
+                return
+            self._busy = True
+        try:
+            from aqt import mw
+        except ImportError:
+            mw = None
+        if mw is None or getattr(mw, "col", None) is None:
+            self._busy = False
+            return
+        col = mw.col
+        future = executor.submit(self._sync, col, priority=PRIORITY_BULK, group="semantic-index", name="semantic-index")
+        future.add_done_callback(self._on_done)
+
+    def _sync(self, col):
+        settings, api_key = self._settings()
+        client = EmbeddingsClient(api_key, model=settings["model"], endpoint=settings.get("endpoint") or None)
+        try:
+            return sync_embeddings(col, get_embedding_store(settings["model"]), client,
+                                   should_cancel=lambda: self._closed)
+        finally:
+            client.close()
+
+    def _on_done(self, future):
+        try:
+            stats = future.result()
+            if stats and (stats["embedded"] or stats["removed"]):
+                self.logger.info(f"Semantic index updated: {stats}")
+        except Exception as e:
+            self.logger.error(f"Error updating semantic index: {e}")
+        with self._lock:
+            self._busy = False
+            again, self._pending = self._pending and not self._closed, False
+        if again:
+            self.schedule_sync()
+
+    def search(self, text: str, k: int = 5, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """嵌入查询文本（一次网络请求）并返回最相似的笔记"""
+        settings, api_key = self._settings()
+        client = EmbeddingsClient(api_key, model=settings["model"], endpoint=settings.get("endpoint") or None)
+        try:
+            query = client.embed([text])[0]
+        finally:
+            client.close()
+        return get_embedding_store(settings["model"]).search(query, k=k, exclude=exclude)
+
+
+# 全局实例
+semantic_index = SemanticIndex()
@@ -0,0 +1,186 @@
+# 端点路由 - 多个 OpenAI 兼容端点（以及多个提供商）之间按延迟与错误率分流，连续失败的暂时剔除
+
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# 主端点（openai_api_key + OPENAI_BASE_URL）在路由与 endpoint_fallbacks 中使用的名称
+PRIMARY_ENDPOINT = "openai"
+
+# 没有延迟样本的端点按这个延迟参与加权，保证新端点也会被尝试
+DEFAULT_LATENCY_MS = 1000.0
+# 错误率对权重的惩罚系数：错误率 50% 的端点相当于延迟变为 (1 + 0.5 * 4) = 3 倍
+ERROR_PENALTY = 4.0
+
+# 换一个端点重试有意义的状态码：其余 4xx 说明请求本身有问题，换端点也会失败
+# （401/403/404 与端点自己的密钥、模型映射有关，换端点可能成功）
+FAILOVER_STATUSES = (401, 403, 404, 408, 429)
+
+
+def should_fail_over(error: Optional[BaseException]) -> bool:
+    """一次失败是否应该换下一个端点重试（网络错误与 5xx 总是换）"""
+    status = getattr(error, "status", 0) or 0
+    return status == 0 or status >= 500 or status in FAILOVER_STATUSES
+
+
+class EndpointProfile:
+    """一个 OpenAI 兼容端点：地址、密钥与模型映射（配置中的模型名 → 该端点上的模型名）"""
+
+    __slots__ = ("name", "url", "api_key", "models")
+
+    def __init__(self, name: str, url: str, api_key: str = "", models: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.models = dict(models or {})
+
+    @classmethod
+    def from_config(cls, entry: Dict[str, Any]) -> Optional["EndpointProfile"]:
+        """由 endpoint_profiles 中的一项构造；缺少名称或地址时返回 None"""
+        if not isinstance(entry, dict):
+            return None
+        name = str(entry.get("name", "")).strip()
+        url = str(entry.get("url", "")).strip()
+        if not name or not url:
+            return None
+        models = entry.get("models") if isinstance(entry.get("models"), dict) else {}
+        return cls(name, url, str(entry.get("api_key", "")).strip(), models)
+
+    def model_for(self, model: str) -> str:
+        """该端点上对应的模型名；映射中的 "*" 匹配所有未列出的模型"""
+        return self.models.get(model) or self.models.get("*") or model
+
+
+def load_endpoint_profiles(entries: Iterable[Dict[str, Any]]) -> List[EndpointProfile]:
+    """解析配置中的端点配置档，跳过无效项与重名项"""
+    profiles, seen = [], {PRIMARY_ENDPOINT}
+    for entry in entries or []:
+        profile = EndpointProfile.from_config(entry)
+        if profile is None or profile.name in seen:
+            logging.getLogger(__name__).warning(f"Ignoring invalid endpoint profile: {entry!r}")
+            continue
+        seen.add(profile.name)
+        profiles.append(profile)
+    return profiles
+
+
+class _EndpointStats:
+    __slots__ = ("latency_ms", "error_rate", "requests", "errors", "consecutive_failures",
+                 "ejections", "ejected_until", "url")
+
+    def __init__(self):
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.url = ""
+
+
+class EndpointRouter:
+    """按端点名称记录延迟与错误率的指数加权平均（EWMA），据此排列每次请求要尝试的端点
+
+    - 权重与 EWMA 延迟成反比，并按错误率惩罚；按权重随机选出首选端点，其余按权重降序排在后面，
+      这样较快的端点承担大部分请求，较慢的端点也会偶尔被选中以刷新统计。
+    - 连续失败 eject_failures 次的端点被剔除 eject_seconds 秒，每次重复剔除时间加倍（不超过
+      max_eject_seconds）；剔除期满后重新参与路由，首次成功即恢复。所有端点都被剔除时仍按原顺序尝试。
+    - fallback 中的端点不参与分流，只在分流的端点都失败后按配置顺序依次尝试。
+    """
+
+    def __init__(self, alpha: float = 0.3, eject_failures: int = 3, eject_seconds: float = 30.0,
+                 max_eject_seconds: float = 300.0, rng: Optional[random.Random] = None):
+        self.alpha = alpha
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _EndpointStats] = {}
+
+    def configure(self, alpha: float, eject_failures: int, eject_seconds: float, max_eject_seconds: float):
+        with self._lock:
+            self.alpha = alpha
+            self.eject_failures = eject_failures
+            self.eject_seconds = eject_seconds
+            self.max_eject_seconds = max_eject_seconds
+
+    def _weight(self, stats: Optional[_EndpointStats]) -> float:
+        latency = DEFAULT_LATENCY_MS if stats is None or stats.latency_ms is None else stats.latency_ms
+        error_rate = 0.0 if stats is None else stats.error_rate
+        return 1.0 / (max(latency, 1.0) * (1.0 + ERROR_PENALTY * error_rate))
+
+    def plan(self, balanced: List[str], fallback: Iterable[str] = ()) -> List[str]:
+        """本次请求依次尝试的端点名称"""
+        now = time.monotonic()
+        fallback = [name for name in fallback if name not in balanced]
+        with self._lock:
+            healthy = [n for n in balanced if now >= getattr(self._stats.get(n), "ejected_until", 0.0)]
+            ejected = [n for n in balanced if n not in healthy]
+            weights = {n: self._weight(self._stats.get(n)) for n in balanced}
+            order: List[str] = []
+            if healthy:
+                first = self._rng.choices(healthy, weights=[weights[n] for n in healthy])[0]
+                order.append(first)
+                order.extend(sorted((n for n in healthy if n != first), key=lambda n: -weights[n]))
+            ready_fallback = [n for n in fallback if now >= getattr(self._stats.get(n), "ejected_until", 0.0)]
+            order.extend(ready_fallback)
+            # 剔除中的端点排在最后：其余端点都失败时仍值得一试
+            order.extend(sorted(ejected, key=lambda n: self._stats[n].ejected_until))
+            order.extend(n for n in fallback if n not in ready_fallback)
+        return order
+
+    def record(self, name: str, latency_ms: Optional[float], ok: bool, url: str = ""):
+        """记录一次请求结果；latency_ms 为 None 时只更新错误率"""
+        with self._lock:
+            stats = self._stats.setdefault(name, _EndpointStats())
+            if url:
+                stats.url = url
+            stats.requests += 1
+            stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+            if ok and latency_ms is not None:
+                if stats.latency_ms is None:
+                    stats.latency_ms = latency_ms
+                else:
+                    stats.latency_ms += self.alpha * (latency_ms - stats.latency_ms)
+            if ok:
+                stats.consecutive_failures = 0
+                stats.ejections = 0
+                return
+            stats.errors += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.eject_failures:
+                duration = min(self.eject_seconds * (2 ** stats.ejections), self.max_eject_seconds)
+                stats.ejections += 1
+                stats.consecutive_failures = 0
+                stats.ejected_until = time.monotonic() + duration
+                logging.getLogger(__name__).warning(f"Endpoint {name} ejected for {duration:.0f}s after repeated failures")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """各端点统计（设置界面展示用）"""
+        now = time.monotonic()
+        with self._lock:
+            items = list(self._stats.items())
+            return [{
+                "name": name,
+                "url": stats.url,
+                "latency_ms": stats.latency_ms,
+                "error_rate": stats.error_rate,
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "ejected_seconds": max(0.0, stats.ejected_until - now),
+            } for name, stats in items]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# 全局实例：endpoint_router 按端点统计（OpenAI 兼容端点与各直连客户端的端点），
+# provider_router 按提供商统计（AIServiceAdapter 记录）；两者名称空间分开，
+# 主端点 "openai" 被剔除不会连带降低整个 openai 提供商的优先级
+endpoint_router = EndpointRouter()
+provider_router = EndpointRouter()
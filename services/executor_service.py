@@ -0,0 +1,236 @@
+# 后台执行器 - 插件内所有后台工作共用的有界线程池，按优先级调度并可按组取消
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .cancellation import CancelToken
+except ImportError:
+    from services.cancellation import CancelToken
+
+# 任务优先级（数值越小越先执行）
+PRIORITY_INTERACTIVE = 0   # 用户正在等待的请求：聊天回答、配置界面的网络调用
+PRIORITY_PREFETCH = 1      # 为即将发生的操作做准备：连接预热
+PRIORITY_BULK = 2          # 可以慢慢做的批量工作：索引构建、嵌入同步
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_PREFETCH: "prefetch",
+    PRIORITY_BULK: "bulk",
+}
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class _Task:
+    __slots__ = ("fn", "args", "kwargs", "priority", "group", "name", "future", "cancel_token", "submitted")
+
+    def __init__(self, fn, args, kwargs, priority, group, name, cancel_token):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.group = group
+        self.name = name
+        self.future: Future = Future()
+        self.cancel_token: Optional[CancelToken] = cancel_token
+        self.submitted = time.monotonic()
+
+
+class ExecutorService:
+    """有界、带优先级的后台执行器
+
+    - 工作线程按需创建，最多 max_workers 个，之后一直复用；
+    - 排队任务按优先级（同级按提交顺序）取出；
+    - 非交互任务最多同时占用 max_workers - reserved_interactive 个线程，批量任务再减半，
+      因此批量工作再多也总有线程留给聊天等交互请求；
+    - 任务可以属于一个命名组，cancel_group() 取消组内排队的任务，并通过任务的 CancelToken
+      通知正在运行的任务；
+    - get_metrics() 给出各优先级的队列深度、运行数和等待时间。
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, reserved_interactive: int = 1,
+                 thread_name_prefix: str = "chat-with-card"):
+        self.max_workers = max(1, max_workers)
+        reserved = min(max(0, reserved_interactive), self.max_workers - 1)
+        self._shared_limit = self.max_workers - reserved
+        self._bulk_limit = max(1, self._shared_limit // 2)
+        self._thread_name_prefix = thread_name_prefix
+        self._cond = threading.Condition()
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._workers: List[threading.Thread] = []
+        self._idle = 0
+        self._running: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        self._running_tasks: List[_Task] = []
+        self._shutdown = False
+        self._stats = {
+            p: {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0,
+                "total_wait_ms": 0.0, "max_wait_ms": 0.0, "total_run_ms": 0.0}
+            for p in PRIORITY_NAMES
+        }
+        self.logger = logging.getLogger(__name__)
+
+    # ---- 提交与取消 ----
+
+    def submit(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_INTERACTIVE,
+               group: Optional[str] = None, name: str = "", cancel_token: Optional[CancelToken] = None,
+               **kwargs) -> Future:
+        """提交 fn(*args, **kwargs)，返回 Future；cancel_token 用于组取消时通知运行中的任务"""
+        if priority not in PRIORITY_NAMES:
+            raise ValueError(f"unknown priority {priority}")
+        task = _Task(fn, args, kwargs, priority, group, name or getattr(fn, "__name__", "task"), cancel_token)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("executor has been shut down")
+            heapq.heappush(self._queue, (priority, next(self._seq), task))
+            self._stats[priority]["submitted"] += 1
+            # 排队任务多于空闲线程时补充线程（一个空闲线程不能吸收一批任务，否则它们只能依次执行）
+            if len(self._queue) > self._idle and len(self._workers) < self.max_workers:
+                self._start_worker_locked()
+            self._cond.notify_all()
+        return task.future
+
+    def cancel_group(self, group: str) -> int:
+        """取消组内全部任务：排队的直接丢弃，运行中的通过 CancelToken 通知，返回涉及的任务数"""
+        return self._cancel(lambda task: task.group == group)
+
+    def cancel_all(self) -> int:
+        """取消全部排队与运行中的任务（配置档关闭时调用）"""
+        return self._cancel(lambda task: True)
+
+    def _cancel(self, matches: Callable[[_Task], bool]) -> int:
+        with self._cond:
+            queued = [entry for entry in self._queue if matches(entry[2])]
+            if queued:
+                self._queue = [entry for entry in self._queue if not matches(entry[2])]
+                heapq.heapify(self._queue)
+            running = [task for task in self._running_tasks if matches(task)]
+            for _p, _s, task in queued:
+                self._stats[task.priority]["cancelled"] += 1
+        for _p, _s, task in queued:
+            if task.cancel_token is not None:
+                task.cancel_token.cancel()
+            task.future.cancel()
+        for task in running:
+            if task.cancel_token is not None:
+                task.cancel_token.cancel()
+        return len(queued) + len(running)
+
+    def shutdown(self, wait: bool = False, timeout: Optional[float] = None):
+        """停止接受新任务、取消排队任务并让工作线程退出"""
+        self.cancel_all()
+        with self._cond:
+            self._shutdown = True
+            workers = list(self._workers)
+            self._cond.notify_all()
+        if wait:
+            for worker in workers:
+                worker.join(timeout)
+
+    # ---- 工作线程 ----
+
+    def _start_worker_locked(self):
+        worker = threading.Thread(
+            target=self._worker_loop,
+            name=f"{self._thread_name_prefix}-{len(self._workers) + 1}",
+            daemon=True,
+        )
+        self._workers.append(worker)
+        worker.start()
+
+    def _can_start_locked(self, priority: int) -> bool:
+        if priority == PRIORITY_INTERACTIVE:
+            return True
+        if self._running[PRIORITY_PREFETCH] + self._running[PRIORITY_BULK] >= self._shared_limit:
+            return False
+        return priority != PRIORITY_BULK or self._running[PRIORITY_BULK] < self._bulk_limit
+
+    def _next_task_locked(self) -> Optional[_Task]:
+        """取出优先级最高、且未超出并发上限的任务"""
+        blocked = []
+        task = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            if self._can_start_locked(entry[0]):
+                task = entry[2]
+                break
+            blocked.append(entry)
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+        return task
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                self._idle += 1
+                task = self._next_task_locked()
+                while task is None and not self._shutdown:
+                    self._cond.wait()
+                    task = self._next_task_locked()
+                self._idle -= 1
+                if task is None:
+                    return
+                self._running[task.priority] += 1
+                self._running_tasks.append(task)
+                wait_ms = (time.monotonic() - task.submitted) * 1000.0
+                stats = self._stats[task.priority]
+                stats["total_wait_ms"] += wait_ms
+                stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+            self._run_task(task)
+
+    def _run_task(self, task: _Task):
+        started = time.monotonic()
+        outcome = "cancelled"
+        try:
+            # 调用方直接 future.cancel() 的排队任务在这里被跳过
+            if task.future.set_running_or_notify_cancel():
+                outcome = "failed"
+                try:
+                    result = task.fn(*task.args, **task.kwargs)
+                except BaseException as e:
+                    self.logger.warning(f"Background task {task.name} failed: {e}")
+                    task.future.set_exception(e)
+                else:
+                    outcome = "completed"
+                    task.future.set_result(result)
+        finally:
+            with self._cond:
+                self._running[task.priority] -= 1
+                self._running_tasks.remove(task)
+                stats = self._stats[task.priority]
+                stats[outcome] += 1
+                stats["total_run_ms"] += (time.monotonic() - started) * 1000.0
+                # 腾出名额后，之前被并发上限挡住的任务可能可以运行了
+                self._cond.notify_all()
+
+    # ---- 指标 ----
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """按优先级汇总的队列深度、运行数、等待与运行耗时（快照）"""
+        with self._cond:
+            depth = {p: 0 for p in PRIORITY_NAMES}
+            for priority, _seq, _task in self._queue:
+                depth[priority] += 1
+            metrics: Dict[str, Any] = {"workers": len(self._workers), "max_workers": self.max_workers}
+            for priority, label in PRIORITY_NAMES.items():
+                stats = dict(self._stats[priority])
+                started = stats["completed"] + stats["failed"] + self._running[priority]
+                stats["queued"] = depth[priority]
+                stats["running"] = self._running[priority]
+                stats["avg_wait_ms"] = stats["total_wait_ms"] / started if started else 0.0
+                finished = stats["completed"] + stats["failed"]
+                stats["avg_run_ms"] = stats["total_run_ms"] / finished if finished else 0.0
+                metrics[label] = stats
+            metrics["queue_depth"] = sum(depth.values())
+            return metrics
+
+
+# 全局实例
+executor = ExecutorService()
@@ -0,0 +1,100 @@
+# Gemini streamGenerateContent 直连客户端（流式）
+
+import json
+import os
+from typing import List
+from urllib.parse import quote
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .chat_client import ChatClient, StreamEvent, split_system
+    from .transport import TransportError
+except ImportError:
+    from services.chat_client import ChatClient, StreamEvent, split_system
+    from services.transport import TransportError
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+
+class GeminiStreamParser:
+    """解析 streamGenerateContent 的流式响应：每个 data 是一个完整的 GenerateContentResponse
+
+    以 alt=sse 请求时响应按 SSE 分帧，各传输共用的 SSE 读取即可拿到完整 JSON；
+    思考内容（thought 为真的 part）不计入回答。
+    """
+
+    def feed(self, data: str) -> List[StreamEvent]:
+        try:
+            obj = json.loads(data)
+        except ValueError:
+            return []
+        if not isinstance(obj, dict):
+            return []
+        if isinstance(obj.get("error"), dict):
+            error = obj["error"]
+            raise TransportError(f"{error.get('status', 'error')}: {error.get('message', '')}",
+                                 int(error.get("code") or 0))
+        events = []
+        candidates = obj.get("candidates") or []
+        candidate = candidates[0] if candidates else {}
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            if part.get("text") and not part.get("thought"):
+                events.append(StreamEvent.delta(part["text"]))
+        usage = obj.get("usageMetadata")
+        if usage:
+            events.append(StreamEvent.usage_of(usage.get("promptTokenCount", 0),
+                                               usage.get("candidatesTokenCount", 0)))
+        reason = candidate.get("finishReason") or (obj.get("promptFeedback") or {}).get("blockReason")
+        if reason and reason != "FINISH_REASON_UNSPECIFIED":
+            events.append(StreamEvent.finish("max_tokens" if reason == "MAX_TOKENS" else reason))
+        return events
+
+
+class GeminiService(ChatClient):
+    """Gemini API 客户端（google_api_key / google_model）"""
+
+    name = "google"
+    provider_config_key = "google"
+
+    def __init__(self, api_key: str = "", model: str = "", max_tokens: int = 500, temperature: float = 0.7):
+        super().__init__(api_key, model, max_tokens, temperature)
+        self.base_url = os.environ.get("GEMINI_BASE_URL", GEMINI_BASE_URL).rstrip("/")
+
+    @property
+    def endpoint(self) -> str:
+        return self._model_url(self.model)
+
+    def _model_url(self, model: str) -> str:
+        return f"{self.base_url}/models/{quote(model, safe='')}:streamGenerateContent?alt=sse"
+
+    def _stream_request(self, conversation_history, model):
+        system, messages = split_system(conversation_history)
+        headers = {
+            "x-goog-api-key": self.api_key,
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        body = {
+            "contents": [
+                {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+                for m in messages
+            ],
+            "generationConfig": {
+                "maxOutputTokens": self.max_tokens,
+                "temperature": self.temperature
+            }
+        }
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": system}]}
+        return self._model_url(model), headers, json.dumps(body).encode("utf-8")
+
+    def _new_parser(self):
+        return GeminiStreamParser()
+
+    def validate_api_key(self, allow_completion=False, cancel_token=None):
+        """通过模型列表接口验证密钥（不产生费用）"""
+        try:
+            from .key_probe import probe_google_key
+        except ImportError:
+            from services.key_probe import probe_google_key
+        return probe_google_key(self.api_key, cancel_token=cancel_token)
@@ -0,0 +1,301 @@
+# 对冲请求 - 首个分片截止时间与 TTFT 统计：上游迟迟不出字时再发一个相同请求，先出字者胜
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .cancellation import CancelToken
+except ImportError:
+    from services.cancellation import CancelToken
+
+# 每个（端点, 模型）保留的最近 TTFT 样本数；样本少于 MIN_SAMPLES 时不估计分位数
+TTFT_WINDOW = 64
+MIN_SAMPLES = 5
+
+
+class FirstTokenTimeout(TimeoutError):
+    """在首个分片截止时间内没有任何尝试产出内容"""
+
+
+class TTFTTracker:
+    """按（端点, 模型）记录最近的首个分片延迟（毫秒），用于估计对冲等待时间"""
+
+    def __init__(self, window: int = TTFT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def record(self, key: Tuple[str, str], ttft_ms: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(ttft_ms)
+
+    def record_censored(self, key: Tuple[str, str], elapsed_ms: float, pct: float):
+        """记录一次在出字前被取消或超时的尝试：真实 TTFT 至少为 elapsed_ms
+
+        只记入不低于当前第 pct 百分位的下界；更短的下界不含信息，当作样本反而会把分位数拉低。
+        只记出字的尝试时，慢的尝试总被对冲取消，分位数会一路降到下限，对冲越来越频繁。
+        """
+        estimate = self.percentile(key, pct)
+        if estimate is None or elapsed_ms >= estimate:
+            self.record(key, elapsed_ms)
+
+    def seed(self, key: Tuple[str, str], samples: Iterable[float]):
+        """用持久化的历史（模型目录中的 ttft 延迟）填充尚无样本的键"""
+        with self._lock:
+            if self._samples.get(key):
+                return
+            history = deque((float(s) for s in samples), maxlen=self.window)
+            if history:
+                self._samples[key] = history
+
+    def percentile(self, key: Tuple[str, str], pct: float) -> Optional[float]:
+        """第 pct 百分位的 TTFT；样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(pct / 100.0 * (len(samples) - 1)))))
+        return samples[index]
+
+    def count(self, key: Tuple[str, str]) -> int:
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+
+def hedge_delay_seconds(tracker: TTFTTracker, key: Tuple[str, str], percentile: float,
+                        min_ms: float, max_ms: float) -> float:
+    """对冲等待时间：历史 TTFT 的分位数，限制在 [min_ms, max_ms]；样本不足时取 max_ms"""
+    estimate = tracker.percentile(key, percentile)
+    if estimate is None:
+        return max_ms / 1000.0
+    return min(max(estimate, min_ms), max_ms) / 1000.0
+
+
+class DeadlineTimer:
+    """在一个共用的守护线程中按时执行回调（首个分片截止、整体截止、启动对冲）
+
+    所有流式请求共用这一个线程，不为每条消息另开计时线程；回调应当很快返回（取消令牌、启动对冲）。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap: List[list] = []
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> list:
+        """delay 秒后执行 callback，返回可传给 cancel() 的句柄"""
+        entry = [time.monotonic() + max(0.0, delay), next(self._seq), callback]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-with-card-deadlines", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    def cancel(self, entry: list):
+        """取消尚未执行的回调（条目留在堆中，到期时丢弃）"""
+        with self._cond:
+            entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                entry = heapq.heappop(self._heap)
+                callback, entry[2] = entry[2], None
+            if callback is None:
+                continue
+            try:
+                callback()
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Deadline callback failed: {e}")
+
+
+class _Attempt:
+    __slots__ = ("index", "token", "finished", "error")
+
+    def __init__(self, index: int, token: CancelToken):
+        self.index = index
+        self.token = token
+        self.finished = False
+        self.error: Optional[BaseException] = None
+
+
+def _retryable(error: Optional[BaseException]) -> bool:
+    """4xx（超时与限流除外）说明请求本身有问题，重发同样的请求没有意义"""
+    status = getattr(error, "status", 0) or 0
+    return not (400 <= status < 500 and status not in (408, 429))
+
+
+def hedged_stream(open_attempt: Callable[[int, CancelToken], Iterator[str]], *,
+                  hedge_delay: Optional[float] = None, max_attempts: int = 2,
+                  first_token_timeout: Optional[float] = None, total_timeout: Optional[float] = None,
+                  cancel_token: Optional[CancelToken] = None,
+                  on_event: Optional[Callable[[str, int], None]] = None,
+                  retryable: Optional[Callable[[Optional[BaseException]], bool]] = None) -> Iterator[str]:
+    """产出最先出字的那次尝试的分片
+
+    open_attempt(i, token) 返回第 i 次尝试的分片迭代器（token 被取消时应尽快结束）。
+    第一个尝试立即开始；hedge_delay 秒内没有分片则启动下一个（最多 max_attempts 个），
+    某个尝试出错且 retryable(error) 为真（默认：不是客户端错误）时也立即启动下一个。第一个产出分片的尝试胜出，其余尝试被取消。
+    first_token_timeout 内没有任何分片时抛出 FirstTokenTimeout；total_timeout 限制整个回答。
+    on_event(kind, index) 报告 "hedge"（启动对冲或换下一个尝试）与 "win"（胜出）事件。
+
+    尝试在调用方线程中直接读取，出错后的下一个尝试也是；只有对冲真正触发时，对冲的尝试才在独立的守护线程中读取。
+    截止时间由共用的 deadline_timer 取消尝试的令牌（关闭套接字）来执行，阻塞中的读取随即返回。
+    """
+    retryable = retryable or _retryable
+    lock = threading.Lock()
+    events: "queue.Queue[tuple]" = queue.Queue()
+    attempts: List[_Attempt] = []
+    timers: List[list] = []
+    logger = logging.getLogger(__name__)
+    winner: Optional[_Attempt] = None
+    expired: Optional[str] = None
+    hedging = hedge_delay is not None and max_attempts > 1
+
+    def new_attempt() -> Optional[_Attempt]:
+        with lock:
+            if winner is not None or expired is not None or len(attempts) >= max_attempts:
+                return None
+            attempt = _Attempt(len(attempts), CancelToken())
+            attempts.append(attempt)
+        if cancel_token is not None:
+            cancel_token.add_callback(attempt.token.cancel)
+        if attempt.index > 0 and on_event is not None:
+            on_event("hedge", attempt.index)
+        return attempt
+
+    def claim(attempt: _Attempt) -> bool:
+        """attempt 产出了分片：还没有胜者时成为胜者并取消其余尝试"""
+        nonlocal winner
+        with lock:
+            if winner is not None:
+                return winner is attempt
+            winner = attempt
+            others = [a for a in attempts if a is not attempt]
+        for other in others:
+            other.token.cancel()
+        if on_event is not None:
+            on_event("win", attempt.index)
+        return True
+
+    def expire(kind: str):
+        nonlocal expired
+        with lock:
+            if expired is not None or (kind == "first" and winner is not None):
+                return
+            expired = kind
+            tokens = [a.token for a in attempts]
+        for token in tokens:
+            token.cancel()
+
+    def pump(attempt: _Attempt):
+        try:
+            for chunk in open_attempt(attempt.index, attempt.token):
+                if attempt.token.is_cancelled or not claim(attempt):
+                    break
+                events.put((attempt.index, "chunk", chunk))
+            events.put((attempt.index, "done", None))
+        except BaseException as e:
+            events.put((attempt.index, "error", e))
+
+    def hedge():
+        if hedging_stopped or (cancel_token is not None and cancel_token.is_cancelled):
+            return
+        attempt = new_attempt()
+        if attempt is None:
+            return
+        threading.Thread(target=pump, args=(attempt,), name=f"chat-with-card-attempt-{attempt.index}",
+                         daemon=True).start()
+        timers.append(deadline_timer.schedule(hedge_delay, hedge))
+
+    hedging_stopped = False
+    if first_token_timeout is not None:
+        timers.append(deadline_timer.schedule(first_token_timeout, lambda: expire("first")))
+    if total_timeout is not None:
+        timers.append(deadline_timer.schedule(total_timeout, lambda: expire("total")))
+    if hedging:
+        timers.append(deadline_timer.schedule(hedge_delay, hedge))
+    try:
+        inline = new_attempt()
+        while True:
+            if inline is not None:
+                attempt, inline = inline, None
+                try:
+                    chunks = open_attempt(attempt.index, attempt.token)
+                    try:
+                        for chunk in chunks:
+                            if attempt.token.is_cancelled or not claim(attempt):
+                                break
+                            yield chunk
+                    finally:
+                        close = getattr(chunks, "close", None)
+                        if close is not None:
+                            close()
+                except Exception as e:
+                    attempt.error = e
+            else:
+                index, kind, payload = events.get()
+                attempt = attempts[index]
+                if kind == "chunk":
+                    if attempt is winner:
+                        yield payload
+                    continue
+                if kind == "error":
+                    attempt.error = payload
+            attempt.finished = True
+
+            if cancel_token is not None and cancel_token.is_cancelled:
+                return
+            if expired == "total":
+                raise TimeoutError(f"No complete response within {total_timeout:.0f}s")
+            if attempt is winner:
+                # 胜出的尝试结束（或出错）即回答结束
+                if attempt.error is not None:
+                    raise attempt.error
+                return
+            if winner is not None:
+                # 对冲的尝试胜出：改为读取它的分片
+                continue
+            if expired == "first":
+                raise FirstTokenTimeout(f"No response within {first_token_timeout:.0f}s")
+            if attempt.error is not None:
+                logger.warning(f"Stream attempt {attempt.index} failed: {attempt.error}")
+            # 没有产出任何分片就结束的尝试：还能尝试则立即补一个（客户端错误除外），否则等其余尝试
+            if not retryable(attempt.error):
+                hedging_stopped = True
+            else:
+                inline = new_attempt()
+                if inline is not None:
+                    continue
+            with lock:
+                pending = [a for a in attempts if not a.finished]
+            if not pending:
+                errors = [a.error for a in attempts if a.error is not None]
+                if errors:
+                    raise errors[-1]
+                return
+    finally:
+        hedging_stopped = True
+        for entry in timers:
+            deadline_timer.cancel(entry)
+        for attempt in attempts:
+            attempt.token.cancel()
+            if cancel_token is not None:
+                cancel_token.remove_callback(attempt.token.cancel)
+
+
+# 全局实例
+ttft_tracker = TTFTTracker()
+deadline_timer = DeadlineTimer()
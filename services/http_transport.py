@@ -0,0 +1,288 @@
+# 轻量 HTTP 传输 - 基于标准库 http.client，聊天热路径不再需要导入 requests
+
+import functools
+import http.client
+import threading
+import time
+import zlib
+from base64 import b64encode
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .cancellation import CancelledError, CancelToken
+    from .transport import HTTPResponse, SSEParser, StreamResponse, Transport, shutdown_socket
+except ImportError:
+    from services.cancellation import CancelledError, CancelToken
+    from services.transport import HTTPResponse, SSEParser, StreamResponse, Transport, shutdown_socket
+
+# 每个源站最多保留的空闲连接数，以及空闲连接的最长保留时间（秒）
+MAX_IDLE_PER_HOST = 4
+IDLE_TIMEOUT = 60.0
+READ_SIZE = 16 * 1024
+
+# 流结束后最多等待多久、读取多少字节来收尾，超出则关闭连接而不是放回连接池
+DRAIN_TIMEOUT = 1.0
+DRAIN_MAX_BYTES = 64 * 1024
+
+# 复用的空闲连接被服务器关闭时出现的错误：换新连接重试一次
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                            ConnectionAbortedError)
+
+
+def _content_decoder(encoding: str):
+    """按 Content-Encoding 返回增量解压器（identity 时返回 None）"""
+    encoding = (encoding or "").strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompressobj()
+    return None
+
+
+def _proxy_for(scheme: str, host: str) -> Optional[str]:
+    """读取 HTTP(S)_PROXY / NO_PROXY 等环境变量（与 requests 的行为一致）"""
+    proxy = getproxies().get(scheme)
+    if not proxy or proxy_bypass(host):
+        return None
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+class _Route:
+    """一个目标 URL 的连接方式：直连，或经由代理（HTTPS 用 CONNECT 隧道，HTTP 用绝对 URI）"""
+
+    __slots__ = ("key", "scheme", "host", "port", "target", "proxy", "proxy_headers")
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme.lower()
+        if self.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"unsupported URL: {url}")
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.scheme == "https" else 80)
+        self.target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.proxy = None
+        self.proxy_headers: Dict[str, str] = {}
+        proxy_url = _proxy_for(self.scheme, self.host)
+        if proxy_url:
+            proxy = urlsplit(proxy_url)
+            self.proxy = (proxy.hostname, proxy.port or 8080)
+            if proxy.username:
+                credentials = f"{unquote(proxy.username)}:{unquote(proxy.password or '')}"
+                self.proxy_headers["Proxy-Authorization"] = "Basic " + b64encode(credentials.encode("utf-8")).decode("ascii")
+            if self.scheme == "http":
+                self.target = url
+        self.key = (self.scheme, self.host, self.port, self.proxy)
+
+    def connect(self, timeout: float) -> http.client.HTTPConnection:
+        if self.proxy is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            return cls(self.host, self.port, timeout=timeout)
+        if self.scheme == "https":
+            conn = http.client.HTTPSConnection(self.proxy[0], self.proxy[1], timeout=timeout)
+            conn.set_tunnel(self.host, self.port, headers=self.proxy_headers or None)
+            return conn
+        return http.client.HTTPConnection(self.proxy[0], self.proxy[1], timeout=timeout)
+
+    def request_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+        merged = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        if self.proxy is not None and self.scheme == "http":
+            merged.update(self.proxy_headers)
+        merged.update(headers)
+        return merged
+
+
+class _HTTPClientStreamResponse(StreamResponse):
+    def __init__(self, transport: "HTTPClientTransport", route: _Route, conn: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse, cancel_token: Optional[CancelToken]):
+        self._transport = transport
+        self._route = route
+        self._conn: Optional[http.client.HTTPConnection] = conn
+        self._response = response
+        self._cancel_token = cancel_token
+        self.status = response.status
+        self.headers = {k.lower(): v for k, v in response.getheaders()}
+        self._decoder = _content_decoder(self.headers.get("content-encoding", ""))
+        if cancel_token is not None:
+            cancel_token.add_callback(self._abort)
+
+    def _abort(self):
+        """关闭套接字，使其他线程中阻塞的读取立即返回"""
+        shutdown_socket(getattr(self._conn, "sock", None))
+
+    def _iter_body(self):
+        response = self._response
+        while True:
+            data = response.read1(READ_SIZE)
+            if not data:
+                break
+            if self._decoder is not None:
+                data = self._decoder.decompress(data)
+                if not data:
+                    continue
+            yield data
+        if self._decoder is not None:
+            tail = self._decoder.flush()
+            if tail:
+                yield tail
+
+    def iter_events(self):
+        parser = SSEParser()
+        try:
+            for data in self._iter_body():
+                yield from parser.feed(data)
+            yield from parser.close()
+        except Exception:
+            if self._cancel_token is not None and self._cancel_token.is_cancelled:
+                return
+            raise
+
+    def read_text(self, limit: int = 4096) -> str:
+        return b"".join(self._iter_body()).decode("utf-8", errors="replace")[:limit]
+
+    def _drain(self, conn: http.client.HTTPConnection):
+        """读完 finish_reason 之后剩下的少量正文（[DONE] 与 chunked 结尾），以便连接可以复用"""
+        try:
+            if conn.sock is not None:
+                conn.sock.settimeout(DRAIN_TIMEOUT)
+            remaining = DRAIN_MAX_BYTES
+            while remaining > 0 and not self._response.isclosed():
+                data = self._response.read1(READ_SIZE)
+                if not data:
+                    break
+                remaining -= len(data)
+        except Exception:
+            pass
+
+    def close(self):
+        if self._cancel_token is not None:
+            self._cancel_token.remove_callback(self._abort)
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        cancelled = self._cancel_token is not None and self._cancel_token.is_cancelled
+        if not cancelled:
+            self._drain(conn)
+        # 正文读完且服务器允许保持连接时放回连接池，否则直接关闭
+        if not cancelled and self._response.isclosed() and not self._response.will_close:
+            self._transport._release(self._route, conn)
+        else:
+            conn.close()
+
+
+class HTTPClientTransport(Transport):
+    """基于 http.client 的传输：长连接池、chunked/gzip 响应、代理环境变量
+
+    与 RequestsTransport 的区别：不自动跟随重定向，不读取 .netrc；只处理聊天接口需要的
+    JSON POST 与 SSE 读取。
+    """
+
+    name = "http_client"
+
+    def __init__(self, max_idle_per_host: int = MAX_IDLE_PER_HOST, idle_timeout: float = IDLE_TIMEOUT):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._pool: Dict[tuple, List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self.stats = {"connections_opened": 0, "connections_reused": 0}
+
+    # ---- 连接池 ----
+
+    def _acquire(self, route: _Route) -> Optional[http.client.HTTPConnection]:
+        now = time.monotonic()
+        with self._lock:
+            idle = self._pool.get(route.key)
+            while idle:
+                conn, since = idle.pop()
+                if now - since < self.idle_timeout:
+                    self.stats["connections_reused"] += 1
+                    return conn
+                conn.close()
+        return None
+
+    def _release(self, route: _Route, conn: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._pool.setdefault(route.key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _send(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes],
+              timeout: float, cancel_token: Optional[CancelToken] = None
+              ) -> Tuple[_Route, http.client.HTTPConnection, http.client.HTTPResponse]:
+        """发送请求并读取响应头；复用的连接已失效时在新连接上重试一次
+
+        连接建立后、发送请求前把关闭套接字注册为取消回调，取消可以打断等待响应头；此时抛出 CancelledError。
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        route = _Route(url)
+        request_headers = route.request_headers(headers)
+        conn = self._acquire(route)
+        while True:
+            reused = conn is not None
+            if conn is None:
+                conn = route.connect(timeout)
+                with self._lock:
+                    self.stats["connections_opened"] += 1
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            abort = None
+            try:
+                if cancel_token is not None:
+                    if conn.sock is None:
+                        conn.connect()
+                    abort = functools.partial(shutdown_socket, conn.sock)
+                    cancel_token.add_callback(abort)
+                    cancel_token.raise_if_cancelled()
+                conn.request(method, route.target, body=body, headers=request_headers)
+                return route, conn, conn.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                conn.close()
+                if cancel_token is not None and cancel_token.is_cancelled:
+                    raise CancelledError("Request was cancelled")
+                if not reused:
+                    raise
+                conn = None
+            except BaseException:
+                conn.close()
+                if cancel_token is not None and cancel_token.is_cancelled:
+                    raise CancelledError("Request was cancelled")
+                raise
+            finally:
+                if abort is not None:
+                    cancel_token.remove_callback(abort)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, {}
+        for idle in pool.values():
+            for conn, _since in idle:
+                conn.close()
+
+    # ---- Transport 接口 ----
+
+    def request(self, method, url, headers, body=None, timeout=30):
+        route, conn, response = self._send(method, url, headers, body, timeout)
+        try:
+            data = response.read()
+        except BaseException:
+            conn.close()
+            raise
+        response_headers = {k.lower(): v for k, v in response.getheaders()}
+        decoder = _content_decoder(response_headers.get("content-encoding", ""))
+        if decoder is not None:
+            data = decoder.decompress(data) + decoder.flush()
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(route, conn)
+        return HTTPResponse(response.status, response_headers, data)
+
+    def stream(self, url, headers, body, timeout=60, cancel_token=None):
+        route, conn, response = self._send("POST", url, headers, body, timeout, cancel_token)
+        return _HTTPClientStreamResponse(self, route, conn, response, cancel_token)
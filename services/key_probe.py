@@ -0,0 +1,57 @@
+# API 密钥探测 - 对各提供商做轻量级的鉴权检查（不产生补全费用）
+
+from typing import Optional, Tuple
+
+try:
+    import requests
+except Exception:
+    requests = None
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .anthropic_service import ANTHROPIC_VERSION
+    from .cancellation import CancelledError
+    from .transport import cancellable_requests
+except ImportError:
+    from services.anthropic_service import ANTHROPIC_VERSION
+    from services.cancellation import CancelledError
+    from services.transport import cancellable_requests
+
+ANTHROPIC_MODELS_URL = "https://api.anthropic.com/v1/models"
+GOOGLE_MODELS_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+
+def _probe(url: str, headers: dict, params: Optional[dict] = None, timeout: float = 15,
+           cancel_token=None) -> Tuple[bool, str]:
+    """cancel_token 被取消时关闭进行中的请求并抛出 CancelledError"""
+    if not requests:
+        return False, "'requests' library not available"
+    try:
+        with requests.Session() as session, cancellable_requests(session, cancel_token):
+            resp = session.get(url, headers=headers, params=params, timeout=timeout)
+        if resp.status_code >= 400:
+            return False, f"HTTP {resp.status_code}: {resp.text[:300]}"
+        return True, "API key is valid"
+    except CancelledError:
+        raise
+    except Exception as e:
+        return False, f"API key validation failed: {str(e)}"
+
+
+def probe_anthropic_key(api_key: str, timeout: float = 15, cancel_token=None) -> Tuple[bool, str]:
+    """通过 Anthropic 模型列表接口验证密钥"""
+    if not api_key:
+        return False, "Invalid or missing API key"
+    headers = {
+        "x-api-key": api_key,
+        "anthropic-version": ANTHROPIC_VERSION,
+    }
+    return _probe(ANTHROPIC_MODELS_URL, headers, params={"limit": 1}, timeout=timeout, cancel_token=cancel_token)
+
+
+def probe_google_key(api_key: str, timeout: float = 15, cancel_token=None) -> Tuple[bool, str]:
+    """通过 Gemini 模型列表接口验证密钥"""
+    if not api_key:
+        return False, "Invalid or missing API key"
+    headers = {"x-goog-api-key": api_key}
+    return _probe(GOOGLE_MODELS_URL, headers, params={"pageSize": 1}, timeout=timeout, cancel_token=cancel_token)
@@ -0,0 +1,175 @@
+# 分级 API 密钥验证 - 默认不消耗任何补全 token
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..config import Config
+    from ..utils.helpers import fingerprint_api_key
+    from .cancellation import CancelledError
+    from .transport import cancellable_requests
+except ImportError:
+    from config import Config
+    from utils.helpers import fingerprint_api_key
+    from services.cancellation import CancelledError
+    from services.transport import cancellable_requests
+
+# 单级验证的结论
+VALID = "valid"
+INVALID = "invalid"
+INCONCLUSIVE = "inconclusive"
+
+
+class KeyValidator:
+    """分级验证 OpenAI 兼容端点的 API 密钥
+
+    1. catalog    —— 新鲜的模型目录缓存中已有该密钥（及所选模型），无需网络请求；
+    2. metadata   —— 请求鉴权的元数据接口 GET /models/{model}（或 /models），不产生费用；
+    3. completion —— 仅在用户明确要求时发送 max_tokens=1 的补全请求。
+
+    某一级给出明确结论（有效 / 密钥无效）即停止；结论按 密钥指纹 缓存一段时间。
+    每次验证的逐级耗时保存在 last_report 中，并附在返回消息里。
+    cancel_token 被取消时关闭进行中请求的套接字并抛出 CancelledError（不缓存任何结论）。
+    """
+
+    _cache: Dict[Tuple[str, str, str, str], Tuple[float, bool, str]] = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, service, cancel_token=None):
+        self.service = service
+        self.cancel_token = cancel_token
+        self.last_report: List[Dict[str, Any]] = []
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    def _cache_key(self) -> Tuple[str, str, str, str]:
+        svc = self.service
+        return (svc.endpoint, svc.models_url, svc.model or "", fingerprint_api_key(svc.api_key))
+
+    @staticmethod
+    def _cache_ttl_seconds() -> float:
+        return float(Config.get("key_validation_cache_minutes", 10)) * 60.0
+
+    def validate(self, allow_completion: bool = False) -> Tuple[bool, str]:
+        """按层级验证，返回 (是否有效, 含逐级耗时的说明)"""
+        self.last_report = []
+        key = self._cache_key()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached and (time.time() - cached[0]) < self._cache_ttl_seconds():
+            self.last_report.append({"tier": "cache", "result": VALID if cached[1] else INVALID, "latency_ms": 0.0})
+            return cached[1], self._compose(cached[2] + " (cached)")
+
+        tiers = [("catalog", self._check_catalog), ("metadata", self._check_metadata)]
+        if allow_completion:
+            tiers.append(("completion", self._check_completion))
+
+        message = "Validation inconclusive"
+        for name, check in tiers:
+            started = time.monotonic()
+            try:
+                result, detail = check()
+            except CancelledError:
+                raise
+            except Exception as e:
+                result, detail = INCONCLUSIVE, f"API key validation failed: {str(e)}"
+            self.last_report.append({
+                "tier": name,
+                "result": result,
+                "latency_ms": (time.monotonic() - started) * 1000.0,
+                "detail": detail,
+            })
+            message = detail
+            if result in (VALID, INVALID):
+                ok = result == VALID
+                with self._cache_lock:
+                    self._cache[key] = (time.time(), ok, detail)
+                return ok, self._compose(detail)
+        return False, self._compose(message)
+
+    def _compose(self, message: str) -> str:
+        lines = [message]
+        for entry in self.last_report:
+            lines.append(f"  · {entry['tier']}: {entry['result']} ({entry['latency_ms']:.1f} ms)")
+        return "\n".join(lines)
+
+    # ---- 各级检查 ----
+
+    def _check_catalog(self) -> Tuple[str, str]:
+        svc = self.service
+        ids = svc.catalog.get_model_ids(svc.models_url, svc.api_key)
+        if ids is None:
+            return INCONCLUSIVE, "No fresh model catalog"
+        if not svc.model or svc.model in ids:
+            return VALID, "API key is valid (cached model catalog)"
+        return INCONCLUSIVE, f"Model {svc.model} not in cached catalog"
+
+    def _check_metadata(self) -> Tuple[str, str]:
+        svc = self.service
+        if not svc.model:
+            ok, _models, msg = svc.list_models(force_refresh=True, cancel_token=self.cancel_token)
+            if ok:
+                return VALID, "API key is valid"
+            return self._classify_error(msg), msg
+
+        url = svc.models_url.rstrip("/") + "/" + svc.model
+        headers = {"Authorization": f"Bearer {svc.api_key}"}
+        with cancellable_requests(svc.session, self.cancel_token):
+            resp = svc.session.get(url, headers=headers, timeout=15)
+        if resp.status_code < 400:
+            return VALID, "API key is valid"
+        msg = f"HTTP {resp.status_code}: {resp.text[:300]}"
+        if resp.status_code == 404:
+            # 密钥已通过鉴权，但网关不提供单模型元数据或模型不存在：改查模型列表
+            return self._check_model_list(msg)
+        return self._classify_error(msg, resp.status_code), msg
+
+    def _check_model_list(self, metadata_error: str) -> Tuple[str, str]:
+        """单模型元数据返回 404 时用模型列表确认；列表同样不可用时仍视为密钥有效（只提示模型）"""
+        svc = self.service
+        ok, _models, msg = svc.list_models(force_refresh=True, cancel_token=self.cancel_token)
+        if not ok:
+            if self._classify_error(msg) == INVALID:
+                return INVALID, msg
+            return VALID, f"API key accepted, but model metadata unavailable ({metadata_error})"
+        ids = svc.catalog.get_model_ids(svc.models_url, svc.api_key) or []
+        if svc.model in ids:
+            return VALID, "API key is valid"
+        return VALID, f"API key is valid, but model {svc.model} was not found at this endpoint"
+
+    def _check_completion(self) -> Tuple[str, str]:
+        svc = self.service
+        headers = {
+            "Authorization": f"Bearer {svc.api_key}",
+            "Content-Type": "application/json"
+        }
+        body = {
+            "model": svc.model,
+            "messages": [{"role": "user", "content": "ping"}],
+            "max_tokens": 1
+        }
+        with cancellable_requests(svc.session, self.cancel_token):
+            resp = svc.session.post(svc.endpoint, headers=headers, data=json.dumps(body), timeout=15)
+        if resp.status_code < 400:
+            return VALID, "API key is valid"
+        msg = f"HTTP {resp.status_code}: {resp.text[:300]}"
+        # 限流与 5xx 不说明密钥无效，不能作为结论缓存
+        return self._classify_error(msg, resp.status_code), msg
+
+    @staticmethod
+    def _classify_error(message: str, status_code: Optional[int] = None) -> str:
+        """401/403 为明确的密钥无效；其他错误（网络、5xx）不下结论"""
+        if status_code is None and message.startswith("HTTP "):
+            try:
+                status_code = int(message[5:8])
+            except ValueError:
+                status_code = None
+        if status_code in (401, 403):
+            return INVALID
+        return INCONCLUSIVE
@@ -0,0 +1,179 @@
+# 分级模型路由 - 默认由快速的小模型回答，问题长或复杂、用户要求或小模型信心不足时升级到强模型
+
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .chat_client import DELTA, FINISH
+except ImportError:
+    from services.chat_client import DELTA, FINISH
+
+TIER_FAST = "fast"
+TIER_STRONG = "strong"
+
+# 需要推理或长篇解释的问题（代码、公式、推导、比较等）
+_COMPLEX_PATTERNS = [
+    re.compile(r"```"),
+    re.compile(r"\\(frac|int|sum|sqrt|begin)\b"),
+    re.compile(r"\b(step[- ]by[- ]step|prove|proof|derive|derivation|compare|contrast|analy[sz]e|"
+               r"in detail|trade-?offs?|pros and cons)\b", re.IGNORECASE),
+    re.compile(r"(详细|推导|证明|比较|对比|分析|区别|优缺点|一步一步)"),
+]
+# 多个问题一起问
+_MAX_QUESTIONS = 2
+
+# 小模型信心不足的说法
+_LOW_CONFIDENCE_PATTERNS = [
+    re.compile(r"\b(i'?m not (entirely |completely )?(sure|certain)|i don'?t know|i'?m unsure|"
+               r"i cannot (determine|be certain)|it'?s unclear|i may be wrong|not enough information)\b",
+               re.IGNORECASE),
+    re.compile(r"(不确定|我不知道|无法确定|不太清楚|可能不准确|信息不足)"),
+]
+
+# CJK 字符大约一个 token 一个，其余文本大约四个字符一个 token
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数（不依赖分词器）"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def is_complex(question: str) -> bool:
+    """问题是否需要强模型：匹配复杂问题模式，或一次问了多个问题"""
+    if any(p.search(question) for p in _COMPLEX_PATTERNS):
+        return True
+    return question.count("?") + question.count("？") > _MAX_QUESTIONS
+
+
+def low_confidence_reason(answer: str, finish_reason: Optional[str] = None) -> Optional[str]:
+    """快速模型的回答是否需要升级重答，返回原因（不需要时返回 None）"""
+    if not answer.strip():
+        return "empty_answer"
+    if finish_reason in ("length", "max_tokens"):
+        return "truncated"
+    if any(p.search(answer) for p in _LOW_CONFIDENCE_PATTERNS):
+        return "uncertain"
+    return None
+
+
+class CascadeDecision:
+    """本轮由哪一层回答：层级、模型与原因；回答结束后填入首个分片延迟与总耗时（毫秒）"""
+
+    __slots__ = ("tier", "model", "reason", "ttft_ms", "total_ms")
+
+    def __init__(self, tier: str, model: str, reason: str):
+        self.tier = tier
+        self.model = model
+        self.reason = reason
+        self.ttft_ms: Optional[float] = None
+        self.total_ms: Optional[float] = None
+
+    def __repr__(self):
+        return f"CascadeDecision({self.tier}, {self.model!r}, {self.reason})"
+
+
+def choose_tier(conversation_history: List[Dict[str, str]], settings: Dict[str, Any],
+                force_strong: bool = False) -> CascadeDecision:
+    """按分级配置（Config.get_cascade_config()）为本轮选择一层"""
+    question = next((m.get("content") or "" for m in reversed(conversation_history) if m.get("role") == "user"), "")
+    reason = None
+    if force_strong:
+        reason = "requested"
+    elif estimate_tokens(question) > settings["max_fast_prompt_tokens"]:
+        reason = "long_question"
+    elif is_complex(question):
+        reason = "complex"
+    elif sum(estimate_tokens(m.get("content") or "") for m in conversation_history) > settings["max_fast_context_tokens"]:
+        reason = "long_context"
+    if reason is not None:
+        return CascadeDecision(TIER_STRONG, settings["strong_model"], reason)
+    return CascadeDecision(TIER_FAST, settings["fast_model"], "default")
+
+
+def cascade_stream(stream_events: Callable[..., Iterator], conversation_history: List[Dict[str, str]],
+                   decision: Optional[CascadeDecision], settings: Optional[Dict[str, Any]] = None,
+                   cancel_token=None) -> Iterator[Tuple[str, Any]]:
+    """按分级决策流式回答；快速层回答信心不足时升级到强模型重答
+
+    产出 (kind, payload)：每一层开始时 ("tier", CascadeDecision)，随后是该层的 ("event", StreamEvent)。
+    decision 为 None 时不分级，使用服务自己的模型。
+    """
+    while True:
+        kwargs = {}
+        if decision is not None:
+            yield "tier", decision
+            kwargs["model"] = decision.model
+        started = time.monotonic()
+        parts, finish_reason = [], None
+        for event in stream_events(conversation_history, cancel_token=cancel_token, **kwargs):
+            if cancel_token is not None and cancel_token.is_cancelled:
+                return
+            if event.kind == DELTA:
+                if decision is not None and decision.ttft_ms is None:
+                    decision.ttft_ms = (time.monotonic() - started) * 1000.0
+                parts.append(event.text)
+            elif event.kind == FINISH:
+                finish_reason = event.finish_reason
+            yield "event", event
+        if decision is None or (cancel_token is not None and cancel_token.is_cancelled):
+            return
+        decision.total_ms = (time.monotonic() - started) * 1000.0
+        cascade_stats.record(decision)
+        if decision.tier != TIER_FAST or not (settings or {}).get("escalate_on_low_confidence", True):
+            return
+        reason = low_confidence_reason("".join(parts), finish_reason)
+        if reason is None:
+            return
+        cascade_stats.record_escalation(reason)
+        decision = CascadeDecision(TIER_STRONG, settings["strong_model"], reason)
+
+
+class CascadeStats:
+    """各层的回答次数、平均首个分片延迟与平均总耗时，以及升级原因计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, float]] = {}
+        self._escalations: Dict[str, int] = {}
+
+    def record(self, decision: CascadeDecision):
+        with self._lock:
+            stats = self._tiers.setdefault(decision.tier, {"count": 0, "ttft_ms": 0.0, "total_ms": 0.0, "ttft_count": 0})
+            stats["count"] += 1
+            stats["total_ms"] += decision.total_ms or 0.0
+            if decision.ttft_ms is not None:
+                stats["ttft_count"] += 1
+                stats["ttft_ms"] += decision.ttft_ms
+
+    def record_escalation(self, reason: str):
+        with self._lock:
+            self._escalations[reason] = self._escalations.get(reason, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {
+                tier: {
+                    "count": int(s["count"]),
+                    "avg_ttft_ms": s["ttft_ms"] / s["ttft_count"] if s["ttft_count"] else None,
+                    "avg_total_ms": s["total_ms"] / s["count"] if s["count"] else None,
+                }
+                for tier, s in self._tiers.items()
+            }
+            return {"tiers": tiers, "escalations": dict(self._escalations)}
+
+    def reset(self):
+        with self._lock:
+            self._tiers.clear()
+            self._escalations.clear()
+
+
+# 全局实例
+cascade_stats = CascadeStats()
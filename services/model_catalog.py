@@ -0,0 +1,230 @@
+# 模型目录缓存 - 按 端点 + 密钥指纹 持久化 /v1/models 结果
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..config import Config
+    from ..utils.helpers import fingerprint_api_key, get_user_files_dir
+except ImportError:
+    from config import Config
+    from utils.helpers import fingerprint_api_key, get_user_files_dir
+
+CATALOG_FILENAME = "model_catalog.json"
+LATENCY_HISTORY_SIZE = 20
+
+# 服务端未返回上下文长度时的已知值（按前缀匹配，越具体越靠前）
+KNOWN_CONTEXT_WINDOWS = [
+    ("gpt-4.1", 1047576),
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-32k", 32768),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo-instruct", 4096),
+    ("gpt-3.5-turbo", 16385),
+    ("gpt-5", 400000),
+    ("o1-mini", 128000),
+    ("o1", 200000),
+    ("o3", 200000),
+    ("o4-mini", 200000),
+]
+
+# 不支持聊天流式输出的模型类型关键词
+NON_STREAMING_KEYWORDS = ("embedding", "whisper", "tts", "dall-e", "moderation", "transcribe", "image")
+
+
+def _extract_context_window(item: Dict[str, Any]) -> Optional[int]:
+    """从模型条目或已知表中获取上下文长度"""
+    for field in ("context_window", "context_length", "max_context_length", "max_model_len"):
+        value = item.get(field)
+        if isinstance(value, int) and value > 0:
+            return value
+    top_provider = item.get("top_provider")
+    if isinstance(top_provider, dict) and isinstance(top_provider.get("context_length"), int):
+        return top_provider["context_length"]
+    model_id = item.get("id", "")
+    for prefix, window in KNOWN_CONTEXT_WINDOWS:
+        if model_id.startswith(prefix):
+            return window
+    return None
+
+
+def _supports_streaming(item: Dict[str, Any]) -> bool:
+    """判断模型是否支持流式聊天输出"""
+    if isinstance(item.get("streaming"), bool):
+        return item["streaming"]
+    model_id = item.get("id", "").lower()
+    return not any(keyword in model_id for keyword in NON_STREAMING_KEYWORDS)
+
+
+class ModelCatalog:
+    """模型目录缓存
+
+    每个 (模型列表 URL, 密钥指纹) 对应一个条目，记录模型元数据、ETag 与抓取时间。
+    条目在 TTL 内视为新鲜，可直接用于填充配置界面和验证密钥；过期后带 If-None-Match
+    重新请求，服务器返回 304 时只刷新时间戳。path 为 None 时仅保存在内存中。
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self.logger = logging.getLogger(__name__)
+        self._load()
+
+    @property
+    def ttl_seconds(self) -> float:
+        if self._ttl_seconds is not None:
+            return self._ttl_seconds
+        return float(Config.get("model_catalog_ttl_hours", 24)) * 3600.0
+
+    @staticmethod
+    def entry_key(models_url: str, api_key: str) -> str:
+        return f"{models_url}|{fingerprint_api_key(api_key)}"
+
+    # ---- 读取 ----
+
+    def get_entry(self, models_url: str, api_key: str) -> Optional[Dict[str, Any]]:
+        """获取条目副本（不存在时返回 None）"""
+        with self._lock:
+            entry = self._entries.get(self.entry_key(models_url, api_key))
+            return json.loads(json.dumps(entry)) if entry else None
+
+    def is_fresh(self, models_url: str, api_key: str) -> bool:
+        """条目是否在 TTL 内"""
+        with self._lock:
+            entry = self._entries.get(self.entry_key(models_url, api_key))
+            if not entry:
+                return False
+            return (time.time() - entry.get("fetched_at", 0)) < self.ttl_seconds
+
+    def get_model_ids(self, models_url: str, api_key: str, allow_stale: bool = False) -> Optional[List[str]]:
+        """获取缓存的模型 ID 列表；没有可用缓存时返回 None"""
+        if not allow_stale and not self.is_fresh(models_url, api_key):
+            return None
+        with self._lock:
+            entry = self._entries.get(self.entry_key(models_url, api_key))
+            if not entry:
+                return None
+            return list(entry.get("models", {}).keys())
+
+    def get_model_info(self, models_url: str, api_key: str, model: str) -> Optional[Dict[str, Any]]:
+        """获取单个模型的元数据（含延迟历史与中位数）"""
+        with self._lock:
+            entry = self._entries.get(self.entry_key(models_url, api_key))
+            info = (entry or {}).get("models", {}).get(model)
+            if info is None:
+                return None
+            info = json.loads(json.dumps(info))
+        for kind, samples in info.get("latency_ms", {}).items():
+            if samples:
+                ordered = sorted(samples)
+                info.setdefault("latency_p50_ms", {})[kind] = ordered[len(ordered) // 2]
+        return info
+
+    # ---- 写入 ----
+
+    def store(self, models_url: str, api_key: str, items: List[Dict[str, Any]], etag: Optional[str] = None):
+        """保存一次完整的模型列表（保留已有的延迟历史）"""
+        key = self.entry_key(models_url, api_key)
+        with self._lock:
+            previous = self._entries.get(key, {}).get("models", {})
+            models = {}
+            for item in items:
+                if not isinstance(item, dict) or not item.get("id"):
+                    continue
+                model_id = item["id"]
+                models[model_id] = {
+                    "owned_by": item.get("owned_by"),
+                    "context_window": _extract_context_window(item),
+                    "supports_streaming": _supports_streaming(item),
+                    "latency_ms": previous.get(model_id, {}).get("latency_ms", {}),
+                }
+            self._entries[key] = {
+                "fetched_at": time.time(),
+                "etag": etag,
+                "models": models,
+            }
+            self._dirty = True
+        self.flush()
+
+    def touch(self, models_url: str, api_key: str):
+        """服务器确认未变化（304）：只刷新抓取时间"""
+        with self._lock:
+            entry = self._entries.get(self.entry_key(models_url, api_key))
+            if not entry:
+                return
+            entry["fetched_at"] = time.time()
+            self._dirty = True
+        self.flush()
+
+    def record_latency(self, models_url: str, api_key: str, model: str, latency_ms: float, kind: str = "total"):
+        """记录某模型的一次请求延迟（kind: total / ttft），只保留最近若干次"""
+        if not model:
+            return
+        with self._lock:
+            entry = self._entries.get(self.entry_key(models_url, api_key))
+            if not entry:
+                return
+            info = entry.setdefault("models", {}).get(model)
+            if info is None:
+                return
+            samples = info.setdefault("latency_ms", {}).setdefault(kind, [])
+            samples.append(round(latency_ms, 1))
+            del samples[:-LATENCY_HISTORY_SIZE]
+            self._dirty = True
+
+    # ---- 持久化 ----
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._entries = data.get("entries", {})
+        except Exception as e:
+            self.logger.warning(f"Failed to load model catalog: {e}")
+            self._entries = {}
+
+    def flush(self):
+        """把未保存的修改写回磁盘（原子替换）"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = json.dumps({"version": 1, "entries": self._entries}, ensure_ascii=False)
+            self._dirty = False
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.warning(f"Failed to save model catalog: {e}")
+
+
+_catalog: Optional[ModelCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_model_catalog() -> ModelCatalog:
+    """获取插件级共享的模型目录（保存在 user_files 下）"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            try:
+                path = os.path.join(get_user_files_dir(), CATALOG_FILENAME)
+            except Exception:
+                path = None
+            _catalog = ModelCatalog(path)
+        return _catalog
@@ -1,20 +1,45 @@
-# OpenAI API服务（requests 直连实现，避免二进制依赖）
+# OpenAI API服务（标准库/requests 直连实现，避免二进制依赖）
 
 import logging
 import os
 import json
-from typing import List, Dict
+import threading
+import time
+from collections.abc import Mapping
+from typing import List, Dict, Optional
+from urllib.parse import urlparse
 
 # 尝试相对导入，如果失败则使用绝对导入
 try:
     from ..config import Config
+    from .model_catalog import get_model_catalog
+    from .key_validator import KeyValidator
+    from .cancellation import CancelledError
+    from .chat_client import DELTA, StreamEvent
+    from .endpoint_router import (PRIMARY_ENDPOINT, EndpointProfile, endpoint_router, load_endpoint_profiles,
+                                  should_fail_over)
+    from .hedging import deadline_timer, hedge_delay_seconds, hedged_stream, ttft_tracker
+    from .transport import (TransportError, cancellable_requests, create_transport, load_requests,
+                            parse_chat_chunk)
 except ImportError:
     from config import Config
+    from services.model_catalog import get_model_catalog
+    from services.key_validator import KeyValidator
+    from services.cancellation import CancelledError
+    from services.chat_client import DELTA, StreamEvent
+    from services.endpoint_router import (PRIMARY_ENDPOINT, EndpointProfile, endpoint_router,
+                                          load_endpoint_profiles, should_fail_over)
+    from services.hedging import deadline_timer, hedge_delay_seconds, hedged_stream, ttft_tracker
+    from services.transport import (TransportError, cancellable_requests, create_transport, load_requests,
+                                    parse_chat_chunk)
+
+
+def __getattr__(name):
+    # 兼容旧代码对 openai_service.requests 的引用，同时保持 requests 延迟导入
+    if name == "requests":
+        return load_requests()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-try:
-    import requests
-except Exception:
-    requests = None
 
 class OpenAIService:
     """OpenAI API服务类（不依赖 openai 官方包，避免 pydantic-core 依赖）"""
@@ -30,94 +55,417 @@ class OpenAIService:
 
         self.logger = logging.getLogger(__name__)
         self.endpoint = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1/chat/completions")
+        self.models_url = os.environ.get("OPENAI_MODELS_URL", "https://api.openai.com/v1/models")
+
+        # 模型目录缓存（持久化，按端点与密钥指纹区分）
+        self.catalog = get_model_catalog()
+
+        # 长连接会话：同一实例内复用 TCP/TLS 连接池（实例由 ServiceRegistry 共享）
+        self._session = None
+        # 聊天请求走可替换的传输层（默认 http.client；requests 传输共用上面的会话）
+        try:
+            self.transport = create_transport(Config.get_transport_config()["transport"], lambda: self.session)
+        except Exception as e:
+            self.logger.warning(f"No HTTP transport available: {e}")
+            self.transport = None
+        # 端点配置档各自的传输（各自的连接池），第一次路由到该端点时创建
+        self._endpoint_transports = {}
+        self._endpoint_transports_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            "requests": 0,
+            "errors": 0,
+            "total_latency_ms": 0.0,
+            "hedged": 0,
+            "hedge_wins": 0,
+        }
+
+    @property
+    def session(self):
+        """requests 会话：模型列表、密钥验证与 requests 传输使用，第一次访问时才导入 requests"""
+        if self._session is None:
+            requests = load_requests()
+            if requests is not None:
+                self._session = requests.Session()
+        return self._session
+
+    @session.setter
+    def session(self, value):
+        self._session = value
+
+    def _record_request(self, started: float, ok: bool):
+        """记录一次 HTTP 请求的耗时与结果"""
+        elapsed_ms = (time.monotonic() - started) * 1000.0
+        with self._metrics_lock:
+            self.metrics["requests"] += 1
+            self.metrics["total_latency_ms"] += elapsed_ms
+            if not ok:
+                self.metrics["errors"] += 1
+
+    def get_metrics(self):
+        """获取请求统计（快照）"""
+        with self._metrics_lock:
+            snapshot = dict(self.metrics)
+        count = snapshot["requests"]
+        snapshot["avg_latency_ms"] = (snapshot["total_latency_ms"] / count) if count else 0.0
+        return snapshot
+
+    def warm_connection(self, timeout: float = 5.0) -> float:
+        """向端点源站发送 HEAD 请求以建立/保持连接，返回耗时（毫秒）
+
+        任何 HTTP 状态码都说明 DNS/TCP/TLS 已完成，连接会留在连接池中供后续对话复用。
+        """
+        if self.transport is None:
+            raise RuntimeError("No HTTP transport available")
+        parsed = urlparse(self.endpoint)
+        origin = f"{parsed.scheme}://{parsed.netloc}/"
+        started = time.monotonic()
+        # 经由聊天使用的传输发送，连接留在同一个连接池中
+        self.transport.request("HEAD", origin, {}, None, timeout=timeout)
+        return (time.monotonic() - started) * 1000.0
+
+    def _record_model_latency(self, started: float, kind: str, model: Optional[str] = None):
+        """把本次请求延迟记入模型目录的历史"""
+        try:
+            elapsed_ms = (time.monotonic() - started) * 1000.0
+            self.catalog.record_latency(self.models_url, self.api_key, model or self.model, elapsed_ms, kind)
+        except Exception:
+            pass
+
+    def close(self):
+        """关闭连接池"""
+        try:
+            self.catalog.flush()
+        except Exception:
+            pass
+        with self._endpoint_transports_lock:
+            transports = [self.transport] + list(self._endpoint_transports.values())
+            self._endpoint_transports.clear()
+        for transport in transports:
+            if transport is None:
+                continue
+            try:
+                transport.close()
+            except Exception:
+                pass
+        if self._session is not None:
+            try:
+                self._session.close()
+            except Exception:
+                pass
+
+    def _endpoint_plan(self):
+        """本次请求依次尝试的端点：未配置端点配置档时只有主端点，否则由路由按延迟与错误率排列
+
+        主端点没有密钥时不参与路由；没有任何可用端点时返回空列表。
+        """
+        settings = Config.get_endpoint_config()
+        primary = EndpointProfile(PRIMARY_ENDPOINT, self.endpoint, self.api_key)
+        profiles = load_endpoint_profiles(settings["profiles"])
+        if not profiles:
+            return [primary] if self.api_key else []
+        endpoint_router.configure(settings["ewma_alpha"], settings["eject_failures"],
+                                  settings["eject_seconds"], settings["max_eject_seconds"])
+        by_name = {p.name: p for p in ([primary] if self.api_key else []) + profiles}
+        fallback = [name for name in settings["fallback"] if name in by_name]
+        balanced = [name for name in by_name if name not in fallback]
+        return [by_name[name] for name in endpoint_router.plan(balanced, fallback)]
+
+    def _transport_for(self, profile: EndpointProfile):
+        """端点使用的传输：主端点用 self.transport，其他端点各有一个"""
+        if profile.name == PRIMARY_ENDPOINT:
+            return self.transport
+        with self._endpoint_transports_lock:
+            transport = self._endpoint_transports.get(profile.name)
+            if transport is None:
+                transport = create_transport(Config.get_transport_config()["transport"], lambda: self.session)
+                self._endpoint_transports[profile.name] = transport
+            return transport
+
+    def _record_endpoint(self, profile, started: float, ok: bool):
+        """把一次请求的延迟与结果记入端点路由统计"""
+        if profile is not None:
+            endpoint_router.record(profile.name, (time.monotonic() - started) * 1000.0, ok, profile.url)
 
     def get_response(self, conversation_history: List[Dict[str, str]]):
-        """获取AI回复（一次性请求）"""
+        """获取AI回复（一次性请求）；失败时按路由顺序换下一个端点"""
         if not conversation_history:
             return self._handle_api_error("Empty conversation history")
-        if not requests:
-            return self._handle_api_error("'requests' library not available")
-        if not self.api_key:
+        if self.transport is None:
+            return self._handle_api_error("No HTTP transport available")
+        plan = self._endpoint_plan()
+        if not plan:
             return self._handle_api_error("Invalid or missing API key")
 
+        last_error = None
+        for profile in plan:
+            started = time.monotonic()
+            try:
+                headers = {"Content-Type": "application/json"}
+                if profile.api_key:
+                    headers["Authorization"] = f"Bearer {profile.api_key}"
+                body = {
+                    "model": profile.model_for(self.model),
+                    "messages": conversation_history,
+                    "max_tokens": self.max_tokens,
+                    "temperature": self.temperature
+                }
+                transport = self._transport_for(profile)
+                resp = transport.request("POST", profile.url, headers, json.dumps(body).encode("utf-8"), timeout=30)
+            except Exception as e:
+                self._record_endpoint(profile, started, False)
+                last_error = str(e)
+                continue
+            try:
+                self._record_request(started, resp.status < 400)
+                self._record_endpoint(profile, started, resp.status < 400)
+                if resp.status < 400 and profile.name == PRIMARY_ENDPOINT:
+                    self._record_model_latency(started, "total")
+                if resp.status >= 400:
+                    last_error = f"HTTP {resp.status}: {resp.text[:300]}"
+                    if should_fail_over(TransportError(last_error, resp.status)):
+                        continue
+                    return self._handle_api_error(last_error)
+                data = resp.json()
+                choices = data.get("choices", [])
+                if not choices:
+                    return self._handle_api_error("No response choices from API")
+                content = choices[0].get("message", {}).get("content")
+                if not content:
+                    return self._handle_api_error("Empty response from API")
+                return content.strip()
+            except Exception as e:
+                return self._handle_api_error(str(e))
+        return self._handle_api_error(last_error)
+
+    def stream_response(self, conversation_history: List[Dict[str, str]], cancel_token=None,
+                        model: Optional[str] = None):
+        """流式响应生成器（使用 OpenAI Chat Completions 流式接口）
+
+        传入 cancel_token 时，取消会立即关闭底层套接字：阻塞中的读取马上返回，服务端也随之停止生成，
+        生成器安静地结束（已产出的分片由调用方保留）。
+        首个分片与完整回答各有截止时间；启用对冲时，迟迟不出字的请求会被一个相同的请求追赶，先出字者胜。
+        model 为本轮使用的模型（分级路由），默认使用 self.model；端点的模型映射同样适用。
+        """
+        for event in self.stream_events(conversation_history, cancel_token=cancel_token, model=model):
+            if event.kind == DELTA:
+                yield event.text
+
+    def stream_events(self, conversation_history: List[Dict[str, str]], cancel_token=None,
+                      model: Optional[str] = None):
+        """流式回答事件（与 Anthropic/Gemini 客户端相同的协议）：文本分片，最后是结束原因"""
+        model = model or self.model
+        if self.transport is None:
+            raise RuntimeError("No HTTP transport available")
+        if cancel_token is not None and cancel_token.is_cancelled:
+            return
+        plan = self._endpoint_plan()
+        if not plan:
+            raise TransportError("Invalid or missing API key")
+        settings = Config.get_hedging_config()
+        attempts = list(plan)
+        hedge_delay = None
+        if settings["enabled"]:
+            # 对冲请求发往 hedge_endpoint；未设置时发往路由中的下一个端点（只有一个端点时重发给它）
+            if settings["endpoint"]:
+                attempts.insert(1, self._hedge_profile(settings))
+            elif len(attempts) == 1:
+                attempts.append(plan[0])
+            hedge_delay = self.hedge_delay(settings, plan[0], model)
+        # 不同端点之间按端点相关的错误（密钥、模型映射）也换端点重试
+        failover = len({profile.name for profile in attempts}) > 1
+        yield from hedged_stream(
+            lambda index, token: self._stream_once(conversation_history, attempts[index], token, model),
+            hedge_delay=hedge_delay,
+            max_attempts=len(attempts),
+            first_token_timeout=settings["first_token_timeout"] or None,
+            total_timeout=settings["total_timeout"] or None,
+            cancel_token=cancel_token,
+            on_event=self._record_hedge_event,
+            retryable=should_fail_over if failover else None,
+        )
+
+    def _stream_once(self, conversation_history, profile, cancel_token=None, model=None):
+        """向一个端点发送一次流式请求并产出流式事件"""
+        model = model or self.model
+        headers, body = self._stream_request(conversation_history, profile.api_key, profile.model_for(model))
+        transport = self._transport_for(profile)
+        started = time.monotonic()
+        produced = False
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            body = {
-                "model": self.model,
-                "messages": conversation_history,
-                "max_tokens": self.max_tokens,
-                "temperature": self.temperature
-            }
-            resp = requests.post(self.endpoint, headers=headers, data=json.dumps(body), timeout=30)
-            if resp.status_code >= 400:
-                return self._handle_api_error(f"HTTP {resp.status_code}: {resp.text[:300]}")
-            data = resp.json()
-            choices = data.get("choices", [])
-            if not choices:
-                return self._handle_api_error("No response choices from API")
-            content = choices[0].get("message", {}).get("content")
-            if not content:
-                return self._handle_api_error("Empty response from API")
-            return content.strip()
-        except Exception as e:
-            return self._handle_api_error(str(e))
+            try:
+                r = transport.stream(profile.url, headers, body, timeout=60, cancel_token=cancel_token)
+            except CancelledError:
+                return
+            except Exception:
+                self._record_endpoint(profile, started, False)
+                raise
+            with r:
+                self._record_request(started, r.status < 400)
+                if r.status >= 400:
+                    self._record_endpoint(profile, started, False)
+                    raise TransportError(f"HTTP {r.status}: {r.read_text(300)}", r.status)
+                for event in self._iter_stream_events(r.iter_events(), started, cancel_token, profile, model):
+                    produced = True
+                    yield event
+        finally:
+            # 出字前被取消（对冲落败、首个分片超时）的尝试也计入 TTFT 统计
+            if not produced and cancel_token is not None and cancel_token.is_cancelled:
+                self._record_censored_ttft(started, profile, model)
+
+    def _hedge_profile(self, settings) -> EndpointProfile:
+        """对冲请求的目标端点
+
+        hedge_endpoint 为端点配置档名称（或主端点 "openai"）时使用该端点自己的密钥与模型映射；
+        为地址时只带 hedge_api_key，不会把其他端点的密钥发往另一台主机。
+        """
+        target = settings["endpoint"]
+        if target == PRIMARY_ENDPOINT:
+            return EndpointProfile(PRIMARY_ENDPOINT, self.endpoint, self.api_key)
+        for profile in load_endpoint_profiles(Config.get_endpoint_config()["profiles"]):
+            if profile.name == target:
+                return profile
+        return EndpointProfile("hedge", target, settings["api_key"])
+
+    def hedge_delay(self, settings=None, profile=None, model=None) -> float:
+        """对冲等待时间（秒）：首选端点与模型历史 TTFT 的分位数"""
+        settings = settings or Config.get_hedging_config()
+        profile = profile or EndpointProfile(PRIMARY_ENDPOINT, self.endpoint, self.api_key)
+        model = model or self.model
+        key = (profile.url, profile.model_for(model))
+        if ttft_tracker.count(key) == 0 and profile.name == PRIMARY_ENDPOINT:
+            try:
+                info = self.catalog.get_model_info(self.models_url, self.api_key, model) or {}
+                ttft_tracker.seed(key, info.get("latency_ms", {}).get("ttft", []))
+            except Exception:
+                pass
+        return hedge_delay_seconds(ttft_tracker, key, settings["percentile"],
+                                   settings["min_delay_ms"], settings["max_delay_ms"])
+
+    def _record_hedge_event(self, kind, index):
+        with self._metrics_lock:
+            if kind == "hedge":
+                self.metrics["hedged"] += 1
+            elif kind == "win" and index > 0:
+                self.metrics["hedge_wins"] += 1
+
+    def start_stream_response(self, conversation_history: List[Dict[str, str]], on_delta, on_done, cancel_token=None):
+        """在 GUI 线程发起流式请求，分片通过回调交付（仅支持回调的传输可用，例如 Qt 传输）
+
+        每个文本分片调用 on_delta(text)，结束时调用 on_done(error)（成功时 error 为 None）；
+        被取消时不再回调。请求发往路由选出的唯一端点，首个分片与完整回答的截止时间同样适用。
+        传输不支持回调、需要故障转移（多个端点）或启用了对冲时返回 None，调用方改用 stream_response()。
+        """
+        plan = self._endpoint_plan()
+        settings = Config.get_hedging_config()
+        if len(plan) != 1 or settings["enabled"]:
+            return None
+        profile = plan[0]
+        transport = self._transport_for(profile)
+        if transport is None or not getattr(transport, "supports_callbacks", False):
+            return None
+        headers, body = self._stream_request(conversation_history, profile.api_key, profile.model_for(self.model))
+        started = time.monotonic()
+        state = {"first_delta": True, "finished": False, "expired": None, "done": False}
+        timers = []
+
+        def on_event(data):
+            if state["finished"]:
+                return
+            deltas, finish_reason = parse_chat_chunk(data)
+            for delta in deltas:
+                if state["first_delta"]:
+                    state["first_delta"] = False
+                    self._record_first_delta(started, profile)
+                on_delta(delta)
+            state["finished"] = finish_reason is not None
+
+        def on_finished(status, error):
+            state["done"] = True
+            for entry in timers:
+                deadline_timer.cancel(entry)
+            if state["expired"]:
+                error = state["expired"]
+            self._record_request(started, error is None)
+            if error is not None and state["first_delta"]:
+                self._record_endpoint(profile, started, False)
+            on_done(error)
+
+        handle = transport.start_stream(profile.url, headers, body, on_event, on_finished,
+                                        timeout=60, cancel_token=cancel_token)
 
-    def stream_response(self, conversation_history: List[Dict[str, str]]):
-        """流式响应生成器（使用 OpenAI Chat Completions 流式接口）"""
-        if not requests:
-            raise RuntimeError("'requests' library not available")
+        def expire(message, first_only):
+            # 在计时线程中执行：只做标记并中止请求（abort 可在任意线程调用），错误由 on_finished 报告
+            if state["done"] or state["expired"] or (first_only and not state["first_delta"]):
+                return
+            if cancel_token is not None and cancel_token.is_cancelled:
+                return
+            state["expired"] = message
+            abort = getattr(handle, "abort", None)
+            if abort is not None:
+                abort()
+
+        if settings["first_token_timeout"] and not state["done"]:
+            timers.append(deadline_timer.schedule(settings["first_token_timeout"], lambda: expire(
+                f"No response within {settings['first_token_timeout']:.0f}s", True)))
+        if settings["total_timeout"] and not state["done"]:
+            timers.append(deadline_timer.schedule(settings["total_timeout"], lambda: expire(
+                f"No complete response within {settings['total_timeout']:.0f}s", False)))
+        return handle
+
+    def _stream_request(self, conversation_history, api_key=None, model=None):
+        """流式请求的请求头与正文（默认使用主端点的密钥与模型）"""
+        api_key = self.api_key if api_key is None else api_key
         headers = {
-            "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
             "Accept": "text/event-stream"
         }
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
         body = {
-            "model": self.model,
+            "model": model or self.model,
             "messages": conversation_history,
             "temperature": self.temperature,
             "stream": True
         }
-        with requests.post(self.endpoint, headers=headers, data=json.dumps(body), stream=True, timeout=60) as r:
-            r.raise_for_status()
-            buffer = ""
-            for line in r.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                if line.startswith("data: "):
-                    data = line[len("data: "):].strip()
-                    if data == "[DONE]":
-                        break
-                    # 有些网关可能一次传多条 JSON，用换行或空格相连，这里做一次拆分
-                    chunks = [data]
-                    if "}{" in data:
-                        # 朴素拆分，尽量不中断
-                        chunks = data.replace('}{', '}\n{').split('\n')
-                    for chunk in chunks:
-                        if not chunk or chunk == "[DONE]":
-                            continue
-                        try:
-                            obj = json.loads(chunk)
-                            choices = obj.get("choices", [])
-                            if not choices:
-                                continue
-                            choice = choices[0]
-                            delta = None
-                            # 兼容 Azure/第三方的字段名
-                            if "delta" in choice:
-                                delta = choice["delta"].get("content")
-                            elif "message" in choice and isinstance(choice["message"], dict):
-                                delta = choice["message"].get("content")
-                            if delta:
-                                yield delta
-                            # 处理结束原因
-                            finish = choice.get("finish_reason")
-                            if finish:
-                                return
-                        except Exception:
-                            continue
+        return headers, json.dumps(body).encode("utf-8")
+
+    def _iter_stream_events(self, events, started, cancel_token=None, profile=None, model=None):
+        """解析 SSE 事件序列并产出文本分片与结束原因；首个分片的延迟记入端点统计"""
+        first_delta = True
+        try:
+            for data in events:
+                if cancel_token is not None and cancel_token.is_cancelled:
+                    return
+                deltas, finish_reason = parse_chat_chunk(data)
+                for delta in deltas:
+                    if first_delta:
+                        first_delta = False
+                        self._record_first_delta(started, profile, model)
+                    yield StreamEvent.delta(delta)
+                if finish_reason:
+                    yield StreamEvent.finish(finish_reason)
+                    return
+        except Exception:
+            if first_delta:
+                self._record_endpoint(profile, started, False)
+            raise
+
+    def _record_first_delta(self, started, profile=None, model=None):
+        """记录首个分片延迟（TTFT）：模型目录历史、对冲统计与端点路由统计"""
+        model = model or self.model
+        if profile is None or profile.name == PRIMARY_ENDPOINT:
+            self._record_model_latency(started, "ttft", model)
+        url, model = (profile.url, profile.model_for(model)) if profile is not None else (self.endpoint, model)
+        ttft_tracker.record((url, model), (time.monotonic() - started) * 1000.0)
+        self._record_endpoint(profile, started, True)
+
+    def _record_censored_ttft(self, started, profile, model=None):
+        """出字前结束的尝试：已等待的时间是 TTFT 的下界"""
+        model = model or self.model
+        url, model = (profile.url, profile.model_for(model)) if profile is not None else (self.endpoint, model)
+        ttft_tracker.record_censored((url, model), (time.monotonic() - started) * 1000.0,
+                                     Config.get_hedging_config()["percentile"])
 
     def _handle_api_error(self, error_message: str):
         """处理API错误"""
@@ -128,43 +476,28 @@ class OpenAIService:
             print(f"OpenAI API Error: {error_message}")
         return error_text
 
-    def validate_api_key(self):
-        """验证API密钥（最小化请求）"""
-        if not requests:
+    def validate_api_key(self, allow_completion=False, cancel_token=None):
+        """分级验证API密钥：模型目录缓存 → 元数据接口 →（仅在明确要求时）补全请求
+
+        cancel_token 被取消时关闭进行中的请求并抛出 CancelledError。
+        """
+        if self.session is None:
             return False, "'requests' library not available"
         if not self.api_key:
             return False, "Invalid or missing API key"
         try:
-            # 如果未指定模型，改用 models 列表接口做快速校验
-            if not self.model:
-                url = os.environ.get("OPENAI_MODELS_URL", "https://api.openai.com/v1/models")
-                headers = {"Authorization": f"Bearer {self.api_key}"}
-                resp = requests.get(url, headers=headers, timeout=15)
-                if resp.status_code >= 400:
-                    return False, f"HTTP {resp.status_code}: {resp.text[:300]}"
-                return True, "API key is valid"
-            # 有模型时，最小请求
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            body = {
-                "model": self.model,
-                "messages": [{"role": "user", "content": "ping"}],
-                "max_tokens": 1
-            }
-            resp = requests.post(self.endpoint, headers=headers, data=json.dumps(body), timeout=15)
-            if resp.status_code >= 400:
-                return False, f"HTTP {resp.status_code}: {resp.text[:300]}"
-            return True, "API key is valid"
+            return KeyValidator(self, cancel_token).validate(allow_completion=allow_completion)
+        except CancelledError:
+            raise
         except Exception as e:
             return False, f"API key validation failed: {str(e)}"
 
     def get_service_status(self):
         """获取服务状态"""
         status = {
-            "openai_available": True,  # requests 直连，不依赖 openai 包
+            "openai_available": True,  # 直连，不依赖 openai 包
             "api_key_set": bool(self.api_key),
+            "transport": self.transport.name if self.transport is not None else None,
             "model": self.model,
             "max_tokens": self.max_tokens,
             "temperature": self.temperature
@@ -189,23 +522,55 @@ class OpenAIService:
         if "temperature" in new_config:
             self.temperature = new_config["temperature"]
 
-    def list_models(self):
-        """列出可用模型（OpenAI /v1/models），过滤常见聊天模型"""
-        if not requests:
+    @staticmethod
+    def _filter_chat_models(ids):
+        """粗略过滤常用聊天模型关键词"""
+        return [i for i in ids if any(k in i for k in ["gpt-", "o-"])]
+
+    def get_cached_models(self):
+        """从模型目录缓存读取模型列表（不发请求，可能已过期），无缓存时返回 None"""
+        if not self.api_key:
+            return None
+        ids = self.catalog.get_model_ids(self.models_url, self.api_key, allow_stale=True)
+        if ids is None:
+            return None
+        return self._filter_chat_models(ids)
+
+    def list_models(self, force_refresh=False, cancel_token=None):
+        """列出可用模型（OpenAI /v1/models），过滤常见聊天模型
+
+        优先使用新鲜的模型目录缓存；过期时带 ETag 做条件请求，304 时沿用缓存。
+        cancel_token 被取消时关闭进行中的请求并抛出 CancelledError。
+        """
+        if self.session is None:
             return False, [], "'requests' library not available"
         if not self.api_key:
             return False, [], "Missing API key"
+        url = self.models_url
+        if not force_refresh:
+            cached = self.catalog.get_model_ids(url, self.api_key)
+            if cached is not None:
+                return True, self._filter_chat_models(cached), "OK (cached)"
         try:
-            url = os.environ.get("OPENAI_MODELS_URL", "https://api.openai.com/v1/models")
             headers = {"Authorization": f"Bearer {self.api_key}"}
-            resp = requests.get(url, headers=headers, timeout=15)
+            entry = self.catalog.get_entry(url, self.api_key)
+            if entry and entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            with cancellable_requests(self.session, cancel_token):
+                resp = self.session.get(url, headers=headers, timeout=15)
+            if resp.status_code == 304 and entry:
+                self.catalog.touch(url, self.api_key)
+                return True, self._filter_chat_models(list(entry.get("models", {}).keys())), "OK (not modified)"
             if resp.status_code >= 400:
                 return False, [], f"HTTP {resp.status_code}: {resp.text[:300]}"
             data = resp.json()
             items = data.get("data", [])
+            resp_headers = getattr(resp, "headers", None)
+            etag = resp_headers.get("ETag") if isinstance(resp_headers, Mapping) else None
+            self.catalog.store(url, self.api_key, items, etag)
             ids = [m.get("id") for m in items if isinstance(m, dict) and m.get("id")]
-            # 粗略过滤常用聊天模型关键词
-            chat_ids = [i for i in ids if any(k in i for k in ["gpt-", "o-"])]
-            return True, chat_ids, "OK"
+            return True, self._filter_chat_models(ids), "OK"
+        except CancelledError:
+            raise
         except Exception as e:
             return False, [], str(e)
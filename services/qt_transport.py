@@ -0,0 +1,201 @@
+# Qt 网络传输 - 用 QNetworkAccessManager 在 GUI 事件循环中收发请求，SSE 分片直接回调给界面
+
+import logging
+from typing import Callable, Dict, Optional
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .cancellation import CancelToken
+    from .transport import HTTPResponse, RequestsTransport, SSEParser, Transport
+except ImportError:
+    from services.cancellation import CancelToken
+    from services.transport import HTTPResponse, RequestsTransport, SSEParser, Transport
+
+try:
+    from aqt.qt import QByteArray, QMetaObject, QNetworkAccessManager, QNetworkRequest, QThread, QUrl, Qt
+except ImportError:
+    try:
+        from PyQt6.QtCore import QByteArray, QMetaObject, QThread, QUrl, Qt
+        from PyQt6.QtNetwork import QNetworkAccessManager, QNetworkRequest
+    except ImportError:
+        QNetworkAccessManager = None
+
+
+def _enum(owner, scope: str, name: str):
+    """兼容 PyQt6 的作用域枚举与 PyQt5 的扁平枚举"""
+    scoped = getattr(owner, scope, None)
+    if scoped is not None and hasattr(scoped, name):
+        return getattr(scoped, name)
+    return getattr(owner, name)
+
+
+class QtStreamHandle:
+    """一个进行中的 Qt 请求；abort() 可以在任意线程调用"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.finished = False
+
+    def abort(self):
+        reply = self.reply
+        if reply is None or self.finished:
+            return
+        try:
+            if QThread.currentThread() is reply.thread():
+                reply.abort()
+            else:
+                QMetaObject.invokeMethod(reply, "abort", _enum(Qt, "ConnectionType", "QueuedConnection"))
+        except RuntimeError:
+            # 底层 C++ 对象已被删除
+            pass
+
+
+class QtTransport(Transport):
+    """基于 QNetworkAccessManager 的传输（只能在 GUI 线程中发起）
+
+    start_stream()/start_request() 立即返回，响应数据在 readyRead/finished 信号中解析并回调，
+    不需要后台线程、队列或定时器轮询；连接复用与 HTTP/2 由 Qt 负责。
+    阻塞接口 request()/stream() 供后台线程调用，交给回退传输（requests）完成。
+    """
+
+    name = "qt"
+    supports_callbacks = True
+    uses_session = True
+
+    def __init__(self, fallback: Optional[Transport] = None, get_session=None):
+        if QNetworkAccessManager is None:
+            raise RuntimeError("QtNetwork not available")
+        self._manager = None
+        self._fallback = fallback
+        self._get_session = get_session
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def manager(self):
+        # 在第一次使用的（GUI）线程中创建，QNetworkAccessManager 与创建线程绑定
+        if self._manager is None:
+            self._manager = QNetworkAccessManager()
+        return self._manager
+
+    @property
+    def fallback(self) -> Transport:
+        if self._fallback is None:
+            self._fallback = RequestsTransport(self._get_session)
+        return self._fallback
+
+    def _build_request(self, url: str, headers: Dict[str, str], timeout: float):
+        request = QNetworkRequest(QUrl(url))
+        for name, value in headers.items():
+            request.setRawHeader(QByteArray(name.encode("latin-1")), QByteArray(str(value).encode("latin-1")))
+        try:
+            request.setAttribute(_enum(QNetworkRequest, "Attribute", "Http2AllowedAttribute"), True)
+        except (AttributeError, TypeError):
+            pass
+        if timeout and hasattr(request, "setTransferTimeout"):
+            # 超过这么久没有收发任何数据才算超时，长时间生成的流不受影响
+            request.setTransferTimeout(int(timeout * 1000))
+        return request
+
+    @staticmethod
+    def _status(reply) -> int:
+        status = reply.attribute(_enum(QNetworkRequest, "Attribute", "HttpStatusCodeAttribute"))
+        try:
+            return int(status or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def _headers(reply) -> Dict[str, str]:
+        return {bytes(name).decode("latin-1").lower(): bytes(value).decode("latin-1")
+                for name, value in reply.rawHeaderPairs()}
+
+    def _send(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes], timeout: float):
+        request = self._build_request(url, headers, timeout)
+        if method == "POST":
+            return self.manager.post(request, QByteArray(body or b""))
+        if method == "GET":
+            return self.manager.get(request)
+        return self.manager.sendCustomRequest(request, QByteArray(method.encode("ascii")), QByteArray(body or b""))
+
+    # ---- 回调接口（GUI 线程） ----
+
+    def start_stream(self, url: str, headers: Dict[str, str], body: bytes,
+                     on_event: Callable[[str], None], on_done: Callable[[int, Optional[str]], None],
+                     timeout: float = 60, cancel_token: Optional[CancelToken] = None) -> QtStreamHandle:
+        """发出流式请求：每个 SSE 事件调用 on_event(data)，结束时调用 on_done(status, error)
+
+        HTTP 错误状态时不解析事件，error 为响应正文；被取消时 on_done 不会被调用。
+        """
+        reply = self._send("POST", url, headers, body, timeout)
+        handle = QtStreamHandle(reply)
+        parser = SSEParser()
+        error_body = []
+
+        def on_ready_read():
+            data = bytes(reply.readAll())
+            if not data:
+                return
+            if self._status(reply) >= 400:
+                error_body.append(data)
+                return
+            for event in parser.feed(data):
+                if handle.finished:
+                    return
+                on_event(event)
+
+        def on_finished():
+            if handle.finished:
+                return
+            on_ready_read()
+            handle.finished = True
+            reply.deleteLater()
+            if cancel_token is not None:
+                cancel_token.remove_callback(handle.abort)
+                if cancel_token.is_cancelled:
+                    return
+            status = self._status(reply)
+            error = None
+            if status >= 400:
+                error = f"HTTP {status}: {b''.join(error_body).decode('utf-8', errors='replace')[:300]}"
+            elif reply.error() != _enum(type(reply), "NetworkError", "NoError"):
+                error = reply.errorString()
+            else:
+                for event in parser.close():
+                    on_event(event)
+            on_done(status, error)
+
+        reply.readyRead.connect(on_ready_read)
+        reply.finished.connect(on_finished)
+        if cancel_token is not None:
+            cancel_token.add_callback(handle.abort)
+        return handle
+
+    def start_request(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes],
+                      on_done: Callable[[Optional[HTTPResponse], Optional[str]], None], timeout: float = 30):
+        """发出一次性请求，完成后调用 on_done(response, error)"""
+        reply = self._send(method, url, headers, body, timeout)
+        handle = QtStreamHandle(reply)
+
+        def on_finished():
+            handle.finished = True
+            reply.deleteLater()
+            status = self._status(reply)
+            if status == 0 and reply.error() != _enum(type(reply), "NetworkError", "NoError"):
+                on_done(None, reply.errorString())
+                return
+            on_done(HTTPResponse(status, self._headers(reply), bytes(reply.readAll())), None)
+
+        reply.finished.connect(on_finished)
+        return handle
+
+    # ---- 阻塞接口（后台线程） ----
+
+    def request(self, method, url, headers, body=None, timeout=30):
+        return self.fallback.request(method, url, headers, body, timeout)
+
+    def stream(self, url, headers, body, timeout=60, cancel_token=None):
+        return self.fallback.stream(url, headers, body, timeout, cancel_token)
+
+    def close(self):
+        if self._fallback is not None:
+            self._fallback.close()
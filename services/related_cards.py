@@ -0,0 +1,544 @@
+# 相关卡片索引 - 基于笔记文本的本地 BM25 倒排索引，为对话提供集合中的相关卡片作为上下文
+
+import heapq
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..utils.helpers import STOP_WORDS, get_profile_file_suffix, get_user_files_dir
+    from ..utils.html_text import html_to_text
+    from ..utils.search_text import tokenize
+    from .executor_service import PRIORITY_BULK, executor
+except ImportError:
+    from utils.helpers import STOP_WORDS, get_profile_file_suffix, get_user_files_dir
+    from utils.html_text import html_to_text
+    from utils.search_text import tokenize
+    from services.executor_service import PRIORITY_BULK, executor
+
+try:
+    from aqt import mw
+    ANKI_AVAILABLE = True
+except ImportError:
+    mw = None
+    ANKI_AVAILABLE = False
+
+INDEX_FILENAME = "related_index{suffix}.bin"
+_MAGIC = b"CWCBM25\x01"
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 每篇笔记最多索引的字符数、单个词频上限（postings 中词频为 16 位）
+MAX_NOTE_CHARS = 20000
+MAX_TF = 0xFFFF
+
+# 查询时最多遍历的 postings 数：按 IDF 从高到低取查询词直到用完预算，
+# 高频词 IDF 接近 0、贡献很小，跳过它们让 10 万笔记的集合也能在几毫秒内返回
+QUERY_POSTING_BUDGET = 20000
+MAX_QUERY_TERMS = 32
+
+# 增量部分或墓碑超过主索引的该比例时合并
+COMPACT_RATIO = 0.1
+
+BUILD_BATCH_SIZE = 2000
+
+
+def index_terms(text: str) -> List[str]:
+    """切分为索引词：复用对话搜索的切分规则，并去掉停用词和单个 ASCII 字符"""
+    return [t for t in tokenize(text) if t not in STOP_WORDS and (len(t) > 1 or not t.isascii())]
+
+
+def note_text(flds: str) -> str:
+    """把笔记原始字段（\\x1f 分隔）转为索引用纯文本"""
+    html = (flds or "").replace("\x1f", "\n")[:MAX_NOTE_CHARS * 2]
+    return html_to_text(html, max_chars=MAX_NOTE_CHARS, include_media_summary=False)
+
+
+class BM25Index:
+    """数组存储的 BM25 倒排索引
+
+    - 主索引为 CSR 结构：offsets[t]..offsets[t+1] 是词 t 在 post_docs（array('I')）
+      与 post_tfs（array('H')）中的区间，每条 posting 只占 6 字节；
+    - 新增或修改的笔记写入增量索引（每个词两个小数组），旧文档只打墓碑；
+    - compact() 把增量合并进主索引并去掉墓碑，重新编号文档。
+
+    所有方法都持有内部锁；search 只在短时间内尝试获取，索引正在合并时返回空结果而不阻塞界面。
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.vocab: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.df = array("I")
+        # 文档表（按文档序号）
+        self.doc_nids = array("q")
+        self.doc_mods = array("q")
+        self.doc_lens = array("I")
+        self.alive = bytearray()
+        self.nid_to_doc: Dict[int, int] = {}
+        # 主索引
+        self.offsets = array("Q", [0])
+        self.post_docs = array("I")
+        self.post_tfs = array("H")
+        self.main_doc_count = 0
+        # 增量索引：词序号 -> (文档数组, 词频数组)
+        self.delta: Dict[int, Tuple[array, array]] = {}
+        self.live_count = 0
+        self.total_len = 0
+        self.tombstones = 0
+        self.watermark = 0
+
+    # ---- 更新 ----
+
+    def add_document(self, nid: int, mod: int, terms: Iterable[str]):
+        """加入（或替换）一篇笔记；旧版本打墓碑，新版本写入增量索引"""
+        counts = Counter(terms)
+        with self._lock:
+            self._remove_locked(nid)
+            doc = len(self.doc_nids)
+            length = min(sum(counts.values()), 0xFFFFFFFF)
+            self.doc_nids.append(nid)
+            self.doc_mods.append(mod)
+            self.doc_lens.append(length)
+            self.alive.append(1)
+            self.nid_to_doc[nid] = doc
+            for term, tf in counts.items():
+                tid = self.vocab.get(term)
+                if tid is None:
+                    tid = len(self.terms)
+                    self.vocab[term] = tid
+                    self.terms.append(term)
+                    self.df.append(0)
+                postings = self.delta.get(tid)
+                if postings is None:
+                    postings = self.delta[tid] = (array("I"), array("H"))
+                postings[0].append(doc)
+                postings[1].append(min(tf, MAX_TF))
+                self.df[tid] += 1
+            self.live_count += 1
+            self.total_len += length
+            if mod > self.watermark:
+                self.watermark = mod
+
+    def remove_document(self, nid: int) -> bool:
+        with self._lock:
+            return self._remove_locked(nid)
+
+    def _remove_locked(self, nid: int) -> bool:
+        doc = self.nid_to_doc.pop(nid, None)
+        if doc is None or not self.alive[doc]:
+            return False
+        # df 不回退（需要遍历文档的全部词），合并时重新统计
+        self.alive[doc] = 0
+        self.live_count -= 1
+        self.total_len -= self.doc_lens[doc]
+        self.tombstones += 1
+        return True
+
+    def doc_mod(self, nid: int) -> Optional[int]:
+        with self._lock:
+            doc = self.nid_to_doc.get(nid)
+            return self.doc_mods[doc] if doc is not None else None
+
+    def note_ids(self) -> List[int]:
+        with self._lock:
+            return list(self.nid_to_doc)
+
+    def delta_doc_count(self) -> int:
+        return len(self.doc_nids) - self.main_doc_count
+
+    def needs_compaction(self) -> bool:
+        base = max(self.main_doc_count, 1)
+        return (self.delta_doc_count() + self.tombstones) > base * COMPACT_RATIO
+
+    def compact(self):
+        """把增量索引合并进主索引、去掉墓碑并重新编号文档和词"""
+        with self._lock:
+            new_doc = array("I", bytes(4 * len(self.doc_nids)))
+            doc_nids, doc_mods, doc_lens = array("q"), array("q"), array("I")
+            for doc, is_alive in enumerate(self.alive):
+                if is_alive:
+                    new_doc[doc] = len(doc_nids)
+                    doc_nids.append(self.doc_nids[doc])
+                    doc_mods.append(self.doc_mods[doc])
+                    doc_lens.append(self.doc_lens[doc])
+
+            alive = self.alive
+            vocab: Dict[str, int] = {}
+            terms: List[str] = []
+            df = array("I")
+            offsets = array("Q", [0])
+            post_docs, post_tfs = array("I"), array("H")
+            for tid, term in enumerate(self.terms):
+                start = len(post_docs)
+                if tid + 1 < len(self.offsets):
+                    s, e = self.offsets[tid], self.offsets[tid + 1]
+                    for d, tf in zip(self.post_docs[s:e], self.post_tfs[s:e]):
+                        if alive[d]:
+                            post_docs.append(new_doc[d])
+                            post_tfs.append(tf)
+                extra = self.delta.get(tid)
+                if extra is not None:
+                    for d, tf in zip(extra[0], extra[1]):
+                        if alive[d]:
+                            post_docs.append(new_doc[d])
+                            post_tfs.append(tf)
+                count = len(post_docs) - start
+                if count:
+                    vocab[term] = len(terms)
+                    terms.append(term)
+                    df.append(count)
+                    offsets.append(len(post_docs))
+
+            self.vocab, self.terms, self.df = vocab, terms, df
+            self.doc_nids, self.doc_mods, self.doc_lens = doc_nids, doc_mods, doc_lens
+            self.alive = bytearray(b"\x01" * len(doc_nids))
+            self.nid_to_doc = {nid: doc for doc, nid in enumerate(doc_nids)}
+            self.offsets, self.post_docs, self.post_tfs = offsets, post_docs, post_tfs
+            self.main_doc_count = len(doc_nids)
+            self.delta = {}
+            self.tombstones = 0
+            self.live_count = len(doc_nids)
+            self.total_len = sum(doc_lens)
+
+    # ---- 查询 ----
+
+    def search(self, terms: Iterable[str], k: int = 5, exclude: Iterable[int] = (),
+               lock_timeout: float = 0.005) -> List[Tuple[int, float]]:
+        """返回 BM25 得分最高的 k 篇笔记 [(note_id, score)]；索引忙时返回空列表"""
+        if not self._lock.acquire(timeout=lock_timeout):
+            return []
+        try:
+            return self._search_locked(set(terms), k, set(exclude))
+        finally:
+            self._lock.release()
+
+    def _search_locked(self, terms, k, exclude) -> List[Tuple[int, float]]:
+        n = self.live_count
+        if not n or not terms or k <= 0:
+            return []
+        avgdl = self.total_len / n or 1.0
+        k1 = self.k1
+        norm_a = k1 * (1 - self.b)
+        norm_b = k1 * self.b / avgdl
+
+        # 按 IDF 从高到低选词，直到用完 postings 预算
+        candidates = []
+        for term in terms:
+            tid = self.vocab.get(term)
+            if tid is not None and self.df[tid]:
+                df = self.df[tid]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                candidates.append((idf, tid, df))
+        candidates.sort(reverse=True)
+        selected, budget = [], QUERY_POSTING_BUDGET
+        for idf, tid, df in candidates[:MAX_QUERY_TERMS]:
+            if selected and df > budget:
+                continue
+            selected.append((idf, tid))
+            budget -= df
+
+        scores: Dict[int, float] = {}
+        alive, doc_lens = self.alive, self.doc_lens
+        main_terms = len(self.offsets) - 1
+        for idf, tid in selected:
+            segments = []
+            if tid < main_terms:
+                s, e = self.offsets[tid], self.offsets[tid + 1]
+                segments.append((self.post_docs[s:e], self.post_tfs[s:e]))
+            extra = self.delta.get(tid)
+            if extra is not None:
+                segments.append(extra)
+            weight = idf * (k1 + 1)
+            for docs, tfs in segments:
+                for d, tf in zip(docs, tfs):
+                    if alive[d]:
+                        scores[d] = scores.get(d, 0.0) + weight * tf / (tf + norm_a + norm_b * doc_lens[d])
+
+        doc_nids = self.doc_nids
+        top = heapq.nlargest(k + len(exclude), scores.items(), key=lambda item: item[1])
+        results = [(doc_nids[d], score) for d, score in top if doc_nids[d] not in exclude]
+        return results[:k]
+
+    # ---- 持久化 ----
+
+    _ARRAYS = ("df", "doc_nids", "doc_mods", "doc_lens", "offsets", "post_docs", "post_tfs")
+
+    def save(self, path: str):
+        """合并后写入单个文件（先写临时文件再替换）"""
+        with self._lock:
+            if self.delta or self.tombstones:
+                self.compact()
+            arrays = [(name, getattr(self, name)) for name in self._ARRAYS]
+            header = json.dumps({
+                "k1": self.k1, "b": self.b, "watermark": self.watermark,
+                "byteorder": sys.byteorder, "terms": self.terms,
+                "arrays": [[name, arr.typecode, arr.itemsize, len(arr)] for name, arr in arrays],
+            }, ensure_ascii=False).encode("utf-8")
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(_MAGIC)
+                f.write(struct.pack("<I", len(header)))
+                f.write(header)
+                for _name, arr in arrays:
+                    arr.tofile(f)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """读取 save() 写入的文件；格式不符时抛出 ValueError"""
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("not a related cards index")
+        pos = len(_MAGIC)
+        (header_len,) = struct.unpack_from("<I", data, pos)
+        pos += 4
+        header = json.loads(data[pos:pos + header_len].decode("utf-8"))
+        pos += header_len
+
+        index = cls(k1=header["k1"], b=header["b"])
+        for name, typecode, itemsize, count in header["arrays"]:
+            arr = array(typecode)
+            if arr.itemsize != itemsize:
+                raise ValueError(f"incompatible item size for {name}")
+            size = itemsize * count
+            arr.frombytes(data[pos:pos + size])
+            if len(arr) != count:
+                raise ValueError("truncated related cards index")
+            if header["byteorder"] != sys.byteorder:
+                arr.byteswap()
+            setattr(index, name, arr)
+            pos += size
+
+        index.terms = header["terms"]
+        index.vocab = {term: tid for tid, term in enumerate(index.terms)}
+        index.watermark = header["watermark"]
+        index.alive = bytearray(b"\x01" * len(index.doc_nids))
+        index.nid_to_doc = {nid: doc for doc, nid in enumerate(index.doc_nids)}
+        index.main_doc_count = len(index.doc_nids)
+        index.live_count = len(index.doc_nids)
+        index.total_len = sum(index.doc_lens)
+        return index
+
+
+def iter_note_batches(col, batch_size: int = BUILD_BATCH_SIZE, min_mod: int = 0):
+    """按笔记 id 分页读取 (id, mod, flds)，每次最多 batch_size 行，避免一次读入整个集合"""
+    last_id = 0
+    while True:
+        rows = col.db.all(
+            "select id, mod, flds from notes where id > ? and mod >= ? order by id limit ?",
+            last_id, min_mod, batch_size,
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def build_index(col, batch_size: int = BUILD_BATCH_SIZE,
+                should_cancel: Optional[Callable[[], bool]] = None) -> Optional[BM25Index]:
+    """分批读取全部笔记建立索引；取消时返回 None"""
+    index = BM25Index()
+    for rows in iter_note_batches(col, batch_size):
+        if should_cancel and should_cancel():
+            return None
+        for nid, mod, flds in rows:
+            index.add_document(nid, mod, index_terms(note_text(flds)))
+    index.compact()
+    return index
+
+
+def refresh_index(index: BM25Index, col, batch_size: int = BUILD_BATCH_SIZE) -> int:
+    """按修改时间水位增量更新：重新索引 mod 不早于水位且有变化的笔记，并为已删除的笔记打墓碑
+
+    返回更新与删除的笔记数。
+    """
+    changed = 0
+    for rows in iter_note_batches(col, batch_size, min_mod=index.watermark):
+        for nid, mod, flds in rows:
+            if index.doc_mod(nid) != mod:
+                index.add_document(nid, mod, index_terms(note_text(flds)))
+                changed += 1
+    # 同时有增删时笔记数可能不变，所以直接比较 id 集合查找被删除的笔记
+    existing = set(col.db.list("select id from notes"))
+    for nid in index.note_ids():
+        if nid not in existing and index.remove_document(nid):
+            changed += 1
+    return changed
+
+
+def describe_notes(col, note_ids: Iterable[int], max_chars: int = 200) -> List[str]:
+    """把笔记格式化为单行摘要（第一个字段 — 第二个字段），已删除的笔记跳过"""
+    lines = []
+    for nid in note_ids:
+        try:
+            note = col.get_note(nid)
+        except Exception:
+            continue
+        parts = [html_to_text(f, include_media_summary=False) for f in list(note.fields)[:2]]
+        text = " — ".join(" ".join(p.split()) for p in parts if p.strip())
+        if len(text) > max_chars:
+            text = text[:max_chars - 1] + "…"
+        if text:
+            lines.append(text)
+    return lines
+
+
+class RelatedCardsIndex:
+    """当前配置档的相关卡片索引
+
+    配置档打开时读取磁盘上的索引（没有则在后台建立），之后在修改笔记的操作完成和添加笔记后
+    于后台按水位增量更新；增量较多时合并并保存，配置档关闭时保存未写入的更新。
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__ + ".RelatedCardsIndex")
+        self._index: Optional[BM25Index] = None
+        self._path: Optional[str] = None
+        self._lock = threading.Lock()
+        self._busy = False
+        self._pending_refresh = False
+        self._dirty = False
+        self._closed = True
+
+    # ---- 生命周期 ----
+
+    def on_profile_open(self):
+        """配置档打开后加载或建立索引（未启用时不做任何事）"""
+        try:
+            from ..config import Config
+        except ImportError:
+            from config import Config
+        if not Config.get_related_cards_config().get("enabled", False):
+            return
+        self._closed = False
+        self._path = os.path.join(get_user_files_dir(), INDEX_FILENAME.format(suffix=get_profile_file_suffix()))
+        self._run_in_background(self._load_or_build)
+
+    def close(self):
+        """配置档关闭：保存未写入的更新并释放内存"""
+        with self._lock:
+            index, path, dirty = self._index, self._path, self._dirty
+            self._index = None
+            self._closed = True
+            self._pending_refresh = False
+            self._dirty = False
+        if index is not None and path and dirty:
+            try:
+                index.save(path)
+            except Exception as e:
+                self.logger.error(f"Error saving related cards index: {e}")
+
+    def is_ready(self) -> bool:
+        return self._index is not None
+
+    # ---- 钩子 ----
+
+    def on_operation_did_execute(self, changes, handler=None):
+        """operation_did_execute 钩子：笔记文本有变化时安排增量更新"""
+        if getattr(changes, "note_text", False):
+            self.schedule_refresh()
+
+    def on_note_added(self, note=None):
+        """add_cards_did_add_note 钩子"""
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        if self._closed or self._index is None:
+            return
+        with self._lock:
+            if self._busy:
+                self._pending_refresh = True
+                return
+            self._busy = True
+        self._run_in_background(self._refresh_loop, already_busy=True)
+
+    # ---- 查询 ----
+
+    def related_notes(self, note_id: Optional[int], text: str, k: int = 3) -> List[Tuple[int, float]]:
+        index = self._index
+        if index is None:
+            return []
+        exclude = (note_id,) if note_id else ()
+        return index.search(index_terms(text), k=k, exclude=exclude)
+
+    def related_context(self, col, note_id: Optional[int], text: str, k: int = 3) -> List[str]:
+        """与给定卡片最相关的 k 张卡片的单行摘要"""
+        results = self.related_notes(note_id, text, k)
+        return describe_notes(col, [nid for nid, _score in results]) if results else []
+
+    # ---- 后台任务 ----
+
+    def _run_in_background(self, task: Callable[[], None], already_busy: bool = False):
+        if not already_busy:
+            with self._lock:
+                if self._busy:
+                    self._pending_refresh = True
+                    return
+                self._busy = True
+        if ANKI_AVAILABLE:
+            future = executor.submit(task, priority=PRIORITY_BULK, group="related-cards", name="related-cards-index")
+            future.add_done_callback(self._on_task_done)
+        else:
+            try:
+                task()
+            finally:
+                self._on_task_done(None)
+
+    def _on_task_done(self, future):
+        if future is not None:
+            try:
+                future.result()
+            except Exception as e:
+                self.logger.error(f"Related cards index task failed: {e}")
+        with self._lock:
+            self._busy = False
+            again = self._pending_refresh and not self._closed
+            self._pending_refresh = False
+        if again:
+            self.schedule_refresh()
+
+    def _load_or_build(self):
+        col = getattr(mw, "col", None)
+        index = None
+        if self._path and os.path.exists(self._path):
+            try:
+                index = BM25Index.load(self._path)
+            except Exception as e:
+                self.logger.warning(f"Rebuilding unreadable related cards index: {e}")
+        if index is None and col is not None:
+            index = build_index(col, should_cancel=lambda: self._closed)
+            if index is not None and self._path:
+                index.save(self._path)
+        if index is None or self._closed:
+            return
+        if col is not None and refresh_index(index, col):
+            self._dirty = True
+        self._index = index
+
+    def _refresh_loop(self):
+        index, col = self._index, getattr(mw, "col", None)
+        if index is None or col is None or self._closed:
+            return
+        if refresh_index(index, col):
+            self._dirty = True
+        if index.needs_compaction() and self._path:
+            index.save(self._path)
+            self._dirty = False
+
+
+# 全局实例
+related_cards_index = RelatedCardsIndex()
@@ -0,0 +1,188 @@
+# 近似回答缓存 - 用 MinHash/LSH 找到“几乎相同的问题 + 几乎相同的卡片”的历史回答
+
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..utils.helpers import text_shingles
+except ImportError:
+    from utils.helpers import text_shingles
+
+# MinHash 签名长度 = 分段数 × 每段行数；16×4 时 Jaccard ≈ 0.5 以上的问题大概率落入同一个桶
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+
+# 上下文（卡片内容 + 上一条回答）只取末尾这么多字符参与指纹
+MAX_CONTEXT_CHARS = 4000
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子，签名在不同进程间保持一致
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+
+def minhash_signature(shingles) -> Tuple[int, ...]:
+    """shingle 集合的 MinHash 签名（空集合返回全最大值）"""
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+    if not hashes:
+        return (_MAX_HASH,) * NUM_PERM
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimate_similarity(sig1: Sequence[int], sig2: Sequence[int]) -> float:
+    """由两个签名估计 Jaccard 相似度"""
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+class CacheKey:
+    """一次请求的指纹：最后一个用户问题与其上下文分别计算签名"""
+
+    __slots__ = ("model", "question", "context")
+
+    def __init__(self, model: str, question: Tuple[int, ...], context: Tuple[int, ...]):
+        self.model = model
+        self.question = question
+        self.context = context
+
+    def with_model(self, model: str) -> "CacheKey":
+        """同一指纹换一个作用域（实际回答的提供商与模型）"""
+        return CacheKey(model, self.question, self.context)
+
+    def bands(self):
+        for i in range(NUM_BANDS):
+            yield (self.model, i, self.question[i * ROWS_PER_BAND:(i + 1) * ROWS_PER_BAND])
+
+
+def make_key(conversation: List[Dict[str, str]], model: str = "") -> Optional[CacheKey]:
+    """由对话生成缓存指纹；最后一条不是用户消息时返回 None
+
+    上下文取系统消息（卡片内容）和最后一个问题之前的那条回答：追问“再简单点”依赖上一条回答，
+    而更早的轮次对结果影响较小。
+    """
+    if not conversation or conversation[-1].get("role") != "user":
+        return None
+    question = conversation[-1].get("content", "")
+    system = " ".join(m.get("content", "") for m in conversation if m.get("role") == "system")
+    previous = next((m.get("content", "") for m in reversed(conversation[:-1]) if m.get("role") == "assistant"), "")
+    context = (system + "\n" + previous)[-MAX_CONTEXT_CHARS:]
+    return CacheKey(model or "", minhash_signature(text_shingles(question)), minhash_signature(text_shingles(context)))
+
+
+class _Entry:
+    __slots__ = ("key", "answer", "created", "hits")
+
+    def __init__(self, key: CacheKey, answer: str):
+        self.key = key
+        self.answer = answer
+        self.created = time.time()
+        self.hits = 0
+
+
+class ResponseCache:
+    """近似回答缓存（进程内，LRU 淘汰）
+
+    问题签名按段写入 LSH 桶，查询时只比较同桶的候选；问题与上下文的估计相似度都不低于
+    threshold 时命中，返回 (回答, 相似度)，相似度取两者中较小的一个。
+    """
+
+    def __init__(self, threshold: float = 0.85, max_entries: int = 500, ttl_seconds: float = 86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._next_id = 1
+        self.stats = {"lookups": 0, "hits": 0, "stores": 0, "evictions": 0}
+
+    def configure(self, threshold: float, max_entries: int, ttl_seconds: float):
+        with self._lock:
+            self.threshold = threshold
+            self.max_entries = max_entries
+            self.ttl_seconds = ttl_seconds
+            while len(self._entries) > max(self.max_entries, 0):
+                self._evict_oldest_locked()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: Optional[CacheKey]) -> Optional[Tuple[str, float]]:
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self.stats["lookups"] += 1
+            candidates = set()
+            for band in key.bands():
+                candidates.update(self._buckets.get(band, ()))
+            best, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries.get(entry_id)
+                if entry is None:
+                    continue
+                if self.ttl_seconds and now - entry.created > self.ttl_seconds:
+                    self._remove_locked(entry_id)
+                    continue
+                score = min(estimate_similarity(key.question, entry.key.question),
+                            estimate_similarity(key.context, entry.key.context))
+                if score >= self.threshold and score > best_score:
+                    best, best_score = entry_id, score
+            if best is None:
+                return None
+            entry = self._entries[best]
+            self._entries.move_to_end(best)
+            entry.hits += 1
+            self.stats["hits"] += 1
+            return entry.answer, best_score
+
+    def store(self, key: Optional[CacheKey], answer: str):
+        if key is None or not answer or self.max_entries <= 0:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(key, answer)
+            for band in key.bands():
+                self._buckets.setdefault(band, []).append(entry_id)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest_locked()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def _evict_oldest_locked(self):
+        entry_id = next(iter(self._entries))
+        self._remove_locked(entry_id)
+        self.stats["evictions"] += 1
+
+    def _remove_locked(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band in entry.key.bands():
+            ids = self._buckets.get(band)
+            if ids is not None:
+                try:
+                    ids.remove(entry_id)
+                except ValueError:
+                    pass
+                if not ids:
+                    del self._buckets[band]
+
+
+# 全局实例
+response_cache = ResponseCache()
@@ -0,0 +1,153 @@
+# AI 服务注册表 - 进程内共享的长生命周期服务实例
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..config import Config
+    from ..utils.helpers import fingerprint_api_key
+    from .ai_service_adapter import AIServiceAdapter
+    from .endpoint_router import endpoint_router, provider_router
+    from .model_cascade import cascade_stats
+except ImportError:
+    from config import Config
+    from utils.helpers import fingerprint_api_key
+    from services.ai_service_adapter import AIServiceAdapter
+    from services.endpoint_router import endpoint_router, provider_router
+    from services.model_cascade import cascade_stats
+
+DEFAULT_CHAT_ENDPOINT = "https://api.openai.com/v1/chat/completions"
+
+
+class ServiceRegistry:
+    """按 端点/模型 配置档 持有 AIServiceAdapter，所有 UI 入口从这里借用实例
+
+    同一配置档只构造一次适配器，因此连接池、缓存、限流状态与统计在整个插件内共享。
+    配置档变化（例如在设置里改了密钥或模型）会得到新的适配器，旧实例按 LRU 淘汰并关闭。
+    """
+
+    MAX_PROFILES = 4
+
+    _adapters: "OrderedDict[Tuple[str, str, str], AIServiceAdapter]" = OrderedDict()
+    _lock = threading.RLock()
+    _profile_open = False
+    _open_hooks: List[Callable[[], None]] = []
+    _close_hooks: List[Callable[[], None]] = []
+
+    @classmethod
+    def profile_key(cls) -> Tuple[str, str, str]:
+        """根据当前配置计算配置档键：(端点, 模型, 密钥指纹)"""
+        openai_config = Config.get_openai_config()
+        endpoint = os.environ.get("OPENAI_BASE_URL", DEFAULT_CHAT_ENDPOINT)
+        return (
+            endpoint,
+            openai_config.get("model", ""),
+            fingerprint_api_key(openai_config.get("api_key", "")),
+        )
+
+    @classmethod
+    def get_adapter(cls) -> AIServiceAdapter:
+        """借用当前配置档对应的适配器（不存在时创建）"""
+        key = cls.profile_key()
+        with cls._lock:
+            adapter = cls._adapters.get(key)
+            if adapter is None:
+                adapter = AIServiceAdapter()
+                cls._adapters[key] = adapter
+                logging.getLogger(__name__).info(f"Created shared AI service for profile {key[0]} / {key[1] or '-'}")
+                cls._evict_locked()
+            else:
+                cls._adapters.move_to_end(key)
+
+        # 非键参数（max_tokens / temperature）直接同步到共享实例
+        openai_config = Config.get_openai_config()
+        adapter.update_config({
+            "max_tokens": openai_config.get("max_tokens", 500),
+            "temperature": openai_config.get("temperature", 0.7),
+        })
+        return adapter
+
+    @classmethod
+    def _evict_locked(cls):
+        """超出上限时关闭最久未使用的适配器"""
+        while len(cls._adapters) > cls.MAX_PROFILES:
+            _, stale = cls._adapters.popitem(last=False)
+            cls._close_adapter(stale)
+
+    @staticmethod
+    def _close_adapter(adapter: AIServiceAdapter):
+        try:
+            adapter.close()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Failed to close AI service: {e}")
+
+    @classmethod
+    def add_profile_open_hook(cls, callback: Callable[[], None]):
+        """注册配置档打开时的回调"""
+        if callback not in cls._open_hooks:
+            cls._open_hooks.append(callback)
+
+    @classmethod
+    def add_profile_close_hook(cls, callback: Callable[[], None]):
+        """注册配置档关闭时的回调（在适配器关闭之前执行）"""
+        if callback not in cls._close_hooks:
+            cls._close_hooks.append(callback)
+
+    @classmethod
+    def on_profile_open(cls):
+        """Anki 配置档打开：重新加载配置并预先创建当前配置档的实例"""
+        Config.load_config()
+        cls._profile_open = True
+        try:
+            cls.get_adapter()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Failed to create AI service on profile open: {e}")
+        for callback in list(cls._open_hooks):
+            try:
+                callback()
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Profile open hook failed: {e}")
+
+    @classmethod
+    def on_profile_close(cls):
+        """Anki 配置档关闭：执行回调并释放所有共享实例"""
+        for callback in list(cls._close_hooks):
+            try:
+                callback()
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Profile close hook failed: {e}")
+        cls._profile_open = False
+        cls.shutdown()
+
+    @classmethod
+    def shutdown(cls):
+        """关闭并清空所有适配器"""
+        with cls._lock:
+            adapters = list(cls._adapters.values())
+            cls._adapters.clear()
+        for adapter in adapters:
+            cls._close_adapter(adapter)
+
+    @classmethod
+    def is_profile_open(cls) -> bool:
+        """当前是否处于已打开的 Anki 配置档中"""
+        return cls._profile_open
+
+    @classmethod
+    def get_metrics(cls) -> Dict[str, Any]:
+        """汇总各配置档的请求统计、各端点与各提供商的路由统计，以及分级模型路由各层的延迟统计"""
+        with cls._lock:
+            items = list(cls._adapters.items())
+        profiles = []
+        for (endpoint, model, _fp), adapter in items:
+            profiles.append({
+                "endpoint": endpoint,
+                "model": model,
+                "metrics": adapter.get_metrics(),
+            })
+        return {"profile_count": len(profiles), "profiles": profiles, "endpoints": endpoint_router.snapshot(),
+                "providers": provider_router.snapshot(), "tiers": cascade_stats.snapshot()}
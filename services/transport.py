@@ -0,0 +1,386 @@
+# HTTP 传输层 - OpenAIService 发请求与读取 SSE 流的可替换实现，以及共用的 SSE 解析
+
+import importlib
+import json
+import logging
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from .cancellation import CancelledError, CancelToken
+except ImportError:
+    from services.cancellation import CancelledError, CancelToken
+
+
+def load_requests():
+    """按需导入 requests（导入开销较大，默认的聊天传输不需要它），不可用时返回 None"""
+    try:
+        import requests
+    except Exception:
+        return None
+    return requests
+
+
+def _abort_response(response):
+    """关闭流式响应的底层套接字，使其他线程中阻塞的读取立即返回"""
+    raw = getattr(response, "raw", None)
+    conn = getattr(raw, "_connection", None) or getattr(raw, "connection", None)
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        # 连接已从 urllib3 响应上分离时，从 http.client 响应的文件对象取套接字
+        fp = getattr(getattr(raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    shutdown_socket(sock)
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+def shutdown_socket(sock):
+    """关闭套接字的读写两端，使其他线程中阻塞的读取（包括等待响应头）立即返回"""
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+# 当前线程中进行的 requests 请求的取消令牌，由下面的 urllib3 连接类读取
+_inflight = threading.local()
+_cancellable_pools = None
+
+
+def _cancellable_pool_classes():
+    """urllib3 连接池类：连接在发送请求前把关闭套接字注册为 _inflight.token 的取消回调
+
+    requests 在响应头到达前不暴露套接字，只有这样取消才能打断连接与等待响应头的阶段。
+    第一次使用时才定义（导入 urllib3 的开销随 requests 一起延迟）。
+    """
+    global _cancellable_pools
+    if _cancellable_pools is None:
+        from urllib3.connection import HTTPConnection, HTTPSConnection
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+        class CancellableConnection:
+            def _abort(self):
+                shutdown_socket(getattr(self, "sock", None))
+
+            def connect(self):
+                super().connect()
+                token = getattr(_inflight, "token", None)
+                if token is not None and token.is_cancelled:
+                    self._abort()
+
+            def request(self, *args, **kwargs):
+                token = getattr(_inflight, "token", None)
+                if token is not None:
+                    _inflight.callbacks.append(self._abort)
+                    token.add_callback(self._abort)
+                return super().request(*args, **kwargs)
+
+        class CancellableHTTPConnection(CancellableConnection, HTTPConnection):
+            pass
+
+        class CancellableHTTPSConnection(CancellableConnection, HTTPSConnection):
+            pass
+
+        class CancellableHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = CancellableHTTPConnection
+
+        class CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = CancellableHTTPSConnection
+
+        _cancellable_pools = {"http": CancellableHTTPConnectionPool, "https": CancellableHTTPSConnectionPool}
+    return _cancellable_pools
+
+
+@contextmanager
+def cancellable_requests(session, cancel_token: Optional[CancelToken]):
+    """在 with 块中经 session 发出的请求可被 cancel_token 取消：取消时关闭套接字并抛出 CancelledError
+
+    取消令牌只在响应头到达之前生效；流式正文的读取由调用方另行注册取消回调。
+    """
+    if cancel_token is None:
+        yield
+        return
+    cancel_token.raise_if_cancelled()
+    pools = _cancellable_pool_classes()
+    adapters = getattr(session, "adapters", None)
+    for adapter in list(adapters.values()) if isinstance(adapters, dict) else []:
+        managers = [getattr(adapter, "poolmanager", None)] + list(getattr(adapter, "proxy_manager", {}).values())
+        for manager in managers:
+            if manager is not None and manager.pool_classes_by_scheme is not pools:
+                # 已建立的连接池仍用原来的连接类，清空后新建
+                manager.pool_classes_by_scheme = pools
+                manager.clear()
+    _inflight.token, _inflight.callbacks = cancel_token, []
+    try:
+        yield
+    except Exception:
+        if cancel_token.is_cancelled:
+            raise CancelledError("Request was cancelled")
+        raise
+    finally:
+        for callback in _inflight.callbacks:
+            cancel_token.remove_callback(callback)
+        _inflight.token, _inflight.callbacks = None, []
+
+
+class TransportError(Exception):
+    """HTTP 错误状态（>= 400），或传输层无法完成请求"""
+
+    def __init__(self, message: str, status: int = 0):
+        super().__init__(message)
+        self.status = status
+
+
+class HTTPResponse:
+    """一次性请求的完整响应"""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.body.decode("utf-8"))
+
+
+class SSEParser:
+    """增量解析 text/event-stream：feed() 接收任意切分的字节，返回已完整的事件的 data 文本
+
+    多行 data 按规范用换行拼接；注释行与 event/id/retry 字段忽略。
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._data: List[str] = []
+
+    def feed(self, chunk: bytes) -> List[str]:
+        events = []
+        self._buffer += chunk
+        while True:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                break
+            line = self._buffer[:end].rstrip(b"\r").decode("utf-8", errors="replace")
+            self._buffer = self._buffer[end + 1:]
+            if not line:
+                if self._data:
+                    events.append("\n".join(self._data))
+                    self._data = []
+                continue
+            if line.startswith(":"):
+                continue
+            field, _, value = line.partition(":")
+            if field == "data":
+                self._data.append(value[1:] if value.startswith(" ") else value)
+        return events
+
+    def close(self) -> List[str]:
+        """流结束：最后一个没有空行结尾的事件也交出去"""
+        events = self.feed(b"\n") if self._buffer else []
+        if self._data:
+            events.append("\n".join(self._data))
+            self._data = []
+        return events
+
+
+def iter_sse_events(chunks: Iterable[bytes]) -> Iterator[str]:
+    """把字节分片序列解析为事件 data 序列"""
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def parse_chat_chunk(data: str) -> Tuple[List[str], Optional[str]]:
+    """解析一个 Chat Completions 流式事件，返回 (文本分片, 结束原因)
+
+    结束原因为 choices[0].finish_reason（例如 "stop"、"length"）；未结束时为 None，没有结束原因的 [DONE] 记为 "stop"。
+    """
+    data = data.strip()
+    if data == "[DONE]":
+        return [], "stop"
+    # 有些网关可能一次传多条 JSON，用换行或空格相连，这里做一次拆分
+    chunks = [data]
+    if "}{" in data:
+        # 朴素拆分，尽量不中断
+        chunks = data.replace('}{', '}\n{').split('\n')
+    deltas = []
+    for chunk in chunks:
+        if not chunk or chunk == "[DONE]":
+            continue
+        try:
+            obj = json.loads(chunk)
+        except ValueError:
+            continue
+        choices = obj.get("choices", []) if isinstance(obj, dict) else []
+        if not choices:
+            continue
+        choice = choices[0]
+        delta = None
+        # 兼容 Azure/第三方的字段名
+        if isinstance(choice.get("delta"), dict):
+            delta = choice["delta"].get("content")
+        elif isinstance(choice.get("message"), dict):
+            delta = choice["message"].get("content")
+        if delta:
+            deltas.append(delta)
+        # 处理结束原因
+        if choice.get("finish_reason"):
+            return deltas, str(choice["finish_reason"])
+    return deltas, None
+
+
+class StreamResponse:
+    """流式响应：status/headers 在响应头到达后即可用，iter_events() 逐个产出 SSE data"""
+
+    status = 0
+    headers: Dict[str, str] = {}
+
+    def iter_events(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def read_text(self, limit: int = 4096) -> str:
+        """读取（错误响应的）正文文本"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class Transport:
+    """传输层接口
+
+    request() 发送一次性请求并返回 HTTPResponse；stream() 发出请求、等到响应头后返回
+    StreamResponse。cancel_token 被取消时，实现需要让阻塞中的读取立即结束：等待响应头时
+    stream() 抛出 CancelledError，之后的迭代安静地停止。
+    """
+
+    name = "base"
+    # 是否提供 start_stream() 回调接口（在 GUI 事件循环中交付事件）
+    supports_callbacks = False
+
+    def request(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes] = None,
+                timeout: float = 30) -> HTTPResponse:
+        raise NotImplementedError
+
+    def stream(self, url: str, headers: Dict[str, str], body: bytes, timeout: float = 60,
+               cancel_token: Optional[CancelToken] = None) -> StreamResponse:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class _RequestsStreamResponse(StreamResponse):
+    def __init__(self, response, cancel_token: Optional[CancelToken]):
+        self._response = response
+        self._cancel_token = cancel_token
+        self.status = response.status_code
+        self.headers = {k.lower(): v for k, v in response.headers.items()}
+        self._abort = lambda: _abort_response(response)
+        if cancel_token is not None:
+            cancel_token.add_callback(self._abort)
+
+    def iter_events(self) -> Iterator[str]:
+        try:
+            yield from iter_sse_events(self._response.iter_content(chunk_size=None))
+        except Exception:
+            if self._cancel_token is not None and self._cancel_token.is_cancelled:
+                return
+            raise
+
+    def read_text(self, limit: int = 4096) -> str:
+        return self._response.text[:limit]
+
+    def close(self):
+        if self._cancel_token is not None:
+            self._cancel_token.remove_callback(self._abort)
+        self._response.close()
+
+
+class RequestsTransport(Transport):
+    """基于 requests.Session 的传输（线程阻塞式，作为回退实现保留）
+
+    get_session 返回要共用的会话（例如 OpenAIService 的会话），在第一次请求时才调用。
+    """
+
+    name = "requests"
+
+    def __init__(self, get_session: Optional[Callable[[], object]] = None):
+        self._get_session = get_session
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            session = self._get_session() if self._get_session is not None else None
+            if session is None:
+                requests = load_requests()
+                if requests is None:
+                    raise RuntimeError("'requests' library not available")
+                session = requests.Session()
+            self._session = session
+        return self._session
+
+    def request(self, method, url, headers, body=None, timeout=30):
+        resp = self.session.request(method, url, headers=headers, data=body, timeout=timeout, allow_redirects=False)
+        return HTTPResponse(resp.status_code, {k.lower(): v for k, v in resp.headers.items()}, resp.content)
+
+    def stream(self, url, headers, body, timeout=60, cancel_token=None):
+        with cancellable_requests(self.session, cancel_token):
+            resp = self.session.post(url, headers=headers, data=body, stream=True, timeout=timeout)
+        return _RequestsStreamResponse(resp, cancel_token)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+DEFAULT_TRANSPORT = "http_client"
+
+# 可选的传输实现：配置名 -> (模块名, 类名)，按需导入
+TRANSPORTS = {
+    "requests": None,
+    "http_client": ("http_transport", "HTTPClientTransport"),
+    "asyncio": ("async_transport", "AsyncTransport"),
+    "qt": ("qt_transport", "QtTransport"),
+}
+
+
+def create_transport(name: str, get_session: Optional[Callable[[], object]] = None) -> Transport:
+    """按配置名创建传输；未知名称或可选实现不可用时回退到 requests（get_session 提供共用的会话）"""
+    spec = TRANSPORTS.get(name or DEFAULT_TRANSPORT)
+    if spec is not None:
+        module_name, class_name = spec
+        try:
+            module = importlib.import_module(f".{module_name}", __package__)
+            transport_class = getattr(module, class_name)
+            # 只在部分场景可用的传输（如 Qt）用同一个 requests 会话处理其余请求
+            if getattr(transport_class, "uses_session", False):
+                return transport_class(get_session=get_session)
+            return transport_class()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Transport '{name}' unavailable, falling back to requests: {e}")
+    elif name and name not in TRANSPORTS:
+        logging.getLogger(__name__).warning(f"Unknown transport '{name}', using requests")
+    return RequestsTransport(get_session)
@@ -0,0 +1,156 @@
+import unittest
+import sys
+import pathlib
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.async_transport import AsyncTransport, EventLoopService
+from services.cancellation import CancelToken
+from services.model_catalog import ModelCatalog
+from services.openai_service import OpenAIService
+from services.transport import SSEParser, parse_chat_chunk
+
+
+def sse_event(text):
+    return f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n".encode("utf-8")
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """/stream 以 chunked SSE 返回三个分片；/hang 发两个分片后挂起；其他路径返回普通 JSON"""
+    protocol_version = "HTTP/1.1"
+    release = threading.Event()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path in ("/stream", "/hang"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                events = [sse_event(t) for t in ("Hel", "lo")]
+                if self.path == "/stream":
+                    events += [sse_event(body["messages"][-1]["content"]), b"data: [DONE]\n\n"]
+                for event in events:
+                    # 故意把事件拆在两个 chunk 之间
+                    for part in (event[:7], event[7:]):
+                        self.wfile.write(f"{len(part):x}\r\n".encode("ascii") + part + b"\r\n")
+                        self.wfile.flush()
+                if self.path == "/hang":
+                    ChatHandler.release.wait(10)
+                self.wfile.write(b"0\r\n\r\n")
+            except OSError:
+                pass
+            return
+        data = json.dumps({"choices": [{"message": {"content": f" echo {body['messages'][-1]['content']} "}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class TestSSEParser(unittest.TestCase):
+    def test_events_split_across_feeds(self):
+        parser = SSEParser()
+        self.assertEqual(parser.feed(b"data: {\"a\"\r\ndata: :1}\r"), [])
+        self.assertEqual(parser.feed(b"\n\r\n: keep-alive\n\nevent: x\ndata:[DONE]"), ['{"a"\n:1}'])
+        self.assertEqual(parser.close(), ["[DONE]"])
+
+    def test_parse_chat_chunk(self):
+        self.assertEqual(parse_chat_chunk('{"choices":[{"delta":{"content":"a"}}]}{"choices":[{"delta":{"content":"b"},'
+                                          '"finish_reason":"stop"}]}'), (["a", "b"], "stop"))
+        self.assertEqual(parse_chat_chunk('{"choices":[{"delta":{},"finish_reason":"length"}]}'), ([], "length"))
+        self.assertEqual(parse_chat_chunk("[DONE]"), ([], "stop"))
+        self.assertEqual(parse_chat_chunk("not json"), ([], None))
+
+
+class TestAsyncTransport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server(("127.0.0.1", 0), ChatHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        ChatHandler.release.set()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.loop_service = EventLoopService(thread_name="test-aio")
+        self.transport = AsyncTransport(self.loop_service)
+        self.svc = OpenAIService()
+        self.svc.api_key = "sk-test"
+        self.svc.catalog = ModelCatalog()
+        self.svc.transport = self.transport
+
+    def tearDown(self):
+        self.loop_service.stop()
+
+    def test_get_response_reuses_connection(self):
+        self.svc.endpoint = self.base + "/v1/chat/completions"
+        for text in ("a", "b"):
+            self.assertEqual(self.svc.get_response([{"role": "user", "content": text}]), f"echo {text}")
+        self.assertEqual(self.transport.client.stats, {"connections_opened": 1, "connections_reused": 1})
+
+    def test_stream_response_from_worker_thread(self):
+        self.svc.endpoint = self.base + "/stream"
+        chunks = list(self.svc.stream_response([{"role": "user", "content": "!"}]))
+        self.assertEqual(chunks, ["Hel", "lo", "!"])
+
+    def test_cancel_stops_blocked_stream(self):
+        self.svc.endpoint = self.base + "/hang"
+        token = CancelToken()
+        chunks = []
+        for chunk in self.svc.stream_response([{"role": "user", "content": "hi"}], cancel_token=token):
+            chunks.append(chunk)
+            if len(chunks) == 2:
+                threading.Timer(0.1, token.cancel).start()
+                started = time.monotonic()
+        self.assertEqual(chunks, ["Hel", "lo"])
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_many_concurrent_streams_on_one_thread(self):
+        url = self.base + "/stream"
+        headers = {"Content-Type": "application/json"}
+
+        async def one(i):
+            body = json.dumps({"messages": [{"role": "user", "content": str(i)}]}).encode()
+            response = await self.transport.open_stream_async(url, headers, body, timeout=10)
+            text = []
+            async for event in self.transport.iter_events_async(response, read_timeout=10):
+                text.extend(parse_chat_chunk(event)[0])
+            return "".join(text)
+
+        async def run_all():
+            return await asyncio.gather(*(one(i) for i in range(100)))
+
+        def client_threads():
+            return {t.name for t in threading.enumerate() if "process_request_thread" not in t.name}
+
+        before = client_threads()
+        results = self.loop_service.submit(run_all()).result(30)
+        self.assertEqual(results, [f"Hello{i}" for i in range(100)])
+        # 除了服务器端线程，客户端只多了一个事件循环线程
+        self.assertLessEqual(client_threads() - before, {"test-aio"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import sys
+import pathlib
+import threading
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from ui.background_task import BackgroundTask
+
+
+class TestBackgroundTask(unittest.TestCase):
+    def _run(self, task):
+        done = threading.Event()
+        results = []
+        task.finished.connect(lambda value: (results.append(("ok", value)), done.set()))
+        task.failed.connect(lambda error: (results.append(("error", error)), done.set()))
+        task.start()
+        done.wait(2)
+        return results
+
+    def test_result_is_delivered(self):
+        results = self._run(BackgroundTask(lambda token, x: x * 2, 21))
+        self.assertEqual(results, [("ok", 42)])
+
+    def test_failure_is_delivered(self):
+        def boom(token):
+            raise ValueError("bad key")
+        results = self._run(BackgroundTask(boom))
+        self.assertEqual(results, [("error", "bad key")])
+
+    def test_cancelled_task_emits_nothing(self):
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow(token):
+            started.set()
+            release.wait(2)
+            return "late"
+
+        task = BackgroundTask(slow)
+        task.finished.connect(results.append)
+        task.start()
+        started.wait(2)
+        task.cancel()
+        release.set()
+        task._future.result(2)
+        self.assertTrue(task.is_cancelled)
+        self.assertEqual(results, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
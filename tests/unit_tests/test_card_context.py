@@ -0,0 +1,91 @@
+import unittest
+import sys
+import pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.card_context import CardContextExtractor
+
+
+BASIC_REVERSED = {
+    "id": 1, "mod": 100, "name": "Basic (and reversed card)", "type": 0,
+    "flds": [{"name": "Front"}, {"name": "Back"}, {"name": "Notes"}],
+    "tmpls": [
+        {"qfmt": "{{Front}}", "afmt": "{{FrontSide}}<hr id=answer>{{Back}}<br>{{#Notes}}{{Notes}}{{/Notes}}"},
+        {"qfmt": "{{Back}}", "afmt": "{{FrontSide}}<hr id=answer>{{Front}}"},
+    ],
+}
+
+CLOZE = {
+    "id": 2, "mod": 100, "name": "Cloze", "type": 1,
+    "flds": [{"name": "Text"}, {"name": "Back Extra"}],
+    "tmpls": [{"qfmt": "{{cloze:Text}}", "afmt": "{{cloze:Text}}<br>{{Back Extra}}"}],
+}
+
+
+class FakeNote:
+    def __init__(self, note_id, notetype, fields, mod=1):
+        self.id = note_id
+        self.mod = mod
+        self.fields = fields
+        self._notetype = notetype
+
+    def note_type(self):
+        return self._notetype
+
+
+class FakeCard:
+    def __init__(self, card_id, note, ord_=0):
+        self.id = card_id
+        self.ord = ord_
+        self._note = note
+
+    def note(self):
+        return self._note
+
+
+class TestCardContextExtractor(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        self.extractor = CardContextExtractor()
+
+    def tearDown(self):
+        Config.load_config()
+
+    def test_basic_card_uses_template_roles_without_duplicating_front(self):
+        note = FakeNote(10, BASIC_REVERSED, ["<b>chat</b>", "<div>cat</div>", "<i>French</i>"])
+        ctx = self.extractor.extract(FakeCard(100, note))
+        self.assertEqual(ctx, {"front": "chat", "back": "cat", "extra": "French", "note_id": 10, "card_id": 100})
+
+    def test_reverse_template_swaps_roles(self):
+        note = FakeNote(10, BASIC_REVERSED, ["chat", "cat", ""])
+        ctx = self.extractor.extract(FakeCard(101, note, ord_=1))
+        self.assertEqual((ctx["front"], ctx["back"]), ("cat", "chat"))
+
+    def test_cloze_hides_active_deletion_and_reports_answer(self):
+        note = FakeNote(11, CLOZE, ["{{c1::Paris}} is the capital of {{c2::France::country}}", "Seine"])
+        ctx = self.extractor.extract(FakeCard(102, note, ord_=1))
+        self.assertEqual(ctx["front"], "Paris is the capital of [country]")
+        self.assertEqual(ctx["back"], "France")
+        self.assertEqual(ctx["extra"], "Seine")
+
+    def test_configured_rules_override_template(self):
+        Config.set("field_role_rules", {"Basic (and reversed card)": {"front": ["Back"], "extra": ["Notes"]}})
+        note = FakeNote(12, BASIC_REVERSED, ["chat", "cat", "pet"])
+        ctx = self.extractor.extract(FakeCard(103, note))
+        self.assertEqual((ctx["front"], ctx["back"], ctx["extra"]), ("cat", "", "pet"))
+
+    def test_context_cached_by_note_id_and_mod(self):
+        note = FakeNote(13, BASIC_REVERSED, ["one", "two", ""], mod=5)
+        self.extractor.extract(FakeCard(104, note))
+        note.fields = ["changed", "two", ""]
+        self.assertEqual(self.extractor.extract(FakeCard(104, note))["front"], "one")
+        note.mod = 6
+        self.assertEqual(self.extractor.extract(FakeCard(104, note))["front"], "changed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import sys
+import pathlib
+from unittest.mock import patch
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services import card_writer as card_writer_module
+from services.card_writer import CardWriter, _PendingAppend, apply_appends
+
+
+class FakeNote:
+    def __init__(self, note_id, fields):
+        self.id = note_id
+        self.fields = list(fields)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.notes = {1: FakeNote(1, ["front 1", "back 1"]), 2: FakeNote(2, ["front 2", "back 2"])}
+        self.update_calls = []
+        self.undo_entries = []
+        self.merged = []
+
+    def get_note(self, note_id):
+        stored = self.notes[note_id]
+        return FakeNote(stored.id, stored.fields)
+
+    def update_notes(self, notes):
+        self.update_calls.append([n.id for n in notes])
+        for note in notes:
+            self.notes[note.id] = note
+        return "update"
+
+    def add_custom_undo_entry(self, name):
+        self.undo_entries.append(name)
+        return len(self.undo_entries)
+
+    def merge_undo_entries(self, target):
+        self.merged.append(target)
+        return "merged"
+
+
+class FakeCard:
+    def __init__(self, nid):
+        self.nid = nid
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+
+
+class FakeReviewer:
+    def __init__(self, nid):
+        self.card = FakeCard(nid)
+        self.redraws = 0
+
+    def _redraw_current_card(self):
+        self.redraws += 1
+
+
+class FakeMW:
+    def __init__(self, visible_nid):
+        self.col = FakeCollection()
+        self.reviewer = FakeReviewer(visible_nid)
+
+
+class TestApplyAppends(unittest.TestCase):
+    def test_merges_pending_appends_into_one_update_and_undo_entry(self):
+        col = FakeCollection()
+        pending = [
+            _PendingAppend(1, 1, "<hr>a", None),
+            _PendingAppend(2, 1, "<hr>b", None),
+            _PendingAppend(1, 1, "<hr>c", None),
+        ]
+        changes, touched = apply_appends(col, pending, "Save AI Conversation")
+        self.assertEqual(changes, "merged")
+        self.assertEqual(touched, {1, 2})
+        self.assertEqual(col.update_calls, [[1, 2]])
+        self.assertEqual(col.undo_entries, ["Save AI Conversation"])
+        self.assertEqual(col.notes[1].fields[1], "back 1<hr>a<hr>c")
+        self.assertEqual(col.notes[2].fields[1], "back 2<hr>b")
+
+
+class TestCardWriterSyncPath(unittest.TestCase):
+    def test_refreshes_reviewer_only_for_visible_note(self):
+        fake_mw = FakeMW(visible_nid=2)
+        results = []
+        with patch.object(card_writer_module, "mw", fake_mw), \
+                patch.object(card_writer_module, "ANKI_AVAILABLE", False):
+            writer = CardWriter()
+            self.assertTrue(writer.append(1, 1, "<hr>x", results.append))
+            self.assertEqual(fake_mw.reviewer.redraws, 0)
+            self.assertTrue(writer.append(2, 1, "<hr>y", results.append))
+            self.assertEqual(fake_mw.reviewer.redraws, 1)
+        self.assertEqual(results, [True, True])
+        self.assertEqual(writer.get_stats()["notes_written"], 2)
+
+    def test_reports_failure_without_collection(self):
+        results = []
+        with patch.object(card_writer_module, "mw", None):
+            writer = CardWriter()
+            self.assertFalse(writer.append(1, 1, "<hr>x", results.append))
+        self.assertEqual(results, [False])
+        self.assertEqual(writer.pending_count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import sys
+import pathlib
+from unittest.mock import patch
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.conversation_store import ConversationStore
+import ui.chat_dialog as chat_dialog_module
+from ui.chat_dialog import ChatDialog
+
+
+CARD = {"front": "chat", "back": "cat", "card_id": 100, "note_id": 10}
+
+
+class TestChatDialogHistory(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        Config.set("conversation_history_page_size", 2)
+        self.store = ConversationStore()
+        patcher = patch.object(chat_dialog_module, "get_conversation_store", lambda: self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.store.close()
+        Config.load_config()
+
+    def test_reopening_restores_last_page_and_pages_older_turns(self):
+        ids = [self.store.append_turn(100, 10, role, text) for role, text in
+               [("user", "q1"), ("assistant", "a1"), ("user", "q2"), ("assistant", "a2")]]
+        self.store.mark_turns_saved(100, ids[1])
+
+        dialog = ChatDialog(dict(CARD))
+        self.assertEqual([m["content"] for m in dialog.conversation_history[1:]], ["q2", "a2"])
+        self.assertTrue(dialog._has_more_turns)
+        self.assertEqual(dialog.saved_message_count, 0)
+
+        dialog.load_earlier_turns()
+        self.assertEqual(dialog.conversation_history[0]["role"], "system")
+        self.assertEqual([m["content"] for m in dialog.conversation_history[1:]], ["q1", "a1", "q2", "a2"])
+        self.assertEqual(dialog.saved_message_count, 2)
+        self.assertFalse(dialog._has_more_turns)
+
+    def test_turns_are_recorded_and_cleared(self):
+        dialog = ChatDialog(dict(CARD))
+        dialog._record_turn("user", "hello")
+        dialog._record_turn("assistant", "hi")
+        self.assertEqual(self.store.count_turns(100), 2)
+        dialog._mark_turns_saved(2)
+        self.assertTrue(all(t["saved"] for t in self.store.load_turns(100)[0]))
+        dialog.clear_chat()
+        self.assertEqual(self.store.count_turns(100), 0)
+
+    def test_history_disabled(self):
+        Config.set("conversation_history_enabled", False)
+        self.store.append_turn(100, 10, "user", "q1")
+        dialog = ChatDialog(dict(CARD))
+        self.assertEqual(len(dialog.conversation_history), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
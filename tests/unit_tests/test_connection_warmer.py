@@ -0,0 +1,53 @@
+import unittest
+import sys
+import pathlib
+from unittest import mock
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.connection_warmer import ConnectionWarmer
+
+
+class TestConnectionWarmer(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        Config.set("prewarm_idle_stop_seconds", 0)  # 不安排后台刷新
+        self.service = mock.Mock()
+        self.service.warm_connection.side_effect = [120.0, 20.0, 30.0]
+        adapter = mock.Mock(_service=self.service)
+        patcher = mock.patch("services.connection_warmer.ServiceRegistry.get_adapter", return_value=adapter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(Config.load_config)
+
+    def test_records_cold_and_warm_latency(self):
+        warmer = ConnectionWarmer()
+        for _ in range(3):
+            warmer._in_flight = True
+            warmer._warm_once()
+        stats = warmer.get_stats()
+        self.assertEqual(stats["warm_count"], 3)
+        self.assertEqual(stats["cold_handshake_ms"], 120.0)
+        self.assertAlmostEqual(stats["warm_request_ms"], 22.0)
+        self.assertAlmostEqual(stats["estimated_saving_ms"], 98.0)
+
+    def test_disabled_does_nothing(self):
+        Config.set("prewarm_enabled", False)
+        warmer = ConnectionWarmer()
+        warmer.warm()
+        self.service.warm_connection.assert_not_called()
+
+    def test_failure_is_recorded(self):
+        self.service.warm_connection.side_effect = OSError("dns failure")
+        warmer = ConnectionWarmer()
+        warmer._warm_once()
+        stats = warmer.get_stats()
+        self.assertEqual(stats["failures"], 1)
+        self.assertIn("dns failure", stats["last_error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
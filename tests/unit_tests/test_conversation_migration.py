@@ -0,0 +1,139 @@
+import unittest
+import sqlite3
+import sys
+import pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+# 插件打包的 mistune（追加到末尾，不覆盖已安装的依赖）
+if str(ROOT / "vendor") not in sys.path:
+    sys.path.append(str(ROOT / "vendor"))
+
+from services import conversation_style
+from services.card_service import CardService
+from services.conversation_migration import ConversationMigrator, compact_conversation_html, is_equivalent
+from utils.html_text import html_to_text
+
+
+CONVERSATION = [
+    {"role": "user", "content": "Why is the sky blue?"},
+    {"role": "assistant", "content": "Because of **Rayleigh** scattering:\n\n- short wavelengths\n- scatter more"},
+]
+
+
+def legacy_back(front_text="Sky"):
+    """旧版本 append_to_card 写入的背面内容"""
+    return front_text + conversation_style.INLINE_SEPARATOR + CardService.format_conversation_for_card(CONVERSATION, "inline")
+
+
+class FakeDB:
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("create table notes (id integer primary key, mid integer, flds text)")
+        self.queries = 0
+
+    def scalar(self, sql, *args):
+        return self.conn.execute(sql, args).fetchone()[0]
+
+    def all(self, sql, *args):
+        self.queries += 1
+        return self.conn.execute(sql, args).fetchall()
+
+
+class FakeNote:
+    def __init__(self, db, note_id):
+        self.db = db
+        self.id = note_id
+        self.fields = db.conn.execute("select flds from notes where id = ?", (note_id,)).fetchone()[0].split("\x1f")
+
+
+class FakeModels:
+    def __init__(self):
+        self.notetypes = {1: {"id": 1, "name": "Basic", "css": ".card {}"}}
+        self.saved = 0
+
+    def get(self, mid):
+        return self.notetypes.get(mid)
+
+    def update_dict(self, notetype):
+        self.saved += 1
+
+
+class FakeCollection:
+    def __init__(self):
+        self.db = FakeDB()
+        self.models = FakeModels()
+        self.undo_entries = []
+        self.merged = 0
+
+    def add_custom_undo_entry(self, name):
+        self.undo_entries.append(name)
+        return len(self.undo_entries)
+
+    def merge_undo_entries(self, target):
+        self.merged += 1
+        return "changes"
+
+    def get_note(self, note_id):
+        return FakeNote(self.db, note_id)
+
+    def update_notes(self, notes):
+        for note in notes:
+            self.db.conn.execute("update notes set flds = ? where id = ?", ("\x1f".join(note.fields), note.id))
+
+
+class TestCompactConversationHtml(unittest.TestCase):
+    def test_rewrites_legacy_blocks_to_class_markup(self):
+        original = legacy_back()
+        compacted = compact_conversation_html(original)
+        self.assertTrue(compacted.startswith("Sky" + conversation_style.CLASS_SEPARATOR_HTML))
+        self.assertNotIn("style=", compacted)
+        self.assertIn('class="cwc cwc-q"', compacted)
+        self.assertTrue(is_equivalent(original, compacted))
+        self.assertEqual(html_to_text(original), html_to_text(compacted))
+        self.assertLess(len(compacted), len(original) / 2)
+
+    def test_leaves_user_styles_alone(self):
+        html = '<p style="margin:0;padding:0;text-align:left;line-height:1.2;display:block;">mine</p><b style="color:red">x</b>'
+        self.assertEqual(compact_conversation_html(html), html)
+
+    def test_equivalence_rejects_structural_change(self):
+        self.assertFalse(is_equivalent("<p>a</p><p>b</p>", "<p>a</p>b"))
+
+
+class TestConversationMigrator(unittest.TestCase):
+    def setUp(self):
+        self.col = FakeCollection()
+        rows = [(i, 1, f"front {i}\x1f" + (legacy_back() if i % 3 == 0 else f"plain {i}")) for i in range(1, 31)]
+        self.col.db.conn.executemany("insert into notes values (?, ?, ?)", rows)
+
+    def test_migrates_in_batches_with_one_undo_entry(self):
+        progress = []
+        changes, report = ConversationMigrator(self.col, batch_size=4).run(progress=lambda d, t: progress.append((d, t)))
+        self.assertEqual(changes, "changes")
+        self.assertEqual(report["scanned"], 10)
+        self.assertEqual(report["changed"], 10)
+        self.assertGreater(report["bytes_saved"], 0)
+        self.assertEqual(self.col.undo_entries, ["Compact AI conversations"])
+        self.assertEqual(self.col.models.saved, 1)
+        self.assertEqual(progress[-1], (10, 10))
+        self.assertEqual(len(progress), 3)
+
+        flds = self.col.db.conn.execute("select flds from notes where id = 3").fetchone()[0]
+        self.assertNotIn("style=", flds)
+        self.assertEqual(self.col.db.conn.execute("select flds from notes where id = 4").fetchone()[0], "front 4\x1fplain 4")
+
+        # 再次运行没有候选笔记
+        self.assertEqual(ConversationMigrator(self.col).count_candidates(), 0)
+
+    def test_cancel_stops_between_batches(self):
+        calls = []
+        _, report = ConversationMigrator(self.col, batch_size=4).run(
+            progress=lambda d, t: calls.append(d), should_cancel=lambda: bool(calls))
+        self.assertTrue(report["cancelled"])
+        self.assertEqual(report["changed"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import sys
+import pathlib
+import time
+from unittest.mock import patch
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.conversation_store import ConversationStore
+from utils.search_text import build_fts_query, make_snippet, tokenize
+
+
+class TestSearchText(unittest.TestCase):
+    def test_tokenize_mixed_scripts(self):
+        self.assertEqual(tokenize("ATP 合成酶 works"), ["atp", "合成", "成酶", "works"])
+        self.assertEqual(tokenize("光"), ["光"])
+        self.assertEqual(tokenize("ひらがなカタカナ"), ["ひら", "らが", "がな", "なカ", "カタ", "タカ", "カナ"])
+
+    def test_query_quotes_user_syntax(self):
+        self.assertEqual(build_fts_query('krebs OR "cycle'), '"krebs" "or" "cycle"')
+        self.assertEqual(build_fts_query("光合作用"), '"光合 合作 作用"')
+        self.assertEqual(build_fts_query("  "), "")
+
+    def test_snippet_marks_terms(self):
+        text = "intro " * 40 + "the Krebs cycle makes NADH"
+        snippet = make_snippet(text, "krebs", width=40)
+        self.assertTrue(snippet.startswith("…"))
+        self.assertIn("[Krebs]", snippet)
+
+
+class TestTurnSearch(unittest.TestCase):
+    def setUp(self):
+        self.store = ConversationStore()
+        self.store.append_turn(1, 10, "assistant", "The Krebs cycle runs in the mitochondrial matrix.")
+        self.store.append_turn(2, 20, "assistant", "Glycolysis happens in the cytoplasm, not the Krebs cycle... Krebs Krebs")
+        self.store.append_turn(3, 30, "user", "光合作用是什么？")
+        self.store.append_turn(4, 40, "assistant", "光合作用は葉緑体で行われます。")
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_ranked_results_with_snippets(self):
+        results = self.store.search_turns("krebs")
+        self.assertEqual([r["card_id"] for r in results], [2, 1])
+        self.assertIn("[Krebs]", results[1]["snippet"])
+        self.assertEqual(self.store.search_turns("krebs matrix")[0]["card_id"], 1)
+
+    def test_cjk_search(self):
+        self.assertEqual(sorted(r["card_id"] for r in self.store.search_turns("光合作用")), [3, 4])
+        self.assertEqual([r["card_id"] for r in self.store.search_turns("葉緑体")], [4])
+        self.assertEqual(self.store.search_turns("合光"), [])
+
+    def test_index_follows_deletes(self):
+        self.store.delete_card_turns(2)
+        self.assertEqual([r["card_id"] for r in self.store.search_turns("krebs")], [1])
+        with patch("services.conversation_store.time.time", return_value=time.time() + 2 * 86400):
+            self.store.apply_retention(max_age_days=1)
+        self.assertEqual(self.store.search_turns("krebs"), [])
+        rows = self.store._conn.execute("select count() from turns_fts where turns_fts match 'krebs'").fetchone()[0]
+        self.assertEqual(rows, 0)
+
+    def test_existing_turns_are_backfilled(self):
+        store = ConversationStore()
+        store.append_turn(9, 90, "user", "backfill me")
+        store._conn.execute("drop table turns_fts")
+        self.assertTrue(store._ensure_turns_fts())
+        self.assertEqual([r["card_id"] for r in store.search_turns("backfill")], [9])
+        store.close()
+
+    def test_search_is_fast_on_many_turns(self):
+        with self.store.transaction():
+            for i in range(5000):
+                self.store.append_turn(100 + i, i, "assistant", f"note {i} about topic{i % 50} and enzymes")
+        started = time.perf_counter()
+        results = self.store.search_turns("topic7 enzymes", limit=20)
+        self.assertEqual(len(results), 20)
+        self.assertLess((time.perf_counter() - started) * 1000, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
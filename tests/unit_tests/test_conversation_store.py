@@ -0,0 +1,129 @@
+import unittest
+import sys
+import pathlib
+import tempfile
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from unittest.mock import patch
+
+from services.conversation_store import (
+    CODEC_ZLIB, ConversationStore, expand_references, find_references, make_reference,
+)
+
+
+class TestConversationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(pathlib.Path(self.tmp.name) / "conversations.db")
+        self.store = ConversationStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_add_and_get_transcript(self):
+        tid = self.store.add_transcript(42, "<div>Q</div>", "Q about mitochondria", card_id=7, turns=1)
+        row = self.store.get_transcript(tid)
+        self.assertEqual((row["note_id"], row["card_id"], row["html"], row["turns"]), (42, 7, "<div>Q</div>", 1))
+        self.assertIsNone(self.store.get_transcript(tid + 100))
+
+    def test_persists_in_wal_mode(self):
+        tid = self.store.add_transcript(1, "<p>a</p>", "a")
+        self.store.close()
+        self.store = ConversationStore(self.path)
+        mode = self.store._conn.execute("pragma journal_mode").fetchone()[0]
+        self.assertEqual(mode.lower(), "wal")
+        self.assertEqual(self.store.get_transcript(tid)["html"], "<p>a</p>")
+
+    def test_search_and_delete(self):
+        self.store.add_transcript(1, "", "The Krebs cycle produces NADH")
+        self.store.add_transcript(2, "", "Glycolysis happens in the cytoplasm")
+        self.store.add_transcript(1, "", "More on the krebs cycle")
+        self.assertEqual([r["note_id"] for r in self.store.search_transcripts("krebs cycle")], [1, 1])
+        self.assertEqual(self.store.search_transcripts('"unbalanced'), [])
+        self.assertEqual(self.store.delete_note_transcripts(1), 2)
+        self.assertEqual(self.store.search_transcripts("krebs"), [])
+        self.assertEqual(len(self.store.get_note_transcripts(2)), 1)
+
+    def test_failed_transaction_rolls_back(self):
+        with self.assertRaises(RuntimeError):
+            with self.store.transaction() as conn:
+                conn.execute("insert into transcripts (note_id, created, html, text) values (1, 0, '', '')")
+                raise RuntimeError("boom")
+        self.assertEqual(self.store.get_note_transcripts(1), [])
+
+
+class TestTurns(unittest.TestCase):
+    def setUp(self):
+        self.store = ConversationStore()
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_pages_turns_oldest_first(self):
+        ids = [self.store.append_turn(5, 50, "user" if i % 2 == 0 else "assistant", f"turn {i}") for i in range(7)]
+        self.store.append_turn(6, 60, "user", "other card")
+
+        page, has_more = self.store.load_turns(5, limit=3)
+        self.assertEqual([t["content"] for t in page], ["turn 4", "turn 5", "turn 6"])
+        self.assertTrue(has_more)
+        page, has_more = self.store.load_turns(5, before_id=page[0]["id"], limit=3)
+        self.assertEqual([t["id"] for t in page], ids[1:4])
+        page, has_more = self.store.load_turns(5, before_id=page[0]["id"], limit=3)
+        self.assertEqual(([t["id"] for t in page], has_more), ([ids[0]], False))
+
+    def test_long_bodies_are_compressed(self):
+        text = "The mitochondrion is the powerhouse of the cell. " * 40
+        tid = self.store.append_turn(1, 1, "assistant", text)
+        codec, size = self.store._conn.execute("select codec, length(body) from turns where id = ?", (tid,)).fetchone()
+        self.assertEqual(codec, CODEC_ZLIB)
+        self.assertLess(size, len(text) / 5)
+        self.assertEqual(self.store.load_turns(1)[0][0]["content"], text)
+
+    def test_mark_saved_and_delete(self):
+        first = self.store.append_turn(1, 1, "user", "q")
+        self.store.append_turn(1, 1, "assistant", "a")
+        self.store.mark_turns_saved(1, first)
+        self.assertEqual([t["saved"] for t in self.store.load_turns(1)[0]], [True, False])
+        self.assertEqual(self.store.delete_card_turns(1), 2)
+        self.assertEqual(self.store.count_turns(1), 0)
+
+    def test_retention_limits(self):
+        with patch("services.conversation_store.time.time", return_value=1000.0):
+            self.store.append_turn(1, 1, "user", "ancient")
+        for i in range(5):
+            self.store.append_turn(2, 2, "user", f"t{i}")
+        deleted = self.store.apply_retention(max_turns_per_card=3, max_age_days=1)
+        self.assertEqual(deleted, 3)
+        self.assertEqual([t["content"] for t in self.store.load_turns(2)[0]], ["t2", "t3", "t4"])
+        self.assertEqual(self.store.count_turns(1), 0)
+
+    def test_maintain_vacuums_after_deleting(self):
+        tmp = tempfile.TemporaryDirectory()
+        store = ConversationStore(str(pathlib.Path(tmp.name) / "c.db"))
+        try:
+            self.assertEqual(store._conn.execute("pragma auto_vacuum").fetchone()[0], 2)
+            for i in range(300):
+                store.append_turn(1, 1, "user", f"{i} " + "x" * 2000)
+            result = store.maintain(max_turns_per_card=10)
+            self.assertEqual(result["deleted"], 290)
+            self.assertEqual(store._conn.execute("pragma freelist_count").fetchone()[0], 0)
+        finally:
+            store.close()
+            tmp.cleanup()
+
+
+class TestReferences(unittest.TestCase):
+    def test_reference_round_trip(self):
+        html = "Back<hr>" + make_reference(12, 3) + make_reference(13)
+        self.assertEqual(find_references(html), [12, 13])
+        self.assertLess(len(make_reference(12, 3)), 100)
+        expanded = expand_references(html, lambda tid, label: f"[{tid}:{label}]")
+        self.assertEqual(expanded, "Back<hr>[12:💬 AI conversation (3 turns)][13:💬 AI conversation]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import sys
+import pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+# 插件打包的 mistune（追加到末尾，不覆盖已安装的依赖）
+if str(ROOT / "vendor") not in sys.path:
+    sys.path.append(str(ROOT / "vendor"))
+
+from services import conversation_style
+from services.card_service import CardService
+from utils.html_text import html_to_text
+
+
+CONVERSATION = [
+    {"role": "user", "content": "What does `map` return?"},
+    {"role": "assistant", "content": "## Summary\n\nIt returns an **iterator**:\n\n- lazy\n- single pass\n\nUse `list()` to materialise it."},
+    {"role": "user", "content": "Thanks"},
+]
+
+
+class FakeModels:
+    def __init__(self):
+        self.saved = []
+
+    def update_dict(self, notetype):
+        self.saved.append(dict(notetype))
+
+
+class FakeCollection:
+    def __init__(self):
+        self.models = FakeModels()
+
+
+class TestConversationStyle(unittest.TestCase):
+    def test_class_mode_is_smaller_and_renders_same_text(self):
+        inline = CardService.format_conversation_for_card(CONVERSATION, "inline")
+        compact = CardService.format_conversation_for_card(CONVERSATION, "class")
+        self.assertNotIn("style=", compact)
+        self.assertIn('<div class="cwc cwc-q">', compact)
+        self.assertIn('<div class="cwc cwc-a">', compact)
+        self.assertLess(len(compact.encode("utf-8")) * 2, len(inline.encode("utf-8")))
+        self.assertEqual(html_to_text(compact), html_to_text(inline))
+
+    def test_inline_mode_keeps_legacy_markup(self):
+        inline = CardService.format_conversation_for_card([{"role": "user", "content": "plain"}], "inline")
+        self.assertTrue(inline.startswith('<p style="margin:0 0 8px 0;'))
+        self.assertIn('<span style="color:#2563eb;font-weight:600;">Question:</span> plain</p>', inline)
+
+    def test_merge_stylesheet_appends_once_and_updates_in_place(self):
+        css = ".card { color: black; }\n"
+        merged = conversation_style.merge_stylesheet(css)
+        self.assertTrue(merged.startswith(css))
+        self.assertTrue(conversation_style.has_stylesheet(merged))
+        self.assertEqual(conversation_style.merge_stylesheet(merged), merged)
+
+        outdated = merged.replace(".cwc-q{margin-bottom:8px}", ".cwc-q{margin-bottom:4px}")
+        self.assertFalse(conversation_style.has_stylesheet(outdated))
+        self.assertEqual(conversation_style.merge_stylesheet(outdated), merged)
+
+    def test_ensure_stylesheet_writes_notetype_only_when_needed(self):
+        col = FakeCollection()
+        notetype = {"name": "Basic", "css": ".card {}"}
+        self.assertTrue(conversation_style.ensure_stylesheet(col, notetype))
+        self.assertTrue(conversation_style.ensure_stylesheet(col, notetype))
+        self.assertEqual(len(col.models.saved), 1)
+        self.assertIn(conversation_style.STYLESHEET, notetype["css"])
+
+
+if __name__ == "__main__":
+    unittest.main()
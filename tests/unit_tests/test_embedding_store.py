@@ -0,0 +1,226 @@
+import unittest
+import sys
+import pathlib
+import base64
+import json
+import sqlite3
+import tempfile
+import threading
+from array import array
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services import embedding_store as embedding_store_module
+from services.embedding_store import EmbeddingStore, EmbeddingsClient, sync_embeddings
+
+
+def fake_embedding(text):
+    """按几个关键词出现次数构造的 4 维向量"""
+    return [float(text.lower().count(word)) + 0.01 for word in ("cell", "energy", "light", "protein")]
+
+
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        EmbeddingHandler.requests_seen.append(body)
+        data = []
+        for i, text in enumerate(body["input"]):
+            vector = fake_embedding(text)
+            if i % 2 == 0:
+                embedding = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        # 故意打乱顺序，客户端应按 index 还原
+        payload = json.dumps({"data": list(reversed(data)), "model": body["model"]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeDB:
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("create table notes (id integer primary key, mod integer, flds text)")
+
+    def all(self, sql, *args):
+        return self.conn.execute(sql, args).fetchall()
+
+    def list(self, sql, *args):
+        return [row[0] for row in self.conn.execute(sql, args)]
+
+    def scalar(self, sql, *args):
+        return self.conn.execute(sql, args).fetchone()[0]
+
+
+class FakeCollection:
+    def __init__(self, notes):
+        self.db = FakeDB()
+        for nid, flds in notes.items():
+            self.db.conn.execute("insert into notes values (?, 100, ?)", (nid, flds))
+
+
+class TestEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = str(pathlib.Path(self.tmp.name) / "embeddings")
+        self.store = EmbeddingStore(self.dir)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def add_sample(self):
+        self.store.add([(1, [1, 0, 0]), (2, [0.9, 0.1, 0]), (3, [0, 1, 0]), (4, [0, 0, 1])], watermark=50)
+
+    def test_search_tombstone_and_reopen(self):
+        self.add_sample()
+        self.assertEqual([nid for nid, _ in self.store.search([1, 0, 0], k=2)], [1, 2])
+        self.assertEqual([nid for nid, _ in self.store.search([1, 0, 0], k=1, exclude=[1])], [2])
+        self.assertEqual(self.store.remove([1, 99]), 1)
+        self.store.add([(3, [1, 0.05, 0])])
+        self.store.close()
+
+        self.store = EmbeddingStore(self.dir)
+        self.assertEqual((len(self.store), self.store.tombstones, self.store.meta["watermark"]), (3, 2, 50))
+        self.assertEqual([nid for nid, _ in self.store.search([1, 0, 0], k=2)], [3, 2])
+
+    def test_compaction_switches_generation(self):
+        self.add_sample()
+        self.store.remove([1, 3])
+        self.assertTrue(self.store.needs_compaction())
+        self.store.compact()
+        self.assertEqual((self.store.meta["gen"], len(self.store.ids), self.store.tombstones), (1, 2, 0))
+        self.assertFalse(pathlib.Path(self.dir, "vectors-0.f32").exists())
+        self.assertEqual([nid for nid, _ in self.store.search([0, 0, 1], k=5)], [4, 2])
+
+    def test_truncated_write_is_repaired_on_open(self):
+        self.add_sample()
+        self.store.close()
+        with open(pathlib.Path(self.dir, "vectors-0.f32"), "ab") as f:
+            f.write(array("f", [1, 1]).tobytes())
+        self.store = EmbeddingStore(self.dir)
+        self.assertEqual(len(self.store.ids), 4)
+        self.assertEqual(pathlib.Path(self.dir, "vectors-0.f32").stat().st_size, 4 * 3 * 4)
+
+    def test_python_and_numpy_paths_agree(self):
+        if embedding_store_module.np is None:
+            self.skipTest("NumPy not installed")
+        self.add_sample()
+        expected = self.store.search([0.5, 0.5, 0.1], k=3)
+        with patch.object(embedding_store_module, "np", None):
+            actual = self.store.search([0.5, 0.5, 0.1], k=3)
+        self.assertEqual([n for n, _ in actual], [n for n, _ in expected])
+
+
+class TestEmbeddingsClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), EmbeddingHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/v1/embeddings"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        EmbeddingHandler.requests_seen = []
+
+    def test_batches_and_decodes_both_formats(self):
+        client = EmbeddingsClient("key", model="test-embed", endpoint=self.url, batch_size=2)
+        try:
+            texts = ["cell cell", "energy", "light", "protein", "cell energy"]
+            vectors = client.embed(texts)
+        finally:
+            client.close()
+        self.assertEqual([len(r["input"]) for r in EmbeddingHandler.requests_seen], [2, 2, 1])
+        for text, vector in zip(texts, vectors):
+            self.assertEqual(list(vector), list(array("f", fake_embedding(text))))
+
+    def test_sync_embeds_changed_notes_and_removes_deleted(self):
+        col = FakeCollection({
+            1: "Mitochondria\x1fThe cell's <b>energy</b> source",
+            2: "Chloroplast\x1fCaptures light energy",
+            3: "Ribosome\x1fMakes protein",
+        })
+        tmp = tempfile.TemporaryDirectory()
+        store = EmbeddingStore(tmp.name)
+        client = EmbeddingsClient("", endpoint=self.url, batch_size=2)
+        try:
+            self.assertEqual(sync_embeddings(col, store, client, batch_size=2), {"embedded": 3, "removed": 0})
+            self.assertEqual(store.search(fake_embedding("protein"), k=1)[0][0], 3)
+
+            col.db.conn.execute("delete from notes where id = 3")
+            col.db.conn.execute("update notes set mod = 200, flds = 'Ribosome-free\x1fNo protein here, light' where id = 2")
+            # 修改时间恰为旧水位的笔记 1 上次已经嵌入，不再重复请求
+            self.assertEqual(sync_embeddings(col, store, client), {"embedded": 1, "removed": 1})
+            self.assertEqual(store.search(fake_embedding("protein"), k=1)[0][0], 2)
+            self.assertEqual(sync_embeddings(col, store, client), {"embedded": 0, "removed": 0})
+        finally:
+            client.close()
+            store.close()
+            tmp.cleanup()
+
+    def test_sync_finds_deletion_when_note_count_is_unchanged(self):
+        col = FakeCollection({1: "a", 2: "b"})
+        tmp = tempfile.TemporaryDirectory()
+        store = EmbeddingStore(tmp.name)
+        client = EmbeddingsClient("", endpoint=self.url)
+        try:
+            sync_embeddings(col, store, client)
+            col.db.conn.execute("delete from notes where id = 2")
+            # 导入的旧笔记修改时间早于水位，与删除同时发生时笔记数不变
+            col.db.conn.execute("insert into notes values (3, 50, 'c')")
+            self.assertEqual(sync_embeddings(col, store, client), {"embedded": 0, "removed": 1})
+            self.assertEqual(sorted(store.rows), [1])
+        finally:
+            client.close()
+            store.close()
+            tmp.cleanup()
+
+    def test_failed_sync_keeps_old_watermark(self):
+        col = FakeCollection({1: "a", 2: "b", 3: "c", 4: "d"})
+        col.db.conn.execute("update notes set mod = 1000 where id = 1")
+        col.db.conn.execute("update notes set mod = 10 where id != 1")
+        tmp = tempfile.TemporaryDirectory()
+        store = EmbeddingStore(tmp.name)
+        client = EmbeddingsClient("", endpoint=self.url, batch_size=2)
+        real_embed, calls = client.embed, []
+
+        def flaky_embed(texts):
+            calls.append(len(texts))
+            if len(calls) == 2:
+                raise RuntimeError("HTTP 429: rate limited")
+            return real_embed(texts)
+
+        client.embed = flaky_embed
+        try:
+            with self.assertRaises(RuntimeError):
+                sync_embeddings(col, store, client, batch_size=2)
+            self.assertEqual(store.meta["watermark"], 0)
+            self.assertEqual(sync_embeddings(col, store, client, batch_size=2), {"embedded": 4, "removed": 0})
+            self.assertEqual(sorted(store.rows), [1, 2, 3, 4])
+            self.assertEqual(store.meta["watermark"], 1000)
+            self.assertEqual(sync_embeddings(col, store, client, batch_size=2), {"embedded": 0, "removed": 0})
+        finally:
+            client.close()
+            store.close()
+            tmp.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
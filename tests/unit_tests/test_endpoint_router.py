@@ -0,0 +1,154 @@
+import unittest
+import sys
+import pathlib
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.endpoint_router import EndpointRouter, endpoint_router, load_endpoint_profiles
+from services.model_catalog import ModelCatalog
+from services.openai_service import OpenAIService
+from ui.config_dialog import format_endpoint_stats
+
+
+class Handler(BaseHTTPRequestHandler):
+    """/down 开头的路径返回 503；其他路径回显模型名与密钥（stream 为真时以 SSE 返回）"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.startswith("/down"):
+            data = b"overloaded"
+            self.send_response(503)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        content = f"{body['model']} {self.headers.get('Authorization', '-')}"
+        if body.get("stream"):
+            events = b"".join(
+                f"data: {json.dumps({'choices': [{'delta': {'content': part}}]})}\n\n".encode()
+                for part in content.split(" ", 1)
+            ) + b"data: [DONE]\n\n"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(events)))
+            self.end_headers()
+            self.wfile.write(events)
+            return
+        data = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestEndpointRouter(unittest.TestCase):
+    def test_faster_endpoint_is_preferred(self):
+        router = EndpointRouter(rng=random.Random(7))
+        for _ in range(5):
+            router.record("fast", 100, True)
+            router.record("slow", 1000, True)
+        firsts = [router.plan(["fast", "slow"])[0] for _ in range(200)]
+        self.assertGreater(firsts.count("fast"), 150)
+        self.assertIn("slow", firsts)
+
+    def test_repeated_failures_eject_endpoint(self):
+        router = EndpointRouter(eject_failures=3, eject_seconds=30)
+        for _ in range(3):
+            router.record("flaky", None, False)
+        self.assertEqual(router.plan(["flaky", "ok"], ["backup"]), ["ok", "backup", "flaky"])
+        stats = {s["name"]: s for s in router.snapshot()}
+        self.assertGreater(stats["flaky"]["ejected_seconds"], 29)
+        self.assertEqual(stats["flaky"]["errors"], 3)
+
+    def test_fallback_is_tried_after_balanced_endpoints(self):
+        router = EndpointRouter()
+        self.assertEqual(router.plan(["a"], ["c", "b", "a"]), ["a", "c", "b"])
+
+    def test_invalid_profiles_are_skipped(self):
+        profiles = load_endpoint_profiles([
+            {"name": "local", "url": "http://127.0.0.1:1/v1/chat/completions", "models": {"*": "llama"}},
+            {"name": "local", "url": "http://duplicate"},
+            {"name": "openai", "url": "http://reserved"},
+            {"url": "http://nameless"},
+        ])
+        self.assertEqual([p.name for p in profiles], ["local"])
+        self.assertEqual(profiles[0].model_for("gpt-4o-mini"), "llama")
+
+    def test_stats_table(self):
+        self.assertIn("暂无统计", format_endpoint_stats([]))
+        html = format_endpoint_stats([{"name": "<local>", "url": "http://x", "latency_ms": 120.4,
+                                       "error_rate": 0.25, "requests": 4, "errors": 1, "ejected_seconds": 0}])
+        self.assertIn("&lt;local&gt;", html)
+        self.assertIn("120 ms", html)
+        self.assertIn("25%", html)
+
+
+class TestEndpointFailover(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Config.load_config()
+        endpoint_router.reset()
+        self.addCleanup(Config.load_config)
+        self.addCleanup(endpoint_router.reset)
+        self.svc = OpenAIService()
+        self.svc.api_key = "sk-primary"
+        self.svc.model = "gpt-4o-mini"
+        self.svc.catalog = ModelCatalog()
+        self.svc.endpoint = self.base + "/down/v1/chat/completions"
+        self.addCleanup(self.svc.close)
+        Config.set("endpoint_profiles", [{
+            "name": "local", "url": self.base + "/v1/chat/completions",
+            "api_key": "sk-local", "models": {"gpt-4o-mini": "qwen2.5"},
+        }])
+        # 回退端点只在分流的端点失败后尝试，因此顺序确定
+        Config.set("endpoint_fallbacks", ["local"])
+
+    def test_get_response_fails_over_with_profile_key_and_model(self):
+        answer = self.svc.get_response([{"role": "user", "content": "hi"}])
+        self.assertEqual(answer, "qwen2.5 Bearer sk-local")
+        stats = {s["name"]: s for s in endpoint_router.snapshot()}
+        self.assertEqual(stats["openai"]["errors"], 1)
+        self.assertEqual(stats["local"]["requests"], 1)
+        self.assertIsNotNone(stats["local"]["latency_ms"])
+
+    def test_stream_fails_over_to_next_endpoint(self):
+        chunks = list(self.svc.stream_response([{"role": "user", "content": "hi"}]))
+        self.assertEqual(chunks, ["qwen2.5", "Bearer sk-local"])
+        self.assertEqual(self.svc.get_metrics()["errors"], 1)
+
+    def test_no_failover_without_profiles(self):
+        Config.set("endpoint_profiles", [])
+        answer = self.svc.get_response([{"role": "user", "content": "hi"}])
+        self.assertIn("HTTP 503", answer)
+
+    def test_primary_without_key_is_skipped(self):
+        self.svc.api_key = ""
+        Config.set("endpoint_fallbacks", [])
+        self.assertEqual(self.svc.get_response([{"role": "user", "content": "hi"}]), "qwen2.5 Bearer sk-local")
+
+
+if __name__ == "__main__":
+    unittest.main()
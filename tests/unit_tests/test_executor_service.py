@@ -0,0 +1,103 @@
+import unittest
+import sys
+import pathlib
+import threading
+from concurrent.futures import CancelledError
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.cancellation import CancelToken
+from services.executor_service import (
+    ExecutorService, PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH,
+)
+
+
+class TestExecutorService(unittest.TestCase):
+    def setUp(self):
+        self.executor = ExecutorService(max_workers=2, reserved_interactive=1)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown(wait=True, timeout=2)
+
+    def blocker(self, started):
+        started.set()
+        self.release.wait(5)
+
+    def test_interactive_runs_before_queued_bulk_and_keeps_a_reserved_worker(self):
+        started = threading.Event()
+        order = []
+        self.executor.submit(self.blocker, started, priority=PRIORITY_BULK)
+        self.assertTrue(started.wait(2))
+        # 非交互任务最多占一个线程：后续批量与预取任务排队，交互任务仍能立即运行
+        queued_bulk = self.executor.submit(order.append, "bulk", priority=PRIORITY_BULK)
+        prefetch = self.executor.submit(order.append, "prefetch", priority=PRIORITY_PREFETCH)
+        interactive = self.executor.submit(order.append, "interactive", priority=PRIORITY_INTERACTIVE)
+        interactive.result(2)
+        self.assertFalse(prefetch.done() or queued_bulk.done())
+        self.release.set()
+        queued_bulk.result(2)
+        self.assertEqual(order, ["interactive", "prefetch", "bulk"])
+        self.assertLessEqual(self.executor.get_metrics()["workers"], 2)
+
+    def test_burst_runs_concurrently_with_an_idle_worker(self):
+        executor = ExecutorService(max_workers=4, reserved_interactive=1)
+        self.addCleanup(executor.shutdown, True, 2)
+        executor.submit(lambda: None).result(2)
+        # 已有一个空闲线程：同时提交的阻塞任务应各占一个线程，而不是依次执行
+        barrier = threading.Barrier(3, timeout=2)
+        futures = [executor.submit(barrier.wait) for _ in range(3)]
+        for future in futures:
+            future.result(3)
+        self.assertEqual(executor.get_metrics()["workers"], 3)
+
+    def test_cancel_group_drops_queued_and_signals_running(self):
+        started = threading.Event()
+        token = CancelToken()
+
+        def long_task():
+            started.set()
+            token.wait(5)
+            return token.is_cancelled
+
+        running = self.executor.submit(long_task, priority=PRIORITY_BULK, group="index", cancel_token=token)
+        self.assertTrue(started.wait(2))
+        queued = self.executor.submit(lambda: "never", priority=PRIORITY_BULK, group="index")
+        other = self.executor.submit(lambda: "other", priority=PRIORITY_INTERACTIVE, group="chat")
+        self.assertEqual(self.executor.cancel_group("index"), 2)
+        self.assertTrue(running.result(2))
+        with self.assertRaises(CancelledError):
+            queued.result(2)
+        self.assertEqual(other.result(2), "other")
+
+    def test_metrics_report_depth_and_wait(self):
+        started = threading.Event()
+        executor = ExecutorService(max_workers=1, reserved_interactive=0)
+        try:
+            executor.submit(self.blocker, started)
+            self.assertTrue(started.wait(2))
+            pending = [executor.submit(lambda: None, priority=PRIORITY_BULK) for _ in range(3)]
+            metrics = executor.get_metrics()
+            self.assertEqual((metrics["queue_depth"], metrics["bulk"]["queued"], metrics["interactive"]["running"]), (3, 3, 1))
+            self.release.set()
+            for future in pending:
+                future.result(2)
+            metrics = executor.get_metrics()
+            self.assertEqual(metrics["bulk"]["completed"], 3)
+            self.assertGreater(metrics["bulk"]["max_wait_ms"], 0)
+        finally:
+            executor.shutdown(wait=True, timeout=2)
+
+    def test_failures_are_delivered_through_the_future(self):
+        def boom():
+            raise ValueError("bad")
+        with self.assertRaises(ValueError):
+            self.executor.submit(boom).result(2)
+        self.assertEqual(self.executor.get_metrics()["interactive"]["failed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+import sys
+import pathlib
+import threading
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.cancellation import CancelToken
+from services.hedging import FirstTokenTimeout, TTFTTracker, hedge_delay_seconds, hedged_stream
+from services.openai_service import OpenAIService
+from services.transport import TransportError
+
+
+def stalled(token):
+    """一直不出字，直到被取消"""
+    token.wait(5)
+    return iter(())
+
+
+def chunks(*parts):
+    return iter(parts)
+
+
+class TestHedgedStream(unittest.TestCase):
+    def run_attempts(self, behaviours, **kwargs):
+        tokens, events = [], []
+
+        def open_attempt(index, token):
+            tokens.append(token)
+            return behaviours[index](token)
+
+        result = list(hedged_stream(open_attempt, on_event=lambda kind, i: events.append((kind, i)), **kwargs))
+        return result, tokens, events
+
+    def test_hedge_wins_when_primary_stalls(self):
+        started = time.monotonic()
+        result, tokens, events = self.run_attempts(
+            [stalled, lambda token: chunks("fast", " answer")], hedge_delay=0.05, max_attempts=2)
+        self.assertEqual(result, ["fast", " answer"])
+        self.assertEqual(events, [("hedge", 1), ("win", 1)])
+        self.assertTrue(tokens[0].is_cancelled)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_no_hedge_when_primary_is_fast(self):
+        result, tokens, events = self.run_attempts(
+            [lambda token: chunks("a", "b"), stalled], hedge_delay=0.5, max_attempts=2)
+        self.assertEqual(result, ["a", "b"])
+        self.assertEqual(events, [("win", 0)])
+        self.assertEqual(len(tokens), 1)
+
+    def test_first_token_timeout(self):
+        started = time.monotonic()
+        with self.assertRaises(FirstTokenTimeout):
+            self.run_attempts([stalled], max_attempts=1, first_token_timeout=0.1)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_server_error_fails_over_immediately(self):
+        def unavailable(token):
+            raise TransportError("HTTP 503: overloaded", 503)
+
+        result, _tokens, events = self.run_attempts(
+            [unavailable, lambda token: chunks("ok")], hedge_delay=5, max_attempts=2)
+        self.assertEqual(result, ["ok"])
+        self.assertEqual(events, [("hedge", 1), ("win", 1)])
+
+    def test_client_error_is_not_retried(self):
+        def unauthorized(token):
+            raise TransportError("HTTP 401: bad key", 401)
+
+        with self.assertRaises(TransportError):
+            self.run_attempts([unauthorized, lambda token: chunks("never")], hedge_delay=0.05, max_attempts=2)
+
+    def test_attempts_run_in_the_callers_thread_until_a_hedge_fires(self):
+        threads = []
+
+        def unavailable(token):
+            threads.append(threading.current_thread())
+            raise TransportError("HTTP 503: overloaded", 503)
+
+        def answer(token):
+            threads.append(threading.current_thread())
+            return chunks("ok")
+
+        result, _tokens, _events = self.run_attempts([unavailable, answer], hedge_delay=5, max_attempts=2,
+                                                     first_token_timeout=5, total_timeout=5)
+        self.assertEqual(result, ["ok"])
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+
+    def test_total_timeout_stops_a_slow_answer(self):
+        def trickle(token):
+            yield "a"
+            token.wait(5)
+            yield "b"
+
+        with self.assertRaises(TimeoutError):
+            self.run_attempts([trickle], max_attempts=1, first_token_timeout=1, total_timeout=0.1)
+
+    def test_cancel_stops_all_attempts(self):
+        parent = CancelToken()
+        tokens = []
+
+        def open_attempt(index, token):
+            tokens.append(token)
+            return stalled(token)
+
+        parent_timer = time.monotonic()
+        threading.Timer(0.1, parent.cancel).start()
+        self.assertEqual(list(hedged_stream(open_attempt, hedge_delay=0.02, max_attempts=2, cancel_token=parent)), [])
+        self.assertLess(time.monotonic() - parent_timer, 1)
+        self.assertTrue(all(token.is_cancelled for token in tokens))
+
+
+class TestTTFTTracker(unittest.TestCase):
+    def test_delay_uses_percentile_within_bounds(self):
+        tracker = TTFTTracker()
+        key = ("https://api.example/v1/chat/completions", "gpt-4o-mini")
+        self.assertEqual(hedge_delay_seconds(tracker, key, 95, 500, 8000), 8.0)
+        tracker.seed(key, [400, 600, 800, 1000, 1200, 1400, 1600, 1800, 2000, 6000])
+        self.assertEqual(tracker.percentile(key, 50), 1200)
+        self.assertEqual(hedge_delay_seconds(tracker, key, 90, 500, 8000), 2.0)
+        self.assertEqual(hedge_delay_seconds(tracker, key, 0, 500, 8000), 0.5)
+        # 已有样本时不再用历史覆盖
+        tracker.seed(key, [1])
+        self.assertEqual(tracker.count(key), 10)
+
+    def test_censored_samples_never_lower_the_estimate(self):
+        tracker = TTFTTracker()
+        key = ("https://api.example/v1/chat/completions", "gpt-4o-mini")
+        tracker.record_censored(key, 3000, 95)
+        tracker.seed(key, [1000, 1000, 1000, 1000, 2000])
+        self.assertEqual(tracker.count(key), 1)
+        for ms in (1000, 1000, 1000, 2000):
+            tracker.record(key, ms)
+        # 低于当前分位数的下界不计入，更高的下界把分位数推高
+        tracker.record_censored(key, 500, 95)
+        self.assertEqual(tracker.count(key), 5)
+        tracker.record_censored(key, 4000, 95)
+        self.assertEqual(tracker.percentile(key, 95), 4000)
+
+
+class TestHedgeTarget(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        self.addCleanup(Config.load_config)
+        self.svc = OpenAIService()
+        self.svc.api_key = "sk-primary"
+        self.addCleanup(self.svc.close)
+
+    def test_hedge_endpoint_never_reuses_other_keys(self):
+        Config.set("endpoint_profiles", [{"name": "backup", "url": "https://backup.example/v1/chat/completions",
+                                          "api_key": "sk-backup"}])
+        settings = Config.get_hedging_config()
+        settings["endpoint"] = "https://other.example/v1/chat/completions"
+        self.assertEqual(self.svc._hedge_profile(settings).api_key, "")
+        settings["api_key"] = "sk-hedge"
+        self.assertEqual(self.svc._hedge_profile(settings).api_key, "sk-hedge")
+        settings["endpoint"] = "backup"
+        profile = self.svc._hedge_profile(settings)
+        self.assertEqual((profile.url, profile.api_key), ("https://backup.example/v1/chat/completions", "sk-backup"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import sys
+import pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.html_text import html_to_text
+
+
+class TestHtmlToText(unittest.TestCase):
+    def test_drops_script_style_and_hidden_content(self):
+        html = ("<style>.card{color:red}</style><script>var a = 1;</script>"
+                "<div>Visible</div><div style='display: none'>secret</div><span hidden>also</span>")
+        self.assertEqual(html_to_text(html), "Visible")
+
+    def test_decodes_entities_and_keeps_lines(self):
+        html = "<div>Tom &amp; Jerry&nbsp;show</div><p>second</p>line<br>break<ul><li>a</li><li>b</li></ul>"
+        self.assertEqual(html_to_text(html), "Tom & Jerry show\nsecond\nline\nbreak\n- a\n- b")
+
+    def test_summarises_media(self):
+        html = "<img src='paste-1.jpg'><img src='x.png' alt='Krebs cycle'>[sound:word.mp3]<audio src='a.ogg'></audio>"
+        self.assertEqual(html_to_text(html), "[image: Krebs cycle]\n[media: 2 images, 2 audio]")
+
+    def test_mathjax_source_is_compacted(self):
+        self.assertEqual(html_to_text(r"Area \(\pi r^2\) and \[E=mc^2\]"), "Area $\\pi r^2$ and $$E=mc^2$$")
+
+    def test_length_cap(self):
+        text = html_to_text("<p>" + "word " * 10000 + "</p>", max_chars=50)
+        self.assertTrue(text.endswith("…"))
+        self.assertLessEqual(len(text), 51)
+
+    def test_unbalanced_markup(self):
+        self.assertEqual(html_to_text("<div><style>x{}</div>kept</style>after"), "after")
+        self.assertEqual(html_to_text("</p>text<b>bold"), "textbold")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import sys
+import pathlib
+import gzip
+import json
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.http_transport import HTTPClientTransport
+from services.model_catalog import ModelCatalog
+from services.openai_service import OpenAIService
+
+
+class Handler(BaseHTTPRequestHandler):
+    """/stream 返回 chunked SSE；/gzip 返回 gzip 压缩的 JSON；其他路径回显请求路径"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for text in ("Hel", "lo"):
+                event = f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n".encode()
+                self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            end = f"data: {json.dumps({'choices': [{'delta': {}, 'finish_reason': 'stop'}]})}\n\ndata: [DONE]\n\n"
+            self.wfile.write(f"{len(end):x}\r\n{end}\r\n0\r\n\r\n".encode())
+            return
+        content = f"{self.path} {body['messages'][-1]['content']}"
+        data = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if self.path.endswith("/gzip") and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPClientTransport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.transport = HTTPClientTransport()
+        self.svc = OpenAIService()
+        self.svc.api_key = "sk-test"
+        self.svc.catalog = ModelCatalog()
+        self.svc.transport = self.transport
+        self.addCleanup(self.transport.close)
+
+    def ask(self, path, text="hi"):
+        self.svc.endpoint = self.base + path
+        return self.svc.get_response([{"role": "user", "content": text}])
+
+    def test_gzip_response_is_decoded(self):
+        self.assertEqual(self.ask("/v1/gzip"), "/v1/gzip hi")
+
+    def test_stream_then_request_reuse_one_connection(self):
+        self.svc.endpoint = self.base + "/v1/stream"
+        self.assertEqual(list(self.svc.stream_response([{"role": "user", "content": "hi"}])), ["Hel", "lo"])
+        self.assertEqual(self.ask("/v1/chat"), "/v1/chat hi")
+        self.assertEqual(self.transport.stats, {"connections_opened": 1, "connections_reused": 1})
+
+    def test_stale_pooled_connection_is_retried(self):
+        self.assertEqual(self.ask("/v1/chat", "a"), "/v1/chat a")
+        # 模拟服务器关闭了空闲连接
+        for idle in self.transport._pool.values():
+            for conn, _since in idle:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(self.ask("/v1/chat", "b"), "/v1/chat b")
+        self.assertEqual(self.transport.stats["connections_opened"], 2)
+
+    def test_http_proxy_from_environment(self):
+        env = {"http_proxy": self.base, "HTTP_PROXY": self.base, "no_proxy": "", "NO_PROXY": ""}
+        with mock.patch.dict(os.environ, env):
+            self.svc.endpoint = "http://api.example.invalid/v1/chat"
+            answer = self.svc.get_response([{"role": "user", "content": "hi"}])
+        # 经由代理时请求行使用绝对 URI
+        self.assertEqual(answer, "http://api.example.invalid/v1/chat hi")
+
+
+if __name__ == "__main__":
+    unittest.main()
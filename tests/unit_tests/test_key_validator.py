@@ -0,0 +1,147 @@
+import unittest
+import sys
+import pathlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.cancellation import CancelledError, CancelToken
+from services.openai_service import OpenAIService
+from services.model_catalog import ModelCatalog
+from services.key_validator import KeyValidator
+from services.key_probe import _probe
+from services.transport import load_requests
+
+
+class StalledHandler(BaseHTTPRequestHandler):
+    """迟迟不发送响应头"""
+    protocol_version = "HTTP/1.1"
+    release = threading.Event()
+
+    def do_GET(self):
+        StalledHandler.release.wait(3)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestKeyValidator(unittest.TestCase):
+    def setUp(self):
+        KeyValidator.clear_cache()
+        self.svc = OpenAIService()
+        self.svc.api_key = "sk-test"
+        self.svc.model = "gpt-4o-mini"
+        self.svc.catalog = ModelCatalog()
+        self.svc.session = mock.Mock()
+
+    def test_fresh_catalog_needs_no_request(self):
+        self.svc.catalog.store(self.svc.models_url, "sk-test", [{"id": "gpt-4o-mini"}])
+        ok, msg = self.svc.validate_api_key()
+        self.assertTrue(ok)
+        self.assertIn("catalog", msg)
+        self.svc.session.get.assert_not_called()
+        self.svc.session.post.assert_not_called()
+
+    def test_metadata_tier_never_sends_completion(self):
+        self.svc.session.get.return_value = mock.Mock(status_code=503, text="unavailable")
+        ok, msg = self.svc.validate_api_key()
+        self.assertFalse(ok)
+        self.assertTrue(self.svc.session.get.call_args.args[0].endswith("/models/gpt-4o-mini"))
+        self.svc.session.post.assert_not_called()
+
+    def test_completion_only_when_explicitly_allowed(self):
+        self.svc.session.get.return_value = mock.Mock(status_code=503, text="unavailable")
+        self.svc.session.post.return_value = mock.Mock(status_code=200)
+        ok, msg = self.svc.validate_api_key(allow_completion=True)
+        self.assertTrue(ok)
+        self.svc.session.post.assert_called_once()
+        validator_tiers = [line for line in msg.splitlines() if line.strip().startswith("·")]
+        self.assertEqual(len(validator_tiers), 3)
+
+    def test_metadata_404_falls_back_to_model_list(self):
+        listing = mock.Mock(status_code=200, headers={}, json=lambda: {"data": [{"id": "gpt-4o"}]})
+        self.svc.session.get.side_effect = [mock.Mock(status_code=404, text="not found"), listing]
+        ok, msg = self.svc.validate_api_key()
+        self.assertTrue(ok)
+        self.assertIn("gpt-4o-mini was not found", msg)
+        self.assertTrue(self.svc.session.get.call_args.args[0].endswith("/models"))
+        self.svc.session.post.assert_not_called()
+
+    def test_metadata_404_is_valid_when_gateway_has_no_model_list(self):
+        self.svc.session.get.return_value = mock.Mock(status_code=404, text="not found")
+        ok, msg = self.svc.validate_api_key()
+        self.assertTrue(ok)
+        self.assertIn("API key accepted", msg)
+
+    def test_rate_limited_completion_is_not_a_verdict(self):
+        self.svc.session.get.return_value = mock.Mock(status_code=503, text="unavailable")
+        self.svc.session.post.return_value = mock.Mock(status_code=429, text="slow down")
+        ok, msg = self.svc.validate_api_key(allow_completion=True)
+        self.assertFalse(ok)
+        ok, msg = self.svc.validate_api_key(allow_completion=True)
+        self.assertNotIn("cached", msg)
+        self.assertEqual(self.svc.session.post.call_count, 2)
+
+    def test_unauthorized_is_definitive_and_cached(self):
+        self.svc.session.get.return_value = mock.Mock(status_code=401, text="bad key")
+        ok, _ = self.svc.validate_api_key(allow_completion=True)
+        self.assertFalse(ok)
+        self.svc.session.post.assert_not_called()
+        ok, msg = self.svc.validate_api_key()
+        self.assertFalse(ok)
+        self.assertIn("cached", msg)
+        self.assertEqual(self.svc.session.get.call_count, 1)
+
+
+
+@unittest.skipIf(load_requests() is None, "requests not installed")
+class TestProbeCancellation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StalledHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/v1/models"
+
+    @classmethod
+    def tearDownClass(cls):
+        StalledHandler.release.set()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def assert_cancel_is_prompt(self, probe):
+        token = CancelToken()
+        threading.Timer(0.2, token.cancel).start()
+        started = time.monotonic()
+        with self.assertRaises(CancelledError):
+            probe(token)
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_cancel_aborts_validation_and_caches_nothing(self):
+        KeyValidator.clear_cache()
+        svc = OpenAIService()
+        self.addCleanup(svc.close)
+        svc.api_key, svc.model, svc.catalog = "sk-test", "gpt-4o-mini", ModelCatalog()
+        svc.models_url = self.url
+        self.assert_cancel_is_prompt(lambda token: svc.validate_api_key(cancel_token=token))
+        self.assertEqual(KeyValidator._cache, {})
+        self.assert_cancel_is_prompt(lambda token: svc.list_models(force_refresh=True, cancel_token=token))
+
+    def test_cancel_aborts_provider_probe(self):
+        self.assert_cancel_is_prompt(lambda token: _probe(self.url, {}, cancel_token=token))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+import unittest
+import sys
+import pathlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.chat_client import StreamEvent
+from services.model_cascade import (TIER_FAST, TIER_STRONG, cascade_stats, cascade_stream, choose_tier,
+                                    estimate_tokens, low_confidence_reason)
+from services.model_catalog import ModelCatalog
+from services.openai_service import OpenAIService
+
+SETTINGS = {
+    "enabled": True,
+    "fast_model": "small",
+    "strong_model": "large",
+    "max_fast_prompt_tokens": 50,
+    "max_fast_context_tokens": 400,
+    "escalate_on_low_confidence": True,
+}
+
+
+def ask(question, history=()):
+    return list(history) + [{"role": "system", "content": "Card: cat"}, {"role": "user", "content": question}]
+
+
+class FakeService:
+    """按模型返回预设回答，并记录每次请求使用的模型"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.models = []
+
+    def stream_events(self, conversation_history, cancel_token=None, model=None):
+        self.models.append(model)
+        for event in self.answers[model]:
+            yield event
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """以 SSE 回显请求中的模型名；模型名以 -truncated 结尾时以 finish_reason=length 结束"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        finish = "length" if body["model"].endswith("-truncated") else None
+        chunk = {'choices': [{'delta': {'content': body['model']}, 'finish_reason': finish}]}
+        data = f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestChooseTier(unittest.TestCase):
+    def test_short_simple_question_goes_to_fast_model(self):
+        decision = choose_tier(ask("What does this word mean?"), SETTINGS)
+        self.assertEqual((decision.tier, decision.model, decision.reason), (TIER_FAST, "small", "default"))
+
+    def test_escalation_reasons(self):
+        cases = [
+            (ask("hi"), {"force_strong": True}, "requested"),
+            (ask("why " * 60), {}, "long_question"),
+            (ask("Compare these two mechanisms"), {}, "complex"),
+            (ask("请详细解释这个公式"), {}, "complex"),
+            (ask("Who? When? Where?"), {}, "complex"),
+            (ask("ok", [{"role": "assistant", "content": "x" * 2000}]), {}, "long_context"),
+        ]
+        for conversation, kwargs, reason in cases:
+            decision = choose_tier(conversation, SETTINGS, **kwargs)
+            self.assertEqual((decision.tier, decision.model, decision.reason), (TIER_STRONG, "large", reason))
+
+    def test_estimate_tokens_counts_cjk_per_character(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens("猫是动物"), 4)
+
+    def test_low_confidence_reason(self):
+        self.assertEqual(low_confidence_reason("  "), "empty_answer")
+        self.assertEqual(low_confidence_reason("A cat", "max_tokens"), "truncated")
+        self.assertEqual(low_confidence_reason("I'm not sure, maybe a cat."), "uncertain")
+        self.assertIsNone(low_confidence_reason("A cat.", "stop"))
+
+
+class TestCascadeStream(unittest.TestCase):
+    def setUp(self):
+        cascade_stats.reset()
+        self.addCleanup(cascade_stats.reset)
+
+    def run_cascade(self, service, conversation, settings=SETTINGS):
+        decision = choose_tier(conversation, settings)
+        return list(cascade_stream(service.stream_events, conversation, decision, settings))
+
+    def test_confident_fast_answer_is_kept(self):
+        service = FakeService({"small": [StreamEvent.delta("A cat."), StreamEvent.finish("stop")]})
+        items = self.run_cascade(service, ask("What is this?"))
+        self.assertEqual(service.models, ["small"])
+        self.assertEqual([kind for kind, _payload in items], ["tier", "event", "event"])
+        decision = items[0][1]
+        self.assertIsNotNone(decision.ttft_ms)
+        self.assertIsNotNone(decision.total_ms)
+        snapshot = cascade_stats.snapshot()
+        self.assertEqual(snapshot["tiers"][TIER_FAST]["count"], 1)
+        self.assertEqual(snapshot["escalations"], {})
+
+    def test_unsure_fast_answer_escalates(self):
+        service = FakeService({
+            "small": [StreamEvent.delta("I don't know.")],
+            "large": [StreamEvent.delta("It is a cat.")],
+        })
+        items = self.run_cascade(service, ask("What is this?"))
+        self.assertEqual(service.models, ["small", "large"])
+        tiers = [payload for kind, payload in items if kind == "tier"]
+        self.assertEqual([(t.tier, t.reason) for t in tiers], [(TIER_FAST, "default"), (TIER_STRONG, "uncertain")])
+        snapshot = cascade_stats.snapshot()
+        self.assertEqual(snapshot["tiers"][TIER_STRONG]["count"], 1)
+        self.assertEqual(snapshot["escalations"], {"uncertain": 1})
+
+    def test_escalation_can_be_disabled(self):
+        service = FakeService({"small": [StreamEvent.delta("A cat"), StreamEvent.finish("max_tokens")]})
+        self.run_cascade(service, ask("What is this?"), dict(SETTINGS, escalate_on_low_confidence=False))
+        self.assertEqual(service.models, ["small"])
+
+    def test_without_decision_service_model_is_used(self):
+        service = FakeService({None: [StreamEvent.delta("A cat.")]})
+        items = list(cascade_stream(service.stream_events, ask("hi"), None))
+        self.assertEqual(items, [("event", StreamEvent.delta("A cat."))])
+        self.assertEqual(cascade_stats.snapshot()["tiers"], {})
+
+
+class TestCascadeConfig(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        self.addCleanup(Config.load_config)
+
+    def test_empty_models_fall_back_to_provider_model(self):
+        Config.set("openai_model", "gpt-4o")
+        settings = Config.get_cascade_config()
+        self.assertFalse(settings["enabled"])
+        self.assertEqual((settings["fast_model"], settings["strong_model"]), ("gpt-4o", "gpt-4o"))
+
+    def test_deck_rules_apply_to_subdecks(self):
+        Config.set("cascade_fast_model", "gpt-4o-mini")
+        Config.set("cascade_strong_model", "gpt-4o")
+        Config.set("cascade_deck_rules", {
+            "Medicine": {"enabled": True, "max_fast_prompt_tokens": 20},
+            "Medicine::Pharmacology": {"fast_model": "o4-mini"},
+            "Med": {"enabled": False},
+        })
+        settings = Config.get_cascade_config("Medicine::Pharmacology::Antibiotics")
+        self.assertEqual(settings["fast_model"], "o4-mini")
+        self.assertFalse(settings["enabled"])
+        settings = Config.get_cascade_config("Medicine")
+        self.assertTrue(settings["enabled"])
+        self.assertEqual(settings["max_fast_prompt_tokens"], 20)
+        self.assertFalse(Config.get_cascade_config("Medical")["enabled"])
+
+
+class TestModelOverride(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Config.load_config()
+        self.addCleanup(Config.load_config)
+        self.svc = OpenAIService()
+        self.svc.api_key = "sk-test"
+        self.svc.model = "gpt-4o"
+        self.svc.catalog = ModelCatalog()
+        self.svc.endpoint = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+        self.addCleanup(self.svc.close)
+
+    def test_stream_events_uses_requested_model(self):
+        conversation = [{"role": "user", "content": "hi"}]
+        self.assertEqual(list(self.svc.stream_events(conversation, model="gpt-4o-mini")),
+                         [StreamEvent.delta("gpt-4o-mini"), StreamEvent.finish("stop")])
+        self.assertEqual(list(self.svc.stream_response(conversation)), ["gpt-4o"])
+
+    def test_finish_reason_reaches_the_cascade(self):
+        conversation = ask("What is this?")
+        self.assertEqual(list(self.svc.stream_events(conversation))[-1], StreamEvent.finish("stop"))
+        settings = dict(SETTINGS, fast_model="small-truncated", strong_model="large")
+        cascade_stats.reset()
+        self.addCleanup(cascade_stats.reset)
+        items = list(cascade_stream(self.svc.stream_events, conversation, choose_tier(conversation, settings),
+                                    settings))
+        tiers = [payload for kind, payload in items if kind == "tier"]
+        self.assertEqual([(t.model, t.reason) for t in tiers], [("small-truncated", "default"), ("large", "truncated")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,14 +8,16 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from services.openai_service import OpenAIService
+from services.model_catalog import ModelCatalog
 
 
 class TestOpenAIModels(unittest.TestCase):
     def setUp(self):
         self.svc = OpenAIService()
         self.svc.api_key = "sk-test"
+        self.svc.catalog = ModelCatalog()
 
-    @mock.patch("services.openai_service.requests.get")
+    @mock.patch("services.openai_service.requests.Session.get")
     def test_list_models_success(self, mget):
         mget.return_value = mock.Mock(status_code=200, json=lambda: {
             "data": [
@@ -30,7 +32,7 @@ class TestOpenAIModels(unittest.TestCase):
         self.assertIn("gpt-4o-mini", models)
         self.assertNotIn("text-embedding-3-small", models)
 
-    @mock.patch("services.openai_service.requests.get")
+    @mock.patch("services.openai_service.requests.Session.get")
     def test_list_models_http_error(self, mget):
         mget.return_value = mock.Mock(status_code=401, text="Unauthorized")
         ok, models, msg = self.svc.list_models()
@@ -38,6 +40,69 @@ class TestOpenAIModels(unittest.TestCase):
         self.assertEqual(models, [])
         self.assertIn("HTTP 401", msg)
 
+    @mock.patch("services.openai_service.requests.Session.get")
+    def test_list_models_uses_fresh_catalog(self, mget):
+        mget.return_value = mock.Mock(status_code=200, headers={"ETag": '"v1"'}, json=lambda: {
+            "data": [{"id": "gpt-4o-mini"}]
+        })
+        self.svc.list_models()
+        ok, models, msg = self.svc.list_models()
+        self.assertTrue(ok)
+        self.assertEqual(models, ["gpt-4o-mini"])
+        self.assertEqual(mget.call_count, 1)
+
+    @mock.patch("services.openai_service.requests.Session.get")
+    def test_stale_catalog_sends_etag_and_accepts_304(self, mget):
+        self.svc.catalog = ModelCatalog(ttl_seconds=0)
+        mget.return_value = mock.Mock(status_code=200, headers={"ETag": '"v1"'}, json=lambda: {
+            "data": [{"id": "gpt-4o-mini"}]
+        })
+        self.svc.list_models()
+        mget.return_value = mock.Mock(status_code=304, headers={})
+        ok, models, msg = self.svc.list_models()
+        self.assertTrue(ok)
+        self.assertEqual(models, ["gpt-4o-mini"])
+        self.assertEqual(mget.call_args.kwargs["headers"]["If-None-Match"], '"v1"')
+
+    @mock.patch("services.openai_service.requests.Session.get")
+    def test_validate_without_model_skips_request_when_catalog_fresh(self, mget):
+        self.svc.model = ""
+        self.svc.catalog.store(self.svc.models_url, "sk-test", [{"id": "gpt-4o"}])
+        ok, msg = self.svc.validate_api_key()
+        self.assertTrue(ok)
+        mget.assert_not_called()
+
+
+class TestModelCatalog(unittest.TestCase):
+    def test_metadata_and_latency_history(self):
+        catalog = ModelCatalog()
+        catalog.store("u", "k", [
+            {"id": "gpt-4o-mini"},
+            {"id": "local-llama", "max_model_len": 8192},
+            {"id": "text-embedding-3-small"},
+        ])
+        self.assertEqual(catalog.get_model_info("u", "k", "gpt-4o-mini")["context_window"], 128000)
+        self.assertEqual(catalog.get_model_info("u", "k", "local-llama")["context_window"], 8192)
+        self.assertFalse(catalog.get_model_info("u", "k", "text-embedding-3-small")["supports_streaming"])
+        for ms in (300, 100, 200):
+            catalog.record_latency("u", "k", "gpt-4o-mini", ms, "ttft")
+        info = catalog.get_model_info("u", "k", "gpt-4o-mini")
+        self.assertEqual(info["latency_ms"]["ttft"], [300, 100, 200])
+        self.assertEqual(info["latency_p50_ms"]["ttft"], 200)
+
+    def test_entries_are_keyed_by_key_fingerprint_and_persisted(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "catalog.json")
+            catalog = ModelCatalog(path)
+            catalog.store("u", "key-a", [{"id": "gpt-4o"}])
+            self.assertIsNone(catalog.get_model_ids("u", "key-b"))
+            with open(path, encoding="utf-8") as f:
+                self.assertNotIn("key-a", f.read())
+            reloaded = ModelCatalog(path)
+            self.assertEqual(reloaded.get_model_ids("u", "key-a"), ["gpt-4o"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,209 @@
+import unittest
+import sys
+import pathlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.ai_service_adapter import AIServiceAdapter
+from services.anthropic_service import AnthropicService, AnthropicStreamParser
+from services.chat_client import StreamEvent, split_system
+from services.endpoint_router import endpoint_router, provider_router
+from services.gemini_service import GeminiService, GeminiStreamParser
+from services.transport import TransportError
+
+ANTHROPIC_EVENTS = [
+    ("message_start", {"type": "message_start", "message": {"usage": {"input_tokens": 12, "output_tokens": 1}}}),
+    ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+    ("ping", {"type": "ping"}),
+    ("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Hel"}}),
+    ("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "lo"}}),
+    ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+    ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 5}}),
+    ("message_stop", {"type": "message_stop"}),
+]
+
+GEMINI_CHUNKS = [
+    {"candidates": [{"content": {"role": "model", "parts": [{"text": "thinking", "thought": True}, {"text": "Hel"}]}}]},
+    {"candidates": [{"content": {"role": "model", "parts": [{"text": "lo"}]}, "finishReason": "STOP"}],
+     "usageMetadata": {"promptTokenCount": 7, "candidatesTokenCount": 2}},
+]
+
+
+class Handler(BaseHTTPRequestHandler):
+    """/anthropic 以 Messages 流回应，/gemini 以 alt=sse 流回应，/down 返回 529；记录最后一个请求"""
+    protocol_version = "HTTP/1.1"
+    last = {}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        Handler.last = {"path": self.path, "headers": dict(self.headers), "body": body}
+        if self.path.startswith("/down"):
+            data = b'{"type":"error","error":{"type":"overloaded_error","message":"Overloaded"}}'
+            self.send_response(529)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if self.path.startswith("/anthropic"):
+            data = b"".join(f"event: {name}\ndata: {json.dumps(obj)}\n\n".encode() for name, obj in ANTHROPIC_EVENTS)
+        else:
+            data = b"".join(f"data: {json.dumps(obj)}\r\n\r\n".encode() for obj in GEMINI_CHUNKS)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+CONVERSATION = [
+    {"role": "system", "content": "You are a tutor."},
+    {"role": "system", "content": "Card: cat"},
+    {"role": "user", "content": "hi"},
+    {"role": "user", "content": "what is this card?"},
+]
+
+
+class TestStreamParsers(unittest.TestCase):
+    def test_anthropic_events(self):
+        parser = AnthropicStreamParser()
+        events = [event for _name, obj in ANTHROPIC_EVENTS for event in parser.feed(json.dumps(obj))]
+        self.assertEqual(events, [
+            StreamEvent.usage_of(12, 1),
+            StreamEvent.delta("Hel"),
+            StreamEvent.delta("lo"),
+            StreamEvent.usage_of(12, 5),
+            StreamEvent.finish("stop"),
+        ])
+
+    def test_anthropic_error_event_carries_status(self):
+        with self.assertRaises(TransportError) as ctx:
+            AnthropicStreamParser().feed('{"type":"error","error":{"type":"overloaded_error","message":"busy"}}')
+        self.assertEqual(ctx.exception.status, 529)
+
+    def test_gemini_chunks(self):
+        parser = GeminiStreamParser()
+        events = [event for obj in GEMINI_CHUNKS for event in parser.feed(json.dumps(obj))]
+        self.assertEqual(events, [
+            StreamEvent.delta("Hel"),
+            StreamEvent.delta("lo"),
+            StreamEvent.usage_of(7, 2),
+            StreamEvent.finish("stop"),
+        ])
+        with self.assertRaises(TransportError) as ctx:
+            parser.feed('{"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "quota"}}')
+        self.assertEqual(ctx.exception.status, 429)
+
+    def test_split_system_merges_roles(self):
+        system, messages = split_system(CONVERSATION)
+        self.assertEqual(system, "You are a tutor.\n\nCard: cat")
+        self.assertEqual(messages, [{"role": "user", "content": "hi\n\nwhat is this card?"}])
+
+
+class TestProviderClients(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Config.load_config()
+        endpoint_router.reset()
+        provider_router.reset()
+        self.addCleanup(Config.load_config)
+        self.addCleanup(endpoint_router.reset)
+        self.addCleanup(provider_router.reset)
+
+    def anthropic(self, path="/anthropic/v1/messages"):
+        client = AnthropicService("sk-ant-test", "claude-test", max_tokens=64)
+        client.messages_url = self.base + path
+        self.addCleanup(client.close)
+        return client
+
+    def gemini(self):
+        client = GeminiService("g-test", "gemini-test")
+        client.base_url = self.base + "/gemini/v1beta"
+        self.addCleanup(client.close)
+        return client
+
+    def test_anthropic_stream_events(self):
+        events = list(self.anthropic().stream_events(CONVERSATION))
+        self.assertEqual([e.text for e in events if e.kind == "delta"], ["Hel", "lo"])
+        self.assertEqual(events[-1], StreamEvent.finish("stop"))
+        request = Handler.last
+        self.assertEqual(request["headers"]["x-api-key"], "sk-ant-test")
+        self.assertEqual(request["body"]["system"], "You are a tutor.\n\nCard: cat")
+        self.assertEqual(request["body"]["max_tokens"], 64)
+        self.assertTrue(request["body"]["stream"])
+        self.assertEqual(endpoint_router.snapshot()[0]["name"], "anthropic")
+
+    def test_gemini_get_response(self):
+        self.assertEqual(self.gemini().get_response(CONVERSATION), "Hello")
+        request = Handler.last
+        self.assertEqual(request["path"], "/gemini/v1beta/models/gemini-test:streamGenerateContent?alt=sse")
+        self.assertEqual(request["headers"]["x-goog-api-key"], "g-test")
+        self.assertEqual(request["body"]["systemInstruction"], {"parts": [{"text": "You are a tutor.\n\nCard: cat"}]})
+        self.assertEqual(request["body"]["contents"][0]["role"], "user")
+
+    def test_http_error_is_reported(self):
+        answer = self.anthropic("/down/v1/messages").get_response(CONVERSATION)
+        self.assertIn("HTTP 529", answer)
+
+    def test_adapter_routes_to_provider_and_fails_over(self):
+        Config.set("ai_provider", "anthropic")
+        Config.set("anthropic_api_key", "sk-ant-test")
+        Config.set("google_api_key", "g-test")
+        Config.set("fallback_providers", ["google"])
+        adapter = AIServiceAdapter()
+        self.addCleanup(adapter.close)
+        adapter._clients = {"anthropic": self.anthropic("/down/v1/messages"), "google": self.gemini()}
+        self.assertTrue(adapter.uses_native_providers())
+        events = list(adapter.stream_events(CONVERSATION))
+        self.assertEqual([e.text for e in events if e.kind == "delta"], ["Hel", "lo"])
+        self.assertIn(StreamEvent.usage_of(7, 2), events)
+        # 实际回答的是回退的提供商
+        self.assertEqual(events[0], StreamEvent.route("google", "gemini-2.0-flash"))
+        self.assertEqual(adapter.default_route(), ("anthropic", "claude-3-5-haiku-latest"))
+        self.assertEqual(adapter.get_current_provider(), "anthropic")
+        self.assertEqual(adapter.get_metrics()["providers"]["anthropic"]["errors"], 1)
+        stats = {s["name"]: s for s in provider_router.snapshot()}
+        self.assertEqual((stats["anthropic"]["errors"], stats["google"]["requests"]), (1, 1))
+
+    def test_provider_routing_ignores_endpoint_stats(self):
+        Config.set("openai_api_key", "sk-test")
+        Config.set("google_api_key", "g-test")
+        Config.set("provider_routing_enabled", True)
+        Config.set("endpoint_fallbacks", ["openai"])
+        for _ in range(5):
+            endpoint_router.record("openai", None, False)
+            provider_router.record("google", None, False)
+        adapter = AIServiceAdapter()
+        self.addCleanup(adapter.close)
+        # 主端点被剔除只影响端点路由；提供商级别被剔除的是 google
+        self.assertEqual(adapter._provider_plan(), ["openai", "google"])
+
+    def test_adapter_defaults_to_openai_only(self):
+        Config.set("openai_api_key", "sk-test")
+        adapter = AIServiceAdapter()
+        self.addCleanup(adapter.close)
+        self.assertFalse(adapter.uses_native_providers())
+        self.assertEqual(adapter._provider_plan(), ["openai"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+import sys
+import pathlib
+import json
+import threading
+from unittest.mock import patch
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.cancellation import CancelToken
+from services.conversation_store import ConversationStore
+from services.model_catalog import ModelCatalog
+from services.openai_service import OpenAIService
+from services.transport import RequestsTransport, Transport, create_transport
+import ui.chat_dialog as chat_dialog_module
+from ui.chat_dialog import ChatDialog
+
+
+def chat_event(text, finish=None):
+    return json.dumps({"choices": [{"delta": {"content": text}, "finish_reason": finish}]})
+
+
+class FakeCallbackTransport(Transport):
+    """同步回调的传输：start_stream() 立即交付预设事件"""
+    name = "fake"
+    supports_callbacks = True
+
+    def __init__(self, events, error=None):
+        self.events = events
+        self.error = error
+        self.requests = []
+
+    def start_stream(self, url, headers, body, on_event, on_done, timeout=60, cancel_token=None):
+        self.requests.append((url, headers, json.loads(body)))
+        for event in self.events:
+            on_event(event)
+        on_done(500 if self.error else 200, self.error)
+        return object()
+
+
+class TestTransportSelection(unittest.TestCase):
+    def test_qt_transport_falls_back_to_requests_without_qt(self):
+        session = object()
+        transport = create_transport("qt", lambda: session)
+        self.assertIsInstance(transport, RequestsTransport)
+        self.assertIs(transport.session, session)
+        self.assertIsInstance(create_transport("no-such-transport", lambda: session), RequestsTransport)
+
+
+class HangingHandle:
+    def __init__(self, on_done):
+        self.on_done = on_done
+        self.aborted = threading.Event()
+
+    def abort(self):
+        self.aborted.set()
+        self.on_done(0, "Operation canceled")
+
+
+class HangingCallbackTransport(Transport):
+    """一直不出字的回调传输；abort() 时像 Qt 一样报告取消错误"""
+    name = "fake"
+    supports_callbacks = True
+
+    def start_stream(self, url, headers, body, on_event, on_done, timeout=60, cancel_token=None):
+        self.handle = HangingHandle(on_done)
+        return self.handle
+
+
+class TestCallbackStreaming(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        self.addCleanup(Config.load_config)
+        self.svc = OpenAIService()
+        self.svc.api_key = "sk-test"
+        self.svc.catalog = ModelCatalog()
+
+    def test_start_stream_response_delivers_deltas_until_finish(self):
+        self.svc.transport = FakeCallbackTransport(
+            [chat_event("Hel"), chat_event("lo", "stop"), chat_event("ignored"), "[DONE]"])
+        deltas, done = [], []
+        handle = self.svc.start_stream_response([{"role": "user", "content": "hi"}], deltas.append, done.append)
+        self.assertIsNotNone(handle)
+        self.assertEqual(deltas, ["Hel", "lo"])
+        self.assertEqual(done, [None])
+        self.assertEqual(self.svc.get_metrics()["requests"], 1)
+
+    def test_start_stream_response_requires_callback_transport(self):
+        self.assertIsNone(self.svc.start_stream_response([], print, print))
+
+    def test_failover_and_hedging_need_the_blocking_path(self):
+        self.svc.transport = FakeCallbackTransport([chat_event("hi", "stop")])
+        Config.set("endpoint_profiles", [{"name": "backup", "url": "https://backup.example/v1/chat/completions",
+                                          "api_key": "sk-backup"}])
+        self.assertIsNone(self.svc.start_stream_response([], print, print))
+        Config.set("endpoint_profiles", [])
+        Config.set("hedge_enabled", True)
+        self.assertIsNone(self.svc.start_stream_response([], print, print))
+        self.assertEqual(self.svc.transport.requests, [])
+
+    def test_only_endpoint_profile_is_used_with_its_key(self):
+        self.svc.api_key = ""
+        Config.set("endpoint_profiles", [{"name": "backup", "url": "https://backup.example/v1/chat/completions",
+                                          "api_key": "sk-backup", "models": {"gpt-4o": "gpt-4o-backup"}}])
+        self.svc.model = "gpt-4o"
+        transport = FakeCallbackTransport([chat_event("hi", "stop")])
+        self.svc._endpoint_transports["backup"] = transport
+        done = []
+        self.assertIsNotNone(self.svc.start_stream_response([], print, done.append))
+        url, headers, body = transport.requests[0]
+        self.assertEqual((url, headers["Authorization"], body["model"]),
+                         ("https://backup.example/v1/chat/completions", "Bearer sk-backup", "gpt-4o-backup"))
+        self.assertEqual(done, [None])
+
+    def test_first_token_deadline_aborts_the_request(self):
+        Config.set("first_token_timeout_seconds", 0.1)
+        self.svc.transport = HangingCallbackTransport()
+        done = []
+        self.svc.start_stream_response([{"role": "user", "content": "hi"}], print, done.append)
+        self.assertTrue(self.svc.transport.handle.aborted.wait(2))
+        self.assertEqual(len(done), 1)
+        self.assertIn("No response within", done[0])
+
+
+class FakeAdapter:
+    def __init__(self, service):
+        self._service = service
+
+
+class TestChatDialogNativeStream(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        self.store = ConversationStore()
+        patcher = patch.object(chat_dialog_module, "get_conversation_store", lambda: self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.store.close()
+
+    def start(self, transport):
+        svc = OpenAIService()
+        svc.api_key = "sk-test"
+        svc.catalog = ModelCatalog()
+        svc.transport = transport
+        dialog = ChatDialog({"front": "chat", "back": "cat", "card_id": 100, "note_id": 10})
+        dialog.ai_service = FakeAdapter(svc)
+        dialog.conversation_history.append({"role": "user", "content": "hi"})
+        dialog._stream_active = True
+        dialog._cancel_token = token = CancelToken()
+        self.assertTrue(dialog._start_native_stream(list(dialog.conversation_history), token))
+        return dialog
+
+    def test_chunks_arrive_without_worker_or_timer(self):
+        dialog = self.start(FakeCallbackTransport([chat_event("Hel"), chat_event("lo", "stop")]))
+        self.assertFalse(dialog._stream_active)
+        self.assertIsNone(dialog._stream_timer)
+        self.assertEqual(dialog.conversation_history[-1], {"role": "assistant", "content": "Hello"})
+
+    def test_error_is_reported_and_not_recorded_as_answer(self):
+        dialog = self.start(FakeCallbackTransport([], error="HTTP 500: boom"))
+        self.assertFalse(dialog._stream_active)
+        self.assertEqual(dialog.conversation_history[-1]["role"], "user")
+
+    def test_falls_back_when_transport_has_no_callbacks(self):
+        svc = OpenAIService()
+        dialog = ChatDialog({"front": "chat", "back": "cat", "card_id": 100, "note_id": 10})
+        dialog.ai_service = FakeAdapter(svc)
+        self.assertFalse(dialog._start_native_stream([], CancelToken()))
+
+
+if __name__ == "__main__":
+    unittest.main()
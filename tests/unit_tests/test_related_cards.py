@@ -0,0 +1,122 @@
+import unittest
+import sys
+import pathlib
+import sqlite3
+import tempfile
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.related_cards import BM25Index, build_index, describe_notes, index_terms, refresh_index
+
+
+class FakeDB:
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("create table notes (id integer primary key, mod integer, flds text)")
+
+    def all(self, sql, *args):
+        return self.conn.execute(sql, args).fetchall()
+
+    def list(self, sql, *args):
+        return [row[0] for row in self.conn.execute(sql, args)]
+
+    def scalar(self, sql, *args):
+        return self.conn.execute(sql, args).fetchone()[0]
+
+
+class FakeNote:
+    def __init__(self, fields):
+        self.fields = fields
+
+
+class FakeCollection:
+    def __init__(self, notes):
+        self.db = FakeDB()
+        for nid, flds in notes.items():
+            self.put(nid, flds, mod=100)
+
+    def put(self, nid, flds, mod):
+        self.db.conn.execute("insert or replace into notes values (?, ?, ?)", (nid, mod, flds))
+
+    def delete(self, nid):
+        self.db.conn.execute("delete from notes where id = ?", (nid,))
+
+    def get_note(self, nid):
+        row = self.db.conn.execute("select flds from notes where id = ?", (nid,)).fetchone()
+        if row is None:
+            raise KeyError(nid)
+        return FakeNote(row[0].split("\x1f"))
+
+
+NOTES = {
+    1: "Mitochondria\x1fThe <b>powerhouse</b> of the cell, produces ATP",
+    2: "Krebs cycle\x1fTakes place in the mitochondria matrix and produces NADH",
+    3: "Photosynthesis\x1fChloroplasts convert light into glucose",
+    4: "Ribosome\x1fSite of protein synthesis",
+    5: "线粒体\x1f细胞的能量工厂",
+}
+
+
+def ids(results):
+    return [nid for nid, _score in results]
+
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.col = FakeCollection(NOTES)
+        self.index = build_index(self.col, batch_size=2)
+
+    def test_ranks_related_notes_and_excludes_current(self):
+        results = self.index.search(index_terms("mitochondria ATP"), k=3, exclude=[1])
+        self.assertEqual(ids(results), [2])
+        self.assertEqual(ids(self.index.search(index_terms("线粒体是什么"), k=3))[:1], [5])
+        self.assertEqual(self.index.search(index_terms("the of"), k=3), [])
+
+    def test_postings_are_compact_arrays(self):
+        self.assertEqual((self.index.post_docs.typecode, self.index.post_tfs.typecode), ("I", "H"))
+        self.assertEqual(self.index.delta, {})
+        self.assertEqual(self.index.live_count, 5)
+
+    def test_incremental_refresh_updates_and_deletes(self):
+        self.col.put(3, "Photosynthesis\x1fHappens in chloroplasts, not mitochondria", mod=200)
+        self.col.put(6, "Electron transport chain\x1fInner mitochondria membrane", mod=200)
+        self.col.delete(2)
+        self.assertEqual(refresh_index(self.index, self.col), 3)
+        self.assertEqual(self.index.watermark, 200)
+        self.assertEqual(sorted(ids(self.index.search(["mitochondria"], k=5))), [1, 3, 6])
+        # 没有新修改时不重复索引
+        self.assertEqual(refresh_index(self.index, self.col), 0)
+
+    def test_refresh_finds_deletion_when_note_count_is_unchanged(self):
+        # 导入的旧笔记修改时间早于水位，与删除同时发生时笔记数不变
+        self.col.delete(2)
+        self.col.put(7, "Glycolysis\x1fSplits glucose in the cytoplasm", mod=50)
+        self.assertEqual(refresh_index(self.index, self.col), 1)
+        self.assertNotIn(2, self.index.note_ids())
+        self.assertEqual(ids(self.index.search(["mitochondria"], k=5)), [1])
+
+        before = ids(self.index.search(index_terms("mitochondria membrane"), k=5))
+        self.index.compact()
+        self.assertEqual(self.index.tombstones, 0)
+        self.assertEqual(ids(self.index.search(index_terms("mitochondria membrane"), k=5)), before)
+
+    def test_save_and_load_round_trip(self):
+        self.index.add_document(7, 300, index_terms("glucose glycolysis"))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(pathlib.Path(tmp) / "index.bin")
+            self.index.save(path)
+            loaded = BM25Index.load(path)
+        query = index_terms("glucose mitochondria")
+        self.assertEqual(loaded.search(query, k=5), self.index.search(query, k=5))
+        self.assertEqual(loaded.watermark, 300)
+
+    def test_describe_notes_skips_deleted(self):
+        self.col.delete(4)
+        self.assertEqual(describe_notes(self.col, [1, 4], max_chars=40),
+                         ["Mitochondria — The powerhouse of the ce…"])
+
+
+if __name__ == "__main__":
+    unittest.main()
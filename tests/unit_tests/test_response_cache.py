@@ -0,0 +1,74 @@
+import unittest
+import sys
+import pathlib
+from unittest.mock import patch
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.response_cache import ResponseCache, make_key
+from utils.helpers import text_shingles
+
+CARD = "Current Anki Card:\nFront: mitochondria\nBack: the powerhouse of the cell, produces ATP"
+OTHER_CARD = "Current Anki Card:\nFront: photosynthesis\nBack: chloroplasts turn light into glucose"
+
+
+def conversation(question, card=CARD, previous=None):
+    history = [{"role": "system", "content": card}]
+    if previous:
+        history += [{"role": "user", "content": "earlier"}, {"role": "assistant", "content": previous}]
+    return history + [{"role": "user", "content": question}]
+
+
+class TestShingles(unittest.TestCase):
+    def test_normalises_before_shingling(self):
+        self.assertEqual(text_shingles("Give  an EXAMPLE!"), text_shingles("give an example"))
+        self.assertEqual(text_shingles("ok"), {"ok"})
+        a, b = text_shingles("explain this simpler"), text_shingles("explain this more simply")
+        self.assertGreater(len(a & b) / len(a | b), 0.5)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(threshold=0.8)
+        self.cache.store(make_key(conversation("Can you explain this more simply?"), "gpt"), "Simple answer")
+
+    def test_near_identical_question_on_same_card_hits(self):
+        hit = self.cache.lookup(make_key(conversation("can you explain this more simply"), "gpt"))
+        self.assertIsNotNone(hit)
+        self.assertEqual(hit[0], "Simple answer")
+        self.assertGreaterEqual(hit[1], 0.8)
+
+    def test_different_question_card_or_model_misses(self):
+        self.assertIsNone(self.cache.lookup(make_key(conversation("Give me an example"), "gpt")))
+        self.assertIsNone(self.cache.lookup(make_key(conversation("Can you explain this more simply?", OTHER_CARD), "gpt")))
+        self.assertIsNone(self.cache.lookup(make_key(conversation("Can you explain this more simply?"), "other-model")))
+        self.assertIsNone(self.cache.lookup(make_key(
+            conversation("Can you explain this more simply?", previous="A long answer about ATP synthase"), "gpt")))
+        self.assertIsNone(make_key(conversation("q")[:-1] + [{"role": "assistant", "content": "a"}]))
+
+    def test_answer_is_scoped_to_the_provider_that_answered(self):
+        key = make_key(conversation("What is ATP?"), "openai:gpt-4o-mini")
+        self.cache.store(key.with_model("google:gemini-2.0-flash"), "Gemini answer")
+        self.assertIsNone(self.cache.lookup(key))
+        self.assertEqual(self.cache.lookup(key.with_model("google:gemini-2.0-flash"))[0], "Gemini answer")
+
+    def test_evicts_least_recently_used_and_expired(self):
+        cache = ResponseCache(threshold=0.8, max_entries=2)
+        questions = ["what is ATP used for", "where is the cell nucleus", "how does glycolysis start"]
+        for q in questions:
+            cache.store(make_key(conversation(q)), q.upper())
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.lookup(make_key(conversation(questions[0]))))
+        self.assertEqual(cache.lookup(make_key(conversation(questions[2])))[0], questions[2].upper())
+        self.assertEqual(sum(len(ids) for ids in cache._buckets.values()), 2 * 16)
+
+        cache.configure(threshold=0.8, max_entries=2, ttl_seconds=60)
+        with patch("services.response_cache.time.time", return_value=10 ** 11):
+            self.assertIsNone(cache.lookup(make_key(conversation(questions[2]))))
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
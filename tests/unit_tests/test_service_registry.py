@@ -0,0 +1,54 @@
+import unittest
+import sys
+import pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.service_registry import ServiceRegistry
+
+
+class TestServiceRegistry(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        Config.set("openai_api_key", "sk-test")
+        Config.set("openai_model", "gpt-4o-mini")
+        ServiceRegistry.shutdown()
+
+    def tearDown(self):
+        ServiceRegistry.shutdown()
+        Config.load_config()
+
+    def test_same_profile_shares_instance(self):
+        first = ServiceRegistry.get_adapter()
+        second = ServiceRegistry.get_adapter()
+        self.assertIs(first, second)
+        self.assertIs(first._service.session, second._service.session)
+
+    def test_profile_change_creates_new_instance(self):
+        first = ServiceRegistry.get_adapter()
+        Config.set("openai_model", "gpt-4o")
+        second = ServiceRegistry.get_adapter()
+        self.assertIsNot(first, second)
+        self.assertEqual(ServiceRegistry.get_metrics()["profile_count"], 2)
+
+    def test_non_key_settings_are_applied_to_shared_instance(self):
+        adapter = ServiceRegistry.get_adapter()
+        Config.set("temperature", 0.1)
+        self.assertIs(ServiceRegistry.get_adapter(), adapter)
+        self.assertEqual(adapter._service.temperature, 0.1)
+
+    def test_profile_close_runs_hooks_and_releases_instances(self):
+        calls = []
+        ServiceRegistry.add_profile_close_hook(lambda: calls.append("closed"))
+        ServiceRegistry.get_adapter()
+        ServiceRegistry.on_profile_close()
+        self.assertEqual(calls, ["closed"])
+        self.assertEqual(ServiceRegistry.get_metrics()["profile_count"], 0)
+        ServiceRegistry._close_hooks.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
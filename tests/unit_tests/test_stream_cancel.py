@@ -0,0 +1,211 @@
+import unittest
+import sys
+import pathlib
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest.mock import patch
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import Config
+from services.cancellation import CancelledError, CancelToken, cancel_all_tokens, track_token
+from services.conversation_store import ConversationStore
+from services.http_transport import HTTPClientTransport
+from services.model_catalog import ModelCatalog
+from services.openai_service import OpenAIService
+from services.transport import RequestsTransport
+import ui.chat_dialog as chat_dialog_module
+from ui.chat_dialog import ChatDialog
+
+
+class SlowStreamHandler(BaseHTTPRequestHandler):
+    """先发两个分片，然后一直挂起（模拟仍在生成的长回答）"""
+    protocol_version = "HTTP/1.1"
+    release = threading.Event()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for text in ("Hel", "lo"):
+                event = f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+                self.wfile.flush()
+            SlowStreamHandler.release.wait(10)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowHeadersHandler(BaseHTTPRequestHandler):
+    """迟迟不发送响应头（模拟排队中的上游）"""
+    protocol_version = "HTTP/1.1"
+    release = threading.Event()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        SlowHeadersHandler.release.wait(3)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCancelBeforeHeaders(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHeadersHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/v1/chat/completions"
+
+    @classmethod
+    def tearDownClass(cls):
+        SlowHeadersHandler.release.set()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def assert_cancel_is_prompt(self, transport):
+        self.addCleanup(transport.close)
+        token = CancelToken()
+        threading.Timer(0.2, token.cancel).start()
+        started = time.monotonic()
+        with self.assertRaises(CancelledError):
+            transport.stream(self.url, {"Content-Type": "application/json"}, b"{}", timeout=30, cancel_token=token)
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_http_client_transport(self):
+        self.assert_cancel_is_prompt(HTTPClientTransport())
+
+    def test_requests_transport(self):
+        self.assert_cancel_is_prompt(RequestsTransport())
+
+    def test_already_cancelled_token_sends_nothing(self):
+        token = CancelToken()
+        token.cancel()
+        transport = HTTPClientTransport()
+        self.addCleanup(transport.close)
+        with self.assertRaises(CancelledError):
+            transport.stream(self.url, {}, b"{}", cancel_token=token)
+        self.assertEqual(transport.stats["connections_opened"], 0)
+
+
+class TestStreamCancellation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowStreamHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        SlowStreamHandler.release.set()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_cancel_aborts_blocked_read_and_keeps_received_chunks(self):
+        svc = OpenAIService()
+        svc.api_key = "sk-test"
+        svc.catalog = ModelCatalog()
+        svc.endpoint = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+        token = CancelToken()
+        chunks = []
+        for chunk in svc.stream_response([{"role": "user", "content": "hi"}], cancel_token=token):
+            chunks.append(chunk)
+            if len(chunks) == 2:
+                # 下一次读取会阻塞，由另一个线程取消
+                threading.Timer(0.1, token.cancel).start()
+                started = time.monotonic()
+        self.assertEqual(chunks, ["Hel", "lo"])
+        self.assertLess(time.monotonic() - started, 2)
+        svc.close()
+
+    def test_cancel_all_tokens_cancels_tracked_tokens(self):
+        tokens = [track_token(CancelToken()) for _ in range(2)]
+        tokens[1].cancel()
+        self.assertEqual(cancel_all_tokens(), 1)
+        self.assertTrue(tokens[0].is_cancelled)
+        self.assertEqual(cancel_all_tokens(), 0)
+
+
+class TestChatDialogStop(unittest.TestCase):
+    def setUp(self):
+        Config.load_config()
+        self.store = ConversationStore()
+        patcher = patch.object(chat_dialog_module, "get_conversation_store", lambda: self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_stop_keeps_partial_answer_in_history(self):
+        dialog = ChatDialog({"front": "chat", "back": "cat", "card_id": 100, "note_id": 10})
+        token = CancelToken()
+        dialog._stream_active = True
+        dialog._cancel_token = token
+        dialog._stream_accum = ["Hel"]
+        dialog._stream_queue = queue.Queue()
+        dialog._stream_queue.put(("chunk", "lo"))
+
+        dialog.stop_generation()
+        self.assertTrue(token.is_cancelled)
+        self.assertFalse(dialog._stream_active)
+        self.assertEqual(dialog.conversation_history[-1], {"role": "assistant", "content": "Hello"})
+        self.assertEqual(self.store.load_turns(100)[0][-1]["content"], "Hello")
+        # 没有进行中的请求时再次停止不做任何事
+        dialog.stop_generation()
+        self.assertEqual(len(dialog.conversation_history), 2)
+
+    def test_late_cache_lookup_keeps_the_next_requests_key(self):
+        dialog = ChatDialog({"front": "chat", "back": "cat", "card_id": 101, "note_id": 11})
+        dialog.ai_service = SimpleNamespace(get_response=lambda conversation: "answer")
+        started, release = threading.Event(), threading.Event()
+        looked_up = []
+
+        def slow_lookup(key):
+            looked_up.append(key)
+            if len(looked_up) == 1:
+                started.set()
+                release.wait(5)
+            return None
+
+        settings = {"enabled": True, "threshold": 0.85, "max_entries": 10, "ttl_hours": 1}
+        with patch.object(Config, "get_response_cache_config", return_value=settings), \
+                patch.object(chat_dialog_module.response_cache, "lookup", side_effect=slow_lookup):
+            dialog._start_response([{"role": "user", "content": "what does mitochondria do"}])
+            first = dialog._stream_future
+            self.assertTrue(started.wait(5))
+            dialog.stop_generation()
+            dialog._start_response([{"role": "user", "content": "translate chat into french"}])
+            second_key = dialog._stream_cache_key
+            # 停止的请求的查询此时才返回，不能改动新请求的缓存键
+            release.set()
+            first.result(5)
+            dialog._stream_future.result(5)
+
+        self.assertIsNotNone(second_key)
+        self.assertIs(dialog._stream_cache_key, second_key)
+        self.assertIs(looked_up[1], second_key)
+        self.assertNotEqual(looked_up[0].question, second_key.question)
+
+
+if __name__ == "__main__":
+    unittest.main()
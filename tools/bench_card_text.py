@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+基准测试：卡片 HTML → 提示词文本。
+对比旧的正则去标签实现与 utils.html_text.html_to_text，
+输出每种模板的提取耗时与输出 token 数（近似值：按单词/标点计数）。
+
+用法:
+    python tools/bench_card_text.py [--repeat 200]
+"""
+import argparse
+import re
+import sys
+import time
+import pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.html_text import html_to_text
+
+
+def legacy_extract(html_content):
+    """旧实现（CardService.extract_text_from_html 的原始版本）"""
+    text = re.sub(r'<[^>]+>', '', html_content)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def approx_tokens(text):
+    """近似 token 数：单词、数字、CJK 字符与标点各计一个"""
+    return len(re.findall(r"[A-Za-z]+|\d+|[぀-ヿ㐀-鿿]|[^\w\s]", text))
+
+
+# ---- 样例模板（按 Anki 默认笔记类型与常见社区模板的结构构造） ----
+
+BASIC_CSS = """<style>.card {
+ font-family: arial;
+ font-size: 20px;
+ text-align: center;
+ color: black;
+ background-color: white;
+}
+</style>"""
+
+BASIC_BACK = BASIC_CSS + """<div class="card">What is the capital of France?</div>
+<hr id=answer>
+Paris<br>Population: about 2.1&nbsp;million &amp; the largest city in France."""
+
+CLOZE_BACK = BASIC_CSS + """<script type="text/x-mathjax-config">
+MathJax.Hub.Config({ tex2jax: { inlineMath: [['\\\\(','\\\\)']] } });
+</script>
+<div class="card cloze-card">The derivative of <span class=cloze>\\(x^2\\)</span> is
+<span class=cloze>\\(2x\\)</span>.<br><br>
+<div class="extra">Power rule: \\(\\frac{d}{dx}x^n = n x^{n-1}\\)</div></div>"""
+
+
+def heavy_template_back():
+    """模拟带大量 CSS/JS、隐藏提示与媒体的社区模板（正面嵌入背面）"""
+    css_rules = "\n".join(
+        f".field-{i} {{ margin: {i % 7}px 0; padding: 4px {i % 5}px; color: #{i:06x}; }}"
+        for i in range(400)
+    )
+    js = """<script>
+    var hints = document.querySelectorAll('.hints');
+    for (var i = 0; i < hints.length; i++) {
+        hints[i].addEventListener('click', function (e) { e.target.classList.toggle('open'); });
+    }
+    if (typeof persistence !== 'undefined') { persistence.setItem('seen', Date.now()); }
+    </script>"""
+    front = """<div id="front"><div class="field-1"><b>Which nerve</b> innervates the
+    <i>deltoid</i> muscle?</div><img src="paste-5c2f0a7d9e1b.jpg"></div>"""
+    extra = "".join(
+        f"<div class='hints' style='display:none'>Hidden hint {i}: {'lorem ipsum ' * 20}</div>"
+        for i in range(30)
+    )
+    back = """<hr id=answer><div class="field-2">Axillary nerve (C5–C6)</div>
+    <ul><li>Also supplies teres minor</li><li>At risk in surgical neck fractures</li></ul>
+    <div class="source">First Aid 2024 p.&nbsp;452</div>[sound:deltoid_pronunciation.mp3]
+    <img src="axillary_nerve_diagram.png" alt="Axillary nerve course">"""
+    return f"<style>{css_rules}</style>{js}{front}{extra}{back}{js}"
+
+
+TEMPLATES = {
+    "basic": BASIC_BACK,
+    "cloze+mathjax": CLOZE_BACK,
+    "heavy community template": heavy_template_back(),
+}
+
+
+def bench(func, html, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        out = func(html)
+    elapsed = (time.perf_counter() - started) / repeat
+    return elapsed * 1e6, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'template':<28}{'html bytes':>12}{'impl':>9}{'µs/op':>10}{'tokens':>9}")
+    print("-" * 68)
+    for name, html in TEMPLATES.items():
+        for impl_name, func in (("legacy", legacy_extract), ("parser", lambda h: html_to_text(h, max_chars=4000))):
+            us, out = bench(func, html, args.repeat)
+            print(f"{name:<28}{len(html.encode('utf-8')):>12}{impl_name:>9}{us:>10.1f}{approx_tokens(out):>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,90 @@
+# 后台任务 - 在插件的共享执行器中执行阻塞调用，通过 Qt 信号把结果送回主线程
+
+import logging
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..services.cancellation import CancelToken, track_token
+    from ..services.executor_service import PRIORITY_INTERACTIVE, executor
+except ImportError:
+    from services.cancellation import CancelToken, track_token
+    from services.executor_service import PRIORITY_INTERACTIVE, executor
+
+try:
+    from aqt.qt import QObject, pyqtSignal
+    QT_AVAILABLE = True
+except ImportError:
+    QT_AVAILABLE = False
+
+if QT_AVAILABLE:
+    class _TaskSignals(QObject):
+        """任务信号：在主线程创建，后台线程 emit 时 Qt 自动排队到主线程"""
+        finished = pyqtSignal(object)
+        failed = pyqtSignal(str)
+else:
+    class _Signal:
+        """测试环境下的简易信号（同步调用）"""
+        def __init__(self):
+            self._slots = []
+
+        def connect(self, slot):
+            self._slots.append(slot)
+
+        def emit(self, *args):
+            for slot in list(self._slots):
+                slot(*args)
+
+    class _TaskSignals:
+        def __init__(self):
+            self.finished = _Signal()
+            self.failed = _Signal()
+
+
+class BackgroundTask:
+    """在后台线程执行 fn(cancel_token, *args, **kwargs)
+
+    结果通过 finished(object) 信号返回，异常通过 failed(str) 信号返回。
+    cancel() 之后不再发出任何信号；任务若已在运行，可通过 cancel_token 感知取消。
+    调用方需要持有任务对象直到信号送达。
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._future = None
+        self.cancel_token = track_token(CancelToken())
+        self.signals = _TaskSignals()
+        self.finished = self.signals.finished
+        self.failed = self.signals.failed
+
+    def start(self, priority: int = PRIORITY_INTERACTIVE, group=None):
+        """提交到共享执行器（默认为交互优先级）"""
+        self._future = executor.submit(
+            self._run, priority=priority, group=group,
+            name=getattr(self._fn, "__name__", "background-task"), cancel_token=self.cancel_token,
+        )
+        return self
+
+    def _run(self):
+        if self.cancel_token.is_cancelled:
+            return
+        try:
+            result = self._fn(self.cancel_token, *self._args, **self._kwargs)
+        except Exception as e:
+            if not self.cancel_token.is_cancelled:
+                logging.getLogger(__name__).warning(f"Background task failed: {e}")
+                self.failed.emit(str(e))
+            return
+        if not self.cancel_token.is_cancelled:
+            self.finished.emit(result)
+
+    def cancel(self):
+        """取消任务：未开始的直接丢弃，运行中的通过令牌通知"""
+        self.cancel_token.cancel()
+        if self._future is not None:
+            self._future.cancel()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.cancel_token.is_cancelled
@@ -134,6 +134,13 @@ if addon_dir not in sys.path:
 try:
     from services.ai_service_adapter import AIServiceAdapter
     from services.card_service import CardService
+    from services.service_registry import ServiceRegistry
+    from services.conversation_store import get_conversation_store
+    from services.related_cards import related_cards_index
+    from services.response_cache import make_key, response_cache
+    from services.cancellation import CancelToken, track_token
+    from services.executor_service import PRIORITY_INTERACTIVE, executor
+    from services.model_cascade import TIER_STRONG, cascade_stats, cascade_stream, choose_tier
 except ImportError as e:
     print(f"Import error in chat_dialog: {e}")
     # 创建占位符类
@@ -141,11 +148,38 @@ except ImportError as e:
         def get_response(self, conversation):
             return "AI服务导入失败，请检查插件安装"
 
+    class ServiceRegistry:
+        @staticmethod
+        def get_adapter():
+            return AIServiceAdapter()
+
+    get_conversation_store = None
+    related_cards_index = None
+    response_cache = None
+
+    class CancelToken:
+        is_cancelled = False
+        def cancel(self):
+            self.is_cancelled = True
+
+    def track_token(token):
+        return token
+
+    PRIORITY_INTERACTIVE = 0
+    executor = None
+    TIER_STRONG = "strong"
+    cascade_stats = None
+    cascade_stream = None
+    choose_tier = None
+
     class CardService:
         @staticmethod
-        def format_conversation_for_card(conversation):
+        def format_conversation_for_card(conversation, style_mode=None):
             return "对话格式化失败"
         @staticmethod
+        def save_conversation_to_card(conversation, on_done=None):
+            return False, {}
+        @staticmethod
         def get_conversation_separator():
             return "<hr>"
 
@@ -184,24 +218,45 @@ class ChatDialog(QDialog):
         self.card_content = card_content
         self.conversation_history = []
         self.saved_message_count = 0  # 跟踪已保存的消息数量
-        self.ai_service = AIServiceAdapter()
+        self.ai_service = ServiceRegistry.get_adapter()
         self.logger = logging.getLogger(__name__ + ".ChatDialog")
 
         # 流式/线程相关状态
-        self._stream_thread = None
+        self._stream_future = None
+        self._stream_handle = None
         self._stream_queue = None
         self._stream_timer = None
         self._stream_active = False
         self._stream_accum = []
         self._stream_start_pos = None
         self._stream_end_pos = None
-
-        # 初始化AI上下文
+        # 近似回答缓存：本次请求的指纹、命中时的相似度、是否出错（出错的回答不写入缓存）
+        self._stream_cache_key = None
+        self._stream_cache_hit = None
+        self._stream_failed = False
+        # 本次回答的 token 用量（提供商在流中报告时才有）
+        self._stream_usage = None
+        # 分级模型路由：本次回答由哪一层回答（CascadeDecision，未启用时为 None）
+        self._stream_tier = None
+        # 本次回答的 (提供商, 模型)：请求前为预期值，收到 route 事件后为实际值；近似回答缓存按它区分
+        self._stream_route = None
+        # 当前请求的取消令牌（停止按钮、关闭窗口、关闭配置档时取消）；本窗口的后台任务属于同一个任务组
+        self._cancel_token = None
+        self._task_group = f"chat-dialog-{id(self)}"
+
+        # 按卡片保存的对话历史：与非系统消息一一对应的轮次 id，以及是否还有更早的轮次
+        self._turn_ids = []
+        self._oldest_turn_id = None
+        self._has_more_turns = False
+
+        # 初始化AI上下文，并恢复该卡片上次的对话
         self.initialize_ai_context()
+        self._restore_history()
 
         # 设置UI（如果Qt可用）
         if QT_AVAILABLE:
             self.setup_ui()
+            self._render_history()
 
     def initialize_ai_context(self):
         """初始化AI上下文"""
@@ -209,9 +264,13 @@ class ChatDialog(QDialog):
             return
 
         # 创建系统消息，包含卡片内容
+        extra = self.card_content.get('extra', '')
+        extra_line = f"\nExtra: {extra}" if extra else ""
+        related = self._related_cards_context()
+        related_block = "\n\nRelated cards from my collection:\n" + "\n".join(f"- {line}" for line in related) if related else ""
         context_message = f"""Current Anki Card:
 Front: {self.card_content.get('front', '')}
-Back: {self.card_content.get('back', '')}
+Back: {self.card_content.get('back', '')}{extra_line}{related_block}
 
 Please help me understand this card better. You can explain concepts, provide examples, answer questions, or help with memorization techniques."""
 
@@ -219,6 +278,107 @@ Please help me understand this card better. You can explain concepts, provide ex
             {"role": "system", "content": context_message}
         ]
 
+    def _related_cards_context(self):
+        """集合中与当前卡片最相关的卡片摘要（未启用或索引尚未就绪时为空）"""
+        settings = Config.get_related_cards_config()
+        if not settings.get("enabled") or related_cards_index is None or not related_cards_index.is_ready():
+            return []
+        try:
+            from aqt import mw
+            text = " ".join(self.card_content.get(key, "") for key in ("front", "back", "extra"))
+            return related_cards_index.related_context(
+                mw.col, self.card_content.get("note_id"), text, k=settings.get("count", 3)
+            )
+        except Exception as e:
+            self.logger.error(f"Error finding related cards: {e}")
+            return []
+
+    def _get_history_store(self):
+        """当前卡片可用的对话历史存储（未启用或没有卡片 id 时返回 None）"""
+        if not self.card_content or not self.card_content.get("card_id") or get_conversation_store is None:
+            return None
+        if not Config.get_conversation_history_config().get("enabled", True):
+            return None
+        try:
+            return get_conversation_store()
+        except Exception as e:
+            self.logger.error(f"Error opening conversation store: {e}")
+            return None
+
+    def _restore_history(self):
+        """恢复该卡片最近一页对话（更早的轮次按需加载）"""
+        store = self._get_history_store()
+        if not store:
+            return
+        try:
+            page_size = Config.get_conversation_history_config().get("page_size", 20)
+            turns, self._has_more_turns = store.load_turns(self.card_content["card_id"], limit=page_size)
+            self._prepend_turns(turns)
+        except Exception as e:
+            self.logger.error(f"Error restoring conversation history: {e}")
+
+    def _prepend_turns(self, turns):
+        """把更早的轮次插入系统消息之后；已保存到卡片的轮次计入 saved_message_count"""
+        if not turns:
+            return
+        system = [m for m in self.conversation_history if m["role"] == "system"]
+        rest = [m for m in self.conversation_history if m["role"] != "system"]
+        older = [{"role": t["role"], "content": t["content"]} for t in turns]
+        self.conversation_history = system + older + rest
+        self._turn_ids = [t["id"] for t in turns] + self._turn_ids
+        self._oldest_turn_id = turns[0]["id"]
+
+        # 保存总是从上次保存处开始，已保存的轮次构成前缀
+        saved = 0
+        for turn in turns:
+            if not turn.get("saved"):
+                break
+            saved += 1
+        self.saved_message_count = saved + (self.saved_message_count if saved == len(turns) else 0)
+
+    def _record_turn(self, role, content):
+        """对话轮次完成后立即写入存储"""
+        turn_id = None
+        store = self._get_history_store()
+        if store:
+            try:
+                turn_id = store.append_turn(
+                    self.card_content["card_id"], self.card_content.get("note_id") or 0, role, content
+                )
+            except Exception as e:
+                self.logger.error(f"Error recording conversation turn: {e}")
+        self._turn_ids.append(turn_id)
+
+    def _render_history(self):
+        """重新显示当前对话历史（恢复或加载更早轮次之后）"""
+        if hasattr(self, 'chat_display'):
+            self.chat_display.clear()
+        for msg in self.conversation_history:
+            if msg["role"] == "user":
+                self.display_message("User", msg["content"])
+            elif msg["role"] == "assistant":
+                self.display_message("AI", msg["content"])
+        if hasattr(self, 'load_earlier_button'):
+            self.load_earlier_button.setVisible(self._has_more_turns)
+
+    def load_earlier_turns(self):
+        """加载更早的一页对话"""
+        store = self._get_history_store()
+        if not store or self._oldest_turn_id is None:
+            return
+        try:
+            page_size = Config.get_conversation_history_config().get("page_size", 20)
+            turns, self._has_more_turns = store.load_turns(
+                self.card_content["card_id"], before_id=self._oldest_turn_id, limit=page_size
+            )
+            self._prepend_turns(turns)
+        except Exception as e:
+            self.logger.error(f"Error loading earlier conversation turns: {e}")
+            self._has_more_turns = False
+        self._render_history()
+        if hasattr(self, 'chat_display'):
+            self.chat_display.verticalScrollBar().setValue(0)
+
     def setup_ui(self):
         """设置用户界面"""
         if not QT_AVAILABLE:
@@ -247,6 +407,25 @@ Please help me understand this card better. You can explain concepts, provide ex
         main_layout.setSpacing(0)  # 移除默认间距
         main_layout.setContentsMargins(0, 0, 0, 0)  # 移除默认边距
 
+        # 加载更早的对话（仅在存储中还有更早轮次时显示）
+        self.load_earlier_button = QPushButton(_("Load earlier messages"))
+        self.load_earlier_button.setStyleSheet("""
+            QPushButton {
+                padding: 6px 12px;
+                border: none;
+                border-bottom: 1px solid #e5e7eb;
+                background-color: #fafafa;
+                color: #6b7280;
+                font-size: 13px;
+            }
+            QPushButton:hover {
+                color: #111827;
+            }
+        """)
+        self.load_earlier_button.clicked.connect(self.load_earlier_turns)
+        self.load_earlier_button.setVisible(False)
+        main_layout.addWidget(self.load_earlier_button)
+
         # 聊天显示区域 - 现代极简风格
         self.chat_display = QTextEdit()
         self.chat_display.setReadOnly(True)
@@ -318,6 +497,25 @@ Please help me understand this card better. You can explain concepts, provide ex
         self.send_button.clicked.connect(self.send_message)
         input_layout.addWidget(self.send_button)
 
+        # 停止按钮：仅在生成回答时显示，立即断开连接并保留已收到的部分
+        self.stop_button = QPushButton(_("Stop"))
+        self.stop_button.setStyleSheet("""
+            QPushButton {
+                padding: 12px 20px;
+                background-color: white;
+                color: #dc2626;
+                border: 1px solid #fca5a5;
+                font-size: 14px;
+                font-weight: 500;
+            }
+            QPushButton:hover {
+                background-color: #fef2f2;
+            }
+        """)
+        self.stop_button.clicked.connect(self.stop_generation)
+        self.stop_button.setVisible(False)
+        input_layout.addWidget(self.stop_button)
+
         main_layout.addWidget(input_widget)
 
         # 控制按钮区域 - 现代极简风格
@@ -352,6 +550,13 @@ Please help me understand this card better. You can explain concepts, provide ex
         self.save_button.clicked.connect(self.save_to_card)
         button_layout.addWidget(self.save_button)
 
+        # 分级模型路由：用强模型重新回答上一个问题（未启用时隐藏）
+        self.stronger_button = QPushButton(f'⬆ {_("Ask stronger model")}')
+        self.stronger_button.setStyleSheet(button_style)
+        self.stronger_button.clicked.connect(self.ask_stronger_model)
+        self.stronger_button.setVisible(bool(self._cascade_settings().get("enabled")))
+        button_layout.addWidget(self.stronger_button)
+
         self.clear_button = QPushButton(_("Clear Chat"))
         self.clear_button.setStyleSheet(button_style)
         self.clear_button.clicked.connect(self.clear_chat)
@@ -384,6 +589,7 @@ Please help me understand this card better. You can explain concepts, provide ex
             "role": "user",
             "content": user_message
         })
+        self._record_turn("user", user_message)
 
         # 显示用户消息
         self.display_message("User", user_message)
@@ -391,6 +597,34 @@ Please help me understand this card better. You can explain concepts, provide ex
         # 清空输入框
         self.input_field.clear()
 
+        self._start_response(list(self.conversation_history))
+
+    def ask_stronger_model(self):
+        """用强模型重新回答最近一个问题（新回答追加在原回答之后）"""
+        if self._stream_active:
+            return
+        last_user = max((i for i, m in enumerate(self.conversation_history) if m.get("role") == "user"), default=None)
+        if last_user is None:
+            self.show_message(_("Please enter a message"), _("Warning"))
+            return
+        self._start_response(self.conversation_history[:last_user + 1], force_strong=True)
+
+    def _cascade_settings(self):
+        """当前卡片所在牌组的分级模型路由配置"""
+        deck = (self.card_content or {}).get("deck") or None
+        try:
+            return Config.get_cascade_config(deck)
+        except Exception as e:
+            self.logger.error(f"Error reading cascade config: {e}")
+            return {}
+
+    def _start_response(self, conversation, force_strong=False):
+        """为 conversation 发起一次回答：按分级路由选择模型，流式显示在新的回答块中"""
+        settings = self._cascade_settings()
+        decision = None
+        if choose_tier is not None and settings.get("enabled"):
+            decision = choose_tier(conversation, settings, force_strong=force_strong)
+
         # 禁用发送按钮，显示加载状态
         if hasattr(self, 'send_button'):
             self.send_button.setEnabled(False)
@@ -415,32 +649,74 @@ Please help me understand this card better. You can explain concepts, provide ex
             self.chat_display.moveCursor(END)
             self._stream_end_pos = self.chat_display.textCursor().position()
 
-        # 初始化流式状态
-        self._stream_queue = queue.Queue()
+        # 初始化流式状态；后台线程只持有本次请求的队列和令牌，停止后迟到的事件不会影响下一次请求
+        self._stream_queue = events = queue.Queue()
         self._stream_active = True
         self._stream_accum = []
+        self._stream_route = self._default_route(decision)
+        # 缓存键在主线程按本次的预期回答者计算；后台线程只拿它查询，不写对话框状态。
+        # 用户要求强模型重答时不使用缓存的回答，也不保存
+        self._stream_cache_key = cache_key = None if force_strong else self._response_cache_key(conversation)
+        self._cancel_token = token = track_token(CancelToken())
+        if hasattr(self, 'stop_button'):
+            self.stop_button.setVisible(True)
+
+        # 传输支持回调（Qt 网络传输）时，分片直接在 GUI 事件循环中到达，不需要后台线程与定时器；
+        # 回调接口只能使用配置的模型，分级路由时改用后台线程
+        if QT_AVAILABLE and decision is None and self._start_native_stream(conversation, token, cache_key):
+            return
 
         def worker():
             final_text = None
             try:
+                cached = self._lookup_cached_response(cache_key)
+                if cached is not None:
+                    final_text, similarity = cached
+                    events.put(('cached', similarity))
+                    return
                 base_service = getattr(self.ai_service, '_service', None)
                 stream = getattr(base_service, 'stream_response', None)
-                if callable(stream):
-                    for chunk in stream(self.conversation_history):
+                stream_events = getattr(self.ai_service, 'stream_events', None)
+                if callable(stream_events):
+                    # 各提供商共用的事件协议：文本分片与用量；分级路由时每一层开始前还有一个 tier 事件
+                    if decision is not None:
+                        items = cascade_stream(stream_events, conversation, decision, settings, cancel_token=token)
+                    else:
+                        items = (('event', event) for event in stream_events(conversation, cancel_token=token))
+                    for item_kind, payload in items:
+                        if token.is_cancelled:
+                            break
+                        if item_kind == 'tier':
+                            events.put(('tier', payload))
+                        elif payload.kind == 'delta':
+                            events.put(('chunk', payload.text))
+                        elif payload.kind == 'usage':
+                            events.put(('usage', payload.usage))
+                        elif payload.kind == 'route':
+                            events.put(('route', (payload.provider, payload.model)))
+                elif callable(stream):
+                    for chunk in stream(conversation, cancel_token=token):
+                        if token.is_cancelled:
+                            break
                         # 将分片推入队列供主线程消费
-                        self._stream_queue.put(('chunk', chunk))
-                    final_text = ''.join(self._stream_accum) if self._stream_accum else None
+                        events.put(('chunk', chunk))
                 else:
-                    # 同步一次性请求
-                    final_text = self.ai_service.get_response(self.conversation_history)
+                    # 同步一次性请求（无法中断，取消后丢弃结果）
+                    final_text = self.ai_service.get_response(conversation)
             except Exception as e:
-                self._stream_queue.put(('error', str(e)))
+                if not token.is_cancelled:
+                    events.put(('error', str(e)))
             finally:
-                self._stream_queue.put(('done', final_text))
+                events.put(('done', final_text))
 
-        # 启动后台线程
-        self._stream_thread = threading.Thread(target=worker, daemon=True)
-        self._stream_thread.start()
+        # 提交到共享执行器（交互优先级，不会被索引等批量任务占满）
+        if executor is not None:
+            self._stream_future = executor.submit(
+                worker, priority=PRIORITY_INTERACTIVE, group=self._task_group, name="chat-response", cancel_token=token
+            )
+        else:
+            self._stream_future = threading.Thread(target=worker, daemon=True)
+            self._stream_future.start()
 
         # 使用 QTimer 在主线程轮询队列，安全更新 UI
         if QT_AVAILABLE:
@@ -450,6 +726,48 @@ Please help me understand this card better. You can explain concepts, provide ex
                 self._stream_timer.timeout.connect(self._on_stream_timer)
             self._stream_timer.start()
 
+    def _start_native_stream(self, conversation, token, cache_key=None):
+        """通过传输层回调接收流式回答；服务或传输不支持时返回 False，改用后台线程
+
+        需要端点故障转移或对冲时 start_stream_response() 返回 None，同样改用后台线程。
+        """
+        # 回调接口只有 OpenAIService 提供；可能路由到其他提供商时改用后台线程
+        uses_native = getattr(self.ai_service, 'uses_native_providers', None)
+        if callable(uses_native) and uses_native():
+            return False
+        base_service = getattr(self.ai_service, '_service', None)
+        start = getattr(base_service, 'start_stream_response', None)
+        if not callable(start):
+            return False
+
+        def dispatch(kind, payload):
+            # 停止后迟到的回调不影响下一次请求
+            if token.is_cancelled or self._cancel_token is not token:
+                return
+            try:
+                self._handle_stream_event(kind, payload, pump_events=False)
+            except Exception as e:
+                self.display_message("System", f"UI 更新异常: {e}")
+                self._finalize_stream()
+
+        def on_done(error):
+            if error:
+                dispatch('error', error)
+            dispatch('done', None)
+
+        cached = self._lookup_cached_response(cache_key)
+        if cached is not None:
+            dispatch('cached', cached[1])
+            dispatch('done', cached[0])
+            return True
+        try:
+            self._stream_handle = start(conversation, lambda chunk: dispatch('chunk', chunk), on_done,
+                                        cancel_token=token)
+        except Exception as e:
+            on_done(str(e))
+            return True
+        return self._stream_handle is not None
+
     def _on_stream_timer(self):
         """主线程定时器：消费分片、原位更新 Dom、处理完成/错误"""
         try:
@@ -462,52 +780,7 @@ Please help me understand this card better. You can explain concepts, provide ex
             while (self._stream_queue is not None) and (not self._stream_queue.empty()):
                 processed_any = True
                 kind, payload = self._stream_queue.get_nowait()
-                if kind == 'chunk':
-                    self._stream_accum.append(payload)
-                    text = ''.join(self._stream_accum)
-                    if hasattr(self, 'chat_display') and self._stream_start_pos is not None and self._stream_end_pos is not None:
-                        END, MOVE_ANCHOR, KEEP_ANCHOR = _qt_cursor_consts()
-                        cursor = self.chat_display.textCursor()
-                        cursor.setPosition(self._stream_start_pos, MOVE_ANCHOR)
-                        cursor.setPosition(self._stream_end_pos, KEEP_ANCHOR)
-                        # 替换loading状态为实际消息内容（处理markdown）
-                        processed_text = self._process_ai_message(text)
-                        cursor.insertHtml(f'<div style="margin:12px 0;padding:12px 16px;border:1px solid #e5e7eb;color:#111827;font-size:14px;max-width:75%;margin-right:auto;line-height:1.5;">{processed_text}</div>')
-                        self._stream_end_pos = cursor.position()
-                        try:
-                            QApplication.processEvents()
-                        except Exception:
-                            pass
-                elif kind == 'error':
-                    # 替换loading状态为错误消息
-                    if hasattr(self, 'chat_display') and self._stream_start_pos is not None and self._stream_end_pos is not None:
-                        END, MOVE_ANCHOR, KEEP_ANCHOR = _qt_cursor_consts()
-                        cursor = self.chat_display.textCursor()
-                        cursor.setPosition(self._stream_start_pos, MOVE_ANCHOR)
-                        cursor.setPosition(self._stream_end_pos, KEEP_ANCHOR)
-                        cursor.insertHtml(f'<div style="margin:12px 0;padding:12px 16px;background-color:#fef2f2;border:1px solid #fca5a5;color:#dc2626;font-size:14px;max-width:75%;margin-right:auto;line-height:1.5;">Error: {payload}</div>')
-                        self._stream_end_pos = cursor.position()
-                    else:
-                        self.display_message("System", f"AI 流式错误: {payload}")
-                elif kind == 'done':
-                    final_text = payload
-                    # 如果没有通过 chunk 路径累积，则 final_text 可能来自一次性请求
-                    if final_text and not self._stream_accum:
-                        if hasattr(self, 'chat_display') and self._stream_start_pos is not None and self._stream_end_pos is not None:
-                            END, MOVE_ANCHOR, KEEP_ANCHOR = _qt_cursor_consts()
-                            cursor = self.chat_display.textCursor()
-                            cursor.setPosition(self._stream_start_pos, MOVE_ANCHOR)
-                            cursor.setPosition(self._stream_end_pos, KEEP_ANCHOR)
-                            # 替换loading状态为最终消息内容（处理markdown）
-                            processed_final_text = self._process_ai_message(final_text)
-                            cursor.insertHtml(f'<div style="margin:12px 0;padding:12px 16px;border:1px solid #e5e7eb;color:#111827;font-size:14px;max-width:75%;margin-right:auto;line-height:1.5;">{processed_final_text}</div>')
-                            self._stream_end_pos = cursor.position()
-                    # 写入会话历史
-                    full = ''.join(self._stream_accum) if self._stream_accum else (final_text or '')
-                    if full:
-                        self.conversation_history.append({"role": "assistant", "content": full})
-                    # 收尾
-                    self._finalize_stream()
+                self._handle_stream_event(kind, payload)
             # 若暂无事件，也保持 UI 活跃
             if processed_any:
                 try:
@@ -518,6 +791,222 @@ Please help me understand this card better. You can explain concepts, provide ex
             self.display_message("System", f"UI 更新异常: {e}")
             self._finalize_stream()
 
+    def _handle_stream_event(self, kind, payload, pump_events=True):
+        """处理一个流式事件（chunk/usage/tier/route/cached/error/done）：原位更新回答块，完成时写入历史并收尾
+
+        pump_events 为 False 时不在分片之间处理 Qt 事件（在网络信号回调中调用时避免重入）。
+        """
+        if kind == 'chunk':
+            self._stream_accum.append(payload)
+            text = ''.join(self._stream_accum)
+            if hasattr(self, 'chat_display') and self._stream_start_pos is not None and self._stream_end_pos is not None:
+                END, MOVE_ANCHOR, KEEP_ANCHOR = _qt_cursor_consts()
+                cursor = self.chat_display.textCursor()
+                cursor.setPosition(self._stream_start_pos, MOVE_ANCHOR)
+                cursor.setPosition(self._stream_end_pos, KEEP_ANCHOR)
+                # 替换loading状态为实际消息内容（处理markdown）
+                processed_text = self._process_ai_message(text)
+                cursor.insertHtml(f'<div style="margin:12px 0;padding:12px 16px;border:1px solid #e5e7eb;color:#111827;font-size:14px;max-width:75%;margin-right:auto;line-height:1.5;">{processed_text}</div>')
+                self._stream_end_pos = cursor.position()
+                if pump_events:
+                    try:
+                        QApplication.processEvents()
+                    except Exception:
+                        pass
+        elif kind == 'usage':
+            self._stream_usage = payload
+        elif kind == 'route':
+            self._stream_route = payload
+        elif kind == 'tier':
+            # 新的一层开始回答；快速层信心不足升级时丢弃它的回答，改显示升级提示
+            escalated = self._stream_tier is not None
+            self._stream_tier = payload
+            self._stream_accum = []
+            self._stream_usage = None
+            if escalated:
+                self._replace_stream_block(
+                    f'<div style="color:#6b7280;font-size:14px;font-style:italic;">⬆ {_("Asking stronger model")} '
+                    f'({self._escape_html(self._tier_reason_label(payload.reason))})...</div>')
+        elif kind == 'cached':
+            self._stream_cache_hit = payload
+        elif kind == 'error':
+            self._stream_failed = True
+            # 替换loading状态为错误消息
+            if hasattr(self, 'chat_display') and self._stream_start_pos is not None and self._stream_end_pos is not None:
+                END, MOVE_ANCHOR, KEEP_ANCHOR = _qt_cursor_consts()
+                cursor = self.chat_display.textCursor()
+                cursor.setPosition(self._stream_start_pos, MOVE_ANCHOR)
+                cursor.setPosition(self._stream_end_pos, KEEP_ANCHOR)
+                cursor.insertHtml(f'<div style="margin:12px 0;padding:12px 16px;background-color:#fef2f2;border:1px solid #fca5a5;color:#dc2626;font-size:14px;max-width:75%;margin-right:auto;line-height:1.5;">Error: {payload}</div>')
+                self._stream_end_pos = cursor.position()
+            else:
+                self.display_message("System", f"AI 流式错误: {payload}")
+        elif kind == 'done':
+            final_text = payload
+            # 如果没有通过 chunk 路径累积，则 final_text 可能来自一次性请求
+            if final_text and not self._stream_accum:
+                if hasattr(self, 'chat_display') and self._stream_start_pos is not None and self._stream_end_pos is not None:
+                    END, MOVE_ANCHOR, KEEP_ANCHOR = _qt_cursor_consts()
+                    cursor = self.chat_display.textCursor()
+                    cursor.setPosition(self._stream_start_pos, MOVE_ANCHOR)
+                    cursor.setPosition(self._stream_end_pos, KEEP_ANCHOR)
+                    # 替换loading状态为最终消息内容（处理markdown）
+                    processed_final_text = self._process_ai_message(final_text)
+                    if self._stream_cache_hit is not None:
+                        processed_final_text = self._cached_badge_html(self._stream_cache_hit) + processed_final_text
+                    cursor.insertHtml(f'<div style="margin:12px 0;padding:12px 16px;border:1px solid #e5e7eb;color:#111827;font-size:14px;max-width:75%;margin-right:auto;line-height:1.5;">{processed_final_text}</div>')
+                    self._stream_end_pos = cursor.position()
+            # 在回答下方标出回答的层级与模型，以及提供商报告的用量
+            notes = ''
+            if self._stream_tier is not None:
+                notes += self._tier_note_html(self._stream_tier)
+            if self._stream_usage:
+                notes += self._usage_note_html(self._stream_usage)
+            if notes and self._stream_accum and not self._stream_failed:
+                self._replace_stream_block(self._process_ai_message(''.join(self._stream_accum)) + notes)
+            # 写入会话历史
+            full = ''.join(self._stream_accum) if self._stream_accum else (final_text or '')
+            if full:
+                self.conversation_history.append({"role": "assistant", "content": full})
+                self._record_turn("assistant", full)
+                cancelled = self._cancel_token is not None and self._cancel_token.is_cancelled
+                if self._stream_cache_hit is None and not self._stream_failed and not cancelled \
+                        and response_cache is not None:
+                    # 按实际回答的提供商与模型保存（故障转移或升级后可能与查找时的预期不同）
+                    key = self._stream_cache_key
+                    response_cache.store(key.with_model(self._route_scope()) if key is not None else None, full)
+            # 收尾
+            self._finalize_stream()
+
+    def stop_generation(self):
+        """停止按钮：断开当前请求，已收到的部分作为回答保留"""
+        self._cancel_stream()
+
+    def _cancel_stream(self):
+        """取消进行中的请求并立即收尾：取出队列中已到达的分片，把部分回答写入历史"""
+        if not self._stream_active:
+            return
+        if self._cancel_token is not None:
+            self._cancel_token.cancel()
+        events = self._stream_queue
+        while events is not None and not events.empty():
+            kind, payload = events.get_nowait()
+            if kind == 'chunk':
+                self._stream_accum.append(payload)
+            elif kind == 'tier':
+                self._stream_accum = []
+        partial = ''.join(self._stream_accum)
+        stopped_note = f'<div style="color:#6b7280;font-size:12px;margin-top:6px;">⏹ {_("Stopped")}</div>'
+        if partial:
+            self._replace_stream_block(self._process_ai_message(partial) + stopped_note)
+            self.conversation_history.append({"role": "assistant", "content": partial})
+            self._record_turn("assistant", partial)
+        else:
+            self._replace_stream_block(stopped_note)
+        self._finalize_stream()
+
+    def _replace_stream_block(self, inner_html):
+        """用新的内容替换正在生成的回答块"""
+        if not hasattr(self, 'chat_display') or self._stream_start_pos is None or self._stream_end_pos is None:
+            return
+        END, MOVE_ANCHOR, KEEP_ANCHOR = _qt_cursor_consts()
+        cursor = self.chat_display.textCursor()
+        cursor.setPosition(self._stream_start_pos, MOVE_ANCHOR)
+        cursor.setPosition(self._stream_end_pos, KEEP_ANCHOR)
+        cursor.insertHtml(f'<div style="margin:12px 0;padding:12px 16px;border:1px solid #e5e7eb;color:#111827;font-size:14px;max-width:75%;margin-right:auto;line-height:1.5;">{inner_html}</div>')
+        self._stream_end_pos = cursor.position()
+
+    def _cancel_all_tasks(self):
+        """取消本窗口的全部后台任务（包括尚在排队的）"""
+        self._cancel_stream()
+        if executor is not None:
+            executor.cancel_group(self._task_group)
+
+    def closeEvent(self, event):
+        """关闭窗口时取消进行中的请求"""
+        self._cancel_all_tasks()
+        super().closeEvent(event)
+
+    def reject(self):
+        """按 Esc 关闭时同样取消进行中的请求"""
+        self._cancel_all_tasks()
+        super().reject()
+
+    def _default_route(self, decision=None):
+        """不发生故障转移时回答本轮的 (提供商, 模型)"""
+        model = decision.model if decision is not None else None
+        default_route = getattr(self.ai_service, 'default_route', None)
+        if callable(default_route):
+            try:
+                return default_route(model)
+            except Exception as e:
+                self.logger.error(f"Error resolving answer route: {e}")
+        return "openai", model or Config.get_openai_config().get("model", "")
+
+    def _route_scope(self):
+        """近似回答缓存的作用域：提供商与模型"""
+        provider, model = self._stream_route or self._default_route()
+        return f"{provider}:{model}"
+
+    def _response_cache_key(self, conversation):
+        """当前问题在近似回答缓存中的键（主线程调用），作用域为预期回答者（提供商与模型）；
+        缓存未启用时返回 None"""
+        settings = Config.get_response_cache_config()
+        if not settings.get("enabled") or response_cache is None:
+            return None
+        try:
+            response_cache.configure(settings["threshold"], settings["max_entries"], settings["ttl_hours"] * 3600)
+            return make_key(conversation, self._route_scope())
+        except Exception as e:
+            self.logger.error(f"Error computing response cache key: {e}")
+            return None
+
+    def _lookup_cached_response(self, key):
+        """按 key 查找近似回答缓存（后台线程调用，不修改对话框状态）；命中时返回 (回答, 相似度)"""
+        if key is None or response_cache is None:
+            return None
+        try:
+            return response_cache.lookup(key)
+        except Exception as e:
+            self.logger.error(f"Error looking up response cache: {e}")
+            return None
+
+    def _cached_badge_html(self, similarity):
+        """缓存回答上方的标记"""
+        return (f'<div style="color:#6b7280;font-size:12px;margin-bottom:6px;">⚡ {_("Cached answer")} '
+                f'({similarity:.0%} {_("match")})</div>')
+
+    def _usage_note_html(self, usage):
+        """回答下方的 token 用量"""
+        return (f'<div style="color:#6b7280;font-size:12px;margin-top:6px;">{_("Tokens")}: '
+                f'{usage.get("input_tokens", 0)} → {usage.get("output_tokens", 0)}</div>')
+
+    def _tier_reason_label(self, reason):
+        """分级路由原因的显示文字"""
+        labels = {
+            "requested": _("requested"),
+            "long_question": _("long question"),
+            "complex": _("complex question"),
+            "long_context": _("long conversation"),
+            "empty_answer": _("empty fast answer"),
+            "truncated": _("fast answer truncated"),
+            "uncertain": _("fast model unsure"),
+        }
+        return labels.get(reason, reason)
+
+    def _tier_note_html(self, decision):
+        """回答下方的层级、模型与延迟，以及该层的平均延迟"""
+        label = _("Strong model") if decision.tier == TIER_STRONG else _("Fast model")
+        parts = [f"{label}: {self._escape_html(decision.model)}"]
+        if decision.reason != "default":
+            parts.append(self._escape_html(self._tier_reason_label(decision.reason)))
+        if decision.ttft_ms is not None:
+            parts.append(f"{_('first token')} {decision.ttft_ms:.0f} ms")
+        stats = (cascade_stats.snapshot()["tiers"].get(decision.tier) if cascade_stats is not None else None) or {}
+        if stats.get("avg_ttft_ms") is not None:
+            parts.append(f"{_('tier average')} {stats['avg_ttft_ms']:.0f} ms ({stats['count']})")
+        return f'<div style="color:#6b7280;font-size:12px;margin-top:6px;">{" · ".join(parts)}</div>'
+
     def _finalize_stream(self):
         """结束流式：停止计时器、恢复按钮、清理状态"""
         if self._stream_timer:
@@ -526,11 +1015,21 @@ Please help me understand this card better. You can explain concepts, provide ex
             except Exception:
                 pass
         self._stream_active = False
-        self._stream_thread = None
+        self._stream_future = None
+        self._stream_handle = None
         self._stream_queue = None
         self._stream_start_pos = None
         self._stream_end_pos = None
         self._stream_accum = []
+        self._stream_cache_key = None
+        self._stream_cache_hit = None
+        self._stream_failed = False
+        self._stream_usage = None
+        self._stream_tier = None
+        self._stream_route = None
+        self._cancel_token = None
+        if hasattr(self, 'stop_button'):
+            self.stop_button.setVisible(False)
         if hasattr(self, 'send_button'):
             self.send_button.setEnabled(True)
             self.send_button.setText("Send")
@@ -586,6 +1085,9 @@ Please help me understand this card better. You can explain concepts, provide ex
             if hasattr(self, 'save_button'):
                 self.save_button.setText(_("Save to Card"))
 
+            if hasattr(self, 'stronger_button'):
+                self.stronger_button.setText(f'⬆ {_("Ask stronger model")}')
+
             if hasattr(self, 'clear_button'):
                 self.clear_button.setText(_("Clear Chat"))
 
@@ -656,16 +1158,28 @@ Please help me understand this card better. You can explain concepts, provide ex
                 self.show_message(_("No new conversation to save"), _("Information"))
                 return
 
-            # 格式化对话内容
-            formatted_conversation = CardService.format_conversation_for_card(new_conversation)
+            # 格式化并保存到卡片（后台写入，完成后回调）
+            previous_count = self.saved_message_count
+            completed = []
 
-            # 保存到卡片
-            success = CardService.append_to_card(formatted_conversation)
+            def on_saved(success, stats):
+                completed.append(success)
+                if success:
+                    self.saved_message_count = max(self.saved_message_count, len(all_conversation))
+                    self._mark_turns_saved(len(all_conversation))
+                    self.show_success_message(stats)
+                else:
+                    # 写入失败：这些消息下次仍可再次保存
+                    self.saved_message_count = min(self.saved_message_count, previous_count)
+                    self.show_message(_("Failed to Save to Card"), _("Error"))
+
+            queued, _stats = CardService.save_conversation_to_card(new_conversation, on_done=on_saved)
 
-            if success:
-                # 更新已保存的消息计数
+            if completed:
+                return
+            if queued:
+                # 先更新已保存的消息计数，避免写入完成前重复保存
                 self.saved_message_count = len(all_conversation)
-                self.show_success_message()
             else:
                 self.show_message(_("Failed to Save to Card"), _("Error"))
 
@@ -673,11 +1187,34 @@ Please help me understand this card better. You can explain concepts, provide ex
             self.show_message(_("Failed to Save to Card") + f": {str(e)}", _("Error"))
             logging.error(f"Error saving conversation to card: {e}")
 
+    def _mark_turns_saved(self, message_count):
+        """记录前 message_count 条消息对应的轮次已保存到卡片"""
+        turn_ids = [t for t in self._turn_ids[:message_count] if t]
+        store = self._get_history_store()
+        if store and turn_ids:
+            try:
+                store.mark_turns_saved(self.card_content["card_id"], max(turn_ids))
+            except Exception as e:
+                self.logger.error(f"Error marking conversation turns saved: {e}")
+
     def clear_chat(self):
         """清空聊天记录"""
         if hasattr(self, 'chat_display'):
             self.chat_display.clear()
 
+        # 同时删除该卡片保存的对话历史
+        store = self._get_history_store()
+        if store:
+            try:
+                store.delete_card_turns(self.card_content["card_id"])
+            except Exception as e:
+                self.logger.error(f"Error clearing conversation history: {e}")
+        self._turn_ids = []
+        self._oldest_turn_id = None
+        self._has_more_turns = False
+        if hasattr(self, 'load_earlier_button'):
+            self.load_earlier_button.setVisible(False)
+
         # 重置保存计数器
         self.saved_message_count = 0
 
@@ -696,9 +1233,12 @@ Please help me understand this card better. You can explain concepts, provide ex
         self.update_ui_language()
         return super().exec()
 
-    def show_success_message(self):
+    def show_success_message(self, stats=None):
         """显示成功消息 - 现代极简风格"""
-        self.show_message(_("Conversation saved to card successfully"), _("Information"))
+        message = _("Conversation saved to card successfully")
+        if stats and stats.get("inline_bytes") and stats.get("bytes") < stats.get("inline_bytes"):
+            message += f"\n{stats['inline_bytes']:,} → {stats['bytes']:,} bytes"
+        self.show_message(message, _("Information"))
 
     def show_message(self, message, title="Message"):
         """显示消息框 - 现代极简风格"""
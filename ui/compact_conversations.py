@@ -0,0 +1,80 @@
+# 工具菜单：压缩集合中已保存的 AI 对话
+
+import logging
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..services.conversation_migration import ConversationMigrator, format_report
+except ImportError:
+    from services.conversation_migration import ConversationMigrator, format_report
+
+# 翻译函数
+try:
+    from ..i18n.translator import _
+except ImportError:
+    try:
+        from i18n.translator import _
+    except ImportError:
+        def _(text): return text
+
+try:
+    from anki.collection import OpChanges
+    from aqt import mw
+    from aqt.operations import CollectionOp
+    from aqt.utils import askUser, showInfo
+    ANKI_AVAILABLE = True
+except ImportError:
+    mw = None
+    ANKI_AVAILABLE = False
+
+
+def compact_saved_conversations(parent=None):
+    """确认后在后台压缩全部含旧格式对话的笔记（一个撤销步骤，带进度）"""
+    if not ANKI_AVAILABLE or not mw or not mw.col:
+        return
+    parent = parent or mw
+
+    try:
+        candidates = ConversationMigrator(mw.col).count_candidates()
+    except Exception as e:
+        logging.error(f"Error counting notes with saved conversations: {e}")
+        showInfo(_("Failed to scan the collection") + f": {e}", parent=parent)
+        return
+    if not candidates:
+        showInfo(_("No notes with saved AI conversations need compacting."), parent=parent)
+        return
+    if not askUser(
+        _("Compact saved AI conversations in {count} notes? Styling is moved into the note type CSS; "
+          "this can be undone with Edit > Undo.").format(count=f"{candidates:,}"),
+        parent=parent,
+    ):
+        return
+
+    def update_progress(done, total):
+        mw.taskman.run_on_main(
+            lambda: mw.progress.update(
+                label=_("Compacting AI conversations") + f" {done:,}/{total:,}",
+                value=done,
+                max=total,
+            )
+        )
+
+    def should_cancel():
+        want_cancel = getattr(mw.progress, "want_cancel", None)
+        return bool(want_cancel and want_cancel())
+
+    result = {}
+
+    def op(col):
+        changes, report = ConversationMigrator(col).run(progress=update_progress, should_cancel=should_cancel)
+        result["report"] = report
+        return changes if changes is not None else OpChanges()
+
+    def on_success(_changes):
+        showInfo(format_report(result.get("report", {})), parent=parent, title=_("Compact AI conversations"))
+
+    def on_failure(exc):
+        logging.error(f"Conversation migration failed: {exc}")
+        showInfo(_("Failed to compact conversations") + f": {exc}", parent=parent)
+
+    CollectionOp(parent=parent, op=op).success(on_success).failure(on_failure).run_in_background()
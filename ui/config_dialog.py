@@ -26,12 +26,17 @@ if addon_dir not in sys.path:
 try:
     from aqt import mw
     from config import Config
-    from services.ai_service_adapter import AIServiceAdapter
+    from services.service_registry import ServiceRegistry
+    from services.key_probe import probe_anthropic_key, probe_google_key
+    from services.endpoint_router import endpoint_router
+    from ui.background_task import BackgroundTask
 except ImportError as e:
     print(f"Import error in config_dialog: {e}")
     mw = None
     Config = None
-    AIServiceAdapter = None
+    ServiceRegistry = None
+    BackgroundTask = None
+    endpoint_router = None
 
 # 使用Anki的Qt导入（推荐方式）
 try:
@@ -109,6 +114,28 @@ except ImportError:
 
     QT_AVAILABLE = False
 
+
+def format_endpoint_stats(snapshot):
+    """把端点路由统计格式化为 HTML 表格"""
+    if not snapshot:
+        return "暂无统计（发送过请求后显示）"
+    from html import escape
+    rows = []
+    for item in sorted(snapshot, key=lambda s: s["name"]):
+        latency = "-" if item["latency_ms"] is None else f"{item['latency_ms']:.0f} ms"
+        if item["ejected_seconds"] > 0:
+            state = f"⛔ 剔除中（{item['ejected_seconds']:.0f} 秒）"
+        else:
+            state = "✅ 正常"
+        rows.append(
+            f"<tr><td title='{escape(item['url'])}'>{escape(item['name'])}</td><td>{latency}</td>"
+            f"<td>{item['error_rate'] * 100:.0f}%</td><td>{item['requests']}（失败 {item['errors']}）</td>"
+            f"<td>{state}</td></tr>"
+        )
+    return ("<table cellspacing='6'><tr><th>端点</th><th>延迟</th><th>错误率</th><th>请求数</th><th>状态</th></tr>"
+            + "".join(rows) + "</table>")
+
+
 class ConfigDialog(QDialog):
     """配置对话框"""
     
@@ -135,6 +162,12 @@ class ConfigDialog(QDialog):
         # 设置语言（如果配置中有语言设置）
         if 'language' in self.config:
             set_language(self.config['language'])
+
+        # 后台任务（测试连接 / 刷新模型），对话框关闭时统一取消
+        self._connection_tasks = []
+        self._connection_results = {}
+        self._connection_progress = None
+        self._models_task = None
         
         # 设置UI（如果Qt可用）
         if QT_AVAILABLE:
@@ -169,9 +202,9 @@ class ConfigDialog(QDialog):
         button_layout = QHBoxLayout()
         
         # 测试连接按钮
-        test_button = QPushButton("🔍 " + _("Test Connection"))
-        test_button.clicked.connect(self.test_connection)
-        button_layout.addWidget(test_button)
+        self.test_button = QPushButton("🔍 " + _("Test Connection"))
+        self.test_button.clicked.connect(self.test_connection)
+        button_layout.addWidget(self.test_button)
 
         button_layout.addStretch()
 
@@ -323,10 +356,11 @@ class ConfigDialog(QDialog):
             self.model_combo.addItem(saved_model)
         form_layout.addRow("🔵 OpenAI 模型:", self.model_combo)
 
-        # 刷新模型按钮
+        # 刷新模型按钮（须在载入缓存之前创建：缓存过期时会立即开始后台刷新）
         self.refresh_models_btn = QPushButton("刷新模型")
         self.refresh_models_btn.clicked.connect(self.refresh_models)
         form_layout.addRow("", self.refresh_models_btn)
+        self._load_cached_models()
         
         # 最大令牌数
         self.max_tokens_spin = QSpinBox()
@@ -396,6 +430,12 @@ class ConfigDialog(QDialog):
         self.timeout_spin.setSuffix(" 秒")
         form_layout.addRow("⏱️ 超时时间:", self.timeout_spin)
         
+        # 测试连接时发送真实补全请求（默认只做免费的元数据验证）
+        self.completion_probe_check = QCheckBox()
+        self.completion_probe_check.setChecked(False)
+        self.completion_probe_check.setToolTip("会发送一次 max_tokens=1 的补全请求，产生少量费用")
+        form_layout.addRow("🧪 测试连接时发送补全请求:", self.completion_probe_check)
+
         # 调试模式
         self.debug_check = QCheckBox()
         self.debug_check.setChecked(self.config.get("debug_mode", False))
@@ -418,13 +458,51 @@ class ConfigDialog(QDialog):
         fallback_layout.addWidget(self.fallback_text)
         
         layout.addWidget(fallback_group)
+
+        # 回退端点配置（endpoint_profiles 中的名称；主端点为 openai）
+        endpoint_fallback_group = QGroupBox("🔄 回退端点")
+        endpoint_fallback_layout = QVBoxLayout(endpoint_fallback_group)
+
+        endpoint_fallback_info = QLabel("其余 OpenAI 兼容端点都失败时，依次尝试这些端点（端点配置档名称，主端点为 openai）:")
+        endpoint_fallback_layout.addWidget(endpoint_fallback_info)
+
+        self.endpoint_fallback_text = QTextEdit()
+        self.endpoint_fallback_text.setMaximumHeight(80)
+        self.endpoint_fallback_text.setPlainText(", ".join(self.config.get("endpoint_fallbacks", [])))
+        self.endpoint_fallback_text.setPlaceholderText("例如: local, backup-gateway")
+        endpoint_fallback_layout.addWidget(self.endpoint_fallback_text)
+
+        layout.addWidget(endpoint_fallback_group)
+
+        # 各端点的延迟、错误率与剔除状态
+        endpoints_group = QGroupBox("📡 端点统计")
+        endpoints_layout = QVBoxLayout(endpoints_group)
+
+        self.endpoint_stats_label = QLabel()
+        self.endpoint_stats_label.setWordWrap(True)
+        endpoints_layout.addWidget(self.endpoint_stats_label)
+
+        refresh_stats_button = QPushButton("🔄 刷新")
+        refresh_stats_button.clicked.connect(self.refresh_endpoint_stats)
+        endpoints_layout.addWidget(refresh_stats_button)
+
+        layout.addWidget(endpoints_group)
+        self.refresh_endpoint_stats()
         layout.addStretch()
         
         return widget
     
+    def refresh_endpoint_stats(self):
+        """刷新端点统计"""
+        snapshot = endpoint_router.snapshot() if endpoint_router else []
+        self.endpoint_stats_label.setText(format_endpoint_stats(snapshot))
+
     def test_connection(self):
-        """测试连接（直连 OpenAI）"""
+        """测试连接：在后台并行验证已配置的各提供商密钥，结果通过信号回到主线程"""
         try:
+            if self._connection_tasks:
+                return
+
             # 临时保存配置进行测试
             temp_config = self.get_current_config()
 
@@ -439,33 +517,101 @@ class ConfigDialog(QDialog):
                 for key, value in temp_config.items():
                     Config.set(key, value)
 
-            # 测试连接
-            if AIServiceAdapter:
-                adapter = AIServiceAdapter()
-            else:
+            if not (ServiceRegistry and BackgroundTask):
                 QMessageBox.warning(self, "连接测试", "❌ 无法导入 AI 服务模块")
                 return
 
-            # 显示测试进度
+            # 借用共享实例（在主线程完成，后台线程只做网络调用）
+            adapter = ServiceRegistry.get_adapter()
+            allow_completion = self.completion_probe_check.isChecked()
+            # 取消时 token 关闭进行中请求的套接字，立即释放执行器线程
+            targets = [("OpenAI", lambda token: adapter.validate_api_key(allow_completion=allow_completion,
+                                                                         cancel_token=token))]
+            anthropic_key = temp_config.get("anthropic_api_key", "").strip()
+            if anthropic_key:
+                targets.append(("Anthropic", lambda token: probe_anthropic_key(anthropic_key, cancel_token=token)))
+            google_key = temp_config.get("google_api_key", "").strip()
+            if google_key:
+                targets.append(("Google", lambda token: probe_google_key(google_key, cancel_token=token)))
+
+            # 显示测试进度（主线程保持空闲，可以重绘与取消）
             from aqt.qt import QProgressDialog
-            progress = QProgressDialog("正在测试连接...", "取消", 0, 0, self)
+            self._connection_results = {}
+            progress = QProgressDialog("正在测试连接...", "取消", 0, len(targets), self)
             progress.setWindowModality(2)  # Qt.WindowModal
+            progress.setMinimumDuration(0)
+            progress.canceled.connect(self._cancel_connection_test)
             progress.show()
+            self._connection_progress = progress
+            self.test_button.setEnabled(False)
 
-            try:
-                is_valid, message = adapter.validate_api_key()
-
-                if is_valid:
-                    QMessageBox.information(self, "连接测试", f"✅ 连接成功!\n\n{message}")
-                else:
-                    QMessageBox.warning(self, "连接测试", f"❌ 连接失败!\n\n{message}")
-            finally:
-                progress.close()
+            for label, probe in targets:
+                task = BackgroundTask(probe)
+                task.finished.connect(lambda result, label=label: self._on_connection_result(label, result))
+                task.failed.connect(lambda error, label=label: self._on_connection_result(label, (False, error)))
+                self._connection_tasks.append(task)
+            for task in self._connection_tasks:
+                task.start()
 
         except Exception as e:
+            self._finish_connection_test()
             error_msg = f"💥 测试过程中发生错误:\n\n{str(e)}"
             QMessageBox.critical(self, "连接测试", error_msg)
-    
+
+    def _on_connection_result(self, label, result):
+        """单个提供商验证完成（主线程）"""
+        if not self._connection_tasks:
+            return
+        try:
+            is_valid, message = result
+        except Exception:
+            is_valid, message = False, str(result)
+        self._connection_results[label] = (is_valid, message)
+        if self._connection_progress is not None:
+            self._connection_progress.setValue(len(self._connection_results))
+        if len(self._connection_results) < len(self._connection_tasks):
+            return
+
+        results = dict(self._connection_results)
+        self._finish_connection_test()
+        lines = [
+            f"{'✅' if ok else '❌'} {name}: {msg}"
+            for name, (ok, msg) in results.items()
+        ]
+        if all(ok for ok, _msg in results.values()):
+            QMessageBox.information(self, "连接测试", "✅ 连接成功!\n\n" + "\n".join(lines))
+        else:
+            QMessageBox.warning(self, "连接测试", "❌ 连接失败!\n\n" + "\n".join(lines))
+
+    def _cancel_connection_test(self):
+        """用户点击取消：丢弃所有未完成的验证"""
+        for task in self._connection_tasks:
+            task.cancel()
+        self._finish_connection_test()
+
+    def _finish_connection_test(self):
+        """清理测试状态并恢复按钮"""
+        self._connection_tasks = []
+        self._connection_results = {}
+        progress = self._connection_progress
+        self._connection_progress = None
+        if progress is not None:
+            try:
+                progress.canceled.disconnect(self._cancel_connection_test)
+            except Exception:
+                pass
+            progress.close()
+        if hasattr(self, 'test_button'):
+            self.test_button.setEnabled(True)
+
+    def done(self, result):
+        """关闭对话框时取消仍在进行的后台任务"""
+        self._cancel_connection_test()
+        if self._models_task is not None:
+            self._models_task.cancel()
+            self._models_task = None
+        super().done(result)
+
     def get_current_config(self):
         """获取当前配置"""
         # 处理回退提供商
@@ -473,6 +619,7 @@ class ConfigDialog(QDialog):
         fallback_providers = []
         if fallback_text:
             fallback_providers = [p.strip() for p in fallback_text.split(",") if p.strip()]
+        endpoint_fallbacks = [p.strip() for p in self.endpoint_fallback_text.toPlainText().split(",") if p.strip()]
         
         # 获取语言设置
         language_code = 'en'  # 默认值
@@ -492,7 +639,10 @@ class ConfigDialog(QDialog):
             "retry_attempts": self.retry_spin.value(),
             "timeout": self.timeout_spin.value(),
             "debug_mode": self.debug_check.isChecked(),
-            "fallback_providers": fallback_providers
+            "fallback_providers": fallback_providers,
+            "endpoint_fallbacks": endpoint_fallbacks,
+            # 端点配置档只在配置文件中编辑，保存时原样保留
+            "endpoint_profiles": self.config.get("endpoint_profiles", [])
         }
     
     def save_config(self):
@@ -548,34 +698,88 @@ class ConfigDialog(QDialog):
         
         return True
 
-    def refresh_models(self):
-        """使用当前 API Key 从 OpenAI 获取模型列表并填充下拉框"""
+    def _load_cached_models(self):
+        """打开对话框时立即用模型目录缓存填充下拉框；缓存过期时在后台静默刷新"""
+        if not ServiceRegistry or not self.config.get("openai_api_key", "").strip():
+            return
+        try:
+            svc = ServiceRegistry.get_adapter()._service
+            cached = svc.get_cached_models()
+            if cached:
+                self._populate_model_combo(cached)
+            if not svc.catalog.is_fresh(svc.models_url, svc.api_key):
+                self.refresh_models(quiet=True)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Failed to load cached models: {e}")
+
+    def refresh_models(self, quiet=False):
+        """使用当前 API Key 在后台获取模型列表；再次点击按钮可取消"""
+        if self._models_task is not None:
+            self._models_task.cancel()
+            self._finish_refresh_models()
+            return
+        # clicked 信号会传入 checked 参数
+        quiet = quiet is True
         try:
             api_key = self.openai_key_edit.text().strip()
             if not api_key:
-                QMessageBox.warning(self, "刷新模型", "请先填写 OpenAI API 密钥")
+                if not quiet:
+                    QMessageBox.warning(self, "刷新模型", "请先填写 OpenAI API 密钥")
                 return
             # 临时更新配置供服务使用
             if Config:
                 Config.set("openai_api_key", api_key)
-            if AIServiceAdapter:
-                adapter = AIServiceAdapter()
-                svc = adapter._service
-                ok, models, msg = svc.list_models()
-                if not ok:
-                    QMessageBox.warning(self, "刷新模型", f"获取模型失败: {msg}")
-                    return
-                # 填充下拉
-                self.model_combo.clear()
-                # 优先保留当前保存的模型
-                saved = self.config.get("openai_model", "").strip()
-                if saved and saved not in models:
-                    self.model_combo.addItem(saved)
-                for m in models:
-                    if not saved or m != saved:
-                        self.model_combo.addItem(m)
-                QMessageBox.information(self, "刷新模型", f"已加载 {len(models)} 个模型")
-            else:
-                QMessageBox.warning(self, "刷新模型", "服务不可用")
+            if not (ServiceRegistry and BackgroundTask):
+                if not quiet:
+                    QMessageBox.warning(self, "刷新模型", "服务不可用")
+                return
+
+            svc = ServiceRegistry.get_adapter()._service
+            # 手动刷新强制绕过新鲜缓存（仍会带 ETag 做条件请求）
+            task = BackgroundTask(lambda token: svc.list_models(force_refresh=not quiet, cancel_token=token))
+            task.finished.connect(lambda result: self._on_models_loaded(result, quiet))
+            task.failed.connect(lambda error: self._on_models_loaded((False, [], error), quiet))
+            self._models_task = task
+            self.refresh_models_btn.setText("取消刷新")
+            task.start()
         except Exception as e:
-            QMessageBox.critical(self, "刷新模型", f"异常: {str(e)}")
+            self._finish_refresh_models()
+            # 静默刷新（打开对话框时）只记录日志，不在对话框构建过程中弹窗
+            if quiet:
+                logging.getLogger(__name__).warning(f"Background model refresh failed: {e}")
+            else:
+                QMessageBox.critical(self, "刷新模型", f"异常: {str(e)}")
+
+    def _on_models_loaded(self, result, quiet=False):
+        """模型列表返回（主线程）"""
+        if self._models_task is None:
+            return
+        self._finish_refresh_models()
+        ok, models, msg = result
+        if not ok:
+            if not quiet:
+                QMessageBox.warning(self, "刷新模型", f"获取模型失败: {msg}")
+            return
+        current = self.model_combo.currentText()
+        self._populate_model_combo(models)
+        if current:
+            self.model_combo.setCurrentText(current)
+        if not quiet:
+            QMessageBox.information(self, "刷新模型", f"已加载 {len(models)} 个模型")
+
+    def _populate_model_combo(self, models):
+        """填充模型下拉框，优先保留当前保存的模型"""
+        self.model_combo.clear()
+        saved = self.config.get("openai_model", "").strip()
+        if saved and saved not in models:
+            self.model_combo.addItem(saved)
+        for m in models:
+            self.model_combo.addItem(m)
+        if saved:
+            self.model_combo.setCurrentText(saved)
+
+    def _finish_refresh_models(self):
+        """恢复刷新按钮状态"""
+        self._models_task = None
+        if hasattr(self, 'refresh_models_btn'):
+            self.refresh_models_btn.setText("刷新模型")
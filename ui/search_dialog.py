@@ -0,0 +1,130 @@
+# 对话搜索窗口 - 在全部卡片的 AI 对话中全文搜索，双击结果在浏览器中打开卡片
+
+import html
+import logging
+import time
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..services.conversation_store import get_conversation_store
+except ImportError:
+    from services.conversation_store import get_conversation_store
+
+# 翻译函数
+try:
+    from ..i18n.translator import _
+except ImportError:
+    try:
+        from i18n.translator import _
+    except ImportError:
+        def _(text): return text
+
+try:
+    from aqt import dialogs, mw
+    from aqt.qt import (QDialog, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem,
+                        QLabel, QTimer, Qt)
+    QT_AVAILABLE = True
+except ImportError:
+    QT_AVAILABLE = False
+
+# 输入停止多久后开始搜索（毫秒）
+SEARCH_DEBOUNCE_MS = 150
+SEARCH_LIMIT = 100
+
+# 片段中命中词的标记（先转义再替换为加粗）
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+def format_result_html(result) -> str:
+    """把一条搜索结果格式化为列表项的富文本"""
+    snippet = html.escape(result["snippet"]).replace(_MARK_START, "<b>").replace(_MARK_END, "</b>")
+    role = "Q" if result["role"] == "user" else "A"
+    date = time.strftime("%Y-%m-%d", time.localtime(result["created"]))
+    saved = " · saved" if result.get("saved") else ""
+    return f"<span style='color:#6b7280'>{role} · {date}{saved}</span><br>{snippet}"
+
+
+def open_card_in_browser(card_id: int):
+    """在 Anki 浏览器中定位到指定卡片"""
+    search = f"cid:{int(card_id)}"
+    try:
+        dialogs.open("Browser", mw, search=(search,))
+    except TypeError:
+        # 旧版本 Browser 不支持 search 参数
+        browser = dialogs.open("Browser", mw)
+        browser.form.searchEdit.lineEdit().setText(search)
+        browser.onSearchActivated()
+
+
+if QT_AVAILABLE:
+    class ConversationSearchDialog(QDialog):
+        """搜索全部卡片的 AI 对话轮次（按 BM25 排序，显示命中片段）"""
+
+        def __init__(self, parent=None):
+            super().__init__(parent)
+            self.logger = logging.getLogger(__name__ + ".ConversationSearchDialog")
+            self.setWindowTitle(_("Search AI Conversations"))
+            self.resize(640, 480)
+
+            layout = QVBoxLayout()
+            self.query_edit = QLineEdit()
+            self.query_edit.setPlaceholderText(_("Search conversations..."))
+            self.query_edit.textChanged.connect(self._schedule_search)
+            self.query_edit.returnPressed.connect(self.run_search)
+            layout.addWidget(self.query_edit)
+
+            self.results_list = QListWidget()
+            self.results_list.setWordWrap(True)
+            self.results_list.itemActivated.connect(self._open_item)
+            layout.addWidget(self.results_list)
+
+            self.status_label = QLabel("")
+            self.status_label.setStyleSheet("color: #6b7280; font-size: 12px;")
+            layout.addWidget(self.status_label)
+            self.setLayout(layout)
+
+            self._timer = QTimer(self)
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self.run_search)
+
+        def _schedule_search(self, _text=None):
+            self._timer.start(SEARCH_DEBOUNCE_MS)
+
+        def run_search(self):
+            self._timer.stop()
+            query = self.query_edit.text().strip()
+            self.results_list.clear()
+            if not query:
+                self.status_label.setText("")
+                return
+            started = time.perf_counter()
+            try:
+                results = get_conversation_store().search_turns(
+                    query, limit=SEARCH_LIMIT, marker=(_MARK_START, _MARK_END)
+                )
+            except Exception as e:
+                self.logger.error(f"Error searching conversations: {e}")
+                self.status_label.setText(_("Search failed") + f": {e}")
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            for result in results:
+                item = QListWidgetItem()
+                item.setData(Qt.ItemDataRole.UserRole if hasattr(Qt, "ItemDataRole") else Qt.UserRole, result["card_id"])
+                label = QLabel(format_result_html(result))
+                label.setWordWrap(True)
+                label.setTextFormat(Qt.TextFormat.RichText if hasattr(Qt, "TextFormat") else Qt.RichText)
+                label.setContentsMargins(6, 4, 6, 4)
+                item.setSizeHint(label.sizeHint())
+                self.results_list.addItem(item)
+                self.results_list.setItemWidget(item, label)
+            self.status_label.setText(f"{len(results)} results · {elapsed_ms:.1f} ms")
+
+        def _open_item(self, item):
+            role = Qt.ItemDataRole.UserRole if hasattr(Qt, "ItemDataRole") else Qt.UserRole
+            card_id = item.data(role)
+            if card_id:
+                try:
+                    open_card_in_browser(card_id)
+                except Exception as e:
+                    self.logger.error(f"Error opening card {card_id} in browser: {e}")
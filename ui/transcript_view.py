@@ -0,0 +1,55 @@
+# 复习界面中展开字段里的对话引用标记
+
+import json
+import logging
+
+# 尝试相对导入，如果失败则使用绝对导入
+try:
+    from ..services.conversation_store import REF_CLASS, expand_references, get_conversation_store
+except ImportError:
+    from services.conversation_store import REF_CLASS, expand_references, get_conversation_store
+
+try:
+    from aqt import mw
+    ANKI_AVAILABLE = True
+except ImportError:
+    mw = None
+    ANKI_AVAILABLE = False
+
+# pycmd 消息前缀：cwc_expand:<transcript id>
+EXPAND_COMMAND = "cwc_expand:"
+
+
+def _clickable_reference(transcript_id: int, label_html: str) -> str:
+    return (
+        f'<div class="{REF_CLASS}" id="cwc-ref-{transcript_id}" style="cursor:pointer;opacity:.75;margin:6px 0;"'
+        f' onclick="pycmd(\'{EXPAND_COMMAND}{transcript_id}\')">{label_html} ▸</div>'
+    )
+
+
+def render_references(html, card, context):
+    """card_will_show 钩子：把引用标记变为可点击的占位（不读取数据库，不增加渲染开销）"""
+    try:
+        return expand_references(html, _clickable_reference)
+    except Exception as e:
+        logging.error(f"Error rendering conversation references: {e}")
+        return html
+
+
+def handle_expand_message(handled, message, context):
+    """webview_did_receive_js_message 钩子：点击占位后从对话存储读取完整对话并替换到页面中"""
+    if not isinstance(message, str) or not message.startswith(EXPAND_COMMAND):
+        return handled
+    try:
+        transcript_id = int(message[len(EXPAND_COMMAND):])
+        transcript = get_conversation_store().get_transcript(transcript_id)
+        content = transcript["html"] if transcript else "<i>Conversation not found</i>"
+        web = getattr(getattr(mw, "reviewer", None), "web", None)
+        if web:
+            web.eval(
+                f"(function(){{var el=document.getElementById('cwc-ref-{transcript_id}');"
+                f"if(el){{el.outerHTML={json.dumps(content)};}}}})();"
+            )
+    except Exception as e:
+        logging.error(f"Error expanding stored conversation: {e}")
+    return (True, None)
@@ -1,8 +1,10 @@
 # 工具函数
 
 import re
+import os
 import logging
 import json
+import hashlib
 from datetime import datetime
 
 def sanitize_html(html_content):
@@ -152,24 +154,40 @@ def calculate_text_similarity(text1, text2):
     # 返回Jaccard相似度
     return len(intersection) / len(union)
 
+def normalize_for_matching(text):
+    """近似匹配用的规范化：小写、去掉标点，连续空白合并为一个空格"""
+    if not text:
+        return ""
+    return " ".join(re.sub(r"[^\w]+", " ", text.lower()).split())
+
+def text_shingles(text, size=3):
+    """规范化后按字符切为长度为 size 的 shingle 集合（不依赖分词，中英文通用）
+
+    与 calculate_text_similarity 的词集合相比，字符 shingle 对改写、复数、少量错字更稳健。
+    """
+    normalized = normalize_for_matching(text)
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+# 常见英文停用词（关键词提取和相关卡片索引共用）
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those'
+})
+
 def extract_keywords(text, max_keywords=10):
     """从文本中提取关键词"""
     if not text:
         return []
     
-    # 简单的关键词提取：移除常见停用词
-    stop_words = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 
-        'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
-        'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
-        'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those'
-    }
-    
     # 提取单词
     words = re.findall(r'\b[a-zA-Z]{3,}\b', text.lower())
     
     # 过滤停用词
-    keywords = [word for word in words if word not in stop_words]
+    keywords = [word for word in words if word not in STOP_WORDS]
     
     # 计算词频
     word_freq = {}
@@ -206,3 +224,26 @@ def is_valid_url(url):
         r'(?:/?|[/?]\S+)$', re.IGNORECASE)
     
     return url_pattern.match(url) is not None
+
+def fingerprint_api_key(api_key, length=16):
+    """生成 API 密钥指纹（用于缓存键，避免在内存/磁盘中以明文作为键）"""
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:length]
+
+def get_user_files_dir():
+    """获取插件的 user_files 目录（Anki 升级插件时保留该目录），不存在则创建"""
+    addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = os.path.join(addon_dir, "user_files")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def get_profile_file_suffix():
+    """当前 Anki 配置档对应的文件名后缀（"-配置档名"，不在 Anki 中时为空），用于按配置档分开保存数据"""
+    try:
+        from aqt import mw
+        name = mw.pm.name if mw and mw.pm else ""
+    except Exception:
+        name = ""
+    name = re.sub(r"[^\w.-]+", "_", name or "")
+    return f"-{name}" if name else ""
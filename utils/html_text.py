@@ -0,0 +1,198 @@
+# HTML → 纯文本提取（单遍，基于 html.parser）
+
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+
+# 内容对提示词无意义的标签：整个子树都跳过
+SKIP_TAGS = {
+    "script", "style", "template", "noscript", "head", "title",
+    "svg", "object", "iframe", "canvas", "button", "select", "textarea",
+    # MathJax 渲染后的节点（TeX 源码本身会保留）
+    "mjx-container", "mjx-assistive-mml",
+}
+
+# 没有结束标签的元素
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "track", "wbr",
+}
+
+# 块级元素：前后断行
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "details", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4",
+    "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section",
+    "summary", "table", "tbody", "thead", "tfoot", "tr", "ul",
+}
+
+_HIDDEN_STYLE_RE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden", re.IGNORECASE)
+_SOUND_RE = re.compile(r"\[sound:[^\]]*\]")
+_SPACE_RE = re.compile(r"[ \t\r\f\v\u00a0]+")
+_MATHJAX_INLINE_RE = re.compile(r"\\\((.+?)\\\)", re.DOTALL)
+_MATHJAX_DISPLAY_RE = re.compile(r"\\\[(.+?)\\\]", re.DOTALL)
+
+# 超长模板分块喂给解析器，达到长度上限即停止
+_FEED_CHUNK = 16384
+
+
+class _CardTextExtractor(HTMLParser):
+    """单遍提取卡片文本：跳过脚本/样式/隐藏内容，保留段落结构，统计媒体引用"""
+
+    def __init__(self, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.length = 0
+        self.truncated = False
+        self.images = 0
+        self.audio = 0
+        self.video = 0
+        self._skip_stack: List[str] = []
+        self._pre_depth = 0
+
+    # ---- 输出 ----
+
+    def _emit(self, text: str):
+        if not text or self.truncated:
+            return
+        if self.max_chars is not None and self.length + len(text) > self.max_chars:
+            text = text[:max(0, self.max_chars - self.length)]
+            self.truncated = True
+        self.parts.append(text)
+        self.length += len(text)
+
+    def _newline(self):
+        if self.parts and not self.parts[-1].endswith("\n"):
+            self._emit("\n")
+
+    # ---- 解析回调 ----
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_stack:
+            if tag not in VOID_TAGS:
+                self._skip_stack.append(tag)
+            return
+        attr_map = dict(attrs)
+        if tag in SKIP_TAGS or self._is_hidden(attr_map):
+            if tag not in VOID_TAGS:
+                self._skip_stack.append(tag)
+            return
+
+        if tag == "img":
+            self.images += 1
+            alt = (attr_map.get("alt") or "").strip()
+            if alt:
+                self._emit(f"[image: {alt}]")
+            return
+        if tag in ("audio", "video"):
+            if tag == "audio":
+                self.audio += 1
+            else:
+                self.video += 1
+            self._skip_stack.append(tag)
+            return
+        if tag == "br":
+            self._emit("\n")
+            return
+        if tag == "pre":
+            self._pre_depth += 1
+        if tag in BLOCK_TAGS:
+            self._newline()
+            if tag == "li":
+                self._emit("- ")
+        elif tag in ("td", "th"):
+            self._emit(" ")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self._skip_stack and self._skip_stack[-1] == tag:
+            self._skip_stack.pop()
+
+    def handle_endtag(self, tag):
+        if self._skip_stack:
+            # 容忍不配对的结束标签：只在栈中存在该标签时出栈
+            if tag in self._skip_stack:
+                while self._skip_stack:
+                    if self._skip_stack.pop() == tag:
+                        break
+            return
+        if tag == "pre" and self._pre_depth:
+            self._pre_depth -= 1
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_data(self, data):
+        if self._skip_stack or not data:
+            return
+        if "[sound:" in data:
+            self.audio += len(_SOUND_RE.findall(data))
+            data = _SOUND_RE.sub("", data)
+        if self._pre_depth:
+            self._emit(data)
+            return
+        data = _SPACE_RE.sub(" ", data.replace("\n", " "))
+        if data == " " and (not self.parts or self.parts[-1].endswith((" ", "\n"))):
+            return
+        self._emit(data)
+
+    @staticmethod
+    def _is_hidden(attr_map) -> bool:
+        if "hidden" in attr_map:
+            return True
+        style = attr_map.get("style")
+        return bool(style and _HIDDEN_STYLE_RE.search(style))
+
+    # ---- 结果 ----
+
+    def media_summary(self) -> str:
+        items = []
+        if self.images:
+            items.append(f"{self.images} image{'s' if self.images > 1 else ''}")
+        if self.audio:
+            items.append(f"{self.audio} audio")
+        if self.video:
+            items.append(f"{self.video} video")
+        return f"[media: {', '.join(items)}]" if items else ""
+
+
+def _normalize_lines(text: str) -> str:
+    lines = [line.strip() for line in text.split("\n")]
+    out = []
+    for line in lines:
+        if line or (out and out[-1]):
+            out.append(line)
+    return "\n".join(out).strip()
+
+
+def html_to_text(html_content: str, max_chars: Optional[int] = None, include_media_summary: bool = True) -> str:
+    """把卡片 HTML 转为适合放入提示词的纯文本
+
+    - 丢弃 script/style/template 等内容以及 hidden / display:none 的元素
+    - 解码 HTML 实体，块级元素与 <br> 转为换行，列表项以 "- " 开头
+    - TeX 源码保留为 $...$ / $$...$$，MathJax 渲染节点丢弃
+    - 图片、音频、视频汇总为一行 [media: ...]（图片 alt 文本保留在原位）
+    - max_chars 为输出长度上限，超出时截断并以 "…" 结尾
+    """
+    if not html_content:
+        return ""
+
+    extractor = _CardTextExtractor(max_chars=max_chars)
+    for start in range(0, len(html_content), _FEED_CHUNK):
+        extractor.feed(html_content[start:start + _FEED_CHUNK])
+        if extractor.truncated:
+            break
+    if not extractor.truncated:
+        extractor.close()
+
+    text = "".join(extractor.parts)
+    text = _MATHJAX_DISPLAY_RE.sub(lambda m: f"$${m.group(1).strip()}$$", text)
+    text = _MATHJAX_INLINE_RE.sub(lambda m: f"${m.group(1).strip()}$", text)
+    text = _normalize_lines(text)
+    if extractor.truncated:
+        text = text.rstrip() + "…"
+
+    summary = extractor.media_summary() if include_media_summary else ""
+    if summary:
+        text = f"{text}\n{summary}" if text else summary
+    return text
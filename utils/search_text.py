@@ -0,0 +1,65 @@
+# 搜索用文本切分 - 拉丁文字按词，CJK 按重叠二元组
+
+import re
+from typing import List
+
+# CJK 统一表意文字、扩展 A、兼容表意文字、平假名、片假名、韩文音节
+_CJK_RANGES = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_TOKEN_RE = re.compile(rf"[{_CJK_RANGES}]+|[^\W_]+", re.UNICODE)
+_CJK_RE = re.compile(rf"[{_CJK_RANGES}]")
+
+
+def _cjk_bigrams(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text: str) -> List[str]:
+    """切分为检索词：拉丁/数字按词并转小写，CJK 连续片段切为重叠二元组（单字保留原样）
+
+    中文、日文没有空格分词，二元组不依赖词典即可匹配任意两字以上的查询。
+    """
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(text or ""):
+        token = match.group(0)
+        if _CJK_RE.match(token):
+            tokens.extend(_cjk_bigrams(token))
+        else:
+            tokens.append(token.lower())
+    return tokens
+
+
+def prepare_fts_text(text: str) -> str:
+    """把文本转为以空格分隔的检索词，供 FTS5 unicode61 分词器索引"""
+    return " ".join(tokenize(text))
+
+
+def build_fts_query(query: str) -> str:
+    """把用户输入转为 FTS5 MATCH 表达式：每个输入词的检索词组成一个短语，短语之间为 AND
+
+    所有检索词都加引号，用户输入的引号、括号、AND/OR 等不会被当作 FTS 语法。
+    """
+    phrases = []
+    for word in (query or "").split():
+        tokens = tokenize(word)
+        if tokens:
+            phrases.append('"' + " ".join(t.replace('"', '""') for t in tokens) + '"')
+    return " ".join(phrases)
+
+
+def make_snippet(text: str, query: str, width: int = 160, marker=("[", "]")) -> str:
+    """从原文中截取包含第一个命中词的片段，并用 marker 标出所有命中的查询词"""
+    text = re.sub(r"\s+", " ", text or "").strip()
+    terms = sorted({w for w in (query or "").split() if w}, key=len, reverse=True)
+    if not terms:
+        return text[:width]
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    first = pattern.search(text)
+    start = 0
+    if first and first.start() > width // 3:
+        start = first.start() - width // 3
+    end = min(len(text), start + width)
+    snippet = text[start:end]
+    snippet = pattern.sub(lambda m: f"{marker[0]}{m.group(0)}{marker[1]}", snippet)
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")